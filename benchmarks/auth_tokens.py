@@ -0,0 +1,49 @@
+"""
+Benchmark authenticating, and validating a token, over and over, as the same
+user, with every plugin loaded.
+
+Each tenant's service catalog is built and serialized once, so the time per
+request should be dominated by the token and user fields rather than the
+size of the catalog; and the response to validating a token is cached in its
+session, so validating it again is a lookup.
+
+Run with::
+
+    python benchmarks/auth_tokens.py
+"""
+
+from __future__ import print_function
+
+from twisted.internet.task import Clock
+
+from harness import Mimic, per_call, report
+
+from mimic.core import MimicCore
+
+
+def main():
+    """
+    Time a password authentication, a listing of the endpoints of its token
+    and a validation of the token, with every plugin loaded.
+    """
+    mimic = Mimic(MimicCore.fromPlugins(Clock()).apis())
+    body = {"auth": {"passwordCredentials": {"username": "benchmark",
+                                             "password": "benchmark"}}}
+    token = mimic.catalog["access"]["token"]["id"]
+    report("authentication", "plugins", [
+        (len(mimic.core.apis()),
+         per_call(lambda: mimic.json("POST", "/identity/v2.0/tokens",
+                                     body)))])
+    report("GET /tokens/<token>/endpoints", "plugins", [
+        (len(mimic.core.apis()),
+         per_call(lambda: mimic.request(
+             "GET", "/identity/v2.0/tokens/{0}/endpoints".format(token))))])
+    report("GET /tokens/<token>", "plugins", [
+        (len(mimic.core.apis()),
+         per_call(lambda: mimic.request(
+             "GET", "/identity/v2.0/tokens/{0}?belongsTo={1}".format(
+                 token, mimic.tenant_id))))])
+
+
+if __name__ == "__main__":
+    main()
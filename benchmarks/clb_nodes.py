@@ -0,0 +1,76 @@
+"""
+Benchmark adding, getting and deleting nodes on cloud load balancers which
+already have many nodes.
+
+Nodes are indexed by ID and by address and port, so the time per request
+should depend on the number of nodes in the request, not on the number of
+nodes already on the load balancer.
+
+Run with::
+
+    python benchmarks/clb_nodes.py
+"""
+
+from __future__ import print_function
+
+from harness import Mimic, per_call, report
+
+from mimic.rest.loadbalancer_api import LoadBalancerApi
+
+
+def nodes_json(start, count):
+    """
+    The JSON for ``count`` nodes with distinct addresses.
+    """
+    return {"nodes": [{"address": "10.{0}.{1}.{2}".format(
+        n // 65536, (n // 256) % 256, n % 256),
+        "port": 80, "condition": "ENABLED"}
+        for n in range(start, start + count)]}
+
+
+def populated(size):
+    """
+    A Mimic with a single load balancer which has ``size`` nodes, and the
+    URL of that load balancer.
+    """
+    mimic = Mimic([LoadBalancerApi()])
+    base = mimic.endpoint("cloudLoadBalancers") + "/loadbalancers"
+    lb = mimic.json("POST", base, {"loadBalancer": {
+        "name": "bench", "protocol": "HTTP",
+        "virtualIps": [{"type": "PUBLIC"}]}})[1]["loadBalancer"]
+    lb_url = "{0}/{1}".format(base, lb["id"])
+    mimic.json("POST", lb_url + "/nodes", nodes_json(0, size))
+    return mimic, lb_url
+
+
+def main():
+    """
+    Time a bulk add of nodes to an empty load balancer, and a GET, and an add
+    followed by a DELETE, of one node on load balancers of each size.
+    """
+    bulk_rows = []
+    get_rows = []
+    delete_rows = []
+    for size in (100, 1000, 5000):
+        bulk_rows.append((size, per_call(lambda: populated(size), number=3)))
+        mimic, lb_url = populated(size)
+        node_id = mimic.json("GET", lb_url + "/nodes")[1]["nodes"][-1]["id"]
+        get_rows.append((size, per_call(
+            lambda: mimic.request("GET", "{0}/nodes/{1}".format(
+                lb_url, node_id)))))
+        extra = [size]
+
+        def add_and_delete():
+            [node] = mimic.json("POST", lb_url + "/nodes",
+                                nodes_json(extra[0], 1))[1]["nodes"]
+            extra[0] += 1
+            mimic.request("DELETE", "{0}/nodes/{1}".format(
+                lb_url, node["id"]))
+        delete_rows.append((size, per_call(add_and_delete)))
+    report("create LB + POST /nodes with N nodes", "nodes", bulk_rows)
+    report("GET /nodes/<id>", "nodes", get_rows)
+    report("POST /nodes + DELETE /nodes/<id>", "nodes", delete_rows)
+
+
+if __name__ == "__main__":
+    main()
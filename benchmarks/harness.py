@@ -0,0 +1,99 @@
+"""
+Shared helpers for Mimic's benchmark scripts.
+
+The benchmarks drive Mimic in-process, through the same in-memory HTTP
+machinery the test suite uses, so they measure routing and rendering as well
+as the model code without depending on the network.
+"""
+
+from __future__ import print_function
+
+import json
+import timeit
+
+from twisted.internet.task import Clock
+
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.test.helpers import request, request_with_content
+
+
+class Mimic(object):
+    """
+    A Mimic resource tree with a single set of plugins and an authenticated
+    tenant, whose requests complete synchronously.
+    """
+
+    def __init__(self, apis):
+        """
+        Build the resource tree and authenticate against it.
+        """
+        self.clock = Clock()
+        self.core = MimicCore(self.clock, apis)
+        self.root = MimicRoot(self.core, self.clock).app.resource()
+        _, catalog = self.json("POST", "/identity/v2.0/tokens", {
+            "auth": {"passwordCredentials": {"username": "benchmark",
+                                             "password": "benchmark"}}
+        })
+        self.catalog = catalog
+        self.tenant_id = catalog["access"]["token"]["tenant"]["id"]
+
+    def endpoint(self, service_name):
+        """
+        The public URL of the first endpoint for the named service.
+        """
+        for entry in self.catalog["access"]["serviceCatalog"]:
+            if entry["name"] == service_name:
+                return entry["endpoints"][0]["publicURL"]
+
+    def request(self, method, uri, body=b""):
+        """
+        Issue a request and return the response.
+        """
+        return _result(request(None, self.root, method, uri, body))
+
+    def content(self, method, uri, body=b""):
+        """
+        Issue a request and return the response and its body.
+        """
+        return _result(request_with_content(None, self.root, method, uri,
+                                            body))
+
+    def json(self, method, uri, body=None):
+        """
+        Issue a request with a JSON body and return the response and its
+        decoded JSON body.
+        """
+        response, content = self.content(
+            method, uri, json.dumps(body) if body is not None else b"")
+        return response, json.loads(content) if content else None
+
+
+def _result(deferred):
+    """
+    Extract the result of a Deferred which has already fired.
+    """
+    results = []
+    deferred.addBoth(results.append)
+    [result] = results
+    if hasattr(result, "raiseException"):
+        result.raiseException()
+    return result
+
+
+def per_call(function, number=200, repeat=3):
+    """
+    The best time, in microseconds, for one call to ``function``.
+    """
+    return min(timeit.repeat(function, number=number,
+                             repeat=repeat)) / number * 1e6
+
+
+def report(title, column, rows):
+    """
+    Print a table of ``(size, microseconds)`` rows.
+    """
+    print(title)
+    print("{0:>10}  {1:>12}".format(column, "usec/call"))
+    for size, usec in rows:
+        print("{0:>10}  {1:>12.1f}".format(size, usec))
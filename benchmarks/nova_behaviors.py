@@ -0,0 +1,60 @@
+"""
+Benchmark creating a server when many server creation behaviors are
+registered.
+
+Behaviors are indexed by the literal prefix of their criteria, so the time
+per request should depend on the number of behaviors which could plausibly
+match the server, not on the number registered.
+
+Run with::
+
+    python benchmarks/nova_behaviors.py
+"""
+
+from __future__ import print_function
+
+from harness import Mimic, per_call, report
+
+from mimic.rest.nova_api import NovaApi, NovaControlApi
+
+
+def populated(size):
+    """
+    A Mimic with ``size`` behaviors registered for servers with particular
+    names, and half as many for servers with particular metadata, none of
+    which match the servers the benchmark creates.
+    """
+    nova = NovaApi()
+    mimic = Mimic([nova, NovaControlApi(nova_api=nova)])
+    control = mimic.endpoint("cloudServersBehavior") + "/behaviors/creation/"
+    for n in range(size):
+        mimic.json("POST", control, {
+            "name": "fail",
+            "parameters": {"message": "Failure {0}".format(n), "code": 500},
+            "criteria": [{"server_name": "doomed-{0}$".format(n)}]})
+        if n % 2:
+            mimic.json("POST", control, {
+                "name": "error", "parameters": {},
+                "criteria": [{"metadata": {"chaos": "error-{0}".format(n)}}]})
+    return mimic
+
+
+def main():
+    """
+    Time creating a server, which no behavior matches, for each number of
+    registered behaviors.
+    """
+    rows = []
+    for size in (10, 100, 1000, 5000):
+        mimic = populated(size)
+        servers = mimic.endpoint("cloudServersOpenStack") + "/servers"
+        body = {"server": {"name": "healthy", "imageRef": "image",
+                           "flavorRef": "flavor",
+                           "metadata": {"chaos": "none"}}}
+        rows.append((size, per_call(
+            lambda: mimic.json("POST", servers, body))))
+    report("POST /servers", "behaviors", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark ``GET /servers/<server_id>`` and ``DELETE /servers/<server_id>``
+against collections of increasing size.
+
+Servers are looked up in an index keyed by server ID, so the time per
+request should stay flat as the collection grows.
+
+Run with::
+
+    python benchmarks/nova_get_server.py
+"""
+
+from __future__ import print_function
+
+from harness import Mimic, per_call, report
+
+from mimic.model.nova_objects import Server
+from mimic.rest.nova_api import NovaApi
+
+
+def populated(size):
+    """
+    A Mimic with a single tenant owning ``size`` servers.
+    """
+    nova = NovaApi()
+    mimic = Mimic([nova])
+    collection = (nova._get_session(mimic.core.sessions, mimic.tenant_id)
+                  .collection_for_region("ORD"))
+    for n in range(size):
+        Server.from_creation_request_json(collection, {
+            "server": {"name": "server-{0}".format(n),
+                       "imageRef": "image", "flavorRef": "flavor"}})
+    return mimic, collection
+
+
+def main():
+    """
+    Time a GET of the newest server, and a create followed by a delete, for
+    each collection size.
+    """
+    get_rows = []
+    delete_rows = []
+    for size in (100, 1000, 10000, 50000):
+        mimic, collection = populated(size)
+        base = mimic.endpoint("cloudServersOpenStack") + "/servers/"
+        newest = collection.servers.keys()[-1]
+        get_rows.append((size, per_call(
+            lambda: mimic.request("GET", base + newest))))
+
+        def create_and_delete():
+            server = Server.from_creation_request_json(collection, {
+                "server": {"name": "doomed", "imageRef": "image",
+                           "flavorRef": "flavor"}})
+            mimic.request("DELETE", base + server.server_id)
+        delete_rows.append((size, per_call(create_and_delete)))
+    report("GET /servers/<id>", "servers", get_rows)
+    report("create + DELETE /servers/<id>", "servers", delete_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Benchmark sweeping expired sessions when many sessions are live.
+
+Sessions are kept in a heap ordered by expiry time, so the time per sweep
+should depend on the number of sessions which have expired since the last
+sweep, not on the number of sessions.
+
+Run with::
+
+    python benchmarks/session_sweep.py
+"""
+
+from __future__ import print_function
+
+from twisted.internet.task import Clock
+
+from harness import per_call, report
+
+from mimic.session import SessionStore
+
+
+def main():
+    """
+    Time a sweep which finds no expired sessions, as most periodic sweeps
+    do, for each number of live sessions.
+    """
+    rows = []
+    for size in (100, 1000, 10000, 100000):
+        clock = Clock()
+        sessions = SessionStore(clock)
+        for n in range(size):
+            sessions.session_for_token("token-{0}".format(n))
+        clock.advance(3600)
+        rows.append((size, per_call(sessions.sweep_expired)))
+    report("sweep_expired", "sessions", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,11 @@
 """
 Canned response for get auth token
 """
+import json
 from datetime import datetime, timedelta
 
+from mimic.util.json_template import JSONTemplate, insert_member, slot
+
 
 GLOBAL_MUTABLE_AUTH_STORE = {}
 GLOBAL_MUTABLE_TOKEN_STORE = {}
@@ -57,10 +60,15 @@ def impersonator_user_role(id, name):
     }
 
 
+impersonator_user_role_template = JSONTemplate(
+    impersonator_user_role(slot("id"), slot("name")))
+
+
 def get_token(tenant_id,
               entry_generator=None,
               prefix_for_endpoint=None,
               timestamp=format_timestamp,
+              response_expires=None,
               response_token=HARD_CODED_TOKEN,
               response_user_id=HARD_CODED_USER_ID,
               response_user_name=HARD_CODED_USER_NAME,
@@ -71,36 +79,23 @@ def get_token(tenant_id,
 
     :param callable timestamp: A callable, like format_timestamp, which takes a
         datetime and returns a string.
+    :param datetime.datetime response_expires: When the token expires; by
+        default, a day from now.
     :param entry_generator: A callable, like canned_entries, which takes a
         datetime and returns an iterable of Entry.
 
     :return: a JSON-serializable dictionary matching the format of the JSON
              response for the identity ``/v2/tokens`` request.
     """
-    def entry_json():
-        for entry in entry_generator(tenant_id):
-            def endpoint_json():
-                for endpoint in entry.endpoints:
-                    yield {
-                        "region": endpoint.region,
-                        "tenantId": endpoint.tenant_id,
-                        "publicURL": endpoint.url_with_prefix(
-                            prefix_for_endpoint(endpoint)
-                        ),
-                    }
-            yield {
-                "name": entry.name,
-                "type": entry.type,
-                "endpoints": list(endpoint_json())
-            }
-
+    if response_expires is None:
+        response_expires = datetime.now() + timedelta(days=1)
     response = {
         "access": {
             "token": {
                 # TODO: This token should be synthesized and stored in an
                 # auth_store-style argument, alongside impersonation tokens.
                 "id": response_token,
-                "expires": timestamp(datetime.now() + timedelta(days=1)),
+                "expires": timestamp(response_expires),
                 "tenant": {
                     "id": tenant_id,
                     "name": tenant_id},
@@ -114,10 +109,51 @@ def get_token(tenant_id,
     }
 
     if entry_generator is not None and prefix_for_endpoint is not None:
-        response["access"]["serviceCatalog"] = list(entry_json())
+        response["access"]["serviceCatalog"] = service_catalog(
+            entry_generator(tenant_id), prefix_for_endpoint)
     return response
 
 
+def service_catalog(entries, prefix_for_endpoint):
+    """
+    The service catalog of a response to an authentication request.
+
+    :param entries: An iterable of :obj:`mimic.catalog.Entry`.
+    :param callable prefix_for_endpoint: A callable which returns the URI
+        prefix of a :obj:`mimic.catalog.Endpoint`.
+
+    :return: a JSON-serializable list.
+    """
+    return [{
+        "name": entry.name,
+        "type": entry.type,
+        "endpoints": [{
+            "region": endpoint.region,
+            "tenantId": endpoint.tenant_id,
+            "publicURL": endpoint.url_with_prefix(
+                prefix_for_endpoint(endpoint)
+            ),
+        } for endpoint in entry.endpoints]
+    } for entry in entries]
+
+
+def get_token_with_serialized_catalog(tenant_id, serialized_catalog,
+                                      **kwargs):
+    """
+    The JSON text of the response of :func:`get_token`, with a service
+    catalog which has already been serialized spliced into it, so that only
+    the small part of the response which differs between tokens has to be
+    serialized for each one.
+
+    :param str serialized_catalog: The JSON text of a service catalog, as
+        returned by :func:`service_catalog`.
+    :param kwargs: The other arguments of :func:`get_token`.
+    """
+    access = json.dumps(get_token(tenant_id, **kwargs)["access"])
+    return ('{"access": ' +
+            insert_member(access, "serviceCatalog", serialized_catalog) + '}')
+
+
 def get_endpoints(tenant_id, entry_generator, prefix_for_endpoint):
     """
     Canned response for Identity's get endpoints call.  This returns endpoints
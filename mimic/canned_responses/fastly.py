@@ -1,9 +1,9 @@
 """
 Canned response for fastly
 """
-import random
 import string
-import uuid
+
+from mimic.util.ids import allocator
 
 
 class FastlyResponse(object):
@@ -23,14 +23,17 @@ class FastlyResponse(object):
                  response for fastly_client.get_current_customer()
                  ("/current_customer") request.
         """
-        def _random_string():
-            random_string = u''.join(random.choice(
-                string.ascii_uppercase + string.ascii_uppercase)
-                for _ in range(20))
-            return random_string
-
-        id = _random_string()
-        owner_id = _random_string()
+        def _random_string(namespace):
+            # 20 capital letters, which can spell every 94-bit number
+            number = allocator.number(namespace, 94)
+            letters = []
+            for _ in range(20):
+                number, digit = divmod(number, 26)
+                letters.append(string.ascii_uppercase[digit])
+            return u''.join(letters)
+
+        id = _random_string("fastly_customer")
+        owner_id = _random_string("fastly_owner")
 
         current_customer = {
             u'can_edit_matches': u'0',
@@ -71,8 +74,8 @@ class FastlyResponse(object):
         """
         data = dict((key, value[0]) for key, value in url_data)
 
-        publish_key = uuid.uuid4().hex
-        service_id = uuid.uuid4().hex
+        publish_key = allocator.hex("fastly_publish_key", 32)
+        service_id = allocator.hex("fastly_service", 32)
         service_name = data['name']
 
         self.fastly_cache[service_name] = {
@@ -3,23 +3,97 @@
 Canned response for add/get/list/delete load balancers and
 add/get/delete/list nodes
 """
-from random import randrange
-from copy import deepcopy
+from mimic.model.clb_objects import LoadBalancer, Node
 from mimic.util.helper import (not_found_response, invalid_resource,
-                               set_resource_status, seconds_to_timestamp)
+                               seconds_to_timestamp)
+from mimic.util.ordered import OrderedIndex
 from twisted.python import log
 
 
 class Region_Tenant_CLBs(object):
     """
-    Object that stores a store of CLB and CLB Metadata info
+    Object that stores a store of CLB info
     """
-    def __init__(self):
+    def __init__(self, clock):
         """
-        There are two stores - the lb info, and the metadata info
+        ``lbs`` maps the ID of each load balancer to its
+        :obj:`LoadBalancer`, and the load balancers are also indexed by
+        tenant, in creation order.  The clock is used to schedule load
+        balancers' status changes, and ``transitions`` holds the pending
+        status change (a delayed call) for each load balancer that has one.
         """
         self.lbs = {}
-        self.meta = {}
+        self.clock = clock
+        self.transitions = {}
+        self._lbs_by_tenant = {}
+
+    def add_lb(self, lb):
+        """
+        Add a :obj:`LoadBalancer` to the store, replacing any other load
+        balancer with the same ID.
+        """
+        if lb.id in self.lbs:
+            self.remove_lb(lb.id)
+        self.lbs[lb.id] = lb
+        self._lbs_by_tenant.setdefault(lb.tenant_id, OrderedIndex()).add(
+            lb.id, lb)
+
+    def remove_lb(self, lb_id):
+        """
+        Remove the load balancer with the given ID from the store.
+        """
+        lb = self.lbs.pop(lb_id)
+        tenant_lbs = self._lbs_by_tenant[lb.tenant_id]
+        tenant_lbs.pop(lb_id)
+        if not tenant_lbs:
+            del self._lbs_by_tenant[lb.tenant_id]
+
+    def cancel_transitions(self):
+        """
+        Cancel every pending status change, such as when the session the
+        store belongs to is forgotten, so that the clock no longer refers to
+        the load balancers.
+        """
+        for delayed_call in self.transitions.values():
+            delayed_call.cancel()
+        self.transitions.clear()
+
+    def lbs_for_tenant(self, tenant_id):
+        """
+        Iterate over the load balancers owned by the given tenant, oldest
+        first.
+        """
+        return iter(self._lbs_by_tenant.get(tenant_id, ()))
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of the load balancers in this
+        store and the times their pending status changes are due, for a
+        snapshot; see :obj:`from_snapshot_json`.
+        """
+        lbs = []
+        for tenant_lbs in self._lbs_by_tenant.values():
+            lbs.extend(lb.snapshot_json() for lb in tenant_lbs)
+        return {"lbs": lbs,
+                "transitions": [[lb_id, delayed_call.getTime()]
+                                for lb_id, delayed_call
+                                in self.transitions.items()]}
+
+    @classmethod
+    def from_snapshot_json(cls, clock, snapshot_json):
+        """
+        Re-create a store from the result of :obj:`snapshot_json`, scheduling
+        each pending status change for when it was due, or immediately if
+        that time has already passed.
+        """
+        store = cls(clock)
+        for lb_json in snapshot_json["lbs"]:
+            store.add_lb(LoadBalancer.from_snapshot_json(lb_json))
+        for lb_id, due in snapshot_json["transitions"]:
+            _schedule_transition(store, lb_id,
+                                 max(0, due - clock.seconds()),
+                                 _next_status[store.lbs[lb_id].status])
+        return store
 
 
 def load_balancer_example(lb_info, lb_id, status,
@@ -27,85 +101,46 @@ def load_balancer_example(lb_info, lb_id, status,
     """
     Create load balancer response example
     """
-    lb_example = {"name": lb_info["name"],
-                  "id": lb_id,
-                  "protocol": lb_info["protocol"],
-                  "port": lb_info.get("port", 80),
-                  "algorithm": lb_info.get("algorithm") or "RANDOM",
-                  "status": status,
-                  "cluster": {"name": "test-cluster"},
-                  "timeout": lb_info.get("timeout", 30),
-                  "created": {"time": current_time},
-                  "virtualIps": [{"address": "127.0.0.1",
-                                 "id": 1111, "type": "PUBLIC", "ipVersion": "IPV4"},
-                                 {"address": "0000:0000:0000:0000:1111:111b:0000:0000",
-                                  "id": 1111,
-                                  "type": "PUBLIC",
-                                  "ipVersion": "IPV6"}],
-                  "sourceAddresses": {"ipv6Public": "0000:0001:0002::00/00",
-                                      "ipv4Servicenet": "127.0.0.1",
-                                      "ipv4Public": "127.0.0.1"},
-                  "httpsRedirect": lb_info.get("httpsRedirect", False),
-                  "updated": {"time": current_time},
-                  "halfClosed": lb_info.get("halfClosed", False),
-                  "connectionLogging": lb_info.get("connectionLogging", {"enabled": False}),
-                  "contentCaching": {"enabled": False}}
-    if lb_info.get("nodes"):
-        lb_example.update({"nodes": _format_nodes_on_lb(lb_info["nodes"])})
-    if lb_info.get("metadata"):
-        lb_example.update({"metadata": _format_meta(lb_info["metadata"])})
-    return lb_example
+    return LoadBalancer.from_json(None, lb_id, lb_info, status,
+                                  current_time).full_json()
 
 
 def add_load_balancer(tenant_id, store, lb_info, lb_id, current_timestamp):
     """
     Returns response of a newly created load balancer with
     response code 202, and adds the new lb to the store's lbs.
-    Note: ``store.lbs`` has tenant_id added as an extra key in comparison
-    to the lb_example.
     """
     status = "ACTIVE"
-
-    # Loadbalancers metadata is a list object, creating a metadata store
-    # so we dont have to deal with the list
-    meta = {}
-    if "metadata" in lb_info:
-        for each in lb_info["metadata"]:
-            meta.update({each["key"]: each["value"]})
-    store.meta[lb_id] = meta
-    log.msg(store.meta)
-
-    if "lb_building" in store.meta[lb_id]:
-        status = "BUILD"
-
-    # Add tenant_id and nodeCount to store.lbs
     current_timestring = seconds_to_timestamp(current_timestamp)
-    store.lbs[lb_id] = load_balancer_example(lb_info, lb_id, status,
-                                             current_timestring)
-    store.lbs[lb_id].update({"tenant_id": tenant_id})
-    store.lbs[lb_id].update(
-        {"nodeCount": len(store.lbs[lb_id].get("nodes", []))})
+    try:
+        lb = LoadBalancer.from_json(tenant_id, lb_id, lb_info, status,
+                                    current_timestring)
+    except ValueError as e:
+        return invalid_resource(str(e), 400), 400
+    log.msg(lb.meta)
 
-    # and remove before returning response for add lb
-    new_lb = _lb_without_tenant(store, lb_id)
+    if "lb_building" in lb.meta:
+        lb.status = "BUILD"
 
-    return {'loadBalancer': new_lb}, 202
+    _cancel_transition(store, lb_id)
+    store.add_lb(lb)
+    if lb.status == "BUILD":
+        _schedule_transition(store, lb_id, lb.meta["lb_building"], "ACTIVE")
 
+    return {'loadBalancer': lb.full_json()}, 202
 
-def get_load_balancers(store, lb_id, current_timestamp):
+
+def get_load_balancers(store, lb_id):
     """
     Returns the load balancers with the given lb id, with response
     code 200. If no load balancers are found returns 404.
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-        log.msg(store.lbs[lb_id]["status"])
-        new_lb = _lb_without_tenant(store, lb_id)
-        return {'loadBalancer': new_lb}, 200
+        return {'loadBalancer': store.lbs[lb_id].full_json()}, 200
     return not_found_response("loadbalancer"), 404
 
 
-def del_load_balancer(store, lb_id, current_timestamp):
+def del_load_balancer(store, lb_id):
     """
     Returns response for a load balancer that is in building status for 20
     seconds and response code 202, and adds the new lb to ``store.lbs``.
@@ -113,27 +148,24 @@ def del_load_balancer(store, lb_id, current_timestamp):
     status until a nightly job(maybe?)
     """
     if lb_id in store.lbs:
+        lb = store.lbs[lb_id]
 
-        if store.lbs[lb_id]["status"] == "PENDING-DELETE":
+        if lb.status == "PENDING-DELETE":
             msg = ("Must provide valid load balancers: {0} are immutable and "
                    "could not be processed.".format(lb_id))
             # Dont doubt this to be 422, it is 400!
             return invalid_resource(msg, 400), 400
 
-        _verify_and_update_lb_state(store, lb_id, True, current_timestamp)
+        _lb_updated(store, lb_id)
 
-        if any([store.lbs[lb_id]["status"] == "ACTIVE",
-                store.lbs[lb_id]["status"] == "ERROR",
-                store.lbs[lb_id]["status"] == "PENDING-UPDATE"]):
-            del store.lbs[lb_id]
+        if lb.status in ("ACTIVE", "ERROR", "PENDING-UPDATE"):
+            _remove_lb(store, lb_id)
             return b'', 202
 
-        if store.lbs[lb_id]["status"] == "PENDING-DELETE":
+        if lb.status == "PENDING-DELETE":
             return b'', 202
 
-        if store.lbs[lb_id]["status"] == "DELETED":
-            _verify_and_update_lb_state(store, lb_id,
-                                        current_timestamp=current_timestamp)
+        if lb.status == "DELETED":
             msg = "Must provide valid load balancers: {0} could not be found.".format(lb_id)
             # Dont doubt this to be 422, it is 400!
             return invalid_resource(msg, 400), 400
@@ -141,240 +173,184 @@ def del_load_balancer(store, lb_id, current_timestamp):
     return not_found_response("loadbalancer"), 404
 
 
-def list_load_balancers(tenant_id, store, current_timestamp):
+def list_load_balancers(tenant_id, store):
     """
     Returns the list of load balancers with the given tenant id with response
     code 200. If no load balancers are found returns empty list.
     """
-    response = dict(
-        (k, v) for (k, v) in store.lbs.items()
-        if tenant_id == v['tenant_id']
-    )
-    for each in response:
-        _verify_and_update_lb_state(store, each, False, current_timestamp)
-        log.msg(store.lbs[each]["status"])
-    updated_resp = dict(
-        (k, v) for (k, v) in store.lbs.items()
-        if tenant_id == v['tenant_id']
-    )
-    return {'loadBalancers': _prep_for_list(updated_resp.values()) or []}, 200
-
-
-def add_node(store, node_list, lb_id, current_timestamp):
+    return {'loadBalancers': [lb.short_json()
+                              for lb in store.lbs_for_tenant(tenant_id)]}, 200
+
+
+def add_node(store, node_list, lb_id):
     """
     Returns the canned response for add nodes
     """
     if lb_id in store.lbs:
+        lb = store.lbs[lb_id]
 
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-
-        if store.lbs[lb_id]["status"] != "ACTIVE":
+        if lb.status != "ACTIVE":
             resource = invalid_resource(
                 "Load Balancer '{0}' has a status of {1} and is considered "
-                "immutable.".format(lb_id, store.lbs[lb_id]["status"]), 422)
+                "immutable.".format(lb_id, lb.status), 422)
             return (resource, 422)
 
-        nodes = _format_nodes_on_lb(node_list)
+        nodes = [Node.from_json(each) for each in node_list]
 
-        if store.lbs[lb_id].get("nodes"):
-            for existing_node in store.lbs[lb_id]["nodes"]:
-                for new_node in node_list:
-                    if (existing_node["address"] == new_node["address"] and
-                            existing_node["port"] == new_node["port"]):
-                        resource = invalid_resource(
-                            "Duplicate nodes detected. One or more nodes "
-                            "already configured on load balancer.", 413)
-                        return (resource, 413)
+        if lb.nodes:
+            if any(lb.has_node_at(node.address, node.port) for node in nodes):
+                resource = invalid_resource(
+                    "Duplicate nodes detected. One or more nodes "
+                    "already configured on load balancer.", 413)
+                return (resource, 413)
 
-            store.lbs[lb_id]["nodes"] = store.lbs[lb_id]["nodes"] + nodes
+            lb.add_nodes(nodes)
         else:
-            store.lbs[lb_id]["nodes"] = nodes
-            store.lbs[lb_id]["nodeCount"] = len(store.lbs[lb_id]["nodes"])
-            _verify_and_update_lb_state(store, lb_id,
-                                        current_timestamp=current_timestamp)
-        return {"nodes": nodes}, 200
+            lb.add_nodes(nodes)
+            _lb_updated(store, lb_id)
+        return {"nodes": [node.as_json() for node in nodes]}, 200
 
     return not_found_response("loadbalancer"), 404
 
 
-def get_nodes(store, lb_id, node_id, current_timestamp):
+def get_nodes(store, lb_id, node_id):
     """
     Returns the node on the load balancer
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
+        lb = store.lbs[lb_id]
 
-        if store.lbs[lb_id]["status"] == "DELETED":
+        if lb.status == "DELETED":
             return (
                 invalid_resource(
                     "The loadbalancer is marked as deleted.", 410),
                 410)
 
-        if store.lbs[lb_id].get("nodes"):
-            for each in store.lbs[lb_id]["nodes"]:
-                if node_id == each["id"]:
-                    return {"node": each}, 200
+        if node_id in lb.nodes:
+            return {"node": lb.nodes[node_id].as_json()}, 200
         return not_found_response("node"), 404
 
     return not_found_response("loadbalancer"), 404
 
 
-def delete_node(store, lb_id, node_id, current_timestamp):
+def delete_node(store, lb_id, node_id):
     """
     Determines whether the node to be deleted exists in mimic store and
     returns the response code.
     """
     if lb_id in store.lbs:
+        lb = store.lbs[lb_id]
 
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-
-        if store.lbs[lb_id]["status"] != "ACTIVE":
+        if lb.status != "ACTIVE":
             resource = invalid_resource(
                 "Load Balancer '{0}' has a status of {1} and is considered "
-                "immutable.".format(lb_id, store.lbs[lb_id]["status"]), 422)
+                "immutable.".format(lb_id, lb.status), 422)
             return (resource, 422)
 
-        _verify_and_update_lb_state(store, lb_id,
-                                    current_timestamp=current_timestamp)
+        _lb_updated(store, lb_id)
 
-        if store.lbs[lb_id].get("nodes"):
-            for each in store.lbs[lb_id]["nodes"]:
-                if each["id"] == node_id:
-                    index = store.lbs[lb_id]["nodes"].index(each)
-                    del store.lbs[lb_id]["nodes"][index]
-                    if not store.lbs[lb_id]["nodes"]:
-                        del store.lbs[lb_id]["nodes"]
-                    store.lbs[lb_id].update({"nodeCount": len(store.lbs[lb_id].get("nodes", []))})
-                    return None, 202
+        if lb.remove_node(node_id) is not None:
+            return None, 202
 
         return not_found_response("node"), 404
 
     return not_found_response("loadbalancer"), 404
 
 
-def list_nodes(store, lb_id, current_timestamp):
+def list_nodes(store, lb_id):
     """
     Returns the list of nodes remaining on the load balancer
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-        if lb_id not in store.lbs:
-            return not_found_response("loadbalancer"), 404
-
-        if store.lbs[lb_id]["status"] == "DELETED":
+        lb = store.lbs[lb_id]
+        if lb.status == "DELETED":
             return invalid_resource("The loadbalancer is marked as deleted.", 410), 410
-        node_list = []
-        if store.lbs[lb_id].get("nodes"):
-            node_list = store.lbs[lb_id]["nodes"]
-        return {"nodes": node_list}, 200
+        return {"nodes": [node.as_json() for node in lb.nodes]}, 200
     else:
         return not_found_response("loadbalancer"), 404
 
 
-def _format_nodes_on_lb(node_list):
+_next_status = {
+    # mapping of the status of a load balancer with a pending status change
+    # to the status it changes to; None means it is removed
+    "BUILD": "ACTIVE",
+    "PENDING-UPDATE": "ACTIVE",
+    "PENDING-DELETE": "DELETED",
+    "DELETED": None,
+}
+
+
+def _set_lb_status(store, lb_id, status):
     """
-    create a dict of nodes given the list of nodes
+    Put the load balancer into the given status now, and schedule the status
+    change that follows from it, if any, according to its metadata:
+    PENDING-UPDATE lasts for ``lb_pending_update`` seconds before the load
+    balancer is ACTIVE again, PENDING-DELETE lasts for ``lb_pending_delete``
+    seconds before it is DELETED (each 10 by default), and a DELETED load balancer
+    is removed altogether an hour later.
     """
-    nodes = []
-    for each in node_list:
-        node = {}
-        node["address"] = each["address"]
-        node["condition"] = each["condition"]
-        node["port"] = each["port"]
-        if each.get("weight"):
-            node["weight"] = each["weight"]
-        if each.get("type"):
-            node["type"] = each["type"]
-        node["id"] = randrange(999999)
-        node["status"] = "ONLINE"
-        nodes.append(node)
-    return nodes
-
-
-def _format_meta(metadata_list):
+    lb = store.lbs[lb_id]
+    lb.status = status
+    lb.updated = seconds_to_timestamp(store.clock.seconds())
+    if status == "PENDING-UPDATE":
+        _schedule_transition(store, lb_id, lb.meta["lb_pending_update"],
+                             "ACTIVE")
+    elif status == "PENDING-DELETE":
+        _schedule_transition(store, lb_id, lb.meta["lb_pending_delete"],
+                             "DELETED")
+    elif status == "DELETED":
+        _schedule_transition(store, lb_id, 3600, None)
+
+
+def _schedule_transition(store, lb_id, seconds, status):
     """
-    creates metadata with 'id' as a key
+    After the given number of seconds on the store's clock, put the load
+    balancer into the given status, or remove it if the status is ``None``.
+    Replaces any status change already scheduled for the load balancer.
     """
-    meta = []
-    for each in metadata_list:
-        each.update({"id": randrange(999)})
-        meta.append(each)
-    return meta
+    def transition():
+        del store.transitions[lb_id]
+        if status is None:
+            _remove_lb(store, lb_id)
+        else:
+            _set_lb_status(store, lb_id, status)
+
+    _cancel_transition(store, lb_id)
+    store.transitions[lb_id] = store.clock.callLater(seconds, transition)
 
 
-def _lb_without_tenant(store, lb_id):
+def _cancel_transition(store, lb_id):
     """
-    returns a copy of the store for the given lb_id, without
-    tenant_id
+    Cancel the status change scheduled for the load balancer, if any.
     """
-    new_lb = deepcopy(store.lbs[lb_id])
-    del new_lb["tenant_id"]
-    del new_lb["nodeCount"]
-    return new_lb
+    delayed_call = store.transitions.pop(lb_id, None)
+    if delayed_call is not None:
+        delayed_call.cancel()
 
 
-def _prep_for_list(lb_list):
+def _remove_lb(store, lb_id):
     """
-    Removes tenant id and changes the nodes list to 'nodeCount' set to the
-    number of node on the LB
+    Remove the load balancer and its scheduled status change from the store.
     """
-    entries_to_keep = ('name', 'protocol', 'id', 'port', 'algorithm', 'status', 'timeout',
-                       'created', 'virtualIps', 'updated', 'nodeCount')
-    filtered_lb_list = []
-    for each in lb_list:
-        filtered_lb_list.append(dict((entry, each[entry]) for entry in entries_to_keep))
-    return filtered_lb_list
+    _cancel_transition(store, lb_id)
+    store.remove_lb(lb_id)
 
 
-def _verify_and_update_lb_state(store, lb_id, set_state=True,
-                                current_timestamp=None):
+def _lb_updated(store, lb_id):
     """
-    Based on the current state, the metadata on the lb and the time since the LB has
-    been in that state, set the appropriate state in store.lbs
+    Record that the load balancer has been changed by a client.  If it is
+    ACTIVE and its metadata asks for it, it goes into PENDING-UPDATE,
+    PENDING-DELETE or ERROR status.
     Note: Reconsider if update metadata is implemented
     """
-    current_timestring = seconds_to_timestamp(current_timestamp)
-    if store.lbs[lb_id]["status"] == "BUILD":
-        store.meta[lb_id]["lb_building"] = store.meta[lb_id]["lb_building"] or 10
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"],
-            store.meta[lb_id]["lb_building"],
-            current_timestamp=current_timestamp
-        ) or "BUILD"
-
-    elif store.lbs[lb_id]["status"] == "ACTIVE" and set_state:
-        if "lb_pending_update" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "PENDING-UPDATE"
-            log.msg("here")
-            log.msg(store.lbs[lb_id]["status"])
-        if "lb_pending_delete" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "PENDING-DELETE"
-        if "lb_error_state" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "ERROR"
-        store.lbs[lb_id]["updated"]["time"] = current_timestring
-
-    elif store.lbs[lb_id]["status"] == "PENDING-UPDATE":
-        if "lb_pending_update" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = set_resource_status(
-                store.lbs[lb_id]["updated"]["time"],
-                store.meta[lb_id]["lb_pending_update"],
-                current_timestamp=current_timestamp
-            ) or "PENDING-UPDATE"
-
-    elif store.lbs[lb_id]["status"] == "PENDING-DELETE":
-        store.meta[lb_id]["lb_pending_delete"] = store.meta[lb_id]["lb_pending_delete"] or 10
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"],
-            store.meta[lb_id]["lb_pending_delete"], "DELETED",
-            current_timestamp=current_timestamp
-        ) or "PENDING-DELETE"
-        store.lbs[lb_id]["updated"]["time"] = current_timestring
-
-    elif store.lbs[lb_id]["status"] == "DELETED":
-        # see del_load_balancer above for an explanation of this state change.
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"], 3600, "DELETING-NOW",
-            current_timestamp=current_timestamp
-        ) or "DELETED"
-        if store.lbs[lb_id]["status"] == "DELETING-NOW":
-            del store.lbs[lb_id]
+    lb = store.lbs[lb_id]
+    if lb.status != "ACTIVE":
+        return
+    status = "ACTIVE"
+    if "lb_pending_update" in lb.meta:
+        status = "PENDING-UPDATE"
+    if "lb_pending_delete" in lb.meta:
+        status = "PENDING-DELETE"
+    if "lb_error_state" in lb.meta:
+        status = "ERROR"
+    _set_lb_status(store, lb_id, status)
@@ -2,6 +2,8 @@
 Canned response for monitoring json home
 """
 
+from mimic.util.json_template import JSONTemplate, slot
+
 
 def json_home(url):
     """
@@ -1145,3 +1147,8 @@ def json_home(url):
             }
         }
     }
+
+
+# The document is large, so it is serialized only once, with a slot for the
+# URL.
+json_home_template = JSONTemplate(json_home(slot("url")))
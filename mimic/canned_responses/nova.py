@@ -10,56 +10,75 @@ contains only those responses for which no live / dynamic / stateful responses
 can be generated, and are therefore not really fully implemented.
 """
 
+from json import dumps
+
 from mimic.canned_responses.mimic_presets import get_presets
 from mimic.util.helper import not_found_response
+from mimic.util.json_template import JSONTemplate, slot
+
+_image = JSONTemplate(
+    {'image': {'status': 'ACTIVE', 'id': slot('image_id'),
+               'name': 'mimic-test-image'}})
+
+_image_not_found = dumps(not_found_response('images'))
+
+_flavor = JSONTemplate(
+    {'flavor': {'id': slot('flavor_id'), 'name': 'mimic-test-flavor'}})
+
+_flavor_not_found = dumps(not_found_response('flavors'))
+
+_limits = dumps(
+    {"limits":
+     {"absolute": {"maxServerMeta": 40,
+                   "maxPersonality": 5,
+                   "totalPrivateNetworksUsed": 0,
+                   "maxImageMeta": 40,
+                   "maxPersonalitySize": 1000,
+                   "maxSecurityGroupRules": -1,
+                   "maxTotalKeypairs": 100,
+                   "totalCoresUsed": 5,
+                   "totalRAMUsed": 2560,
+                   "totalInstancesUsed": 5,
+                   "maxSecurityGroups": -1,
+                   "totalFloatingIpsUsed": 0,
+                   "maxTotalCores": -1,
+                   "totalSecurityGroupsUsed": 0,
+                   "maxTotalPrivateNetworks": 3,
+                   "maxTotalFloatingIps": -1,
+                   "maxTotalInstances": 200,
+                   "maxTotalRAMSize": 256000}}})
 
 
 def get_image(image_id):
     """
     Canned response for get image.  The image id provided is substituted in the
     response, if not one of the invalid image ids specified in mimic_presets.
+
+    :return: a 2-tuple of the JSON text of the response and its response code.
     """
     if (
             image_id in get_presets['servers']['invalid_image_ref'] or
             image_id.endswith('Z')
     ):
-        return not_found_response('images'), 404
-    return {'image': {'status': 'ACTIVE', 'id': image_id, 'name': 'mimic-test-image'}}, 200
+        return _image_not_found, 404
+    return _image.render(image_id=image_id), 200
 
 
 def get_flavor(flavor_id):
     """
     Canned response for get flavor.
     The flavor id provided is substituted in the response
+
+    :return: a 2-tuple of the JSON text of the response and its response code.
     """
     if flavor_id in get_presets['servers']['invalid_flavor_ref']:
-        return not_found_response('flavors'), 404
-    return ({'flavor': {'name': '512MB Standard Instance',
-                        'id': flavor_id,
-                        'name': 'mimic-test-flavor'}},
-            200)
+        return _flavor_not_found, 404
+    return _flavor.render(flavor_id=flavor_id), 200
 
 
 def get_limit():
     """
-    Canned response for limits for servers. Returns only the absolute limits
+    Canned response for limits for servers. Returns only the absolute limits,
+    as JSON text.
     """
-    return {"limits":
-            {"absolute": {"maxServerMeta": 40,
-                          "maxPersonality": 5,
-                          "totalPrivateNetworksUsed": 0,
-                          "maxImageMeta": 40,
-                          "maxPersonalitySize": 1000,
-                          "maxSecurityGroupRules": -1,
-                          "maxTotalKeypairs": 100,
-                          "totalCoresUsed": 5,
-                          "totalRAMUsed": 2560,
-                          "totalInstancesUsed": 5,
-                          "maxSecurityGroups": -1,
-                          "totalFloatingIpsUsed": 0,
-                          "maxTotalCores": -1,
-                          "totalSecurityGroupsUsed": 0,
-                          "maxTotalPrivateNetworks": 3,
-                          "maxTotalFloatingIps": -1,
-                          "maxTotalInstances": 200,
-                          "maxTotalRAMSize": 256000}}}
+    return _limits
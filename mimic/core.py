@@ -6,13 +6,19 @@ Service catalog hub and integration for Mimic application objects.
 
 from __future__ import unicode_literals
 
+import json
+from hashlib import sha1
+
+from six import text_type
+
 from twisted.python.urlpath import URLPath
 from twisted.plugin import getPlugins
 from mimic import plugins
 
+from mimic.canned_responses.auth import service_catalog
 from mimic.imimic import IAPIMock
 from mimic.session import SessionStore
-from mimic.util.helper import random_hex_generator
+from mimic.util.cache import LRUCache
 
 
 class MimicCore(object):
@@ -21,7 +27,8 @@ class MimicCore(object):
     mocks.
     """
 
-    def __init__(self, clock, apis):
+    def __init__(self, clock, apis, resource_cache_size=1024,
+                 catalog_cache_size=4096):
         """
         Create a MimicCore with an IReactorTime to do any time-based scheduling
         against.
@@ -32,14 +39,30 @@ class MimicCore(object):
 
         :param apis: an iterable of all :obj:`IAPIMock`s that this MimicCore
             will expose.
+
+        :param int resource_cache_size: the maximum number of per-region
+            service resources to keep around, so that differing ``Host``
+            headers cannot grow the cache without bound.
+
+        :param int catalog_cache_size: the maximum number of serialized
+            service catalogs (one for each tenant and base URI) to keep
+            around; see :obj:`TenantCatalog.serialized`.
         """
         self._uuid_to_api = {}
         self.sessions = SessionStore(clock)
+        self.resource_cache = LRUCache(resource_cache_size)
+        self.catalog_cache = LRUCache(catalog_cache_size)
+        self.sessions.catalog_factory = self.catalog_for_tenant
 
         for api in apis:
-            this_api_id = ((api.__class__.__name__) + '-' +
-                           random_hex_generator(3))
-            self._uuid_to_api[this_api_id] = api
+            name = api.__class__.__name__
+            # The same APIs get the same IDs each time mimic runs, so that
+            # the service catalogs of several worker processes agree.
+            same_name = len([existing for existing in self._uuid_to_api
+                             if existing.startswith(name + '-')])
+            suffix = sha1((name + '-' + text_type(same_name))
+                          .encode('utf-8')).hexdigest()[:6]
+            self._uuid_to_api[name + '-' + suffix] = api
 
     @classmethod
     def fromPlugins(cls, clock):
@@ -48,6 +71,19 @@ class MimicCore(object):
         """
         return cls(clock, list(getPlugins(IAPIMock, plugins)))
 
+    def apis(self):
+        """
+        All the :obj:`IAPIMock`s that this :obj:`MimicCore` exposes.
+        """
+        return list(self._uuid_to_api.values())
+
+    def api_for_service(self, service_id):
+        """
+        The :obj:`IAPIMock` with the given mimic internal service ID, or
+        ``None`` if there is none.
+        """
+        return self._uuid_to_api.get(service_id)
+
     def service_with_region(self, region_name, service_id, base_uri):
         """
         Given the name of a region and a mimic internal service ID, get a
@@ -60,15 +96,20 @@ class MimicCore(object):
         :param str base_uri: the base uri to use instead of the default -
             most likely comes from a request URI
 
-        :return: A resource.
+        :return: A resource.  Resources are cached by region, service ID and
+            base URI, since every request beneath a region would otherwise
+            build an identical one.
         :rtype: :obj:`twisted.web.iweb.IResource`
         """
         if service_id in self._uuid_to_api:
             api = self._uuid_to_api[service_id]
-            return api.resource_for_region(
-                region_name,
-                self.uri_for_service(region_name, service_id, base_uri),
-                self.sessions,
+            return self.resource_cache.get_or_create(
+                (service_id, region_name, base_uri),
+                lambda: api.resource_for_region(
+                    region_name,
+                    self.uri_for_service(region_name, service_id, base_uri),
+                    self.sessions,
+                )
             )
 
     def uri_for_service(self, region, service_id, base_uri):
@@ -116,3 +157,61 @@ class MimicCore(object):
                         endpoint.region, service_id, base_uri
                     )
                 yield entry
+
+    def catalog_for_tenant(self, tenant_id):
+        """
+        Build the :obj:`TenantCatalog` of the given tenant.
+
+        Each session's catalog is built once, when the session is created
+        (see :obj:`mimic.session.Session.catalog`), so a tenant's endpoints
+        keep the same IDs for as long as mimic keeps the tenant.
+        """
+        return TenantCatalog(self, tenant_id)
+
+
+class TenantCatalog(object):
+    """
+    The service catalog of one tenant.
+
+    :ivar list entries: The tenant's :obj:`mimic.catalog.Entry` objects, from
+        every plugin.
+    """
+
+    def __init__(self, core, tenant_id):
+        """
+        Ask every plugin of a :obj:`MimicCore` for its catalog entries for the
+        given tenant.
+        """
+        self._core = core
+        self._service_ids = {}
+        self.entries = []
+        for service_id, api in core._uuid_to_api.items():
+            for entry in api.catalog_entries(tenant_id):
+                for endpoint in entry.endpoints:
+                    self._service_ids[endpoint] = service_id
+                self.entries.append(entry)
+
+    def prefix_map(self, base_uri):
+        """
+        A mapping of each of the tenant's endpoints to its URI prefix (see
+        :obj:`MimicCore.uri_for_service`) under the given base URI.
+        """
+        return dict([
+            (endpoint, self._core.uri_for_service(endpoint.region,
+                                                  service_id, base_uri))
+            for endpoint, service_id in self._service_ids.items()])
+
+    def serialized(self, base_uri):
+        """
+        The JSON text of the service catalog of a token response (see
+        :obj:`mimic.canned_responses.auth.service_catalog`) under the given
+        base URI.
+
+        The text is cached in the core's ``catalog_cache``, since rendering it
+        is the bulk of the work of authenticating, and clients authenticate
+        often; the cache is bounded, so that many tenants or differing
+        ``Host`` headers cannot grow it without bound.
+        """
+        return self._core.catalog_cache.get_or_create(
+            (self, base_uri), lambda: json.dumps(
+                service_catalog(self.entries, self.prefix_map(base_uri).get)))
@@ -0,0 +1,161 @@
+# -*- test-case-name: mimic.test.test_fixtures -*-
+
+"""
+Load objects into mimic in bulk from a fixtures document, rather than
+creating them one request at a time through the REST APIs.
+
+A fixtures document is JSON lines: each line is a record of one object to
+create, of the form::
+
+    {"kind": <kind>, "tenant_id": <tenant ID>, ...}
+
+A record of kind ``"tenant"`` creates a session for the tenant, with the
+optional ``"username"`` and ``"token"`` it gives; records of the other kinds
+are loaded by the API mocks which provide :obj:`IAPIMockFixtures` (see their
+``load_fixture`` methods for the rest of the fields of each kind), creating
+the tenant's session if need be.  Objects can refer to objects earlier in the
+document, such as the nodes of a load balancer, by the IDs given for them.
+
+Records are loaded in chunks, and the reactor is given the chance to serve
+other requests between chunks, so that a large document does not make mimic
+unresponsive while it loads.
+"""
+
+import json
+
+from characteristic import attributes
+from twisted.internet.defer import Deferred
+
+from mimic.imimic import IAPIMockFixtures
+from mimic.session import NonMatchingTenantError
+
+CHUNK_SIZE = 500
+
+
+@attributes(["line", "message", "loaded"])
+class FixtureError(Exception):
+    """
+    A fixture record could not be loaded.
+
+    :ivar int line: The line number of the record, from 1.
+    :ivar str message: Why it could not be loaded.
+    :ivar dict loaded: The number of records of each kind loaded before it.
+    """
+
+
+def _fixture_apis(core):
+    """
+    The API mocks of a :obj:`MimicCore` which load fixtures.
+
+    :return: a ``dict`` mapping each kind of record to the API which loads
+        it.
+    """
+    apis = {}
+    for api in core.apis():
+        if IAPIMockFixtures.providedBy(api):
+            for kind in api.fixture_kinds:
+                apis.setdefault(kind, api)
+    return apis
+
+
+def _load_tenant(sessions, record):
+    """
+    Create a session from a record of kind ``"tenant"``.
+    """
+    if record.get("username") is not None:
+        sessions.session_for_username_password(
+            record["username"], None, record["tenant_id"])
+    else:
+        sessions.session_for_tenant_id(record["tenant_id"],
+                                       record.get("token"))
+
+
+def _load_record(core, apis, record):
+    """
+    Load one fixture record into a :obj:`MimicCore`.
+
+    :return: ``True`` if the record was loaded, or ``False`` if it belongs to
+        a tenant which is not this mimic's (because it is one worker of
+        several; see :obj:`mimic.workers`).
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    sessions = core.sessions
+    kind = record.get("kind")
+    if kind != "tenant" and kind not in apis:
+        raise ValueError("unknown kind of fixture: {0!r}".format(kind))
+    tenant_id = record["tenant_id"]
+    if kind != "tenant":
+        tenant_id = apis[kind].fixture_tenant_id(tenant_id)
+    if sessions.id_filter is not None and not sessions.id_filter(tenant_id):
+        return False
+    if kind == "tenant":
+        _load_tenant(sessions, record)
+    else:
+        session = sessions.session_for_tenant_id(tenant_id)
+        apis[kind].load_fixture(session, record, sessions.clock)
+    return True
+
+
+def load(core, lines, chunk_size=CHUNK_SIZE, reactor=None):
+    """
+    Load a fixtures document into a :obj:`MimicCore`.
+
+    The first chunk of records is loaded straight away, and each other
+    chunk in a later iteration of the reactor.  If a record cannot be
+    loaded, loading stops there; the records before it stay loaded.
+
+    :param lines: an iterable of the lines of the document, such as a file;
+        blank lines are ignored.
+    :param int chunk_size: The number of records to load at a time.
+    :param reactor: The :obj:`twisted.internet.interfaces.IReactorTime` with
+        which to schedule the chunks; by default, the global reactor.
+
+    :return: a :obj:`Deferred` which fires with a ``dict`` of the number of
+        records of each kind loaded (and of ``"skipped"`` records, which
+        belong to another worker), or fails with :obj:`FixtureError`.
+    """
+    if reactor is None:
+        from twisted.internet import reactor
+    apis = _fixture_apis(core)
+    numbered = enumerate(lines, 1)
+    loaded = {}
+    d = Deferred()
+
+    def load_chunk():
+        count = 0
+        for line_number, line in numbered:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line.decode("utf-8")
+                                    if isinstance(line, bytes) else line)
+                kind = (record["kind"]
+                        if _load_record(core, apis, record) else "skipped")
+            except (KeyError, ValueError, TypeError,
+                    NonMatchingTenantError) as e:
+                d.errback(FixtureError(line=line_number,
+                                       message=_describe(e),
+                                       loaded=loaded))
+                return
+            loaded[kind] = loaded.get(kind, 0) + 1
+            count += 1
+            if count == chunk_size:
+                reactor.callLater(0, load_chunk)
+                return
+        d.callback(loaded)
+
+    load_chunk()
+    return d
+
+
+def _describe(error):
+    """
+    Describe why a record could not be loaded.
+    """
+    if isinstance(error, KeyError):
+        return "missing {0}".format(error)
+    if isinstance(error, NonMatchingTenantError):
+        return "user {0} belongs to tenant {1}".format(
+            error.session.username, error.session.tenant_id)
+    return str(error)
@@ -2,7 +2,7 @@
 Interfaces for Mimic.
 """
 
-from zope.interface import Interface
+from zope.interface import Attribute, Interface
 
 
 class IAPIMock(Interface):
@@ -23,3 +23,82 @@ class IAPIMock(Interface):
         """
         Get a resource for the given region.
         """
+
+
+class IAPIMockSnapshot(Interface):
+    """
+    An :obj:`IAPIMock` whose per-session data can be saved in a snapshot of
+    mimic's state, and restored from one.  See :obj:`mimic.snapshot`.
+    """
+
+    def dump_session_data(data, blobs):  # pragma:nocover
+        """
+        Get a JSON-serializable representation of the data this API keeps in
+        one session (as created by the factory it passes to
+        :obj:`mimic.session.Session.data_for_api`).
+
+        :param blobs: a :obj:`mimic.snapshot.BlobStore` in which to store
+            large binary payloads.
+        """
+
+    def load_session_data(dumped, blobs, clock):  # pragma:nocover
+        """
+        Re-create the data this API keeps in one session from the result of
+        :obj:`dump_session_data`.
+
+        :param blobs: the :obj:`mimic.snapshot.BlobStore` the payloads were
+            stored in.
+        :param clock: the :obj:`twisted.internet.interfaces.IReactorTime`
+            which the data should use to schedule things.
+        """
+
+
+class IAPIMockRelease(Interface):
+    """
+    An :obj:`IAPIMock` whose per-session data holds on to things outside the
+    session, such as calls scheduled on the clock, which must be let go of
+    when the session is forgotten.  See :obj:`mimic.session.SessionStore`.
+    """
+
+    def release_session_data(data):  # pragma:nocover
+        """
+        Let go of whatever the data this API keeps in one session holds on
+        to, such as by cancelling its scheduled calls, once the session has
+        been forgotten.
+        """
+
+
+class IAPIMockFixtures(Interface):
+    """
+    An :obj:`IAPIMock` whose objects can be created in bulk from a fixtures
+    document, rather than one by one through its REST API.  See
+    :obj:`mimic.fixtures`.
+    """
+
+    fixture_kinds = Attribute(
+        """
+        The ``"kind"``s of fixture record that this API loads.
+        """)
+
+    def fixture_tenant_id(tenant_id):  # pragma:nocover
+        """
+        The tenant ID of the session in which this API keeps the data of the
+        given tenant (which is not necessarily the same tenant ID, if this
+        API translates it).
+        """
+
+    def load_fixture(session, fixture, clock):  # pragma:nocover
+        """
+        Create the object described by one fixture record in the data this
+        API keeps in the given session.
+
+        :param session: the :obj:`mimic.session.Session` of the tenant given
+            by :obj:`fixture_tenant_id`.
+        :param dict fixture: the record; its ``"kind"`` is one of
+            :obj:`fixture_kinds`.
+        :param clock: the :obj:`twisted.internet.interfaces.IReactorTime`
+            which the data should use to schedule things.
+
+        :raise: :obj:`KeyError`, :obj:`ValueError` or :obj:`TypeError` if the
+            record does not describe a valid object.
+        """
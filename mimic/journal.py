@@ -0,0 +1,348 @@
+# -*- test-case-name: mimic.test.test_journal -*-
+
+"""
+An append-only journal of the changes made to mimic's state through its
+APIs, so that a mimic which stops unexpectedly can be brought back to where
+it was.
+
+The journal is a file of JSON lines.  Each line is a record of the form::
+
+    {"now": <the clock's seconds>, "ids": <the ID allocator's state>,
+     "forgotten": [<username>, ...],
+     "sessions": [<session snapshot>, ...]}
+
+where each session snapshot is as taken by
+:obj:`mimic.snapshot.snapshot_session`, and the ID allocator's state is as
+taken by :obj:`mimic.util.ids.IDAllocator.state`, so that a mimic with the
+same ``--id-seed`` which replays the journal does not allocate the IDs of
+the objects in it again.
+
+Whenever a request which may change mimic's state (any request other than a
+``GET`` or ``HEAD``) uses a session, that session is marked as changed,
+along with the API whose data the request may change: the API a
+``/mimicking/...`` request is routed to, none for the identity API (which
+changes only the session's token and expiry time), or all of them for
+mimic's own control APIs.  Sessions which are forgotten (because they
+expired, were evicted, or were replaced) are noted too.  Every so often, the
+forgotten users and the changed sessions, with the data of just the APIs
+which changed, are appended to the journal as one record.  Replaying the
+records in order removes the sessions of the forgotten users, and restores
+each changed API of each session as it was when it was last written, so
+several changes to one API of one session between writes cost one snapshot
+of that API's data for the session.
+
+A record is built and encoded on the reactor thread, because it is made
+from the live objects of the API mocks, which only that thread may touch;
+but it is written and synced to disk in another thread, one write at a
+time, so no request waits for the disk.
+"""
+
+import json
+import os
+
+from twisted.application.service import Service
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+from twisted.python import log
+from twisted.python.filepath import FilePath
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+from mimic.snapshot import (
+    BlobStore, advance_to, restore_sessions, snapshot_session
+)
+
+_READ_ONLY_METHODS = (b"GET", b"HEAD")
+
+
+def _blob_directory(journal_file):
+    """
+    The directory in which the large payloads of the records in the given
+    journal file are stored.
+    """
+    return journal_file.sibling(journal_file.basename() + ".blobs")
+
+
+def _changed_apis(core, request):
+    """
+    The API mocks whose data a request may change, or ``None`` if it may
+    change the data of any of them.
+    """
+    segments = request.path.split(b"/")
+    if segments[1:2] == [b"mimicking"] and len(segments) > 2:
+        api = core.api_for_service(segments[2].decode("utf-8"))
+        return set() if api is None else set([api])
+    if segments[1:2] == [b"identity"]:
+        return set()
+    return None
+
+
+class Journal(Service):
+    """
+    A service which appends records of the sessions changed by requests to a
+    journal file, and syncs it to disk, every :obj:`interval` seconds.
+
+    :ivar float interval: The number of seconds between writes.
+    :ivar int records: The number of records written.
+    """
+
+    def __init__(self, core, path, interval=1.0, clock=None,
+                 in_thread=None):
+        """
+        :param mimic.core.MimicCore core: The core whose sessions to journal.
+        :param str path: The name of the journal file, which is created if it
+            does not exist, and appended to if it does.
+        :param float interval: The number of seconds between writes.
+        :param clock: The :obj:`twisted.internet.interfaces.IReactorTime`
+            which schedules the writes; by default, the global reactor.  This
+            is a real clock, even when mimic's own clock is not.
+        :param in_thread: A callable like :obj:`deferToThread` with which to
+            write to the journal file in another thread; by default,
+            :obj:`deferToThread`.
+        """
+        self.core = core
+        self.interval = interval
+        self.records = 0
+        self._journal_file = FilePath(path)
+        self._blobs = BlobStore(_blob_directory(self._journal_file))
+        self._clock = clock
+        self._in_thread = in_thread or deferToThread
+        # the changed sessions, by username, and the APIs whose data changed
+        # (or None for all of them)
+        self._changed = {}
+        self._forgotten = set()
+        # the APIs which each request being served may change
+        self._scopes = []
+        self._pending = []
+        self._writing = None
+        self._idle = []
+        self._file = None
+        self._loop = None
+        self._last_now = None
+        core.sessions.observe_use(self._session_used)
+        core.sessions.observe_forget(self._session_forgotten)
+
+    def _session_used(self, session):
+        """
+        Mark a session as changed if it is being used to serve a request
+        which may change it.
+        """
+        if not self._scopes:
+            return
+        changed = self._changed.get(session.username)
+        if changed is None:
+            apis = set()
+        elif changed[0] is session:
+            apis = changed[1]
+        else:
+            apis = None
+        for scope in self._scopes:
+            if apis is None or scope is None:
+                apis = None
+                break
+            apis = apis | scope
+        self._changed[session.username] = (session, apis)
+
+    def _session_forgotten(self, session):
+        """
+        Note that a session was forgotten, so that it is not brought back by
+        :obj:`replay`.
+        """
+        changed = self._changed.get(session.username)
+        if changed is not None and changed[0] is session:
+            del self._changed[session.username]
+        self._forgotten.add(session.username)
+
+    def wrap(self, resource):
+        """
+        Wrap the root resource of mimic so that the sessions used by requests
+        which may change them are journaled.
+        """
+        return _JournalingResource(self, resource)
+
+    def startService(self):
+        """
+        Open the journal file, and start writing to it periodically.
+        """
+        Service.startService(self)
+        self._file = open(self._journal_file.path, "ab")
+        self._loop = LoopingCall(self.flush)
+        if self._clock is not None:
+            self._loop.clock = self._clock
+        self._loop.start(self.interval, now=False)
+
+    def stopService(self):
+        """
+        Write any outstanding changes, and close the journal file once they
+        have been written.
+        """
+        Service.stopService(self)
+        if self._loop.running:
+            self._loop.stop()
+        self.flush()
+        return self._when_idle().addCallback(self._close)
+
+    def _close(self, ignored):
+        """
+        Close the journal file.
+        """
+        self._file.close()
+        self._file = None
+
+    def flush(self):
+        """
+        Append a record of the users forgotten and the sessions changed since
+        the last write, if any (or if the clock has moved), and sync the
+        journal file to disk.
+        """
+        now = self.core.sessions.clock.seconds()
+        if (not self._changed and not self._forgotten and
+                now == self._last_now):
+            return
+        changed = list(self._changed.values())
+        self._changed.clear()
+        forgotten = sorted(self._forgotten)
+        self._forgotten.clear()
+        record = {"now": now,
+                  "ids": self.core.sessions.ids.state(),
+                  "forgotten": forgotten,
+                  "sessions": [snapshot_session(self.core, session,
+                                                self._blobs, apis)
+                               for session, apis in changed]}
+        self._pending.append(json.dumps(record).encode("utf-8") + b"\n")
+        self._last_now = now
+        self._write_pending()
+
+    def _write_pending(self):
+        """
+        Write the records which have not been written, unless a write is
+        already in progress.
+        """
+        if self._writing is not None:
+            return
+        if not self._pending:
+            idle, self._idle = self._idle, []
+            for d in idle:
+                d.callback(None)
+            return
+        lines, self._pending = self._pending, []
+        self._writing = self._in_thread(self._write, b"".join(lines))
+        self._writing.addCallbacks(
+            self._written, lambda failure: log.err(
+                failure, "Could not write to the journal"),
+            callbackArgs=(len(lines),))
+        self._writing.addCallback(self._next_write)
+
+    def _write(self, data):
+        """
+        Append some records to the journal file and sync it to disk; this
+        runs in another thread.
+        """
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _written(self, ignored, records):
+        """
+        Count the records just written.
+        """
+        self.records += records
+
+    def _next_write(self, ignored):
+        """
+        Start the next write, once one has finished.
+        """
+        self._writing = None
+        self._write_pending()
+
+    def _when_idle(self):
+        """
+        A :obj:`Deferred` which fires once every record has been written.
+        """
+        if self._writing is None and not self._pending:
+            return succeed(None)
+        d = Deferred()
+        self._idle.append(d)
+        return d
+
+
+class _JournalingResource(Resource):
+    """
+    A resource which renders another one, recording the sessions used by
+    requests which may change them in a :obj:`Journal`.
+
+    Requests are rendered by the wrapped resource directly, so it must be a
+    leaf, as the resources of ``klein`` apps are.  The sessions used by a
+    request which finishes asynchronously are recorded until it finishes
+    (along with those used by any other requests in the meantime).
+    """
+
+    isLeaf = True
+
+    def __init__(self, journal, wrapped):
+        """
+        Wrap ``wrapped`` for ``journal``.
+        """
+        Resource.__init__(self)
+        self._journal = journal
+        self._wrapped = wrapped
+
+    def render(self, request):
+        """
+        Render the wrapped resource, noting the sessions it uses if the
+        request may change them.
+        """
+        if request.method in _READ_ONLY_METHODS:
+            return self._wrapped.render(request)
+        scope = _changed_apis(self._journal.core, request)
+        self._journal._scopes.append(scope)
+        try:
+            result = self._wrapped.render(request)
+        except:
+            self._journal._scopes.remove(scope)
+            raise
+        if result is NOT_DONE_YET and not request.finished:
+            request.notifyFinish().addBoth(self._finished, scope)
+        else:
+            self._journal._scopes.remove(scope)
+        return result
+
+    def _finished(self, result, scope):
+        """
+        Stop recording for a request which finished asynchronously.
+        """
+        self._journal._scopes.remove(scope)
+
+
+def replay(core, path):
+    """
+    Replay the records in a journal file into a :obj:`MimicCore`, advancing
+    its clock to the time of each record in turn, skipping the IDs
+    allocated before it was written, and removing the sessions of the users
+    it says were forgotten.
+
+    A final record which was only partly written (because mimic stopped while
+    writing it) is ignored.
+
+    :param str path: The name of the journal file.
+    :return: the number of records replayed.
+    """
+    journal_file = FilePath(path)
+    blobs = BlobStore(_blob_directory(journal_file))
+    replayed = 0
+    with open(journal_file.path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                log.msg("Ignoring incomplete journal record {0} of {1}"
+                        .format(replayed + 1, path))
+                break
+            advance_to(core, record["now"])
+            core.sessions.ids.skip(record.get("ids", {}))
+            for username in record.get("forgotten", []):
+                core.sessions.remove_session(username)
+            restore_sessions(core, record["sessions"], blobs, partial=True)
+            replayed += 1
+    return replayed
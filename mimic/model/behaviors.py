@@ -1,16 +1,36 @@
+# -*- test-case-name: mimic.test.test_behaviors -*-
+
 """
 General-purpose utilities for customizing response behavior.
 """
 
 import re
+from heapq import heappop, heappush
+
 from characteristic import attributes, Attribute
+from six import integer_types, string_types
+
+from mimic.util.ids import allocator
+from mimic.util.ordered import OrderedIndex
 
+# Characters which do not stand for themselves in a regular expression.
+_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
 
-@attributes(['name', 'predicate'])
+# Characters which may make the character before them optional.
+_QUANTIFIERS = frozenset("*+?{")
+
+
+@attributes(['name', 'predicate', Attribute('prefix', default_value=None)])
 class Criterion(object):
     """
     A criterion evaluates a predicate (callable object returning boolean)
     against an attribute with the given name.
+
+    :ivar prefix: ``None``, or a 2-tuple of a key and some literal text which
+        the attribute must begin with for the predicate to match, so that
+        :obj:`BehaviorRegistry` can skip evaluating it for most attributes.
+        The key is ``None`` to mean the attribute itself, or the key of the
+        item of the attribute (a ``dict``) which must begin with the text.
     """
 
     def evaluate(self, attributes):
@@ -39,6 +59,22 @@ class CriteriaCollection(object):
                 return False
         return True
 
+    def index_prefix(self):
+        """
+        The longest literal prefix of any of the :obj:`Criterion`, by which
+        :obj:`BehaviorRegistry` indexes this collection.
+
+        :return: a 3-tuple of the attribute name, the key (see
+            :obj:`Criterion.prefix`) and the prefix, or ``None`` if none of the
+            criteria have a non-empty one.
+        """
+        best = None
+        for criterion in self.criteria:
+            if criterion.prefix is not None and (
+                    len(criterion.prefix[1]) > len(best[2] if best else "")):
+                best = (criterion.name,) + tuple(criterion.prefix)
+        return best
+
 
 def regexp_predicate(value):
     """
@@ -48,6 +84,26 @@ def regexp_predicate(value):
     return re.compile(value).match
 
 
+def regexp_prefix(value):
+    """
+    The literal text which every string that the given regular expression
+    matches (with ``re.match``, so at the start of the string) begins with.
+
+    This only looks at the plain characters at the start of the expression,
+    and is empty for expressions it cannot be sure about, such as those with
+    alternatives or inline flags.
+    """
+    if "|" in value or "(?" in value:
+        return value[:0]
+    start = 1 if value.startswith("^") else 0
+    end = start
+    while end < len(value) and value[end] not in _METACHARACTERS:
+        end += 1
+    if end > start and end < len(value) and value[end] in _QUANTIFIERS:
+        end -= 1
+    return value[start:end]
+
+
 @attributes([Attribute("_behaviors", default_factory=dict),
              Attribute("_criteria", default_factory=dict)])
 class EventDescription(object):
@@ -129,30 +185,203 @@ class EventDescription(object):
         return CriteriaCollection(criteria=list(create_criteria()))
 
 
+@attributes(["behavior_id", "position", "behavior", "criteria", "payload",
+             "uses", "expires", "index_key"])
+class _Registration(object):
+    """
+    A behavior registered with a :obj:`BehaviorRegistry`.
+
+    :ivar int position: The order in which it was registered.
+    :ivar uses: The number of times it may still be found, or ``None`` if
+        there is no limit.
+    :ivar expires: The time (in the registry's clock's seconds) at which it
+        is removed, or ``None`` if it is not.
+    :ivar index_key: The path through :obj:`BehaviorRegistry._index` to the
+        set of positions that it is in, or ``None`` if it is unindexed.
+    """
+
+    def json(self):
+        """
+        The JSON payload to register this behavior again with, as it is now.
+        """
+        payload = dict(self.payload, id=self.behavior_id)
+        if self.uses is not None:
+            payload["uses"] = self.uses
+        if self.expires is not None:
+            payload["expires"] = self.expires
+        return payload
+
+
 @attributes(["event",
-             Attribute("registered_behaviors", default_factory=list)])
+             Attribute("_registrations", default_factory=OrderedIndex,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("_positions", default_factory=dict,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("_next_position", default_value=0,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("_expiries", default_factory=list,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("_unindexed", default_factory=set,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("_index", default_factory=dict,
+                       exclude_from_cmp=True, exclude_from_repr=True)])
 class BehaviorRegistry(object):
     """
     A registry of behavior.
 
+    Behaviors whose criteria require an attribute to begin with some literal
+    text (see :obj:`CriteriaCollection.index_prefix`) are indexed by that
+    text, so that finding the behavior for some attributes only evaluates the
+    criteria of the behaviors which could plausibly match them, rather than
+    of every registered behavior.
+
+    A behavior may be registered for a limited number of uses, or for a
+    limited time, after which it is removed.  Behaviors are kept in a heap
+    by the time they expire, so expired behaviors can be removed without
+    looking at any others.
+
     :ivar EventDescription event: The set of criteria and behaviors that this
         registry is operating for.
     """
 
-    def register_from_json(self, json_payload):
+    def register_from_json(self, json_payload, now=0):
         """
         Register a behavior with the given JSON payload from a request.
+
+        As well as the ``"name"``, ``"parameters"`` and ``"criteria"`` of the
+        behavior, the payload may have:
+
+            - ``"uses"``: the number of times the behavior may be found before
+              it is removed.
+            - ``"ttl"``: the number of seconds after ``now`` at which it is
+              removed, or ``"expires"``: the time at which it is removed.
+            - ``"id"``: the ID to give the behavior, rather than a random one.
+
+        :param now: The current time, in seconds.
+        :return: the ID of the behavior.
+        :raises ValueError: if ``"uses"`` or ``"ttl"`` is not a positive
+            number.
+        """
+        payload = dict(json_payload)
+        uses = payload.pop("uses", None)
+        ttl = payload.pop("ttl", None)
+        expires = payload.pop("expires", None)
+        if uses is not None and (not isinstance(uses, integer_types) or
+                                 uses < 1):
+            raise ValueError("uses must be a positive integer")
+        if ttl is not None:
+            if not isinstance(ttl, (float,) + integer_types) or ttl <= 0:
+                raise ValueError("ttl must be a positive number")
+            expires = now + ttl
+        criteria = self.event.create_criteria(payload["criteria"])
+        behavior = self.event.create_behavior(payload["name"],
+                                              payload["parameters"])
+        behavior_id = (payload.pop("id", None) or
+                       allocator.uuid("behavior"))
+        self.remove(behavior_id)
+        position = self._next_position
+        self._next_position += 1
+        prefix = criteria.index_prefix()
+        if prefix is None:
+            index_key = None
+            self._unindexed.add(position)
+        else:
+            name, key, literal = prefix
+            index_key = ((name, key), len(literal), literal)
+            (self._index.setdefault((name, key), {})
+             .setdefault(len(literal), {})
+             .setdefault(literal, set()).add(position))
+        registration = _Registration(
+            behavior_id=behavior_id, position=position, behavior=behavior,
+            criteria=criteria, payload=payload, uses=uses, expires=expires,
+            index_key=index_key)
+        self._registrations.add(behavior_id, registration)
+        self._positions[position] = registration
+        if expires is not None:
+            heappush(self._expiries, (expires, position))
+        return behavior_id
+
+    def remove(self, behavior_id):
+        """
+        Remove a registered behavior.
+
+        :return: ``True`` if there was a behavior with the given ID to remove,
+            otherwise ``False``.
         """
-        self.registered_behaviors.append(
-            (self.event.create_behavior(json_payload["name"],
-                                        json_payload["parameters"]),
-             self.event.create_criteria(json_payload["criteria"])))
+        registration = self._registrations.pop(behavior_id)
+        if registration is None:
+            return False
+        del self._positions[registration.position]
+        if registration.index_key is None:
+            self._unindexed.discard(registration.position)
+        else:
+            group, length, literal = registration.index_key
+            by_length = self._index[group]
+            positions = by_length[length][literal]
+            positions.discard(registration.position)
+            if not positions:
+                del by_length[length][literal]
+                if not by_length[length]:
+                    del by_length[length]
+                    if not by_length:
+                        del self._index[group]
+        return True
+
+    def expire(self, now):
+        """
+        Remove the behaviors which expire at or before the given time.
+        """
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            _, position = heappop(expiries)
+            # The behavior may have been removed already.
+            registration = self._positions.get(position)
+            if registration is not None:
+                self.remove(registration.behavior_id)
 
-    def behavior_for_attributes(self, attributes):
+    def registered_json(self, now=0):
+        """
+        The behaviors which are registered at the given time, in the order
+        they were registered, as the JSON payloads to register them again with
+        (when restoring a snapshot, for example).
         """
-        Retrive a previously-registered behavior given the set of attributes.
+        self.expire(now)
+        return [registration.json() for registration in self._registrations]
+
+    def _candidates(self, attributes):
+        """
+        The positions of the behaviors whose criteria might match the given
+        attributes, in order.
+        """
+        candidates = list(self._unindexed)
+        for (name, key), by_length in self._index.items():
+            value = attributes.get(name)
+            if key is not None:
+                value = (value or {}).get(key, "")
+            for length, by_literal in by_length.items():
+                if isinstance(value, string_types):
+                    candidates.extend(by_literal.get(value[:length], ()))
+                else:
+                    # Let the criteria decide what to make of it.
+                    for positions in by_literal.values():
+                        candidates.extend(positions)
+        candidates.sort()
+        return candidates
+
+    def behavior_for_attributes(self, attributes, now=0):
+        """
+        Retrive a previously-registered behavior given the set of attributes,
+        using it up if it may only be used a limited number of times.
+
+        :param now: The current time, in seconds.
         """
-        for behavior, criteria in self.registered_behaviors:
-            if criteria.evaluate(attributes):
-                return behavior
+        self.expire(now)
+        for position in self._candidates(attributes):
+            registration = self._positions[position]
+            if registration.criteria.evaluate(attributes):
+                if registration.uses is not None:
+                    registration.uses -= 1
+                    if registration.uses == 0:
+                        self.remove(registration.behavior_id)
+                return registration.behavior
         return self.event.default_behavior
@@ -0,0 +1,288 @@
+"""
+Model objects for the CLB mimic.
+"""
+
+from characteristic import attributes, Attribute
+
+from mimic.util.ids import allocator
+from mimic.util.ordered import OrderedIndex
+
+
+_status_delays = {
+    # mapping of each metadata key which asks for a load balancer to spend
+    # some seconds in a status to the number of seconds if no value is given
+    "lb_building": 10,
+    "lb_pending_update": 10,
+    "lb_pending_delete": 10,
+}
+
+
+def _meta_from_metadata(metadata):
+    """
+    The mapping of key to value of a load balancer's metadata items, with
+    the values of the keys in :obj:`_status_delays` converted to a number of
+    seconds.  An empty value, or one of 0, means the default in
+    :obj:`_status_delays`.
+
+    :raise ValueError: if one of those values is not a non-negative number.
+    """
+    meta = {}
+    for each in metadata:
+        key, value = each["key"], each["value"]
+        if key in _status_delays:
+            if value in (None, ""):
+                value = _status_delays[key]
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = None
+            if value is None or not 0 <= value < float("inf"):
+                raise ValueError(
+                    "Metadata value for {0} must be a non-negative number "
+                    "of seconds.".format(key))
+            value = value or _status_delays[key]
+        meta[key] = value
+    return meta
+
+
+@attributes(["id", "address", "port", "condition",
+             Attribute("weight", default_value=None),
+             Attribute("type", default_value=None),
+             Attribute("status", default_value="ONLINE")])
+class Node(object):
+    """
+    A node on a :obj:`LoadBalancer`.
+    """
+
+    @classmethod
+    def from_json(cls, node_json):
+        """
+        Create a node, with a random ID, from the JSON for it in an add node
+        or create load balancer request.
+        """
+        return cls(id=allocator.number("clb_node", 31),
+                   address=node_json["address"],
+                   port=node_json["port"],
+                   condition=node_json["condition"],
+                   weight=node_json.get("weight"),
+                   type=node_json.get("type"))
+
+    def as_json(self):
+        """
+        The JSON representation of this node.
+        """
+        node = {"id": self.id,
+                "address": self.address,
+                "port": self.port,
+                "condition": self.condition,
+                "status": self.status}
+        if self.weight:
+            node["weight"] = self.weight
+        if self.type:
+            node["type"] = self.type
+        return node
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this node's state, for a
+        snapshot; it can be passed to :obj:`Node` as keyword arguments.
+        """
+        return {"id": self.id,
+                "address": self.address,
+                "port": self.port,
+                "condition": self.condition,
+                "weight": self.weight,
+                "type": self.type,
+                "status": self.status}
+
+
+@attributes(["id", "tenant_id", "name", "protocol", "port", "algorithm",
+             "status", "timeout", "created", "updated", "https_redirect",
+             "half_closed", "connection_logging",
+             Attribute("nodes", default_factory=OrderedIndex,
+                       exclude_from_cmp=True),
+             Attribute("_node_ids_by_address", default_factory=dict,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute("metadata", default_factory=list),
+             Attribute("meta", default_factory=dict)])
+class LoadBalancer(object):
+    """
+    A cloud load balancer.
+
+    :ivar nodes: The :obj:`Node` objects on this load balancer, in the order
+        they were added, by node ID.  Use :obj:`add_nodes` and
+        :obj:`remove_node` to change them, so that they stay indexed by
+        address and port too.
+    :type nodes: :obj:`OrderedIndex`
+    :ivar list metadata: The metadata items, each a ``dict`` with ``key``,
+        ``value`` and ``id``, as they are shown to clients.
+    :ivar dict meta: The metadata as a mapping of key to value, used to look
+        up the behaviors (such as ``lb_building``) requested for this load
+        balancer; the values which are numbers of seconds (see
+        :obj:`_status_delays`) are ``float`` s.
+    :ivar str created: The creation time, as a timestamp string.
+    :ivar str updated: The time of the last change, as a timestamp string.
+    """
+
+    @classmethod
+    def from_json(cls, tenant_id, lb_id, lb_info, status, current_time):
+        """
+        Create a load balancer from the JSON for it in a create load balancer
+        request.
+
+        :raise ValueError: if the metadata asks for a status to last for
+            something other than a non-negative number of seconds.
+        """
+        meta = _meta_from_metadata(lb_info.get("metadata") or [])
+        metadata = [{"key": each["key"], "value": each["value"],
+                     "id": allocator.number("clb_metadata", 31)}
+                    for each in lb_info.get("metadata") or []]
+        lb = cls(id=lb_id,
+                 tenant_id=tenant_id,
+                 name=lb_info["name"],
+                 protocol=lb_info["protocol"],
+                 port=lb_info.get("port", 80),
+                 algorithm=lb_info.get("algorithm") or "RANDOM",
+                 status=status,
+                 timeout=lb_info.get("timeout", 30),
+                 created=current_time,
+                 updated=current_time,
+                 https_redirect=lb_info.get("httpsRedirect", False),
+                 half_closed=lb_info.get("halfClosed", False),
+                 connection_logging=lb_info.get("connectionLogging",
+                                                {"enabled": False}),
+                 metadata=metadata,
+                 meta=meta)
+        lb.add_nodes([Node.from_json(each)
+                      for each in lb_info.get("nodes") or []])
+        return lb
+
+    @property
+    def node_count(self):
+        """
+        The number of nodes on this load balancer.
+        """
+        return len(self.nodes)
+
+    def has_node_at(self, address, port):
+        """
+        Whether there is a node with the given address and port on this load
+        balancer.
+        """
+        return (address, port) in self._node_ids_by_address
+
+    def add_nodes(self, nodes):
+        """
+        Add :obj:`Node` objects to this load balancer.  A node whose ID is
+        already in use is given a new random one.
+        """
+        for node in nodes:
+            while node.id in self.nodes:
+                node.id = allocator.number("clb_node", 31)
+            self.nodes.add(node.id, node)
+            self._node_ids_by_address.setdefault(
+                (node.address, node.port), set()).add(node.id)
+
+    def remove_node(self, node_id):
+        """
+        Remove the node with the given ID from this load balancer.
+
+        :return: the removed :obj:`Node`, or ``None`` if there was none.
+        """
+        node = self.nodes.pop(node_id)
+        if node is not None:
+            address = (node.address, node.port)
+            self._node_ids_by_address[address].discard(node_id)
+            if not self._node_ids_by_address[address]:
+                del self._node_ids_by_address[address]
+        return node
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this load balancer's
+        state, for a snapshot; see :obj:`from_snapshot_json`.
+        """
+        return {"id": self.id,
+                "tenant_id": self.tenant_id,
+                "name": self.name,
+                "protocol": self.protocol,
+                "port": self.port,
+                "algorithm": self.algorithm,
+                "status": self.status,
+                "timeout": self.timeout,
+                "created": self.created,
+                "updated": self.updated,
+                "https_redirect": self.https_redirect,
+                "half_closed": self.half_closed,
+                "connection_logging": self.connection_logging,
+                "nodes": [node.snapshot_json() for node in self.nodes],
+                "metadata": self.metadata}
+
+    @classmethod
+    def from_snapshot_json(cls, snapshot_json):
+        """
+        Re-create a :obj:`LoadBalancer` from the result of
+        :obj:`snapshot_json`.
+        """
+        kwargs = dict(snapshot_json)
+        del kwargs["nodes"]
+        lb = cls(meta=_meta_from_metadata(snapshot_json["metadata"]),
+                 **kwargs)
+        lb.add_nodes([Node(**node_json)
+                      for node_json in snapshot_json["nodes"]])
+        return lb
+
+    def _virtual_ips_json(self):
+        """
+        The JSON representation of this load balancer's virtual IPs.
+        """
+        return [{"address": "127.0.0.1", "id": 1111, "type": "PUBLIC",
+                 "ipVersion": "IPV4"},
+                {"address": "0000:0000:0000:0000:1111:111b:0000:0000",
+                 "id": 1111, "type": "PUBLIC", "ipVersion": "IPV6"}]
+
+    def full_json(self):
+        """
+        The JSON representation of this load balancer, as returned when it is
+        created or fetched.
+        """
+        lb = {"name": self.name,
+              "id": self.id,
+              "protocol": self.protocol,
+              "port": self.port,
+              "algorithm": self.algorithm,
+              "status": self.status,
+              "cluster": {"name": "test-cluster"},
+              "timeout": self.timeout,
+              "created": {"time": self.created},
+              "virtualIps": self._virtual_ips_json(),
+              "sourceAddresses": {"ipv6Public": "0000:0001:0002::00/00",
+                                  "ipv4Servicenet": "127.0.0.1",
+                                  "ipv4Public": "127.0.0.1"},
+              "httpsRedirect": self.https_redirect,
+              "updated": {"time": self.updated},
+              "halfClosed": self.half_closed,
+              "connectionLogging": self.connection_logging,
+              "contentCaching": {"enabled": False}}
+        if self.nodes:
+            lb["nodes"] = [node.as_json() for node in self.nodes]
+        if self.metadata:
+            lb["metadata"] = self.metadata
+        return lb
+
+    def short_json(self):
+        """
+        The JSON representation of this load balancer in a list of load
+        balancers.
+        """
+        return {"name": self.name,
+                "id": self.id,
+                "protocol": self.protocol,
+                "port": self.port,
+                "algorithm": self.algorithm,
+                "status": self.status,
+                "timeout": self.timeout,
+                "created": {"time": self.created},
+                "virtualIps": self._virtual_ips_json(),
+                "updated": {"time": self.updated},
+                "nodeCount": self.node_count}
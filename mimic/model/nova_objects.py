@@ -5,32 +5,49 @@ Model objects for the Nova mimic.
 import re
 
 from characteristic import attributes, Attribute
+from itertools import islice
 from random import randrange
 from json import loads, dumps
 
+from six.moves.urllib.parse import urlencode
+
 from mimic.util.helper import (
     seconds_to_timestamp,
     invalid_resource,
+    bad_request,
     random_string,
 )
 
 from mimic.model.behaviors import (
-    BehaviorRegistry, EventDescription, Criterion, regexp_predicate
+    BehaviorRegistry, EventDescription, Criterion, regexp_predicate,
+    regexp_prefix
 )
+from mimic.util.ids import allocator
+from mimic.util.ordered import OrderedIndex, SortedIndex
+from mimic.util.streaming import stream_json
 from twisted.web.http import ACCEPTED, NOT_FOUND
 
 
 @attributes(["collection", "server_id", "server_name", "metadata",
              "creation_time", "update_time", "public_ips", "private_ips",
              "status", "flavor_ref", "image_ref", "disk_config",
-             "admin_password", "creation_request_json"])
+             "admin_password", "creation_request_json",
+             Attribute("_json_cache", default_factory=dict,
+                       exclude_from_cmp=True, exclude_from_repr=True)])
 class Server(object):
     """
     A :obj:`Server` is a representation of all the state associated with a nova
     server.  It can produce JSON-serializable objects for various pieces of
     state that are required for API responses.
+
+    The brief and detailed JSON representations are memoized per URL
+    generator until the server changes, so repeatedly listing unchanged
+    servers is cheap.  The memoized objects are shared between responses and
+    must not be modified.
     """
 
+    max_json_cache_entries = 8
+
     static_defaults = {
         "OS-EXT-STS:power_state": 1,
         "OS-EXT-STS:task_state": None,
@@ -42,6 +59,52 @@ class Server(object):
         "user_id": "170454"
     }
 
+    def update_status(self, status):
+        """
+        Change the status of this server, updating its update time and the
+        collection's indexes to match.
+
+        The status should only ever be changed with this method, since the
+        collection indexes servers by status.
+
+        :param unicode status: The new status, for example ``u"ACTIVE"``.
+        """
+        previous = self.status
+        self.status = status
+        self.update_time = self.collection.clock.seconds()
+        self._json_cache.clear()
+        self.collection.server_updated(self, previous_status=previous)
+
+    def set_metadata_item(self, key, value):
+        """
+        Change one metadata item on this server.
+
+        Metadata should only ever be changed with this method, so that
+        memoized JSON representations which include it are discarded.
+        """
+        self.metadata[key] = value
+        self._json_cache.clear()
+
+    def _memoized_json(self, kind, absolutize_url, render):
+        """
+        Return the JSON representation of the given kind, rendering it with
+        ``render`` if it has not been since the server last changed.
+
+        :param str kind: the kind of representation, such as ``"detail"``.
+        :param callable absolutize_url: see :obj:`default_create_behavior`;
+            representations contain absolute URLs, so each URL generator gets
+            its own.
+        :param callable render: a 0-argument callable returning the
+            representation.
+        """
+        key = (kind, absolutize_url)
+        cached = self._json_cache.get(key)
+        if cached is None:
+            if len(self._json_cache) >= self.max_json_cache_entries:
+                self._json_cache.clear()
+            cached = self._json_cache[key] = render()
+        return cached
+
     def addresses_json(self):
         """
         Create a JSON-serializable data structure describing the public and
@@ -79,11 +142,11 @@ class Server(object):
         Brief JSON-serializable version of this server, for the non-details
         list servers request.
         """
-        return {
+        return self._memoized_json("brief", absolutize_url, lambda: {
             'name': self.server_name,
             'links': self.links_json(absolutize_url),
             'id': self.server_id
-        }
+        })
 
     def detail_json(self, absolutize_url):
         """
@@ -91,6 +154,14 @@ class Server(object):
         returned by either a GET on this individual server or a member in the
         list returned by the list-details request.
         """
+        return self._memoized_json(
+            "detail", absolutize_url,
+            lambda: self._render_detail_json(absolutize_url))
+
+    def _render_detail_json(self, absolutize_url):
+        """
+        Build the object returned by :obj:`Server.detail_json`.
+        """
         template = self.static_defaults.copy()
         tenant_id = self.collection.tenant_id
         template.update({
@@ -140,10 +211,13 @@ class Server(object):
 
     @classmethod
     def from_creation_request_json(cls, collection, creation_json,
-                                   ipsegment=lambda: randrange(255)):
+                                   ipsegment=lambda: randrange(255),
+                                   server_id=None):
         """
         Create a :obj:`Server` from a JSON-serializable object that would be in
         the body of a create server request.
+
+        :param server_id: The ID of the server, or ``None`` to generate one.
         """
         now = collection.clock.seconds()
         server_json = creation_json['server']
@@ -153,8 +227,8 @@ class Server(object):
         self = cls(
             collection=collection,
             server_name=server_json['name'],
-            server_id=('test-server{0}-id-{0}'
-                       .format(str(randrange(9999999999)))),
+            server_id=server_id or ('test-server{0}-id-{0}'.format(
+                allocator.number("nova_server", 33))),
             metadata=server_json.get("metadata") or {},
             creation_time=now,
             update_time=now,
@@ -173,7 +247,42 @@ class Server(object):
             status="ACTIVE",
             admin_password=random_string(12),
         )
-        collection.servers.append(self)
+        collection.add_server(self)
+        return self
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this server's state, for
+        a snapshot; see :obj:`from_snapshot_json`.
+        """
+        return {
+            "server_id": self.server_id,
+            "server_name": self.server_name,
+            "metadata": self.metadata,
+            "creation_time": self.creation_time,
+            "update_time": self.update_time,
+            "public_ips": [ip.json() for ip in self.public_ips],
+            "private_ips": [ip.json() for ip in self.private_ips],
+            "status": self.status,
+            "flavor_ref": self.flavor_ref,
+            "image_ref": self.image_ref,
+            "disk_config": self.disk_config,
+            "admin_password": self.admin_password,
+            "creation_request_json": self.creation_request_json,
+        }
+
+    @classmethod
+    def from_snapshot_json(cls, collection, snapshot_json):
+        """
+        Re-create a :obj:`Server` in the given collection from the result of
+        :obj:`snapshot_json`.
+        """
+        kwargs = dict(snapshot_json)
+        for key in ("public_ips", "private_ips"):
+            kwargs[key] = [_ADDRESS_TYPES[ip["version"]](address=ip["addr"])
+                           for ip in snapshot_json[key]]
+        self = cls(collection=collection, **kwargs)
+        collection.add_server(self)
         return self
 
 
@@ -203,6 +312,8 @@ class IPv6Address(object):
         return {"addr": self.address, "version": 6}
 
 
+_ADDRESS_TYPES = {4: IPv4Address, 6: IPv6Address}
+
 server_creation = EventDescription()
 
 
@@ -212,7 +323,8 @@ def server_name_criterion(value):
     Return a Criterion which matches the given regular expression string
     against the ``"server_name"`` attribute.
     """
-    return Criterion(name='server_name', predicate=regexp_predicate(value))
+    return Criterion(name='server_name', predicate=regexp_predicate(value),
+                     prefix=(None, regexp_prefix(value)))
 
 
 @server_creation.declare_criterion("metadata")
@@ -224,12 +336,18 @@ def metadata_criterion(value):
         to a regular expression describing a metadata value.
     :type value: dict mapping unicode to unicode
     """
+    matchers = [(k, re.compile(v).match) for k, v in value.items()]
+
     def predicate(attribute):
-        for k, v in value.items():
-            if not re.compile(v).match(attribute.get(k, "")):
+        attribute = attribute or {}
+        for k, match in matchers:
+            if not match(attribute.get(k, "")):
                 return False
         return True
-    return Criterion(name='metadata', predicate=predicate)
+    prefixes = sorted(((k, regexp_prefix(v)) for k, v in value.items()),
+                      key=lambda prefix: len(prefix[1]))
+    return Criterion(name='metadata', predicate=predicate,
+                     prefix=prefixes[-1] if prefixes else None)
 
 
 @server_creation.declare_default_behavior
@@ -333,10 +451,9 @@ def create_building_behavior(parameters):
 
     @default_with_hook
     def set_building(server):
-        server.status = u"BUILD"
+        server.update_status(u"BUILD")
         server.collection.clock.callLater(
-            duration,
-            lambda: setattr(server, "status", u"ACTIVE"))
+            duration, server.update_status, u"ACTIVE")
     return set_building
 
 
@@ -351,7 +468,7 @@ def create_error_status_behavior(parameters=None):
     """
     @default_with_hook
     def set_error(server):
-        server.status = u"ERROR"
+        server.update_status(u"ERROR")
     return set_error
 
 
@@ -373,7 +490,13 @@ def metadata_to_creation_behavior(metadata):
 
 @attributes(
     ["tenant_id", "region_name", "clock",
-     Attribute("servers", default_factory=list),
+     Attribute("servers", default_factory=OrderedIndex),
+     Attribute("_positions", default_factory=dict),
+     Attribute("_next_position", default_value=0),
+     Attribute("_by_status", default_factory=SortedIndex),
+     Attribute("_by_image", default_factory=SortedIndex),
+     Attribute("_by_flavor", default_factory=SortedIndex),
+     Attribute("_by_update_time", default_factory=OrderedIndex),
      Attribute(
          "create_behavior_registry",
          default_factory=lambda: BehaviorRegistry(event=server_creation))]
@@ -381,15 +504,91 @@ def metadata_to_creation_behavior(metadata):
 class RegionalServerCollection(object):
     """
     A collection of servers, in a given region, for a given tenant.
+
+    :ivar servers: the :obj:`Server` objects in this collection, in the order
+        they were created, indexed by server ID.
+    :type servers: :obj:`mimic.util.ordered.OrderedIndex`
+
+    Servers are also indexed by status, image and flavor, and kept in order of
+    their last update, so that filtered and paginated list requests only
+    visit the servers they return.
     """
 
+    def add_server(self, server):
+        """
+        Add a newly created :obj:`Server` to this collection and its indexes.
+        """
+        position = self._next_position
+        self._next_position += 1
+        self._positions[server.server_id] = position
+        self.servers.add(server.server_id, server)
+        self._by_status.add(server.status, position, server.server_id)
+        self._by_image.add(server.image_ref, position, server.server_id)
+        self._by_flavor.add(server.flavor_ref, position, server.server_id)
+        self._by_update_time.add(server.server_id, server)
+
+    def remove_server(self, server):
+        """
+        Remove a :obj:`Server` from this collection and its indexes.
+        """
+        position = self._positions.pop(server.server_id)
+        self.servers.pop(server.server_id)
+        self._by_status.remove(server.status, position, server.server_id)
+        self._by_image.remove(server.image_ref, position, server.server_id)
+        self._by_flavor.remove(server.flavor_ref, position, server.server_id)
+        self._by_update_time.pop(server.server_id)
+
+    def server_updated(self, server, previous_status):
+        """
+        Bring the indexes up to date after a server's status and update time
+        have changed.  Called by :obj:`Server.update_status`.
+        """
+        if server.server_id not in self.servers:
+            return
+        position = self._positions[server.server_id]
+        self._by_status.remove(previous_status, position, server.server_id)
+        self._by_status.add(server.status, position, server.server_id)
+        self._by_update_time.move_to_end(server.server_id)
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of the servers and registered
+        behaviors in this collection, for a snapshot; see
+        :obj:`from_snapshot_json`.
+        """
+        return {
+            "servers": [server.snapshot_json() for server in self.servers],
+            "creation_behaviors":
+                self.create_behavior_registry.registered_json(
+                    self.clock.seconds()),
+        }
+
+    @classmethod
+    def from_snapshot_json(cls, tenant_id, region_name, clock,
+                           snapshot_json):
+        """
+        Re-create a :obj:`RegionalServerCollection` from the result of
+        :obj:`snapshot_json`.
+
+        Servers are restored in their original status; a server which was
+        building will not become active by itself.
+        """
+        self = cls(tenant_id=tenant_id, region_name=region_name, clock=clock)
+        for server_json in snapshot_json["servers"]:
+            Server.from_snapshot_json(self, server_json)
+        for server in sorted(self.servers, key=lambda s: s.update_time):
+            self._by_update_time.move_to_end(server.server_id)
+        for payload in snapshot_json["creation_behaviors"]:
+            self.create_behavior_registry.register_from_json(
+                payload, clock.seconds())
+        return self
+
     def server_by_id(self, server_id):
         """
-        Retrieve a :obj:`Server` object by its ID.
+        Retrieve a :obj:`Server` object by its ID, or ``None`` if there is no
+        such server.
         """
-        for server in self.servers:
-            if server.server_id == server_id:
-                return server
+        return self.servers.get(server_id)
 
     def request_creation(self, creation_http_request, creation_json,
                          absolutize_url):
@@ -403,7 +602,7 @@ class RegionalServerCollection(object):
                 "tenant_id": self.tenant_id,
                 "server_name": creation_json["server"]["name"],
                 "metadata": creation_json["server"].get("metadata")
-            })
+            }, self.clock.seconds())
         return behavior(self, creation_http_request, creation_json,
                         absolutize_url)
 
@@ -428,22 +627,101 @@ class RegionalServerCollection(object):
             return None
         return dumps({"addresses": server.addresses_json()})
 
-    def request_list(self, http_get_request, include_details, absolutize_url,
-                     name=u""):
+    def _candidates(self, marker, status, image, flavor, changes_since):
+        """
+        Iterate over the servers which might match a list request, in creation
+        order, starting after ``marker``, using the most selective index
+        available for the given filters.
         """
-        Request the list JSON for all servers.
+        after = None if marker is None else self._positions[marker]
+
+        if changes_since is not None:
+            changed = []
+            for server in reversed(self._by_update_time):
+                if server.update_time < changes_since:
+                    break
+                changed.append(server)
+            changed.sort(key=lambda server: self._positions[server.server_id])
+            return (server for server in changed
+                    if after is None or
+                    self._positions[server.server_id] > after)
+
+        indexes = [(index, value) for (index, value) in
+                   [(self._by_status, status), (self._by_image, image),
+                    (self._by_flavor, flavor)]
+                   if value is not None]
+        if indexes:
+            index, value = min(indexes, key=lambda pair: pair[0].count(pair[1]))
+            return (self.servers[server_id]
+                    for server_id in index.keys_after(value, after))
+
+        if marker is None:
+            return iter(self.servers)
+        return self.servers.values_after(marker)
 
-        Note: only supports filtering by name right now, but will need to
-        support more going forward.
+    def request_list(self, http_get_request, include_details, absolutize_url,
+                     name=u"", status=None, image=None, flavor=None,
+                     changes_since=None, limit=None, marker=None):
         """
-        return dumps(
-            {"servers": [
-                server.brief_json(absolutize_url) if not include_details
-                else server.detail_json(absolutize_url)
-                for server in self.servers
-                if name in server.server_name
-            ]}
-        )
+        Request the list JSON for all servers, or one page of them.
+
+        :param unicode name: Only list servers whose names contain this.
+        :param unicode status: Only list servers with this status.
+        :param unicode image: Only list servers with this image ID.
+        :param unicode flavor: Only list servers with this flavor ID.
+        :param float changes_since: Only list servers updated at or after this
+            time, in seconds since the epoch.
+        :param int limit: The maximum number of servers to list.  If this many
+            are listed, the response includes a ``next`` link.
+        :param unicode marker: The ID of the last server on the previous page;
+            only servers created after it are listed.
+
+        Responds with a 400 if the marker is not the ID of a server in this
+        collection.  Otherwise the list is streamed to the request with
+        :obj:`stream_json`, and its result is returned.
+        """
+        if marker is not None and marker not in self.servers:
+            http_get_request.setResponseCode(400)
+            return dumps(bad_request("marker [{0}] not found".format(marker)))
+
+        def matches(server):
+            return all([
+                name in server.server_name,
+                status is None or server.status == status,
+                image is None or server.image_ref == image,
+                flavor is None or server.flavor_ref == flavor,
+                changes_since is None or server.update_time >= changes_since,
+            ])
+
+        candidates = self._candidates(marker, status, image, flavor,
+                                      changes_since)
+        # The servers are selected now, and only their JSON is generated as
+        # the response is streamed, so that servers created or deleted in
+        # the meantime neither disturb the iteration over the indexes nor
+        # appear in (or vanish from) the response.
+        page = list(islice((server for server in candidates
+                            if matches(server)), limit))
+        result = {"servers": (
+            server.brief_json(absolutize_url) if not include_details
+            else server.detail_json(absolutize_url)
+            for server in page
+        )}
+        if limit is not None and page and len(page) == limit:
+            query = [("limit", limit), ("marker", page[-1].server_id)]
+            for (key, value) in [("name", name or None), ("status", status),
+                                 ("image", image), ("flavor", flavor)]:
+                if value is not None:
+                    query.append((key, value))
+            if changes_since is not None:
+                query.append(("changes-since",
+                              seconds_to_timestamp(changes_since)))
+            path = "v2/{0}/servers{1}".format(
+                self.tenant_id, "/detail" if include_details else "")
+            result["servers_links"] = [{
+                "href": absolutize_url(path) + "?" + urlencode(query),
+                "rel": "next"
+            }]
+        return stream_json(http_get_request, result)
 
     def request_delete(self, http_delete_request, server_id):
         """
@@ -457,11 +735,12 @@ class RegionalServerCollection(object):
             srvfail = loads(server.metadata['delete_server_failure'])
             if srvfail['times']:
                 srvfail['times'] -= 1
-                server.metadata['delete_server_failure'] = dumps(srvfail)
+                server.set_metadata_item('delete_server_failure',
+                                         dumps(srvfail))
                 http_delete_request.setResponseCode(500)
                 return b''
         http_delete_request.setResponseCode(204)
-        self.servers.remove(server)
+        self.remove_server(server)
         return b''
 
 
@@ -487,3 +766,26 @@ class GlobalServerCollections(object):
                                          clock=self.clock)
             )
         return self.regional_collections[region_name]
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this tenant's servers,
+        for a snapshot; see :obj:`from_snapshot_json`.
+        """
+        return dict([(region_name, collection.snapshot_json())
+                     for region_name, collection
+                     in self.regional_collections.items()])
+
+    @classmethod
+    def from_snapshot_json(cls, tenant_id, clock, snapshot_json):
+        """
+        Re-create a :obj:`GlobalServerCollections` from the result of
+        :obj:`snapshot_json`.
+        """
+        return cls(tenant_id=tenant_id, clock=clock,
+                   regional_collections=dict([
+                       (region_name, RegionalServerCollection
+                        .from_snapshot_json(tenant_id, region_name, clock,
+                                            collection_json))
+                       for region_name, collection_json
+                       in snapshot_json.items()]))
@@ -4,8 +4,12 @@ Resources for Mimic's core.
 
 import json
 
+from six import string_types
+
+from twisted.python.filepath import FilePath
 from twisted.web.resource import NoResource
 
+from mimic import fixtures, snapshot
 from mimic.canned_responses.mimic_presets import get_presets
 from mimic.rest.mimicapp import MimicApp
 from mimic.rest.auth_api import AuthApi, base_uri_from_request
@@ -20,15 +24,18 @@ class MimicRoot(object):
 
     app = MimicApp()
 
-    def __init__(self, core, clock=None):
+    def __init__(self, core, clock=None, state_file=None):
         """
         :param mimic.core.MimicCore core: The core object to dispatch routes
             from.
         :param twisted.internet.task.Clock clock: The clock to advance from the
             ``/mimic/v1.1/tick`` API.
+        :param str state_file: The file the ``/mimic/v1.1/snapshot`` and
+            ``/mimic/v1.1/restore`` APIs use by default.
         """
         self.core = core
         self.clock = clock
+        self.state_file = state_file
 
     @app.route("/", methods=["GET"])
     def help(self, request):
@@ -75,6 +82,114 @@ class MimicRoot(object):
             "now": seconds_to_timestamp(self.clock.seconds())
         })
 
+    @app.route("/mimic/v1.1/stats", methods=['GET'])
+    def get_stats(self, request):
+        """
+        Report how many sessions are being kept and how many have been
+        forgotten, and the state of the service resource and catalog
+        caches.
+        """
+        request.setResponseCode(200)
+        return json.dumps({
+            "sessions": self.core.sessions.stats(),
+            "resource_cache": self.core.resource_cache.stats(),
+            "catalog_cache": self.core.catalog_cache.stats()
+        })
+
+    def _state_file_for(self, request):
+        """
+        The snapshot file named by the ``"path"`` in the body of a snapshot or
+        restore request, or the default one.
+
+        So that clients cannot read or write any file mimic can, a ``"path"``
+        must be in the directory of the ``--state-file``, or below it.
+
+        :return: a 2-tuple of the file name (or ``None``) and a message
+            saying why the request is bad (or ``None``).
+        """
+        path = self.state_file
+        body = request.content.read()
+        if body:
+            try:
+                path = json.loads(body).get("path", self.state_file)
+            except (ValueError, AttributeError):
+                return None, "The request body must be a JSON object."
+        if path is None:
+            return None, "No state file given."
+        if path == self.state_file:
+            return path, None
+        if self.state_file is None or not isinstance(path, string_types):
+            return None, "The path must be in the state file's directory."
+        try:
+            FilePath(path).segmentsFrom(FilePath(self.state_file).parent())
+        except ValueError:
+            return None, "The path must be in the state file's directory."
+        return path, None
+
+    @app.route("/mimic/v1.1/fixtures", methods=['POST'])
+    def load_fixtures(self, request):
+        """
+        Create the objects described by the fixtures document (JSON lines) in
+        the request body; see :obj:`mimic.fixtures`.
+        """
+        def loaded(counts):
+            request.setResponseCode(200)
+            return json.dumps({"loaded": counts})
+
+        def failed(failure):
+            failure.trap(fixtures.FixtureError)
+            request.setResponseCode(400)
+            return json.dumps({
+                "message": "Line {0}: {1}".format(failure.value.line,
+                                                  failure.value.message),
+                "loaded": failure.value.loaded})
+        return fixtures.load(self.core, request.content).addCallbacks(
+            loaded, failed)
+
+    @app.route("/mimic/v1.1/snapshot", methods=['POST'])
+    def save_snapshot(self, request):
+        """
+        Save a snapshot of all of mimic's state to the file given as
+        ``"path"`` in the request body (in the directory of the
+        ``--state-file``), or to the ``--state-file``.
+        """
+        path, error = self._state_file_for(request)
+        if error is not None:
+            request.setResponseCode(400)
+            return json.dumps({"message": error})
+        try:
+            dumped = snapshot.save(self.core, path)
+        except (IOError, OSError) as e:
+            request.setResponseCode(400)
+            return json.dumps({"message": "Could not save {0}: {1}"
+                               .format(path, e)})
+        request.setResponseCode(200)
+        return json.dumps({"path": path,
+                           "version": dumped["version"],
+                           "sessions": len(dumped["sessions"])})
+
+    @app.route("/mimic/v1.1/restore", methods=['POST'])
+    def restore_snapshot(self, request):
+        """
+        Replace all of mimic's state with the snapshot in the file given as
+        ``"path"`` in the request body (in the directory of the
+        ``--state-file``), or in the ``--state-file``.
+        """
+        path, error = self._state_file_for(request)
+        if error is not None:
+            request.setResponseCode(400)
+            return json.dumps({"message": error})
+        try:
+            dumped = snapshot.load(self.core, path)
+        except (IOError, snapshot.SnapshotError) as e:
+            request.setResponseCode(400)
+            return json.dumps({"message": "Could not restore {0}: {1}"
+                               .format(path, e)})
+        request.setResponseCode(200)
+        return json.dumps({"path": path,
+                           "version": dumped["version"],
+                           "sessions": len(dumped["sessions"])})
+
     @app.route("/mimicking/<string:service_id>/<string:region_name>",
                branch=True)
     def get_service_resource(self, request, service_id, region_name):
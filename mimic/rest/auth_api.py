@@ -4,15 +4,17 @@ Defines get token, impersonation
 """
 
 import json
-from six import text_type
-from uuid import uuid4
 
 from twisted.web.server import Request
 from twisted.python.urlpath import URLPath
-from mimic.canned_responses.auth import get_token, get_endpoints, impersonator_user_role
+from mimic.canned_responses.auth import (
+    get_endpoints, get_token, get_token_with_serialized_catalog,
+    impersonator_user_role_template
+)
 from mimic.rest.mimicapp import MimicApp
 from mimic.canned_responses.auth import format_timestamp
 from mimic.util.helper import invalid_resource
+from mimic.util.json_template import insert_member
 from mimic.session import NonMatchingTenantError
 
 Request.defaultContentType = 'application/json'
@@ -62,23 +64,15 @@ class AuthApi(object):
                 })
             else:
                 request.setResponseCode(200)
-                prefix_map = {
-                    # map of entry to URI prefix for that entry
-                }
-
-                def lookup(entry):
-                    return prefix_map[entry]
-                result = get_token(
+                catalog = session.catalog
+                return get_token_with_serialized_catalog(
                     session.tenant_id,
-                    entry_generator=lambda tenant_id:
-                    list(self.core.entries_for_tenant(
-                         tenant_id, prefix_map, base_uri_from_request(request))),
-                    prefix_for_endpoint=lookup,
+                    catalog.serialized(base_uri_from_request(request)),
+                    response_expires=session.expires,
                     response_token=session.token,
                     response_user_id=session.user_id,
                     response_user_name=session.username,
                 )
-                return json.dumps(result)
 
         username_generator = (
             lambda exception: "Tenant with Name/Id: '{0}' is not valid for "
@@ -107,6 +101,10 @@ class AuthApi(object):
 
         elif content['auth'].get('token') and tenant_id:
             token = content['auth']['token']['id']
+            if self.core.sessions.token_expired(token):
+                request.setResponseCode(401)
+                return json.dumps({"unauthorized": {
+                    "code": 401, "message": "Token expired"}})
             return format_response(
                 lambda: self.core.sessions.session_for_token(
                     token, tenant_id),
@@ -156,7 +154,8 @@ class AuthApi(object):
         impersonator_token = request.getHeader("x-auth-token")
         expires_in = content['RAX-AUTH:impersonation']['expire-in-seconds']
         username = content['RAX-AUTH:impersonation']['user']['username']
-        impersonated_token = 'impersonated_token_' + text_type(uuid4())
+        impersonated_token = self.core.sessions.generate_id(
+            'token', prefix=u'impersonated_')
         session = self.core.sessions.session_for_impersonation(username,
                                                                expires_in,
                                                                impersonator_token,
@@ -173,42 +172,81 @@ class AuthApi(object):
         Creates a new session for the given tenant_id and token_id
         and always returns response code 200.
         Docs: http://developer.openstack.org/api-ref-identity-v2.html#admin-tokens
+
+        Services may validate a token on every request they handle, so the
+        response for a known token is cached in its session, and looking it
+        up does not create a session.
+
+        A token which has expired, according to mimic's clock, is not
+        found.
         """
         request.setResponseCode(200)
         tenant_id = request.args.get('belongsTo')
         if tenant_id is not None:
             tenant_id = tenant_id[0]
-        session = self.core.sessions.session_for_tenant_id(tenant_id, token_id)
+        session = self.core.sessions.used_session_for_token(token_id,
+                                                            tenant_id)
+        if session is None and self.core.sessions.token_expired(token_id):
+            return token_not_found(request, token_id)
+        if session is None:
+            session = self.core.sessions.session_for_tenant_id(tenant_id,
+                                                               token_id)
+        return session.cached_response(
+            ("validate", token_id),
+            lambda: self._validation_response(session, token_id))
+
+    def _validation_response(self, session, token_id):
+        """
+        The JSON text of the response to validating a token of a session.
+        """
         response = get_token(
             session.tenant_id,
+            response_expires=session.expires,
             response_token=session.token,
             response_user_id=session.user_id,
             response_user_name=session.username,
         )
-        if session.impersonator_session_for_token(token_id) is not None:
-            impersonator_session = session.impersonator_session_for_token(token_id)
-            response["access"]["RAX-AUTH:impersonator"] = impersonator_user_role(
-                impersonator_session.user_id,
-                impersonator_session.username)
-        return json.dumps(response)
+        access = json.dumps(response["access"])
+        impersonator_session = session.impersonator_session_for_token(token_id)
+        if impersonator_session is not None:
+            access = insert_member(
+                access, "RAX-AUTH:impersonator",
+                impersonator_user_role_template.render(
+                    id=impersonator_session.user_id,
+                    name=impersonator_session.username))
+        return '{"access": ' + access + '}'
 
     @app.route('/v2.0/tokens/<string:token_id>/endpoints', methods=['GET'])
     def get_endpoints_for_token(self, request, token_id):
         """
         Return a service catalog consisting of nova and load balancer mocked
-        endpoints.
+        endpoints, or a 404 if the token has expired.
         """
         # FIXME: TEST
         request.setResponseCode(200)
-        prefix_map = {}
-        session = self.core.sessions.session_for_token(token_id)
-        return json.dumps(get_endpoints(
-            session.tenant_id,
-            entry_generator=lambda tenant_id: list(
-                self.core.entries_for_tenant(tenant_id, prefix_map,
-                                             base_uri_from_request(request))),
-            prefix_for_endpoint=prefix_map.get)
-        )
+        session = self.core.sessions.used_session_for_token(token_id)
+        if session is None and self.core.sessions.token_expired(token_id):
+            return token_not_found(request, token_id)
+        if session is None:
+            session = self.core.sessions.session_for_token(token_id)
+        base_uri = base_uri_from_request(request)
+
+        def render():
+            catalog = session.catalog
+            return json.dumps(get_endpoints(
+                session.tenant_id,
+                entry_generator=lambda tenant_id: catalog.entries,
+                prefix_for_endpoint=catalog.prefix_map(base_uri).get))
+        return session.cached_response(("endpoints", base_uri), render)
+
+
+def token_not_found(request, token_id):
+    """
+    Respond that a token (which has expired) is not found.
+    """
+    request.setResponseCode(404)
+    return json.dumps({'itemNotFound': {
+        'code': 404, 'message': 'Token ' + token_id + ' not found'}})
 
 
 def base_uri_from_request(request):
@@ -4,8 +4,6 @@ Defines add node and delete node from load balancers
 """
 from collections import defaultdict
 import json
-from uuid import uuid4
-from six import text_type
 from zope.interface import implementer
 from twisted.web.server import Request
 from twisted.plugin import IPlugin
@@ -14,17 +12,21 @@ from mimic.canned_responses.loadbalancer import (
     add_load_balancer, del_load_balancer, list_load_balancers,
     add_node, delete_node, list_nodes, get_load_balancers, get_nodes)
 from mimic.rest.mimicapp import MimicApp
-from mimic.imimic import IAPIMock
+from mimic.model.clb_objects import Node
+from mimic.imimic import (
+    IAPIMock, IAPIMockFixtures, IAPIMockRelease, IAPIMockSnapshot)
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
-from random import randrange
 from mimic.util.helper import invalid_resource
+from mimic.util.ids import allocator
+from mimic.util.streaming import stream_json
 
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IAPIMockSnapshot, IAPIMockFixtures, IAPIMockRelease,
+             IPlugin)
 class LoadBalancerApi(object):
     """
     Rest endpoints for mocked Load balancer api.
@@ -44,7 +46,7 @@ class LoadBalancerApi(object):
         return [
             Entry(tenant_id, "rax:load-balancer", "cloudLoadBalancers",
                   [
-                      Endpoint(tenant_id, region, text_type(uuid4()),
+                      Endpoint(tenant_id, region, allocator.uuid("endpoint"),
                                prefix="v2")
                       for region in self._regions
                   ])
@@ -59,6 +61,79 @@ class LoadBalancerApi(object):
                                        region)
         return lb_region.app.resource()
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's load balancers
+        in every region; implement :obj:`IAPIMockSnapshot`.
+        """
+        return dict([(region, store.snapshot_json())
+                     for region, store in data.items()])
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's load balancers in every region; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        data = defaultdict(lambda: Region_Tenant_CLBs(clock))
+        for region, store_json in dumped.items():
+            data[region] = Region_Tenant_CLBs.from_snapshot_json(clock,
+                                                                 store_json)
+        return data
+
+    def release_session_data(self, data):
+        """
+        Cancel the pending status changes of a tenant's load balancers in
+        every region; implement :obj:`IAPIMockRelease`.
+        """
+        for store in data.values():
+            store.cancel_transitions()
+
+    fixture_kinds = ["loadbalancer", "node"]
+
+    def fixture_tenant_id(self, tenant_id):
+        """
+        Load balancers are kept in the tenant's own session; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        return tenant_id
+
+    def load_fixture(self, session, fixture, clock):
+        """
+        Create a load balancer from a fixture record of the form ``{"kind":
+        "loadbalancer", "region": ..., "id": ..., "loadBalancer": <as in a
+        create load balancer request>}``, or add nodes to one from a record
+        of the form ``{"kind": "node", "region": ..., "loadbalancer_id": ...,
+        "nodes": [<as in an add node request>]}``, where the region defaults
+        to the first and the ID is generated if not given.  A load balancer's
+        ID must not be in use, and a node's address and port must not be
+        those of another node on its load balancer; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        store = session.data_for_api(
+            self, lambda: defaultdict(lambda: Region_Tenant_CLBs(clock))
+        )[fixture.get("region", self._regions[0])]
+        if fixture["kind"] == "loadbalancer":
+            lb_id = int(fixture.get("id") or
+                        allocator.number("clb_loadbalancer", 31))
+            if lb_id in store.lbs:
+                raise ValueError("load balancer {0} already exists"
+                                 .format(lb_id))
+            body, code = add_load_balancer(
+                session.tenant_id, store, fixture["loadBalancer"], lb_id,
+                clock.seconds())
+            if code != 202:
+                raise ValueError(body["message"])
+        else:
+            lb = store.lbs[int(fixture["loadbalancer_id"])]
+            nodes = [Node.from_json(node_json)
+                     for node_json in fixture["nodes"]]
+            addresses = [(node.address, node.port) for node in nodes]
+            if (len(set(addresses)) != len(addresses) or
+                    any(lb.has_node_at(*address) for address in addresses)):
+                raise ValueError("duplicate nodes on load balancer {0}"
+                                 .format(lb.id))
+            lb.add_nodes(nodes)
+
 
 class LoadBalancerRegion(object):
     """
@@ -84,7 +159,9 @@ class LoadBalancerRegion(object):
         """
         return (self._session_store.session_for_tenant_id(tenant_id)
                 .data_for_api(self._api_mock,
-                              lambda: defaultdict(Region_Tenant_CLBs))
+                              lambda: defaultdict(
+                                  lambda: Region_Tenant_CLBs(
+                                      self._session_store.clock)))
                 [self.region_name])
 
     @app.route('/v2/<string:tenant_id>/loadbalancers', methods=['POST'])
@@ -99,7 +176,7 @@ class LoadBalancerRegion(object):
             request.setResponseCode(400)
             return json.dumps(invalid_resource("Invalid JSON request body"))
 
-        lb_id = randrange(99999)
+        lb_id = allocator.number("clb_loadbalancer", 31)
         response_data = add_load_balancer(tenant_id, self.session(tenant_id),
                                           content['loadBalancer'], lb_id,
                                           self._session_store.clock.seconds())
@@ -112,8 +189,7 @@ class LoadBalancerRegion(object):
         Returns a list of all load balancers created using mimic with response code 200
         """
         response_data = get_load_balancers(
-            self.session(tenant_id), lb_id,
-            self._session_store.clock.seconds()
+            self.session(tenant_id), lb_id
         )
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
@@ -124,11 +200,10 @@ class LoadBalancerRegion(object):
         Returns a list of all load balancers created using mimic with response code 200
         """
         response_data = list_load_balancers(
-            tenant_id, self.session(tenant_id),
-            self._session_store.clock.seconds()
+            tenant_id, self.session(tenant_id)
         )
         request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        return stream_json(request, response_data[0])
 
     @app.route('/v2/<string:tenant_id>/loadbalancers/<int:lb_id>', methods=['DELETE'])
     def delete_load_balancer(self, request, tenant_id, lb_id):
@@ -136,10 +211,7 @@ class LoadBalancerRegion(object):
         Creates a load balancer and adds it to the load balancer store.
         Returns the newly created load balancer with response code 200
         """
-        response_data = del_load_balancer(
-            self.session(tenant_id),
-            lb_id, self._session_store.clock.seconds()
-        )
+        response_data = del_load_balancer(self.session(tenant_id), lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -156,8 +228,7 @@ class LoadBalancerRegion(object):
 
         node_list = content['nodes']
         response_data = add_node(
-            self.session(tenant_id), node_list, lb_id,
-            self._session_store.clock.seconds()
+            self.session(tenant_id), node_list, lb_id
         )
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
@@ -169,8 +240,7 @@ class LoadBalancerRegion(object):
         Returns a 200 response code and list of nodes on the load balancer
         """
         response_data = get_nodes(
-            self.session(tenant_id), lb_id, node_id,
-            self._session_store.clock.seconds()
+            self.session(tenant_id), lb_id, node_id
         )
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
@@ -182,8 +252,7 @@ class LoadBalancerRegion(object):
         Returns a 204 response code, for any load balancer created using the mocks
         """
         response_data = delete_node(
-            self.session(tenant_id), lb_id, node_id,
-            self._session_store.clock.seconds()
+            self.session(tenant_id), lb_id, node_id
         )
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
@@ -194,7 +263,6 @@ class LoadBalancerRegion(object):
         """
         Returns a 200 response code and list of nodes on the load balancer
         """
-        response_data = list_nodes(self.session(tenant_id), lb_id,
-                                   self._session_store.clock.seconds())
+        response_data = list_nodes(self.session(tenant_id), lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
@@ -7,9 +7,13 @@ import collections
 import time
 import random
 import re
-from uuid import uuid4
+from array import array
+from binascii import unhexlify
+from hashlib import sha1
+from itertools import islice
 
-from six import text_type
+from six.moves import xrange
+from six.moves.urllib.parse import urlencode
 
 from zope.interface import implementer
 
@@ -19,17 +23,38 @@ from twisted.plugin import IPlugin
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
 from mimic.rest.mimicapp import MimicApp
-from mimic.imimic import IAPIMock
-from mimic.canned_responses.maas_json_home import json_home
+from mimic.imimic import IAPIMock, IAPIMockFixtures, IAPIMockSnapshot
+from mimic.canned_responses.maas_json_home import json_home_template
 from mimic.canned_responses.maas_monitoring_zones import monitoring_zones
 from mimic.canned_responses.maas_alarm_examples import alarm_examples
-from mimic.util.helper import random_hex_generator
+from mimic.util.ids import allocator
+from mimic.util.ordered import OrderedIndex
+from mimic.util.streaming import stream_json
 
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+def _canned_list_json(values):
+    """
+    The JSON text of a list response of all of the given canned values; the
+    canned lists never change, so they are serialized once.
+    """
+    return json.dumps({'values': values, 'metadata': {
+        'count': len(values),
+        'limit': 100,
+        'marker': None,
+        'next_marker': None,
+        'next_href': None
+    }})
+
+
+_monitoring_zones_json = _canned_list_json(monitoring_zones())
+
+_alarm_examples_json = _canned_list_json(alarm_examples())
+
+
+@implementer(IAPIMock, IAPIMockSnapshot, IAPIMockFixtures, IPlugin)
 class MaasApi(object):
 
     """
@@ -50,7 +75,7 @@ class MaasApi(object):
             Entry(
                 tenant_id, "rax: monitor", "cloudMonitoring",
                 [
-                    Endpoint(tenant_id, region, text_type(uuid4()),
+                    Endpoint(tenant_id, region, allocator.uuid("endpoint"),
                              "v1.0")
                     for region in self._regions
                 ]
@@ -64,31 +89,106 @@ class MaasApi(object):
         """
         return MaasMock(self, uri_prefix, session_store, region).app.resource()
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's monitoring
+        objects in every region; implement :obj:`IAPIMockSnapshot`.
+        """
+        return dict([(region, cache.snapshot_json())
+                     for region, cache in data.items()])
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's monitoring objects in every region; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        data = collections.defaultdict(M_Cache)
+        for region, cache_json in dumped.items():
+            data[region] = M_Cache.from_snapshot_json(cache_json)
+        return data
+
+    fixture_kinds = ["entity", "check", "alarm"]
+
+    def fixture_tenant_id(self, tenant_id):
+        """
+        Monitoring objects are kept in the tenant's own session; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        return tenant_id
+
+    def load_fixture(self, session, fixture, clock):
+        """
+        Create an entity, check or alarm from a fixture record of the form
+        ``{"kind": "entity", "region": ..., "id": ..., "entity": <as in a
+        create entity request>}``, and likewise for ``"check"`` and
+        ``"alarm"``, which also have the ``"entity_id"`` of an existing
+        entity.  The region defaults to the first and the ID is generated if
+        not given; implement :obj:`IAPIMockFixtures`.
+        """
+        cache = session.data_for_api(
+            self, lambda: collections.defaultdict(M_Cache)
+        )[fixture.get("region", self._regions[0])]
+        kind = fixture["kind"]
+        if kind == "entity":
+            created = createEntity(fixture["entity"])
+        else:
+            entity_id = fixture["entity_id"]
+            if entity_id not in cache.entities:
+                raise ValueError("no entity " + entity_id)
+            created = {"check": createCheck,
+                       "alarm": createAlarm}[kind](fixture[kind])
+            created['entity_id'] = entity_id
+        if fixture.get("id"):
+            created['id'] = fixture["id"]
+        {"entity": cache.add_entity,
+         "check": cache.add_check,
+         "alarm": cache.add_alarm}[kind](created)
+
+
+_EMPTY_INDEX = OrderedIndex()
+
 
 class M_Cache(dict):
 
     """
     M(onitoring) Cache Object to hold dictionaries of all entities, checks and alarms.
+
+    Each kind of object is kept in an :obj:`OrderedIndex` keyed by its ID, in
+    the order the objects were created (or last replaced).  Checks and alarms
+    are also indexed by the ID of the entity they belong to; use
+    :obj:`add_entity`, :obj:`remove_entity`, :obj:`add_check`,
+    :obj:`remove_check`, :obj:`add_alarm` and :obj:`remove_alarm` to change
+    them so that those indexes, and the overview and metric list of each
+    entity, stay up to date.
     """
 
     def __init__(self):
         """
         Create the initial structs for cache
         """
-        self.entities_list = []
-        self.checks_list = []
-        self.alarms_list = []
-        self.notifications_list = [{'id': 'ntTechnicalContactsEmail',
-                                    'label': 'Email All Technical Contacts',
-                                    'created_at': time.time(),
-                                    'updated_at': time.time(),
-                                    'metadata': None,
-                                    'type': 'technicalContactsEmail',
-                                    'details': None}]
-        self.notificationplans_list = [{'id': 'npTechnicalContactsEmail',
-                                        'label': 'Technical Contacts - Email',
-                                        'critical_state': [], 'warning_state': [],
-                                        'ok_state': [], 'metadata': None}]
+        self.entities = OrderedIndex()
+        self.checks = OrderedIndex()
+        self.alarms = OrderedIndex()
+        self._checks_by_entity = {}
+        self._alarms_by_entity = {}
+        self._alarms_by_np = {}
+        self._overviews = {}
+        self._metric_lists = {}
+        self.notifications = OrderedIndex()
+        self.notifications.add('ntTechnicalContactsEmail',
+                               {'id': 'ntTechnicalContactsEmail',
+                                'label': 'Email All Technical Contacts',
+                                'created_at': time.time(),
+                                'updated_at': time.time(),
+                                'metadata': None,
+                                'type': 'technicalContactsEmail',
+                                'details': None})
+        self.notificationplans = OrderedIndex()
+        self.notificationplans.add('npTechnicalContactsEmail',
+                                   {'id': 'npTechnicalContactsEmail',
+                                    'label': 'Technical Contacts - Email',
+                                    'critical_state': [], 'warning_state': [],
+                                    'ok_state': [], 'metadata': None})
         self.notificationtypes_list = [{'id': 'webhook', 'fields': [{'name': 'url',
                                                                      'optional': False,
                                                                      'description': 'An HTTP or \
@@ -107,7 +207,203 @@ class M_Cache(dict):
                                                                   the notification to, \
                                                                   with leading + and country \
                                                                   code (E.164 format)'}]}]
-        self.suppressions_list = []
+        self.suppressions = OrderedIndex()
+
+    def _add_child(self, by_entity, objects, obj):
+        """
+        Add a check or alarm to ``objects`` and to the index of the checks or
+        alarms of its entity, as the newest one, replacing any with the same
+        ID.
+        """
+        self._remove_child(by_entity, objects, obj['id'])
+        objects.add(obj['id'], obj)
+        by_entity.setdefault(obj['entity_id'], OrderedIndex()).add(
+            obj['id'], obj)
+        self._overviews.pop(obj['entity_id'], None)
+
+    def _remove_child(self, by_entity, objects, obj_id):
+        """
+        Remove a check or alarm from ``objects`` and from the index of the
+        checks or alarms of its entity.
+
+        :return: the removed object, or ``None`` if there was none.
+        """
+        obj = objects.pop(obj_id)
+        if obj is not None:
+            siblings = by_entity[obj['entity_id']]
+            siblings.pop(obj_id)
+            if not siblings:
+                del by_entity[obj['entity_id']]
+            self._overviews.pop(obj['entity_id'], None)
+        return obj
+
+    def add_entity(self, entity):
+        """
+        Add an entity, replacing any entity with the same ID, as the newest
+        one.
+        """
+        self.entities.pop(entity['id'])
+        self.entities.add(entity['id'], entity)
+        self._overviews.pop(entity['id'], None)
+        self._metric_lists.pop(entity['id'], None)
+
+    def add_check(self, check):
+        """
+        Add a check, replacing any check with the same ID.
+        """
+        self.remove_check(check['id'])
+        self._add_child(self._checks_by_entity, self.checks, check)
+        self._metric_lists.pop(check['entity_id'], None)
+
+    def remove_check(self, check_id):
+        """
+        Remove a check (but not its alarms).
+
+        :return: the removed check, or ``None`` if there was none.
+        """
+        check = self._remove_child(self._checks_by_entity, self.checks,
+                                   check_id)
+        if check is not None:
+            self._metric_lists.pop(check['entity_id'], None)
+        return check
+
+    def checks_for_entity(self, entity_id):
+        """
+        The checks on the given entity, oldest first.
+        """
+        return list(self._checks_by_entity.get(entity_id, ()))
+
+    def add_alarm(self, alarm):
+        """
+        Add an alarm, replacing any alarm with the same ID.
+        """
+        self.remove_alarm(alarm['id'])
+        self._add_child(self._alarms_by_entity, self.alarms, alarm)
+        self._alarms_by_np.setdefault(alarm.get('notification_plan_id'),
+                                      OrderedIndex()).add(alarm['id'], alarm)
+
+    def remove_alarm(self, alarm_id):
+        """
+        Remove an alarm.
+
+        :return: the removed alarm, or ``None`` if there was none.
+        """
+        alarm = self._remove_child(self._alarms_by_entity, self.alarms,
+                                   alarm_id)
+        if alarm is not None:
+            np_id = alarm.get('notification_plan_id')
+            plan_alarms = self._alarms_by_np[np_id]
+            plan_alarms.pop(alarm_id)
+            if not plan_alarms:
+                del self._alarms_by_np[np_id]
+        return alarm
+
+    def alarms_for_plan(self, np_id):
+        """
+        The alarms which use the given notification plan, oldest first.
+
+        :return: an :obj:`OrderedIndex` of alarms by ID, which must not be
+            modified.
+        """
+        return self._alarms_by_np.get(np_id, _EMPTY_INDEX)
+
+    def alarms_for_entity(self, entity_id):
+        """
+        The alarms on the given entity, oldest first.
+        """
+        return list(self._alarms_by_entity.get(entity_id, ()))
+
+    def remove_entity(self, entity_id):
+        """
+        Remove an entity, along with its checks and alarms.
+        """
+        self.entities.pop(entity_id)
+        for check in self.checks_for_entity(entity_id):
+            self.remove_check(check['id'])
+        for alarm in self.alarms_for_entity(entity_id):
+            self.remove_alarm(alarm['id'])
+        self._overviews.pop(entity_id, None)
+        self._metric_lists.pop(entity_id, None)
+
+    def _without_entity_id(self, objects):
+        """
+        Copies of the given checks or alarms, without their ``entity_id``.
+        """
+        result = []
+        for obj in objects:
+            obj = dict(obj)
+            del obj['entity_id']
+            result.append(obj)
+        return result
+
+    def entity_overview(self, entity_id):
+        """
+        The overview of an entity: the entity with its checks and alarms.
+
+        Overviews are kept until the entity or one of its checks or alarms
+        changes, so they must not be modified.
+        """
+        overview = self._overviews.get(entity_id)
+        if overview is None:
+            overview = {
+                'alarms': self._without_entity_id(
+                    self._alarms_by_entity.get(entity_id, ())),
+                'checks': self._without_entity_id(
+                    self._checks_by_entity.get(entity_id, ())),
+                'entity': self.entities[entity_id],
+                'latest_alarm_states': []
+            }
+            self._overviews[entity_id] = overview
+        return overview
+
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all the objects in this cache,
+        for a snapshot; see :obj:`from_snapshot_json`.
+        """
+        return {
+            'entities': list(self.entities),
+            'checks': list(self.checks),
+            'alarms': list(self.alarms),
+            'notifications': list(self.notifications),
+            'notificationplans': list(self.notificationplans),
+            'suppressions': list(self.suppressions),
+        }
+
+    @classmethod
+    def from_snapshot_json(cls, snapshot_json):
+        """
+        Re-create a cache from the result of :obj:`snapshot_json`.
+        """
+        self = cls()
+        for entity in snapshot_json['entities']:
+            self.add_entity(entity)
+        for check in snapshot_json['checks']:
+            self.add_check(check)
+        for alarm in snapshot_json['alarms']:
+            self.add_alarm(alarm)
+        for name in ('notifications', 'notificationplans', 'suppressions'):
+            index = getattr(self, name)
+            index.clear()
+            for obj in snapshot_json[name]:
+                index.add(obj['id'], obj)
+        return self
+
+    def entity_metric_list(self, entity_id):
+        """
+        The metrics available for an entity's checks, as listed by the
+        ``metric_list`` view.
+
+        Metric lists are kept until the entity or one of its checks changes,
+        so they must not be modified.
+        """
+        metric_list = self._metric_lists.get(entity_id)
+        if metric_list is None:
+            metric_list = createMetriclistFromEntity(
+                self.entities[entity_id],
+                self._checks_by_entity.get(entity_id, ()))
+            self._metric_lists[entity_id] = metric_list
+        return metric_list
 
 
 def createEntity(params):
@@ -117,8 +413,8 @@ def createEntity(params):
     params = collections.defaultdict(lambda: '', params)
     newentity = {}
     newentity['label'] = params[u'label'].encode("ascii")
-    newentity['id'] = 'en' + random_hex_generator(4)
-    newentity['agent_id'] = params['agent_id'] or random_hex_generator(12)
+    newentity['id'] = 'en' + allocator.hex('maas_entity', 8)
+    newentity['agent_id'] = params['agent_id'] or allocator.hex('maas_agent', 24)
     newentity['created_at'] = time.time()
     newentity['updated_at'] = time.time()
     newentity['managed'] = params['managed']
@@ -135,10 +431,10 @@ def createCheck(params):
     for k in params.keys():
         if 'encode' in dir(params[k]):
             params[k] = params[k].encode('ascii')
-    params['id'] = 'ch' + random_hex_generator(4)
+    params['id'] = 'ch' + allocator.hex('maas_check', 8)
     params['collectors'] = []
     for q in range(3):
-        params['collectors'].append('co' + random_hex_generator(3))
+        params['collectors'].append('co' + allocator.hex('maas_collector', 6))
     params['confd_hash'] = None
     params['confd_name'] = None
     params['created_at'] = time.time()
@@ -161,7 +457,7 @@ def createAlarm(params):
     for k in params.keys():
         if 'encode' in dir(params[k]):
             params[k] = params[k].encode('ascii')
-    params['id'] = 'al' + random_hex_generator(4)
+    params['id'] = 'al' + allocator.hex('maas_alarm', 8)
     params['confd_hash'] = None
     params['confd_name'] = None
     params['created_at'] = time.time()
@@ -178,7 +474,7 @@ def createNotificationPlan(params):
     for k in params.keys():
         if 'encode' in dir(params[k]):  # because there are integers sometimes.
             params[k] = params[k].encode('ascii')
-    params['id'] = 'np' + random_hex_generator(4)
+    params['id'] = 'np' + allocator.hex('maas_notification_plan', 8)
     params['critical_state'] = None
     params['warning_state'] = None
     params['ok_state'] = None
@@ -195,7 +491,7 @@ def createNotification(params):
     for k in params.keys():
         if 'encode' in dir(params[k]):  # because there are integers sometimes.
             params[k] = params[k].encode('ascii')
-    params['id'] = 'nt' + random_hex_generator(4)
+    params['id'] = 'nt' + allocator.hex('maas_notification', 8)
     params['created_at'] = time.time()
     params['updated_at'] = time.time()
     params['metadata'] = None
@@ -209,7 +505,7 @@ def createSuppression(params):
     for k in params.keys():
         if 'encode' in dir(params[k]):
             params[k] = params[k].encode('ascii')
-    params['id'] = 'sp' + random_hex_generator(4)
+    params['id'] = 'sp' + allocator.hex('maas_suppression', 8)
     if 'notification_plans' not in params:
         params['notification_plans'] = []
     if 'entities' not in params:
@@ -246,38 +542,106 @@ def createMetriclistFromEntity(entity, allchecks):
     return v
 
 
-def createMultiplotFromMetric(metric, reqargs, allchecks):
+# Maps each random byte to an average between 1 and 99, as evenly as 256
+# values allow.
+_AVERAGE_FOR_BYTE = bytes(bytearray(b * 99 // 256 + 1 for b in range(256)))
+
+
+def _random_bytes(rng, count):
+    """
+    ``count`` random bytes, drawn from ``rng`` (a :obj:`random.Random`) in
+    one call, so that they depend only on its state.
+    """
+    if count < 1:
+        return b''
+    return unhexlify('%0*x' % (count * 2, rng.getrandbits(count * 8)))
+
+
+def createDatapointColumns(fromdate, todate, points, rng):
+    """
+    Generate a fake series of ``points`` datapoints evenly spaced from
+    ``fromdate`` towards ``todate``, as two columns: the timestamps, and
+    random averages between 1 and 99 drawn from ``rng`` (a
+    :obj:`random.Random`).
+
+    Each column is filled in one go, rather than a datapoint at a time,
+    since a multiplot can ask for very many points.
+
+    :return: a 2-tuple of :obj:`array.array` of timestamps and of averages.
+    """
+    interval = (todate - fromdate) // points
+    if interval:
+        timestamps = array('d', xrange(fromdate, fromdate + interval * points,
+                                       interval))
+    else:
+        timestamps = array('d', [fromdate]) * max(points, 0)
+    averages = array('b', _random_bytes(rng, points)
+                     .translate(_AVERAGE_FOR_BYTE))
+    return timestamps, averages
+
+
+_DATAPOINT_JSON = '{"numPoints": 4, "timestamp": %d, "average": %d}'
+
+
+def encodeMultiplot(multiplot, columns):
+    """
+    Encode a multiplot as JSON, with its ``data`` encoded straight from the
+    datapoint columns returned by :obj:`createDatapointColumns`.
+    """
+    head = json.dumps(multiplot)
+    data = ', '.join(map(_DATAPOINT_JSON.__mod__, zip(*columns)))
+    return head[:-1] + ', "data": [' + data + ']}'
+
+
+def createMultiplotFromMetric(metric, reqargs, check, seed=None):
     """
     Given a metric, this will produce fake datapoints to graph
     This is for the multiplot API call
+
+    :param dict check: The check the metric belongs to, or ``None`` if there
+        is no such check.
+    :param seed: If not ``None``, the datapoints depend only on this, the
+        metric and the requested time range and number of points.
+
+    :return: a 2-tuple of the multiplot without its data, and the datapoint
+        columns, to be encoded by :obj:`encodeMultiplot`; or ``None`` if the
+        check is missing, on another entity or not a remote.ping check.
     """
+    if (check is None or check['entity_id'] != metric['entity_id'] or
+            check['type'] != 'remote.ping'):
+        return None
     fromdate = int(reqargs['from'][0])
     todate = int(reqargs['to'][0])
     points = int(reqargs['points'][0])
     multiplot = {}
-    for c in allchecks:
-        if c['entity_id'] == metric['entity_id']:
-            if c['type'] == 'remote.ping':
-                multiplot['entity_id'] = metric['entity_id']
-                multiplot['check_id'] = metric['check_id']
-                multiplot['type'] = 'number'
-                multiplot['metric'] = metric['metric']
-                if metric['metric'].endswith('available'):
-                    multiplot['unit'] = 'percent'
-                else:
-                    multiplot['unit'] = 'seconds'
-                multiplot['data'] = []
-                interval = (todate - fromdate) / points
-                timestamp = fromdate
-                for q in range(points):
-                    d = {}
-                    d['numPoints'] = 4
-                    d['timestamp'] = timestamp
-                    d['average'] = random.randint(1, 99)
-                    multiplot['data'].append(d)
-                    timestamp += interval
-
-    return multiplot
+    multiplot['entity_id'] = metric['entity_id']
+    multiplot['check_id'] = metric['check_id']
+    multiplot['type'] = 'number'
+    multiplot['metric'] = metric['metric']
+    if metric['metric'].endswith('available'):
+        multiplot['unit'] = 'percent'
+    else:
+        multiplot['unit'] = 'seconds'
+    if seed is None:
+        rng = random.Random()
+    else:
+        # Seeded with an integer, since random.Random seeds differently from
+        # strings on each version of Python (and by their hash()).
+        rng = random.Random(int(sha1(u'{0}:{1}:{2}:{3}'.format(
+            seed, metric['entity_id'], metric['check_id'], metric['metric'])
+            .encode('utf-8')).hexdigest(), 16))
+    return multiplot, createDatapointColumns(fromdate, todate, points, rng)
+
+
+def _bad_request(message):
+    """
+    Returns a dictionary representing a 400 error.
+    """
+    return {'type': 'badRequest',
+            'code': 400,
+            'message': message,
+            'details': message,
+            'txnId': '.fake.mimic.transaction.id.c-1111111.ts-123444444.v-12344frf'}
 
 
 class MaasMock(object):
@@ -305,6 +669,46 @@ class MaasMock(object):
                 .data_for_api(self._api_mock, lambda: collections.defaultdict(M_Cache))[self._name]
                 )
 
+    def _paginate(self, request, index, default_limit):
+        """
+        Get the page of objects from an :obj:`OrderedIndex` requested by the
+        ``marker`` (the ID of the first object on the page) and ``limit``
+        (at most 1000) arguments of a request.
+
+        :return: a 2-tuple of the list of objects on the page and the
+            pagination metadata for the response.
+        :raise: :obj:`ValueError` if the limit is invalid or the marker is
+            not the ID of an object in the index.
+        """
+        try:
+            limit = int(request.args.get('limit', [default_limit])[0])
+        except ValueError:
+            limit = None
+        if limit is None or not 1 <= limit <= 1000:
+            raise ValueError('limit must be an integer between 1 and 1000')
+        marker = request.args.get('marker', [None])[0]
+        if marker is None:
+            objects = iter(index)
+        elif marker in index:
+            objects = index.values_from(marker)
+        else:
+            raise ValueError('marker not found: ' + marker)
+        page = list(islice(objects, limit + 1))
+        next_marker = None
+        next_href = None
+        if len(page) > limit:
+            next_marker = page.pop()['id']
+            next_href = ('http://' + request.getRequestHostname() + ':' +
+                         self.endpoint_port + request.path + '?' +
+                         urlencode([('marker', next_marker), ('limit', limit)]))
+        metadata = {}
+        metadata['count'] = len(page)
+        metadata['marker'] = marker
+        metadata['next_marker'] = next_marker
+        metadata['limit'] = limit
+        metadata['next_href'] = next_href
+        return page, metadata
+
     app = MimicApp()
 
     @app.route('/v1.0/<string:tenant_id>/mimic/reset', methods=['GET'])
@@ -320,7 +724,7 @@ class MaasMock(object):
         """
         Replies the entities list call
         """
-        entities = self._entity_cache_for_tenant(tenant_id).entities_list
+        entities = self._entity_cache_for_tenant(tenant_id).entities
         metadata = {}
         metadata['count'] = len(entities)
         metadata['limit'] = 1000
@@ -328,7 +732,8 @@ class MaasMock(object):
         metadata['next_marker'] = None
         metadata['next_href'] = None
         request.setResponseCode(200)
-        return json.dumps({'metadata': metadata, 'values': entities})
+        return stream_json(request, {'metadata': metadata,
+                                     'values': list(entities)})
 
     @app.route('/v1.0/<string:tenant_id>/entities', methods=['POST'])
     def create_entity(self, request, tenant_id):
@@ -338,7 +743,7 @@ class MaasMock(object):
         postdata = json.loads(request.content.read())
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         newentity = createEntity({'label': postdata[u'label'].encode('ascii')})
-        self._entity_cache_for_tenant(tenant_id).entities_list.append(newentity)
+        self._entity_cache_for_tenant(tenant_id).add_entity(newentity)
         request.setResponseCode(201)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newentity['id'])
         request.setHeader('x-object-id', newentity['id'])
@@ -350,11 +755,7 @@ class MaasMock(object):
         """
         Fetches a specific entity
         """
-        entity = None
-        for e in self._entity_cache_for_tenant(tenant_id).entities_list:
-            if e['id'] == entity_id:
-                entity = e
-                break
+        entity = self._entity_cache_for_tenant(tenant_id).entities.get(entity_id)
         if not entity:
             request.setResponseCode(404)
             return '{}'
@@ -368,11 +769,10 @@ class MaasMock(object):
         Returns all the checks for a paricular entity
         """
         checks = []
-        for c in self._entity_cache_for_tenant(tenant_id).checks_list:
-            if c['entity_id'] == entity_id:
-                c = dict(c)  # make a copy,  don't want the entity_id in the response
-                del c['entity_id']
-                checks.append(c)
+        for c in self._entity_cache_for_tenant(tenant_id).checks_for_entity(entity_id):
+            c = dict(c)  # make a copy,  don't want the entity_id in the response
+            del c['entity_id']
+            checks.append(c)
         metadata = {}
         metadata['count'] = len(checks)
         metadata['limit'] = 1000
@@ -393,11 +793,9 @@ class MaasMock(object):
         for k in newentity.keys():
             if 'encode' in dir(newentity[k]):  # because there are integers sometimes.
                 newentity[k] = newentity[k].encode('ascii')
-        for q in range(len(self._entity_cache_for_tenant(tenant_id).entities_list)):
-            if self._entity_cache_for_tenant(tenant_id).entities_list[q]['id'] == entity_id:
-                del self._entity_cache_for_tenant(tenant_id).entities_list[q]
-                self._entity_cache_for_tenant(tenant_id).entities_list.append(newentity)
-                break
+        cache = self._entity_cache_for_tenant(tenant_id)
+        if entity_id in cache.entities:
+            cache.add_entity(newentity)
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         request.setResponseCode(204)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newentity['id'])
@@ -410,19 +808,7 @@ class MaasMock(object):
         """
         Delete an entity, all checks that belong to entity, all alarms that belong to those checks
         """
-        entities = self._entity_cache_for_tenant(tenant_id).entities_list
-        checks = self._entity_cache_for_tenant(tenant_id).checks_list
-        alarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        for e in range(len(entities)):
-            if entities[e]['id'] == entity_id:
-                del entities[e]
-                break
-        for c in checks:
-            if c['entity_id'] == entity_id:
-                del checks[checks.index(c)]
-        for a in alarms:
-            if a['entity_id'] == entity_id:
-                del alarms[alarms.index(a)]
+        self._entity_cache_for_tenant(tenant_id).remove_entity(entity_id)
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
 
@@ -435,7 +821,7 @@ class MaasMock(object):
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         newcheck = createCheck(postdata)
         newcheck['entity_id'] = entity_id
-        self._entity_cache_for_tenant(tenant_id).checks_list.append(newcheck)
+        self._entity_cache_for_tenant(tenant_id).add_check(newcheck)
         request.setResponseCode(201)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newcheck['id'])
         request.setHeader('x-object-id', newcheck['id'])
@@ -449,10 +835,10 @@ class MaasMock(object):
         Get a specific check that was created before
         """
         mycheck = {}
-        for c in self._entity_cache_for_tenant(tenant_id).checks_list:
-            if c['id'] == check_id:
-                mycheck = dict(c)
-                del mycheck['entity_id']
+        c = self._entity_cache_for_tenant(tenant_id).checks.get(check_id)
+        if c is not None:
+            mycheck = dict(c)
+            del mycheck['entity_id']
         request.setResponseCode(200)
         return json.dumps(mycheck)
 
@@ -462,17 +848,16 @@ class MaasMock(object):
         """
         Update an existing check
         """
-        checks = self._entity_cache_for_tenant(tenant_id).checks_list
+        cache = self._entity_cache_for_tenant(tenant_id)
         newcheck = json.loads(request.content.read())
         newcheck['entity_id'] = entity_id
         for k in newcheck.keys():
             if 'encode' in dir(newcheck[k]):  # because there are integers sometimes.
                 newcheck[k] = newcheck[k].encode('ascii')
-        for q in range(len(checks)):
-            if checks[q]['entity_id'] == entity_id and checks[q]['id'] == check_id:
-                del checks[q]
-                checks.append(newcheck)
-                break
+        oldcheck = cache.checks.get(check_id)
+        if oldcheck is not None and oldcheck['entity_id'] == entity_id:
+            cache.remove_check(check_id)
+            cache.add_check(newcheck)
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         request.setResponseCode(204)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newcheck['id'])
@@ -486,15 +871,13 @@ class MaasMock(object):
         """
         Deletes check and all alarms associated to it
         """
-        checks = self._entity_cache_for_tenant(tenant_id).checks_list
-        alarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        for c in range(len(checks)):
-            if checks[c]['entity_id'] == entity_id and checks[c]['id'] == check_id:
-                del checks[c]
-                break
-        for a in alarms:
-            if a['check_id'] == check_id and a['entity_id'] == entity_id:
-                del alarms[alarms.index(a)]
+        cache = self._entity_cache_for_tenant(tenant_id)
+        check = cache.checks.get(check_id)
+        if check is not None and check['entity_id'] == entity_id:
+            cache.remove_check(check_id)
+        for a in cache.alarms_for_entity(entity_id):
+            if a['check_id'] == check_id:
+                cache.remove_alarm(a['id'])
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -508,7 +891,7 @@ class MaasMock(object):
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         newalarm = createAlarm(postdata)
         newalarm['entity_id'] = entity_id
-        self._entity_cache_for_tenant(tenant_id).alarms_list.append(newalarm)
+        self._entity_cache_for_tenant(tenant_id).add_alarm(newalarm)
         request.setResponseCode(201)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newalarm['id'])
         request.setHeader('x-object-id', newalarm['id'])
@@ -521,19 +904,18 @@ class MaasMock(object):
         """
         update alarm
         """
-        alarms = self._entity_cache_for_tenant(tenant_id).alarms_list
+        cache = self._entity_cache_for_tenant(tenant_id)
         newalarm = json.loads(request.content.read())
         newalarm['entity_id'] = entity_id
         newalarm['updated_at'] = time.time()
         for k in newalarm.keys():
             if 'encode' in dir(newalarm[k]):  # because there are integers sometimes.
                 newalarm[k] = newalarm[k].encode('ascii')
-        for q in range(len(alarms)):
-            if alarms[q]['entity_id'] == entity_id and alarms[q]['id'] == alarm_id:
-                newalarm['check_id'] = alarms[q]['check_id']
-                del alarms[q]
-                alarms.append(newalarm)
-                break
+        oldalarm = cache.alarms.get(alarm_id)
+        if oldalarm is not None and oldalarm['entity_id'] == entity_id:
+            newalarm['check_id'] = oldalarm['check_id']
+            cache.remove_alarm(alarm_id)
+            cache.add_alarm(newalarm)
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         request.setResponseCode(204)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newalarm['id'])
@@ -547,11 +929,10 @@ class MaasMock(object):
         """
         Delete an alarm
         """
-        alarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        for q in range(len(alarms)):
-            if alarms[q]['entity_id'] == entity_id and alarms[q]['id'] == alarm_id:
-                del alarms[q]
-                break
+        cache = self._entity_cache_for_tenant(tenant_id)
+        alarm = cache.alarms.get(alarm_id)
+        if alarm is not None and alarm['entity_id'] == entity_id:
+            cache.remove_alarm(alarm_id)
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -562,8 +943,8 @@ class MaasMock(object):
         Get all alarms for the specified entity.
         """
         alarms = [
-            dict(alarm) for alarm in self._entity_cache_for_tenant(tenant_id).alarms_list
-            if alarm['entity_id'] == entity_id
+            dict(alarm) for alarm in
+            self._entity_cache_for_tenant(tenant_id).alarms_for_entity(entity_id)
         ]
         for alarm in alarms:
             del alarm['entity_id']
@@ -579,35 +960,18 @@ class MaasMock(object):
     @app.route('/v1.0/<string:tenant_id>/views/overview', methods=['GET'])
     def overview(self, request, tenant_id):
         """
-        serves the overview api call,returns all entities,checks and alarms
-        """
-        entities = self._entity_cache_for_tenant(tenant_id).entities_list
-        checks = self._entity_cache_for_tenant(tenant_id).checks_list
-        alarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        metadata = {}
-        metadata['count'] = len(entities)
-        metadata['marker'] = None
-        metadata['next_marker'] = None
-        metadata['limit'] = 1000
-        metadata['next_href'] = None
-        values = []
-        for e in entities:
-            v = {}
-            v['alarms'] = []
-            for a in alarms:
-                if a['entity_id'] == e['id']:
-                    a = dict(a)
-                    del a['entity_id']
-                    v['alarms'].append(a)
-            v['checks'] = []
-            for c in checks:
-                if c['entity_id'] == e['id']:
-                    c = dict(c)
-                    del c['entity_id']
-                    v['checks'].append(c)
-            v['entity'] = e
-            v['latest_alarm_states'] = []
-            values.append(v)
+        serves the overview api call, returns entities with their checks and
+        alarms, one page at a time.  ``marker`` is the ID of the first entity
+        on the page, and ``limit`` (at most 1000, the default) the number of
+        entities on it.
+        """
+        cache = self._entity_cache_for_tenant(tenant_id)
+        try:
+            page, metadata = self._paginate(request, cache.entities, 1000)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return json.dumps(_bad_request(str(e)))
+        values = [cache.entity_overview(entity['id']) for entity in page]
         request.setResponseCode(200)
         return json.dumps({'metadata': metadata, 'values': values})
 
@@ -623,7 +987,7 @@ class MaasMock(object):
         myhostname_and_port = request.getRequestHostname() + ':' + self.endpoint_port
         mockapi_id = re.findall('/mimicking/(.+?)/', request.path)[0]
         url = "http://" + myhostname_and_port + '/mimicking/' + mockapi_id + '/ORD/v1.0'
-        return json.dumps(json_home(url))
+        return json_home_template.render(url=url)
 
     @app.route('/v1.0/<string:tenant_id>/views/agent_host_info', methods=['GET'])
     def view_agent_host_info(self, request, tenant_id):
@@ -657,7 +1021,7 @@ class MaasMock(object):
         """
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         new_n = createNotification(json.loads(request.content.read()))
-        self._entity_cache_for_tenant(tenant_id).notifications_list.append(new_n)
+        self._entity_cache_for_tenant(tenant_id).notifications.add(new_n['id'], new_n)
         request.setResponseCode(201)
         request.setHeader('content-type', 'text/plain')
         request.setHeader('location', myhostname_and_port + request.path + '/' + new_n['id'])
@@ -669,11 +1033,11 @@ class MaasMock(object):
         """
         Get notification targets
         """
-        nlist = self._entity_cache_for_tenant(tenant_id).notifications_list
+        nlist = self._entity_cache_for_tenant(tenant_id).notifications
         metadata = {'count': len(nlist), 'limit': 100, 'marker': None, 'next_marker': None,
                     'next_href': None}
         request.setResponseCode(200)
-        return json.dumps({'values': nlist, 'metadata': metadata})
+        return json.dumps({'values': list(nlist), 'metadata': metadata})
 
     @app.route('/v1.0/<string:tenant_id>/notifications/<string:n_id>', methods=['PUT'])
     def update_notifications(self, request, tenant_id, n_id):
@@ -681,13 +1045,11 @@ class MaasMock(object):
         Updates notification targets
         """
         postdata = json.loads(request.content.read())
-        nlist = self._entity_cache_for_tenant(tenant_id).notifications_list
-        for n in nlist:
-            if n['id'] == postdata['id']:
-                for k in postdata.keys():
-                    n[k] = postdata[k]
-                n['updated_at'] = time.time()
-                break
+        n = self._entity_cache_for_tenant(tenant_id).notifications.get(postdata['id'])
+        if n is not None:
+            for k in postdata.keys():
+                n[k] = postdata[k]
+            n['updated_at'] = time.time()
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -697,11 +1059,7 @@ class MaasMock(object):
         """
         Delete a notification
         """
-        nlist = self._entity_cache_for_tenant(tenant_id).notifications_list
-        for n in nlist:
-            if n['id'] == n_id:
-                del nlist[nlist.index(n)]
-                break
+        self._entity_cache_for_tenant(tenant_id).notifications.pop(n_id)
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -714,7 +1072,7 @@ class MaasMock(object):
         postdata = json.loads(request.content.read())
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         newnp = createNotificationPlan({'label': postdata[u'label'].encode('ascii')})
-        self._entity_cache_for_tenant(tenant_id).notificationplans_list.append(newnp)
+        self._entity_cache_for_tenant(tenant_id).notificationplans.add(newnp['id'], newnp)
         request.setResponseCode(201)
         request.setHeader('content-type', 'text/plain')
         request.setHeader('location', myhostname_and_port + request.path + '/' + newnp['id'])
@@ -726,23 +1084,18 @@ class MaasMock(object):
         """
         Get all notification plans
         """
-        npist = self._entity_cache_for_tenant(tenant_id).notificationplans_list
+        npist = self._entity_cache_for_tenant(tenant_id).notificationplans
         metadata = {'count': len(npist), 'limit': 100, 'marker': None, 'next_marker': None,
                     'next_href': None}
         request.setResponseCode(200)
-        return json.dumps({'values': npist, 'metadata': metadata})
+        return json.dumps({'values': list(npist), 'metadata': metadata})
 
     @app.route('/v1.0/<string:tenant_id>/notification_plans/<string:np_id>', methods=['GET'])
     def get_notification_plan(self, request, tenant_id, np_id):
         """
         Get specific notif plan
         """
-        mynp = None
-        nplist = self._entity_cache_for_tenant(tenant_id).notificationplans_list
-        for np in nplist:
-            if np['id'] == np_id:
-                mynp = np
-                break
+        mynp = self._entity_cache_for_tenant(tenant_id).notificationplans.get(np_id)
         request.setResponseCode(200)
         return json.dumps(mynp)
 
@@ -752,13 +1105,11 @@ class MaasMock(object):
         Alter a notification plan
         """
         postdata = json.loads(request.content.read())
-        nplist = self._entity_cache_for_tenant(tenant_id).notificationplans_list
-        for np in nplist:
-            if np['id'] == postdata['id']:
-                for k in postdata.keys():
-                    np[k] = postdata[k]
-                np['updated_at'] = time.time()
-                break
+        np = self._entity_cache_for_tenant(tenant_id).notificationplans.get(postdata['id'])
+        if np is not None:
+            for k in postdata.keys():
+                np[k] = postdata[k]
+            np['updated_at'] = time.time()
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -768,12 +1119,9 @@ class MaasMock(object):
         """
         Remove a notifcation plan
         """
-        allalarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        nplist = self._entity_cache_for_tenant(tenant_id).notificationplans_list
-        alarmids_using_np = []
-        for alarm in allalarms:
-            if alarm['notification_plan_id'] == np_id:
-                alarmids_using_np.append(alarm['id'])
+        cache = self._entity_cache_for_tenant(tenant_id)
+        nplist = cache.notificationplans
+        alarmids_using_np = cache.alarms_for_plan(np_id).keys()
 
         if len(alarmids_using_np):
             request.setResponseCode(403)
@@ -788,10 +1136,7 @@ class MaasMock(object):
             errobj['details'] = errobj['message']
             return json.dumps(errobj)
 
-        for np in nplist:
-            if np['id'] == np_id:
-                del nplist[nplist.index(np)]
-                break
+        nplist.pop(np_id)
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -801,7 +1146,7 @@ class MaasMock(object):
         """
         Get the list of suppressions for this tenant.
         """
-        splist = self._entity_cache_for_tenant(tenant_id).suppressions_list
+        splist = self._entity_cache_for_tenant(tenant_id).suppressions
         metadata = {
             'count': len(splist),
             'limit': 100,
@@ -810,19 +1155,14 @@ class MaasMock(object):
             'next_href': None
         }
         request.setResponseCode(200)
-        return json.dumps({'values': splist, 'metadata': metadata})
+        return json.dumps({'values': list(splist), 'metadata': metadata})
 
     @app.route('/v1.0/<string:tenant_id>/suppressions/<string:sp_id>', methods=['GET'])
     def get_suppression(self, request, tenant_id, sp_id):
         """
         Get a suppression by ID.
         """
-        mysp = None
-        splist = self._entity_cache_for_tenant(tenant_id).suppressions_list
-        for sp in splist:
-            if sp['id'] == sp_id:
-                mysp = sp
-                break
+        mysp = self._entity_cache_for_tenant(tenant_id).suppressions.get(sp_id)
         request.setResponseCode(200)
         return json.dumps(mysp)
 
@@ -834,7 +1174,7 @@ class MaasMock(object):
         postdata = json.loads(request.content.read())
         myhostname_and_port = 'http://' + request.getRequestHostname() + ':' + self.endpoint_port
         newsp = createSuppression(postdata)
-        self._entity_cache_for_tenant(tenant_id).suppressions_list.append(newsp)
+        self._entity_cache_for_tenant(tenant_id).suppressions.add(newsp['id'], newsp)
         request.setResponseCode(201)
         request.setHeader('location', myhostname_and_port + request.path + '/' + newsp['id'])
         request.setHeader('x-object-id', newsp['id'])
@@ -847,13 +1187,11 @@ class MaasMock(object):
         Update a suppression.
         """
         postdata = json.loads(request.content.read())
-        splist = self._entity_cache_for_tenant(tenant_id).suppressions_list
-        for sp in splist:
-            if sp['id'] == sp_id:
-                for k in postdata.keys():
-                    sp[k] = postdata[k]
-                sp['updated_at'] = time.time()
-                break
+        sp = self._entity_cache_for_tenant(tenant_id).suppressions.get(sp_id)
+        if sp is not None:
+            for k in postdata.keys():
+                sp[k] = postdata[k]
+            sp['updated_at'] = time.time()
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -863,11 +1201,7 @@ class MaasMock(object):
         """
         Delete a suppression.
         """
-        splist = self._entity_cache_for_tenant(tenant_id).suppressions_list
-        for sp in splist:
-            if sp['id'] == sp_id:
-                del splist[splist.index(sp)]
-                break
+        self._entity_cache_for_tenant(tenant_id).suppressions.pop(sp_id)
         request.setResponseCode(204)
         request.setHeader('content-type', 'text/plain')
         return ''
@@ -877,75 +1211,47 @@ class MaasMock(object):
         """
         Lists the monitoring zones
         """
-        mzs = monitoring_zones()
-        metadata = {
-            'count': len(mzs),
-            'limit': 100,
-            'marker': None,
-            'next_marker': None,
-            'next_href': None
-        }
         request.setResponseCode(200)
-        return json.dumps({'values': mzs, 'metadata': metadata})
+        return _monitoring_zones_json
 
     @app.route('/v1.0/<string:tenant_id>/alarm_examples', methods=['GET'])
     def list_alarm_examples(self, request, tenant_id):
         """
         Lists all of the alarm examples.
         """
-        axs = alarm_examples()
-        metadata = {
-            'count': len(axs),
-            'limit': 100,
-            'marker': None,
-            'next_marker': None,
-            'next_href': None
-        }
         request.setResponseCode(200)
-        return json.dumps({'values': axs, 'metadata': metadata})
+        return _alarm_examples_json
 
     @app.route('/v1.0/<string:tenant_id>/views/alarmCountsPerNp', methods=['GET'])
     def alarm_counts_per_np(self, request, tenant_id):
         """
-        All NotificationPlans a number of alarms pointing to them.
-        """
-        allalarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        allnps = self._entity_cache_for_tenant(tenant_id).notificationplans_list
-        values = []
-        metadata = {}
-        metadata['limit'] = 100
-        metadata['marker'] = None
-        metadata['next_marker'] = None
-        metadata['next_href'] = None
-        for np in allnps:
-            alarm_count = 0
-            v = {}
-            v['notification_plan_id'] = np['id']
-            for alarm in allalarms:
-                if alarm['notification_plan_id'] == np['id']:
-                    alarm_count = alarm_count + 1
-            v['alarm_count'] = alarm_count
-            values.append(v)
-        metadata['count'] = len(values)
+        All NotificationPlans a number of alarms pointing to them, paginated
+        by ``marker`` (a notification plan ID) and ``limit`` (default 100).
+        """
+        cache = self._entity_cache_for_tenant(tenant_id)
+        try:
+            page, metadata = self._paginate(request, cache.notificationplans, 100)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return json.dumps(_bad_request(str(e)))
+        values = [{'notification_plan_id': np['id'],
+                   'alarm_count': len(cache.alarms_for_plan(np['id']))}
+                  for np in page]
         request.setResponseCode(200)
         return json.dumps({'values': values, 'metadata': metadata})
 
     @app.route('/v1.0/<string:tenant_id>/views/alarmsByNp/<string:np_id>', methods=['GET'])
     def alarms_by_np(self, request, tenant_id, np_id):
         """
-        List of alarms pointing to a particular NotificationPlan
+        List of alarms pointing to a particular NotificationPlan, paginated by
+        ``marker`` (an alarm ID) and ``limit`` (default 100).
         """
-        allalarms = self._entity_cache_for_tenant(tenant_id).alarms_list
-        values = []
-        metadata = {}
-        metadata['limit'] = 100
-        metadata['marker'] = None
-        metadata['next_marker'] = None
-        metadata['next_href'] = None
-        for alarm in allalarms:
-            if alarm['notification_plan_id'] == np_id:
-                values.append(alarm)
-        metadata['count'] = len(values)
+        cache = self._entity_cache_for_tenant(tenant_id)
+        try:
+            values, metadata = self._paginate(request, cache.alarms_for_plan(np_id), 100)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return json.dumps(_bad_request(str(e)))
         request.setResponseCode(200)
         return json.dumps({'values': values, 'metadata': metadata})
 
@@ -965,11 +1271,8 @@ class MaasMock(object):
         """
         All available metrics.
         """
-        allchecks = self._entity_cache_for_tenant(tenant_id).checks_list
-        values = []
-        entities = self._entity_cache_for_tenant(tenant_id).entities_list
-        for e in entities:
-            values.append(createMetriclistFromEntity(e, allchecks))
+        cache = self._entity_cache_for_tenant(tenant_id)
+        values = [cache.entity_metric_list(e['id']) for e in cache.entities]
         metadata = {}
         metadata['count'] = len(values)
         metadata['marker'] = None
@@ -983,14 +1286,17 @@ class MaasMock(object):
     def multiplot(self, request, tenant_id):
         """
         datapoints for all metrics requested
-        Right now, only checks of type remote.ping work
+        Right now, only checks of type remote.ping work.  If a ``seed`` is
+        given, the same request gets the same datapoints.
         """
-        allchecks = self._entity_cache_for_tenant(tenant_id).checks_list
+        cache = self._entity_cache_for_tenant(tenant_id)
         metrics_requested = json.loads(request.content.read())
+        seed = request.args.get('seed', [None])[0]
         metrics_replydata = []
         for m in metrics_requested['metrics']:
-            mp = createMultiplotFromMetric(m, request.args, allchecks)
+            mp = createMultiplotFromMetric(m, request.args,
+                                           cache.checks.get(m['check_id']), seed)
             if mp:
-                metrics_replydata.append(mp)
+                metrics_replydata.append(encodeMultiplot(*mp))
         request.setResponseCode(200)
-        return json.dumps({'metrics': metrics_replydata})
+        return '{"metrics": [' + ', '.join(metrics_replydata) + ']}'
@@ -3,11 +3,9 @@
 Defines create, delete, get, list servers and get images and flavors.
 """
 
-from uuid import uuid4
 import json
 
 from characteristic import attributes
-from six import text_type
 
 from zope.interface import implementer
 
@@ -16,20 +14,23 @@ from twisted.web.server import Request
 from twisted.python.urlpath import URLPath
 
 from twisted.plugin import IPlugin
-from twisted.web.http import CREATED
+from twisted.web.http import CREATED, NOT_FOUND, NO_CONTENT
 
 from mimic.canned_responses.nova import get_limit, get_image, get_flavor
 from mimic.rest.mimicapp import MimicApp
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
-from mimic.imimic import IAPIMock
-from mimic.model.nova_objects import GlobalServerCollections
-from mimic.util.helper import bad_request
+from mimic.imimic import IAPIMock, IAPIMockFixtures, IAPIMockSnapshot
+from mimic.model.nova_objects import GlobalServerCollections, Server
+from mimic.util.helper import (
+    bad_request, not_found_response, timestamp_to_seconds
+)
+from mimic.util.ids import allocator
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IAPIMockSnapshot, IAPIMockFixtures, IPlugin)
 class NovaApi(object):
 
     """
@@ -50,7 +51,7 @@ class NovaApi(object):
             Entry(
                 tenant_id, "compute", "cloudServersOpenStack",
                 [
-                    Endpoint(tenant_id, region, text_type(uuid4()),
+                    Endpoint(tenant_id, region, allocator.uuid("endpoint"),
                              prefix="v2")
                     for region in self._regions
                 ]
@@ -65,6 +66,54 @@ class NovaApi(object):
         return (NovaRegion(self, uri_prefix, session_store, region)
                 .app.resource())
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's servers and
+        behaviors in every region; implement :obj:`IAPIMockSnapshot`.
+        """
+        return {"tenant_id": data.tenant_id,
+                "regions": data.snapshot_json()}
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's servers and behaviors in every region; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        return GlobalServerCollections.from_snapshot_json(
+            dumped["tenant_id"], clock, dumped["regions"])
+
+    fixture_kinds = ["server"]
+
+    def fixture_tenant_id(self, tenant_id):
+        """
+        Servers are kept in the tenant's own session; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        return tenant_id
+
+    def load_fixture(self, session, fixture, clock):
+        """
+        Create a server from a fixture record of the form ``{"kind":
+        "server", "region": ..., "id": ..., "status": ..., "server": <the
+        body of a create server request's "server">}``, where the region
+        defaults to the first, the ID is generated if not given (and must
+        not be the ID of an existing server), and the status defaults to
+        ``ACTIVE``; implement :obj:`IAPIMockFixtures`.
+        """
+        collections = session.data_for_api(
+            self, lambda: GlobalServerCollections(tenant_id=session.tenant_id,
+                                                  clock=clock))
+        collection = collections.collection_for_region(
+            fixture.get("region", self._regions[0]))
+        if (fixture.get("id") is not None and
+                collection.server_by_id(fixture["id"]) is not None):
+            raise ValueError("server {0} already exists".format(fixture["id"]))
+        server = Server.from_creation_request_json(
+            collection, {"server": fixture["server"]},
+            server_id=fixture.get("id"))
+        if fixture.get("status", "ACTIVE") != "ACTIVE":
+            server.update_status(fixture["status"])
+
     def _get_session(self, session_store, tenant_id):
         """
         Retrieve or create a new Nova session from a given tenant identifier
@@ -100,7 +149,7 @@ class NovaControlApi(object):
             Entry(
                 tenant_id, "compute", "cloudServersBehavior",
                 [
-                    Endpoint(tenant_id, region, text_type(uuid4()),
+                    Endpoint(tenant_id, region, allocator.uuid("endpoint"),
                              prefix="v2")
                     for region in self.nova_api._regions
                 ]
@@ -149,19 +198,60 @@ class NovaControlApiRegion(object):
                 "parameters": {
                     "code": 404,
                     "message": "Stuff is broken, what"
-                }
+                },
+                # optionally, how many server creations it applies to, and
+                # for how many seconds, before it is removed
+                "uses": 3,
+                "ttl": 60
             }
+
+        The response has the ID of the behavior, by which it can be removed.
         """
-        global_collection = self.api_mock.nova_api._get_session(
-            self.session_store, tenant_id)
+        region_collection = self._region_collection(tenant_id)
         behavior_description = json.loads(request.content.read())
-        region_collection = global_collection.collection_for_region(
-            self.region)
-        region_collection.create_behavior_registry.register_from_json(
-            behavior_description
-        )
+        try:
+            behavior_id = (
+                region_collection.create_behavior_registry.register_from_json(
+                    behavior_description, region_collection.clock.seconds()))
+        except ValueError as e:
+            request.setResponseCode(400)
+            return json.dumps(bad_request(str(e)))
         request.setResponseCode(CREATED)
-        return b''
+        return json.dumps({"id": behavior_id})
+
+    @app.route('/v2/<string:tenant_id>/behaviors/creation/', methods=['GET'])
+    def list_creation_behaviors(self, request, tenant_id):
+        """
+        List the registered server creation behaviors, with the number of
+        uses they have left, and the time they expire.
+        """
+        region_collection = self._region_collection(tenant_id)
+        return json.dumps({
+            "behaviors":
+                region_collection.create_behavior_registry.registered_json(
+                    region_collection.clock.seconds())})
+
+    @app.route('/v2/<string:tenant_id>/behaviors/creation/<string:behavior_id>',
+               methods=['DELETE'])
+    def delete_creation_behavior(self, request, tenant_id, behavior_id):
+        """
+        Remove a registered server creation behavior.
+        """
+        region_collection = self._region_collection(tenant_id)
+        if region_collection.create_behavior_registry.remove(behavior_id):
+            request.setResponseCode(NO_CONTENT)
+            return b''
+        request.setResponseCode(NOT_FOUND)
+        return json.dumps(not_found_response("behaviors"))
+
+    def _region_collection(self, tenant_id):
+        """
+        The :obj:`RegionalServerCollection` of the given tenant in this
+        region.
+        """
+        return (self.api_mock.nova_api
+                ._get_session(self.session_store, tenant_id)
+                .collection_for_region(self.region))
 
 
 class NovaRegion(object):
@@ -233,33 +323,61 @@ class NovaRegion(object):
             .request_read(request, server_id, self.url)
         )
 
-    @app.route('/v2/<string:tenant_id>/servers', methods=['GET'])
-    def list_servers(self, request, tenant_id):
-        """
-        Returns list of servers that were created by the mocks, with the given
-        name.
-        """
+    def _list_servers(self, request, tenant_id, include_details):
+        """
+        Parse the filtering and pagination arguments of a list servers
+        request and respond with the matching page of servers.
+        """
+        def arg(name, default=None):
+            return request.args.get(name, [default])[0]
+
+        limit = arg('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError(limit)
+            except ValueError:
+                request.setResponseCode(400)
+                return json.dumps(
+                    bad_request("limit param must be a positive integer"))
+
+        changes_since = arg('changes-since')
+        if changes_since is not None:
+            try:
+                changes_since = timestamp_to_seconds(changes_since)
+            except ValueError:
+                request.setResponseCode(400)
+                return json.dumps(bad_request("Invalid changes-since value"))
+
         return (
             self._region_collection_for_tenant(tenant_id)
             .request_list(
-                request, include_details=False, absolutize_url=self.url,
-                name=request.args.get('name', [u""])[0]
+                request, include_details=include_details,
+                absolutize_url=self.url, name=arg('name', u""),
+                status=arg('status'), image=arg('image'),
+                flavor=arg('flavor'), changes_since=changes_since,
+                limit=limit, marker=arg('marker')
             )
         )
 
+    @app.route('/v2/<string:tenant_id>/servers', methods=['GET'])
+    def list_servers(self, request, tenant_id):
+        """
+        Returns list of servers that were created by the mocks, optionally
+        filtered by ``name``, ``status``, ``image``, ``flavor`` and
+        ``changes-since``, and paginated by ``limit`` and ``marker``.
+        """
+        return self._list_servers(request, tenant_id, include_details=False)
+
     @app.route('/v2/<string:tenant_id>/servers/detail', methods=['GET'])
     def list_servers_with_details(self, request, tenant_id):
         """
         Returns list of servers that were created by the mocks, with details
-        such as the metadata.
+        such as the metadata.  Accepts the same filtering and pagination
+        arguments as :obj:`list_servers`.
         """
-        return (
-            self._region_collection_for_tenant(tenant_id)
-            .request_list(
-                request, include_details=True, absolutize_url=self.url,
-                name=request.args.get('name', [u""])[0]
-            )
-        )
+        return self._list_servers(request, tenant_id, include_details=True)
 
     @app.route('/v2/<string:tenant_id>/servers/<string:server_id>',
                methods=['DELETE'])
@@ -277,18 +395,18 @@ class NovaRegion(object):
         """
         Returns a get image response, for any given imageid
         """
-        response_data = get_image(image_id)
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        body, code = get_image(image_id)
+        request.setResponseCode(code)
+        return body
 
     @app.route('/v2/<string:tenant_id>/flavors/<string:flavor_id>', methods=['GET'])
     def get_flavor(self, request, tenant_id, flavor_id):
         """
         Returns a get flavor response, for any given flavorid
         """
-        response_data = get_flavor(flavor_id)
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        body, code = get_flavor(flavor_id)
+        request.setResponseCode(code)
+        return body
 
     @app.route('/v2/<string:tenant_id>/limits', methods=['GET'])
     def get_limit(self, request, tenant_id):
@@ -296,7 +414,7 @@ class NovaRegion(object):
         Returns a get flavor response, for any given flavorid
         """
         request.setResponseCode(200)
-        return json.dumps(get_limit())
+        return get_limit()
 
     @app.route('/v2/<string:tenant_id>/servers/<string:server_id>/ips', methods=['GET'])
     def get_ips(self, request, tenant_id, server_id):
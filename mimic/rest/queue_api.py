@@ -3,10 +3,8 @@ API mock for Rackspace Queues.
 """
 import json
 import collections
-from uuid import uuid4
-from six import text_type
 
-from mimic.imimic import IAPIMock
+from mimic.imimic import IAPIMock, IAPIMockSnapshot
 from twisted.plugin import IPlugin
 from mimic.canned_responses.queue import(add_queue, list_queues,
                                          delete_queue)
@@ -16,12 +14,12 @@ from mimic.catalog import Endpoint
 from mimic.rest.mimicapp import MimicApp
 from zope.interface import implementer
 from twisted.web.server import Request
-from random import randrange
+from mimic.util.ids import allocator
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IAPIMockSnapshot, IPlugin)
 class QueueApi(object):
     """
     API mock for Queues.
@@ -32,13 +30,30 @@ class QueueApi(object):
         """
         self._regions = regions
 
-    def resource_for_region(self, uri_prefix, region, session_store):
+    def resource_for_region(self, region, uri_prefix, session_store):
         """
         Get an :obj:`twisted.web.iweb.IResource` for the given URI prefix;
         implement :obj:`IAPIMock`.
         """
         return (QueueApiRoutes(self, uri_prefix, session_store, region).app.resource())
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's queues; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        return dict([(name, list(q_cache.items()))
+                     for name, q_cache in data.items()])
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's queues; implement :obj:`IAPIMockSnapshot`.
+        """
+        data = collections.defaultdict(Q_Cache)
+        for name, queues in dumped.items():
+            data[name] = Q_Cache(queues)
+        return data
+
     def catalog_entries(self, tenant_id):
         """
         List catalog entries for the Nova API.
@@ -47,7 +62,7 @@ class QueueApi(object):
             Entry(
                 tenant_id, "rax:queues", "cloudQueues",
                 [
-                    Endpoint(tenant_id, region, text_type(uuid4()),
+                    Endpoint(tenant_id, region, allocator.uuid("endpoint"),
                              prefix="v1")
                     for region in self._regions
                 ]
@@ -97,7 +112,7 @@ class QueueApiRoutes(object):
         """
         Api call to create and save queue. HTTP status code of 201.
         """
-        queue_id = randrange(99999)
+        queue_id = allocator.number("queue", 31)
         q_cache = self._queue_cache(tenant_id)
         response_data = add_queue(
             queue_id, queue_name,
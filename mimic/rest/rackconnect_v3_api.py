@@ -6,7 +6,7 @@ http://docs.rcv3.apiary.io/
 """
 from collections import defaultdict
 import json
-from uuid import uuid4, UUID
+from uuid import UUID
 
 from characteristic import attributes, Attribute
 from six import text_type
@@ -18,16 +18,18 @@ from zope.interface import implementer
 
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
-from mimic.imimic import IAPIMock
+from mimic.imimic import IAPIMock, IAPIMockFixtures, IAPIMockSnapshot
 from mimic.rest.mimicapp import MimicApp
 from mimic.util.helper import random_ipv4, seconds_to_timestamp
+from mimic.util.ids import allocator
+from mimic.util.streaming import stream_json
 
 
 Request.defaultContentType = 'application/json'
 timestamp_format = '%Y-%m-%dT%H:%M:%SZ'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IAPIMockSnapshot, IAPIMockFixtures, IPlugin)
 class RackConnectV3(object):
     """
     API mock object for RackConnect V3.
@@ -52,7 +54,8 @@ class RackConnectV3(object):
         """
         return [
             Entry(tenant_id, "rax:rackconnect", "rackconnect", [
-                Endpoint(tenant_id, region, text_type(uuid4()), prefix="v3")
+                Endpoint(tenant_id, region, allocator.uuid("endpoint"),
+                         prefix="v3")
                 for region in self.regions
             ])
         ]
@@ -69,9 +72,53 @@ class RackConnectV3(object):
             region_name=region,
             default_pools=self.default_pools).app.resource()
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's load balancer
+        pools in every region; implement :obj:`IAPIMockSnapshot`.
+        """
+        return dict([(region, [pool.snapshot_json() for pool in pools])
+                     for region, pools in data.items()])
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's load balancer pools in every region; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        data = defaultdict(list)
+        for region, pools in dumped.items():
+            data[region] = [LoadBalancerPool.from_snapshot_json(pool_json)
+                            for pool_json in pools]
+        return data
+
+    fixture_kinds = ["pool"]
+
+    def fixture_tenant_id(self, tenant_id):
+        """
+        Load balancer pools are kept in the tenant's own session; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        return tenant_id
+
+    def load_fixture(self, session, fixture, clock):
+        """
+        Create a load balancer pool from a fixture record of the form
+        ``{"kind": "pool", "region": ..., "id": ..., "pool": {"name": ...,
+        "port": ..., "status": ..., "virtual_ip": ...}}``, where the region
+        defaults to the first and anything else not given is generated or
+        defaulted as usual.  A tenant with pools from fixtures does not get
+        the default pools; implement :obj:`IAPIMockFixtures`.
+        """
+        pools = session.data_for_api(self, lambda: defaultdict(list))[
+            fixture.get("region", self.regions[0])]
+        attributes = dict(fixture.get("pool") or {})
+        if fixture.get("id"):
+            attributes["id"] = fixture["id"]
+        pools.append(LoadBalancerPool(**attributes))
+
 
 @attributes(
-    [Attribute("id", default_factory=lambda: text_type(uuid4()),
+    [Attribute("id", default_factory=lambda: allocator.uuid("rcv3_pool"),
                instance_of=text_type),
      Attribute("name", default_value=u"default", instance_of=text_type),
      Attribute("port", default_value=80, instance_of=int),
@@ -138,9 +185,35 @@ class LoadBalancerPool(object):
         """
         return next((node for node in self.nodes if node.id == node_id), None)
 
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this pool's state,
+        including its nodes, for a snapshot; see :obj:`from_snapshot_json`.
+        """
+        response = dict([
+            (attr.name, getattr(self, attr.name))
+            for attr in LoadBalancerPool.characteristic_attributes])
+        response['nodes'] = [node.snapshot_json() for node in self.nodes]
+        return response
+
+    @classmethod
+    def from_snapshot_json(cls, snapshot_json):
+        """
+        Re-create a :obj:`LoadBalancerPool` from the result of
+        :obj:`snapshot_json`.
+        """
+        kwargs = dict(snapshot_json)
+        del kwargs['nodes']
+        pool = cls(**kwargs)
+        pool.nodes.extend(
+            LoadBalancerPoolNode(load_balancer_pool=pool, **node_json)
+            for node_json in snapshot_json['nodes'])
+        return pool
+
 
 @attributes(["created", "load_balancer_pool", "cloud_server",
-             Attribute("id", default_factory=lambda: text_type(uuid4()),
+             Attribute("id",
+                       default_factory=lambda: allocator.uuid("rcv3_node"),
                        instance_of=text_type),
              Attribute("updated", default_value=None),
              Attribute("status", default_value=text_type("ACTIVE"),
@@ -191,6 +264,16 @@ class LoadBalancerPoolNode(object):
         response['cloud_server'] = {'id': self.cloud_server}
         return response
 
+    def snapshot_json(self):
+        """
+        A JSON-serializable representation of all of this node's state, other
+        than the pool it belongs to, for a snapshot.
+        """
+        return dict([
+            (attr.name, getattr(self, attr.name))
+            for attr in LoadBalancerPoolNode.characteristic_attributes
+            if attr.name != 'load_balancer_pool'])
+
     def update(self, now, status, status_detail=None):
         """
         Changes the status of the node.
@@ -252,7 +335,8 @@ class LoadBalancerPoolsInRegion(object):
 
         http://docs.rcv3.apiary.io/#get-%2Fv3%2F%7Btenant_id%7D%2Fload_balancer_pools
         """
-        return json.dumps([pool.as_json() for pool in self.lbpools])
+        pools = list(self.lbpools)
+        return stream_json(request, (pool.as_json() for pool in pools))
 
     @app.route("/nodes", methods=["POST"])
     def bulk_add_nodes_to_load_balancer_pools(self, request):
@@ -4,19 +4,21 @@
 API mock for OpenStack Swift / Rackspace Cloud Files.
 """
 
-from uuid import uuid4, uuid5, NAMESPACE_URL
-from six import text_type
+from base64 import b64decode
+from uuid import uuid5, NAMESPACE_URL
+from six import itervalues
 
 from characteristic import attributes, Attribute
-from json import dumps
 
-from mimic.imimic import IAPIMock
+from mimic.imimic import IAPIMock, IAPIMockFixtures, IAPIMockSnapshot
 from twisted.plugin import IPlugin
 from twisted.web.http import CREATED, ACCEPTED, OK
 
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
 from mimic.rest.mimicapp import MimicApp
+from mimic.util.ids import allocator
+from mimic.util.streaming import stream_json
 from twisted.web.resource import NoResource
 from zope.interface import implementer
 
@@ -38,7 +40,7 @@ def normal_tenant_id_to_crazy_mosso_id(normal_tenant_id):
     )
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IAPIMockSnapshot, IAPIMockFixtures, IPlugin)
 class SwiftMock(object):
     """
     API mock for Swift.
@@ -61,7 +63,8 @@ class SwiftMock(object):
         modified = self.translate_tenant(tenant_id)
         return [
             Entry(modified, "object-store", "cloudFiles", [
-                Endpoint(modified, "ORD", text_type(uuid4()), prefix="v1"),
+                Endpoint(modified, "ORD", allocator.uuid("endpoint"),
+                         prefix="v1"),
             ])
         ]
 
@@ -74,6 +77,53 @@ class SwiftMock(object):
             uri_prefix=uri_prefix,
             session_store=session_store).app.resource()
 
+    def dump_session_data(self, data, blobs):
+        """
+        Get a JSON-serializable representation of a tenant's containers, with
+        the objects' contents in ``blobs``; implement
+        :obj:`IAPIMockSnapshot`.
+        """
+        return data.snapshot_json(blobs)
+
+    def load_session_data(self, dumped, blobs, clock):
+        """
+        Re-create a tenant's containers; implement :obj:`IAPIMockSnapshot`.
+        """
+        return SwiftTenantInRegion.from_snapshot_json(dumped, blobs)
+
+    fixture_kinds = ["container", "object"]
+
+    def fixture_tenant_id(self, tenant_id):
+        """
+        Containers are kept in the session of the tenant's Cloud Files tenant
+        ID; implement :obj:`IAPIMockFixtures`.
+        """
+        return self.translate_tenant(tenant_id)
+
+    def load_fixture(self, session, fixture, clock):
+        """
+        Create a container from a fixture record of the form ``{"kind":
+        "container", "container": <name>}``, or an object from one of the
+        form ``{"kind": "object", "container": <name>, "name": <name>,
+        "content_type": ..., "data": <text>}`` (or ``"data_base64"`` instead
+        of ``"data"``), creating its container if need be; implement
+        :obj:`IAPIMockFixtures`.
+        """
+        tenant = session.data_for_api(self, SwiftTenantInRegion)
+        name = fixture["container"]
+        container = tenant.containers.get(name)
+        if container is None:
+            container = tenant.containers[name] = Container(name=name)
+        if fixture["kind"] == "object":
+            if "data_base64" in fixture:
+                data = b64decode(fixture["data_base64"].encode("ascii"))
+            else:
+                data = fixture["data"].encode("utf-8")
+            container.objects[fixture["name"]] = Object(
+                name=fixture["name"], data=data,
+                content_type=fixture.get("content_type",
+                                         "application/octet-stream"))
+
 
 @attributes("api uri_prefix session_store".split())
 class SwiftRegion(object):
@@ -90,9 +140,8 @@ class SwiftRegion(object):
         Get a resource for a tenant in this region.
         """
         return (self.session_store.session_for_tenant_id(tenant_id)
-                .data_for_api(self.api,
-                              lambda:
-                              SwiftTenantInRegion().app.resource()))
+                .data_for_api(self.api, SwiftTenantInRegion)
+                .app.resource())
 
 
 @attributes(["name", "content_type", "data"])
@@ -135,6 +184,35 @@ class SwiftTenantInRegion(object):
         """
         self.containers = {}
 
+    def snapshot_json(self, blobs):
+        """
+        A JSON-serializable representation of this tenant's containers, for a
+        snapshot; the contents of the objects are stored in ``blobs``, a
+        :obj:`mimic.snapshot.BlobStore`.
+        """
+        return [{"name": container.name,
+                 "objects": [{"name": obj.name,
+                              "content_type": obj.content_type,
+                              "data": blobs.put(obj.data)}
+                             for obj in itervalues(container.objects)]}
+                for container in itervalues(self.containers)]
+
+    @classmethod
+    def from_snapshot_json(cls, snapshot_json, blobs):
+        """
+        Re-create a tenant's containers from the result of
+        :obj:`snapshot_json`.
+        """
+        self = cls()
+        for container_json in snapshot_json:
+            container = Container(name=container_json["name"])
+            for obj in container_json["objects"]:
+                container.objects[obj["name"]] = Object(
+                    name=obj["name"], content_type=obj["content_type"],
+                    data=blobs.get(obj["data"]))
+            self.containers[container.name] = container
+        return self
+
     @app.route("/<string:container_name>", methods=["PUT"])
     def create_container(self, request, container_name):
         """
@@ -162,10 +240,8 @@ class SwiftTenantInRegion(object):
             request.responseHeaders.setRawHeaders("x-container-bytes-used",
                                                   ["0"])
             request.setResponseCode(OK)
-            return dumps([
-                obj.as_json() for obj in
-                self.containers[container_name].objects.values()
-            ])
+            objects = list(itervalues(self.containers[container_name].objects))
+            return stream_json(request, (obj.as_json() for obj in objects))
         else:
             return NoResource()
 
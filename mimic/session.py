@@ -4,22 +4,50 @@
 Implementation of simple in-memory session storage and generation for Mimic.
 """
 
+from heapq import heapify, heappop, heappush
+from itertools import count
 from six import text_type
-from uuid import uuid4
 from datetime import datetime, timedelta
 
 from characteristic import attributes, Attribute
 
+from mimic.imimic import IAPIMockRelease
+from mimic.util.cache import LRUCache
+from mimic.util.ids import allocator
+from mimic.util.ordered import OrderedIndex
+
+
+def release_api_data(api_mock, data):
+    """
+    Release the application data of an API from a session which has been
+    forgotten, if the API needs it to be; see
+    :obj:`mimic.imimic.IAPIMockRelease`.
+    """
+    if IAPIMockRelease.providedBy(api_mock):
+        api_mock.release_session_data(data)
+
 
 @attributes(['username', 'token', 'tenant_id', 'expires',
              Attribute('impersonator_session_map', default_factory=dict),
-             Attribute('_api_objects', default_factory=dict)])
+             Attribute('_api_objects', default_factory=dict),
+             Attribute('_responses', default_factory=dict,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute('_expiry_entry', default_value=None,
+                       exclude_from_cmp=True, exclude_from_repr=True),
+             Attribute('catalog', default_value=None,
+                       exclude_from_cmp=True, exclude_from_repr=True)])
 class Session(object):
     """
     A mimic Session is a record of an authentication token for a particular
     username and tenant_id.
+
+    :ivar catalog: The tenant's service catalog (a
+        :obj:`mimic.core.TenantCatalog`), built by the store's
+        ``catalog_factory`` when the session is created, or ``None``.
     """
 
+    max_cached_responses = 16
+
     @property
     def user_id(self):
         """
@@ -35,6 +63,23 @@ class Session(object):
         """
         return self.impersonator_session_map.get(impersonated_token)
 
+    def cached_response(self, key, render):
+        """
+        Get a response body about this session, such as the response to
+        validating one of its tokens, rendering it with ``render`` if it has
+        not been since the session's expiry time last changed.
+
+        :param key: What the response is, such as the kind of request and
+            the token it is for.
+        :param callable render: A 0-argument callable returning the body.
+        """
+        cached = self._responses.get(key)
+        if cached is None or cached[0] != self.expires:
+            if len(self._responses) >= self.max_cached_responses:
+                self._responses.clear()
+            cached = self._responses[key] = (self.expires, render())
+        return cached[1]
+
     def data_for_api(self, api_mock, data_factory):
         """
         Get the application data for a given API, creating it if necessary.
@@ -43,6 +88,25 @@ class Session(object):
             self._api_objects[api_mock] = data_factory()
         return self._api_objects[api_mock]
 
+    def all_api_data(self):
+        """
+        All the application data in this session.
+
+        :return: a list of 2-tuples of API mock and that API's data.
+        """
+        return list(self._api_objects.items())
+
+    def take_api_data(self):
+        """
+        Remove all the application data from this session, so that it can be
+        moved to a session which replaces this one.
+
+        :return: a list of 2-tuples of API mock and that API's data.
+        """
+        taken = self.all_api_data()
+        self._api_objects.clear()
+        return taken
+
 
 @attributes([Attribute('session', instance_of=Session),
              'desired_tenant'])
@@ -60,14 +124,75 @@ class SessionStore(object):
     are created on demand, since all authentication succeeds by default within
     Mimic.
 
+    Tokens expire according to :obj:`clock`, so advancing mimic's clock
+    expires them: validating an expired token fails (see
+    :obj:`token_expired`), and authenticating again as the same user issues
+    a new token for the same session, which keeps its tenant and all of its
+    API data.  Since users are created on demand, a long-running mimic would
+    still accumulate sessions (and all of the API data that belongs to them)
+    forever; so a session whose token stays expired for ``retention`` is
+    forgotten by :obj:`sweep_expired`, which finds such sessions in a heap
+    ordered by expiry time rather than by looking at every session; and if
+    ``max_sessions`` is set, the least recently used session is forgotten to
+    make room for each new one beyond that number.
+
     :ivar IReactorTime clock: The clock used to track session expiration.
+    :ivar int max_sessions: The maximum number of sessions to keep, or
+        ``None`` for no limit.
+    :ivar timedelta retention: How long a session is kept after its token
+        expires, if it is not authenticated again.
+    :ivar int expired: The number of sessions forgotten because they expired.
+    :ivar int evicted: The number of sessions forgotten to stay within
+        ``max_sessions``.
+    :ivar int api_objects_released: The number of per-API data objects (such
+        as one tenant's servers in one region) forgotten along with those
+        sessions.
+    :ivar id_filter: ``None``, or a callable which is given each username,
+        token and tenant ID generated by :obj:`generate_id`, and returns
+        whether it may be used; the workers of a multi-process mimic use this
+        to hand out only the IDs which are routed back to them (and to load
+        only the fixtures of those tenants).
+    :ivar catalog_factory: ``None``, or a callable which is given the tenant
+        ID of each new session, and returns its ``catalog``.
+    :ivar ids: The :obj:`mimic.util.ids.IDAllocator` from which
+        :obj:`generate_id` draws IDs.
     """
 
-    def __init__(self, clock):
+    def __init__(self, clock, max_sessions=None, expired_tokens_kept=10000,
+                 ids=allocator, retention=timedelta(days=7)):
         """
         Create a session store with the given IReactorTime provider.
+
+        :param int expired_tokens_kept: The number of expired tokens of
+            forgotten sessions, or tokens replaced by new ones, to remember
+            as expired.
         """
         self.clock = clock
+        self.ids = ids
+        self.max_sessions = max_sessions
+        self.retention = retention
+        self.expired = 0
+        self.evicted = 0
+        self.api_objects_released = 0
+        self.id_filter = None
+        self.catalog_factory = None
+        self._use_observers = []
+        self._forget_observers = []
+        self._sessions = OrderedIndex()
+        # (time to forget, entry number, session) of each session, soonest
+        # first; an entry is stale once its session has been forgotten or
+        # has a newer entry (recorded in Session._expiry_entry), and stale
+        # entries are skipped when they come up, or compacted away once they
+        # are the majority
+        self._expiries = []
+        self._stale_expiries = 0
+        self._expiry_order = count()
+        # tokens which expired recently and no longer belong to a session,
+        # so that they are not mistaken for tokens mimic has never seen, and
+        # created on demand
+        self._expired_tokens = LRUCache(expired_tokens_kept)
+        # mapping of each session's own token to the session, least recently
+        # used first
         self._token_to_session = {
             # mapping of token (unicode) to session (Session)
         }
@@ -98,10 +223,7 @@ class SessionStore(object):
         """
         for key in ['username', 'token', 'tenant_id']:
             if attributes.get(key, None) is None:
-                attributes[key] = key + "_" + text_type(uuid4())
-                if key == 'tenant_id':
-                    # integer tenant IDs - uuid4 ints are too long
-                    attributes[key] = text_type(int(uuid4().int % 1e15))
+                attributes[key] = self.generate_id(key)
 
         if 'expires' not in attributes:
             attributes['expires'] = (
@@ -110,14 +232,323 @@ class SessionStore(object):
             )
 
         session = Session(**attributes)
+        if self.catalog_factory is not None:
+            session.catalog = self.catalog_factory(session.tenant_id)
+        self._expired_tokens.pop(session.token)
+        self._expire_at(session, session.expires)
         if username_key is None:
             username_key = session.username
         self._username_to_token[username_key] = session.token
         self._token_to_session[session.token] = session
         self._userid_to_session[session.user_id] = session
         self._tenant_to_token[session.tenant_id] = session.token
+        self._sessions.add(session.token, session)
+        self._make_room()
+        self._notify_use(session)
         return session
 
+    def generate_id(self, key, prefix=u""):
+        """
+        Generate a new username, token or tenant ID, which is acceptable to
+        :obj:`id_filter` if there is one.
+
+        :param str key: ``"username"``, ``"token"`` or ``"tenant_id"``.
+        :param unicode prefix: A prefix for the ID.
+        """
+        while True:
+            if key == 'tenant_id':
+                # integer tenant IDs, of up to 15 digits
+                generated = prefix + text_type(self.ids.number(key, 49))
+            else:
+                generated = prefix + key + "_" + self.ids.uuid(key)
+            if self.id_filter is None or self.id_filter(generated):
+                return generated
+
+    def _now(self):
+        """
+        The current time according to :obj:`clock`, comparable with session
+        expiry times.
+        """
+        return datetime.utcfromtimestamp(self.clock.seconds())
+
+    def _expire_at(self, session, expires):
+        """
+        Set the time at which a session's tokens expire, replacing its entry
+        in the heap of expiry times.
+        """
+        session.expires = expires
+        self._drop_expiry_entry(session)
+        session._expiry_entry = next(self._expiry_order)
+        heappush(self._expiries, (expires + self.retention,
+                                  session._expiry_entry, session))
+
+    def _drop_expiry_entry(self, session):
+        """
+        Make a session's entry in the heap of expiry times stale, compacting
+        the heap if most of its entries are.
+        """
+        if session._expiry_entry is None:
+            return
+        session._expiry_entry = None
+        self._stale_expiries += 1
+        if self._stale_expiries * 2 > len(self._expiries):
+            self._expiries = [entry for entry in self._expiries
+                              if entry[2]._expiry_entry == entry[1]]
+            heapify(self._expiries)
+            self._stale_expiries = 0
+
+    def _live(self, session):
+        """
+        Whether a session's tokens have not yet expired.
+        """
+        return session.expires > self._now()
+
+    def _expire(self, session):
+        """
+        Forget a session whose tokens expired, remembering them as expired.
+        """
+        self._forget(session)
+        self.expired += 1
+        for token in [session.token] + list(session.impersonator_session_map):
+            self._expired_tokens.set(token, True)
+
+    def _renew(self, session, token=None):
+        """
+        Issue a new token to a session whose tokens have expired, keeping the
+        session and its API data, and remembering the old tokens as expired.
+
+        :param unicode token: The new token; by default, a new one is
+            generated.
+        """
+        old_token = session.token
+        for expired in [old_token] + list(session.impersonator_session_map):
+            if self._token_to_session.get(expired) is session:
+                del self._token_to_session[expired]
+            self._expired_tokens.set(expired, True)
+        session.impersonator_session_map.clear()
+        if token is None:
+            token = self.generate_id('token')
+        self._expired_tokens.pop(token)
+        self._sessions.pop(old_token)
+        session.token = token
+        self._sessions.add(token, session)
+        self._token_to_session[token] = session
+        if self._tenant_to_token.get(session.tenant_id) == old_token:
+            self._tenant_to_token[session.tenant_id] = token
+        if self._username_to_token.get(session.username) == old_token:
+            self._username_to_token[session.username] = token
+        self._expire_at(session, self._now() + timedelta(days=1))
+        self._notify_use(session)
+
+    def token_expired(self, token):
+        """
+        Whether a token has expired: either it belongs to a session whose
+        tokens have expired, or it belonged to one which has since been
+        forgotten or issued a new token (recently; see
+        ``expired_tokens_kept``), and has not been used to create a session
+        since.
+        """
+        token_session = self._token_to_session.get(token)
+        if token_session is not None:
+            return not self._live(token_session)
+        return token in self._expired_tokens
+
+    def _used(self, session):
+        """
+        Record that a session was just used, so that it is the last to be
+        evicted.
+        """
+        if session.token in self._sessions:
+            self._sessions.move_to_end(session.token)
+        self._notify_use(session)
+
+    def _notify_use(self, session):
+        """
+        Tell the observers added with :obj:`observe_use` that a session was
+        just created or used.
+        """
+        for observer in self._use_observers:
+            observer(session)
+
+    def observe_use(self, observer):
+        """
+        Call ``observer`` with each session that is looked up or created in
+        this store from now on.
+        """
+        self._use_observers.append(observer)
+
+    def observe_forget(self, observer):
+        """
+        Call ``observer`` with each session that is forgotten by this store
+        from now on, whether it expired, was evicted, was replaced, or was
+        removed.
+        """
+        self._forget_observers.append(observer)
+
+    def _make_room(self):
+        """
+        Forget the least recently used sessions until there are no more than
+        ``max_sessions``.
+        """
+        if self.max_sessions is None:
+            return
+        while len(self._sessions) > self.max_sessions:
+            self._forget(self._sessions[self._sessions.first_key()])
+            self.evicted += 1
+
+    def _forget(self, session):
+        """
+        Remove a session, and every key that refers to it, from this store.
+        """
+        self._sessions.pop(session.token)
+        for token in [session.token] + list(session.impersonator_session_map):
+            if self._token_to_session.get(token) is session:
+                del self._token_to_session[token]
+        if self._userid_to_session.get(session.user_id) is session:
+            del self._userid_to_session[session.user_id]
+        if self._tenant_to_token.get(session.tenant_id) == session.token:
+            del self._tenant_to_token[session.tenant_id]
+        if self._username_to_token.get(session.username) == session.token:
+            del self._username_to_token[session.username]
+        self._drop_expiry_entry(session)
+        self.api_objects_released += len(session._api_objects)
+        for api_mock, data in session.all_api_data():
+            release_api_data(api_mock, data)
+        for observer in self._forget_observers:
+            observer(session)
+
+    def all_sessions(self):
+        """
+        All the sessions in this store, least recently used first.
+        """
+        return list(self._sessions)
+
+    def add_session(self, username, token, tenant_id, expires):
+        """
+        Add a session with the given fields, such as one restored from a
+        snapshot, replacing any session with the same token, or with the same
+        username (which is the same session, issued a different token).
+
+        :return: the new :obj:`Session`.
+        """
+        existing = self._sessions.get(token)
+        if existing is not None:
+            self._forget(existing)
+        existing = self.existing_session_for_username(username)
+        if existing is not None:
+            self._forget(existing)
+        return self._new_session(username=username, token=token,
+                                 tenant_id=tenant_id, expires=expires)
+
+    def add_impersonated_token(self, session, impersonated_token,
+                               impersonator_session):
+        """
+        Make ``impersonated_token`` a token for ``session``, issued to the user
+        of ``impersonator_session`` (which may be ``None``).
+        """
+        session.impersonator_session_map[impersonated_token] = (
+            impersonator_session)
+        self._token_to_session[impersonated_token] = session
+        self._expired_tokens.pop(impersonated_token)
+
+    def clear(self):
+        """
+        Forget all sessions.  This does not count as expiring or evicting
+        them.
+        """
+        for session in self._sessions:
+            session._expiry_entry = None
+            for api_mock, data in session.all_api_data():
+                release_api_data(api_mock, data)
+            for observer in self._forget_observers:
+                observer(session)
+        self._sessions.clear()
+        self._token_to_session.clear()
+        self._userid_to_session.clear()
+        self._tenant_to_token.clear()
+        self._username_to_token.clear()
+        del self._expiries[:]
+        self._stale_expiries = 0
+        self._expired_tokens.clear()
+
+    def empty_copy(self):
+        """
+        A new, empty store with the same clock, settings and ID allocator as
+        this one, to build sessions in before they replace this store's own
+        with :obj:`replace_sessions`.
+        """
+        store = SessionStore(self.clock, self.max_sessions, ids=self.ids,
+                             retention=self.retention)
+        store.id_filter = self.id_filter
+        store.catalog_factory = self.catalog_factory
+        return store
+
+    def replace_sessions(self, other):
+        """
+        Replace all of this store's sessions with those of another store
+        (made with :obj:`empty_copy`), which must not be used afterwards.
+        This does not count as expiring or evicting the sessions replaced.
+        """
+        self.clear()
+        self._sessions = other._sessions
+        self._token_to_session = other._token_to_session
+        self._userid_to_session = other._userid_to_session
+        self._tenant_to_token = other._tenant_to_token
+        self._username_to_token = other._username_to_token
+        self._expiries = other._expiries
+        self._stale_expiries = other._stale_expiries
+        self._expiry_order = other._expiry_order
+        for session in self._sessions:
+            self._notify_use(session)
+
+    def limit_sessions(self, max_sessions):
+        """
+        Keep no more than ``max_sessions`` sessions from now on, evicting the
+        least recently used ones if there are already more.
+
+        :param max_sessions: The maximum number of sessions, or ``None`` for
+            no limit.
+        """
+        self.max_sessions = max_sessions
+        self._make_room()
+
+    def sweep_expired(self):
+        """
+        Forget all sessions whose tokens expired, according to :obj:`clock`,
+        at least ``retention`` ago.
+
+        This takes time proportional to the number of sessions forgotten (and
+        the logarithm of the number of sessions), not to the number of
+        sessions.
+
+        :return: the number of sessions forgotten.
+        """
+        now = self._now()
+        forgotten = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            _, entry, session = heappop(self._expiries)
+            if session._expiry_entry != entry:
+                self._stale_expiries -= 1
+                continue
+            session._expiry_entry = None
+            self._expire(session)
+            forgotten += 1
+        return forgotten
+
+    def stats(self):
+        """
+        A JSON-serializable summary of the sessions in this store and of the
+        sessions it has forgotten.
+        """
+        return {
+            "sessions": len(self._sessions),
+            "tokens": len(self._token_to_session),
+            "max_sessions": self.max_sessions,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "api_objects_released": self.api_objects_released,
+        }
+
     def session_for_token(self, token, tenant_id=None):
         """
         :param unicode token: An authentication token previously created by
@@ -129,15 +560,67 @@ class SessionStore(object):
 
         :raise: :obj:`KeyError` if no such thing exists.
         """
-        if token in self._token_to_session:
-            s = self._token_to_session[token]
+        s = self._token_to_session.get(token)
+        if s is not None:
             if tenant_id is not None and s.tenant_id != tenant_id:
                 raise NonMatchingTenantError(session=s,
                                              desired_tenant=tenant_id)
+            if self._live(s):
+                self._used(s)
+            else:
+                self._renew(s, token)
         else:
             s = self._new_session(token=token, tenant_id=tenant_id)
         return s
 
+    def existing_session_for_token(self, token):
+        """
+        Look up the session for a token without creating one.
+
+        :return: the :obj:`Session` for the token, or ``None`` if there is
+            none.
+        """
+        return self._token_to_session.get(token)
+
+    def existing_session_for_username(self, username):
+        """
+        Look up the session of a user without creating one.
+
+        :return: the :obj:`Session` of the user, or ``None`` if there is
+            none.
+        """
+        session = self._token_to_session.get(
+            self._username_to_token.get(username))
+        if session is not None and session.username == username:
+            return session
+
+    def remove_session(self, username):
+        """
+        Forget the session of a user, if there is one.  This does not count
+        as expiring or evicting it.
+        """
+        session = self.existing_session_for_username(username)
+        if session is not None:
+            self._forget(session)
+
+    def used_session_for_token(self, token, tenant_id=None):
+        """
+        Look up the session for a token without creating one, and record that
+        it was used, as :obj:`session_for_token` would.
+
+        :return: the :obj:`Session` for the token, or ``None`` if there is
+            none, or the token has expired, or ``tenant_id`` is given and is
+            not the session's tenant.
+        """
+        session = self._token_to_session.get(token)
+        if session is None or (tenant_id is not None and
+                               session.tenant_id != tenant_id):
+            return None
+        if not self._live(session):
+            return None
+        self._used(session)
+        return session
+
     def session_for_api_key(self, username, api_key, tenant_id=None):
         """
         Create or return a :obj:`Session`.
@@ -154,13 +637,18 @@ class SessionStore(object):
     def session_for_username_password(self, username, password,
                                       tenant_id=None):
         """
-        Create or return a :obj:`Session` based on a user's credentials.
+        Create or return a :obj:`Session` based on a user's credentials,
+        issuing it a new token if its token has expired.
         """
         if username in self._username_to_token:
             s = self._token_to_session[self._username_to_token[username]]
             if tenant_id is not None and s.tenant_id != tenant_id:
                 raise NonMatchingTenantError(session=s,
                                              desired_tenant=tenant_id)
+            if self._live(s):
+                self._used(s)
+            else:
+                self._renew(s)
             return s
 
         return self._new_session(username=username,
@@ -176,19 +664,25 @@ class SessionStore(object):
         session = self.session_for_username_password(
             username, "lucky we don't check passwords, isn't it"
         )
-        session.expires = datetime.utcfromtimestamp(self.clock.seconds() + expires_in)
-        session.impersonator_session_map[impersonated_token] = impersonator_session
-        self._token_to_session[impersonated_token] = session
+        self._expire_at(session, datetime.utcfromtimestamp(
+            self.clock.seconds() + expires_in))
+        self.add_impersonated_token(session, impersonated_token,
+                                    impersonator_session)
         return session
 
     def session_for_tenant_id(self, tenant_id, token_id=None):
         """
-        Looks up a session based on the tenant_id.
+        Looks up a session based on the tenant_id.  The tenant's session is
+        returned even if its token has expired, since the tenant (and its
+        API data) outlives its tokens.
         :param unicode tenant_id: The tenant_id of a previously-created
             session.
         :param unicode token_id: Sets token in the session to the token_id provided,
             else, creates one.
         """
-        if tenant_id not in self._tenant_to_token:
+        token = self._tenant_to_token.get(tenant_id)
+        if token is None:
             return self._new_session(tenant_id=tenant_id, token=token_id)
-        return self.session_for_token(self._tenant_to_token[tenant_id])
+        session = self._token_to_session[token]
+        self._used(session)
+        return session
@@ -0,0 +1,318 @@
+# -*- test-case-name: mimic.test.test_snapshot -*-
+
+"""
+Save all of mimic's in-memory state to disk, and restore it from there, so
+that a mimic can be started with a pre-built fixture instead of having to be
+populated through its REST APIs.
+
+A snapshot is a JSON document::
+
+    {
+        "format": "mimic-snapshot",
+        "version": 1,
+        "now": <the clock's seconds when the snapshot was taken>,
+        "ids": <the number of IDs allocated of each kind>,
+        "sessions": [
+            {
+                "username": ..., "token": ..., "tenant_id": ...,
+                "expires": <seconds since the epoch>,
+                "impersonated_tokens": {<token>: <impersonator's token>},
+                "apis": {<API mock class name>: <the API's data>}
+            },
+            ...
+        ]
+    }
+
+where each API's data is whatever its :obj:`IAPIMockSnapshot` implementation
+makes of it.  Binary payloads (such as the contents of Swift objects) are kept
+in a :obj:`BlobStore`: small ones inline, as base64, and large ones out of
+line, as files named by their SHA-1 in a directory next to the snapshot.
+"""
+
+from __future__ import division
+
+import json
+from base64 import b64decode, b64encode
+from calendar import timegm
+from datetime import datetime
+from hashlib import sha1
+
+from twisted.python.filepath import FilePath
+
+from mimic.imimic import IAPIMockSnapshot
+from mimic.session import release_api_data
+
+SNAPSHOT_FORMAT = "mimic-snapshot"
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    """
+    A snapshot could not be restored.
+    """
+
+
+class BlobStore(object):
+    """
+    Storage for the binary payloads in a snapshot.
+
+    :ivar int inline_limit: Payloads of at most this many bytes are stored in
+        the snapshot itself.
+    """
+
+    inline_limit = 4096
+
+    def __init__(self, directory=None):
+        """
+        :param directory: The :obj:`FilePath` of the directory in which to
+            store large payloads, or ``None`` to store all payloads inline.
+        """
+        self._directory = directory
+
+    def put(self, data):
+        """
+        Store a payload.
+
+        :param bytes data: The payload.
+        :return: a JSON-serializable reference to it, for :obj:`get`.
+        """
+        if self._directory is None or len(data) <= self.inline_limit:
+            return {"inline": b64encode(data).decode("ascii")}
+        digest = sha1(data).hexdigest()
+        if not self._directory.exists():
+            self._directory.makedirs()
+        blob = self._directory.child(digest)
+        if not blob.exists():
+            temporary = blob.temporarySibling()
+            temporary.setContent(data)
+            temporary.moveTo(blob)
+        return {"sha1": digest}
+
+    def get(self, reference):
+        """
+        Retrieve a payload.
+
+        :param reference: The result of :obj:`put` for the payload.
+        :return: the payload, as ``bytes``.
+        :raise: :obj:`SnapshotError` if an out-of-line payload is missing.
+        """
+        if "inline" in reference:
+            return b64decode(reference["inline"].encode("ascii"))
+        if self._directory is None:
+            raise SnapshotError("no blob directory for " + reference["sha1"])
+        blob = self._directory.child(reference["sha1"])
+        if not blob.exists():
+            raise SnapshotError("missing blob " + reference["sha1"])
+        return blob.getContent()
+
+
+def _snapshot_apis(core):
+    """
+    The API mocks of a :obj:`MimicCore` whose data can be snapshotted, by a
+    name that is the same each time mimic runs.
+
+    :return: a ``dict`` mapping names to API mocks.
+    """
+    apis = {}
+    for api in core.apis():
+        if IAPIMockSnapshot.providedBy(api):
+            name = api.__class__.__name__
+            apis.setdefault(name, api)
+    return apis
+
+
+def _expires_to_seconds(expires):
+    """
+    Convert a session expiry time to seconds since the epoch.
+    """
+    return timegm(expires.utctimetuple()) + expires.microsecond / 1e6
+
+
+def snapshot_session(core, session, blobs, only=None):
+    """
+    Take a snapshot of one session of a :obj:`MimicCore`, and all the data
+    in it.
+
+    :param blobs: The :obj:`BlobStore` in which to store binary payloads.
+    :param only: ``None``, or a collection of API mocks, whose data alone is
+        to be included.
+    :return: a JSON-serializable snapshot of the session, as found in the
+        ``"sessions"`` of the result of :obj:`snapshot`.
+    """
+    names = dict((api, name) for name, api in _snapshot_apis(core).items())
+    apis = {}
+    for api, data in session.all_api_data():
+        if api in names and (only is None or api in only):
+            apis[names[api]] = api.dump_session_data(data, blobs)
+    return {
+        "username": session.username,
+        "token": session.token,
+        "tenant_id": session.tenant_id,
+        "expires": _expires_to_seconds(session.expires),
+        "impersonated_tokens": dict(
+            (token, impersonator and impersonator.token)
+            for token, impersonator
+            in session.impersonator_session_map.items()),
+        "apis": apis,
+    }
+
+
+def snapshot(core, blobs):
+    """
+    Take a snapshot of all of the state of a :obj:`MimicCore`.
+
+    :param blobs: The :obj:`BlobStore` in which to store binary payloads.
+    :return: a JSON-serializable snapshot.
+    """
+    return {"format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "now": core.sessions.clock.seconds(),
+            "ids": core.sessions.ids.state(),
+            "sessions": [snapshot_session(core, session, blobs)
+                         for session in core.sessions.all_sessions()]}
+
+
+def advance_to(core, now):
+    """
+    Advance the clock of a :obj:`MimicCore` to the given time, if it is
+    behind and can be advanced (that is, mimic is not running in real time).
+    """
+    clock = core.sessions.clock
+    if hasattr(clock, "advance") and clock.seconds() < now:
+        clock.advance(now - clock.seconds())
+
+
+def restore_sessions(core, sessions_json, blobs, sessions=None,
+                     partial=False):
+    """
+    Restore snapshots of sessions, as taken by :obj:`snapshot_session`, into
+    a :obj:`mimic.session.SessionStore`, replacing any sessions with the same
+    tokens.
+
+    :param blobs: The :obj:`BlobStore` the snapshots' payloads were stored
+        in.
+    :param sessions: The store to restore the sessions into; by default, the
+        core's own.
+    :param bool partial: Whether the snapshots have only some APIs' data
+        (see the ``only`` of :obj:`snapshot_session`), in which case a
+        session keeps the data of the other APIs from the session of the same
+        user it replaces.
+    """
+    if sessions is None:
+        sessions = core.sessions
+    apis = _snapshot_apis(core)
+    restored = []
+    for session_json in sessions_json:
+        kept = []
+        if partial:
+            replaced = sessions.existing_session_for_username(
+                session_json["username"])
+            if replaced is not None:
+                kept = replaced.take_api_data()
+        session = sessions.add_session(
+            username=session_json["username"],
+            token=session_json["token"],
+            tenant_id=session_json["tenant_id"],
+            expires=datetime.utcfromtimestamp(session_json["expires"]))
+        for name, data_json in session_json["apis"].items():
+            if name in apis:
+                api = apis[name]
+                data = api.load_session_data(data_json, blobs, sessions.clock)
+                session.data_for_api(api, lambda: data)
+        for api, data in kept:
+            if session.data_for_api(api, lambda: data) is not data:
+                release_api_data(api, data)
+        restored.append((session, session_json))
+    for session, session_json in restored:
+        for token, impersonator_token in (
+                session_json["impersonated_tokens"].items()):
+            sessions.add_impersonated_token(
+                session, token,
+                impersonator_token and
+                sessions.existing_session_for_token(impersonator_token))
+
+
+def restore(core, dumped, blobs):
+    """
+    Replace all of the state of a :obj:`MimicCore` with a snapshot.
+
+    The snapshot's sessions are restored into a new, empty session store
+    first, so that if any of them cannot be restored, the core is left as it
+    was.  Then the core's clock is advanced to the time the snapshot was
+    taken, with :obj:`advance_to`, the IDs allocated before the snapshot was
+    taken are skipped, so that a mimic with the same ``--id-seed`` does not
+    allocate them again, and the core's sessions are replaced with the
+    restored ones.  The core's cached service catalogs and service
+    resources, which belong to the state being replaced, are forgotten.
+
+    :param dumped: The result of :obj:`snapshot`.
+    :param blobs: The :obj:`BlobStore` the snapshot's payloads were stored
+        in.
+    :raise: :obj:`SnapshotError` if ``dumped`` is not a snapshot that this
+        version of mimic can restore.
+    """
+    if (not isinstance(dumped, dict) or
+            dumped.get("format") != SNAPSHOT_FORMAT):
+        raise SnapshotError("not a mimic snapshot")
+    if dumped.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError("unsupported snapshot version: {0}"
+                            .format(dumped.get("version")))
+    if not isinstance(dumped.get("ids", {}), dict):
+        raise SnapshotError("malformed ID allocator state")
+    restored = core.sessions.empty_copy()
+    try:
+        restore_sessions(core, dumped["sessions"], blobs, restored)
+    except SnapshotError:
+        restored.clear()
+        raise
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        restored.clear()
+        raise SnapshotError("malformed session: {0!r}".format(e))
+    advance_to(core, dumped["now"])
+    core.sessions.ids.skip(dumped.get("ids", {}))
+    core.sessions.replace_sessions(restored)
+    core.catalog_cache.clear()
+    core.resource_cache.clear()
+
+
+def _blob_directory(state_file):
+    """
+    The directory in which the large payloads of the snapshot in the given
+    file are stored.
+    """
+    return state_file.sibling(state_file.basename() + ".blobs")
+
+
+def save(core, path):
+    """
+    Save a snapshot of all of the state of a :obj:`MimicCore` to a file,
+    replacing it atomically.
+
+    :param str path: The name of the file.
+    :return: the snapshot, as returned by :obj:`snapshot`.
+    """
+    state_file = FilePath(path)
+    dumped = snapshot(core, BlobStore(_blob_directory(state_file)))
+    temporary = state_file.temporarySibling()
+    temporary.setContent(json.dumps(dumped).encode("utf-8"))
+    temporary.moveTo(state_file)
+    return dumped
+
+
+def load(core, path):
+    """
+    Replace all of the state of a :obj:`MimicCore` with the snapshot saved
+    in a file by :obj:`save`.
+
+    :param str path: The name of the file.
+    :return: the snapshot, as returned by :obj:`snapshot`.
+    :raise: :obj:`SnapshotError` if the file does not contain a snapshot
+        that this version of mimic can restore.
+    """
+    state_file = FilePath(path)
+    try:
+        dumped = json.loads(state_file.getContent().decode("utf-8"))
+    except ValueError:
+        raise SnapshotError("not a mimic snapshot")
+    restore(core, dumped, BlobStore(_blob_directory(state_file)))
+    return dumped
@@ -1,12 +1,18 @@
 """
 Twisted Application plugin for Mimic
 """
+from datetime import timedelta
+from os.path import exists
+
 from twisted.application.strports import service
+from twisted.application.internet import TimerService
 from twisted.application.service import MultiService
 from twisted.web.server import Site
 from twisted.python import usage
+from mimic import journal, snapshot, workers
 from mimic.core import MimicCore
 from mimic.resource import MimicRoot
+from mimic.util.ids import allocator
 from twisted.internet.task import Clock
 
 
@@ -14,24 +20,152 @@ class Options(usage.Options):
     """
     Options for Mimic
     """
-    optParameters = [['listen', 'l', '8900', 'The endpoint to listen on.']]
+    optParameters = [['listen', 'l', '8900', 'The endpoint to listen on.'],
+                     ['session-sweep-interval', None, 60,
+                      'How often, in seconds of mimic time, to forget '
+                      'expired sessions.', float],
+                     ['session-retention', None, 7 * 86400,
+                      'How long, in seconds of mimic time, to keep a '
+                      'session (and its servers, load balancers and other '
+                      'data) after its token expires, if its user does not '
+                      'authenticate again.', float],
+                     ['max-sessions', None, None,
+                      'The maximum number of sessions to keep; the least '
+                      'recently used are forgotten beyond this.', int],
+                     ['state-file', None, None,
+                      'A snapshot to restore on startup, if it exists; also '
+                      'the default file for the snapshot and restore '
+                      'APIs.'],
+                     ['journal', None, None,
+                      'A journal of changes to replay on startup, if it '
+                      'exists, and to append changes to.  With '
+                      '--state-file, the journal is compacted into the state '
+                      'file on startup.'],
+                     ['journal-interval', None, 1.0,
+                      'How often, in seconds, to write and sync changes to '
+                      'the journal.', float],
+                     ['workers', None, 1,
+                      'The number of worker processes to run; each tenant '
+                      'is served by one of them.  Each worker keeps its own '
+                      '--max-sessions sessions, and its own state file and '
+                      'journal, named after the given ones.', int],
+                     ['id-seed', None, None,
+                      'A seed for the IDs of the users, tokens, servers '
+                      'and other objects mimic creates, so that they are '
+                      'the same from run to run.'],
+                     ['worker', None, None,
+                      'Run as the worker with the given index (from 0) of '
+                      '--workers; used by mimic itself.', int]]
     optFlags = [['realtime', 'r',
                  'Make mimic advance time as real time advances; '
                  'disable the "tick" endpoint.']]
 
+    def postOptions(self):
+        """
+        Check that the session, journal and worker options are in range.
+        """
+        if self['session-sweep-interval'] <= 0:
+            raise usage.UsageError('--session-sweep-interval must be positive')
+        if self['session-retention'] < 0:
+            raise usage.UsageError('--session-retention must not be negative')
+        if self['max-sessions'] is not None and self['max-sessions'] < 1:
+            raise usage.UsageError('--max-sessions must be at least 1')
+        if self['journal-interval'] <= 0:
+            raise usage.UsageError('--journal-interval must be positive')
+        if self['workers'] < 1:
+            raise usage.UsageError('--workers must be at least 1')
+        if (self['worker'] is not None and
+                not 0 <= self['worker'] < self['workers']):
+            raise usage.UsageError('--worker must be less than --workers')
+
+
+def _worker_arguments(config, index, listen):
+    """
+    The arguments to the ``twistd`` which runs one worker of a multi-process
+    mimic.
+
+    :param int index: The index of the worker.
+    :param str listen: The endpoint on which the worker should listen.
+    """
+    arguments = ['--nodaemon', '--pidfile=', '--logfile=-', 'mimic',
+                 '--listen', listen,
+                 '--workers', str(config['workers']),
+                 '--worker', str(index),
+                 '--session-sweep-interval',
+                 repr(config['session-sweep-interval']),
+                 '--session-retention', repr(config['session-retention']),
+                 '--journal-interval', repr(config['journal-interval'])]
+    if config['realtime']:
+        arguments.append('--realtime')
+    if config['max-sessions'] is not None:
+        arguments.extend(['--max-sessions', str(config['max-sessions'])])
+    if config['id-seed'] is not None:
+        arguments.extend(['--id-seed',
+                          '{0}:{1}'.format(config['id-seed'], index)])
+    for option in ['state-file', 'journal']:
+        if config[option] is not None:
+            arguments.extend(['--' + option,
+                              workers.worker_file(config[option], index)])
+    return arguments
+
+
+def _makeDispatcherService(config):
+    """
+    Set up a dispatcher which runs ``--workers`` worker processes, and
+    forwards each request to one of them.
+    """
+    s = MultiService()
+    pool = workers.Workers(
+        config['workers'],
+        lambda index, listen: _worker_arguments(config, index, listen))
+    pool.setServiceParent(s)
+    site = Site(workers.Dispatcher(pool.agent, config['workers']))
+    site.displayTracebacks = False
+    service(config['listen'], site).setServiceParent(s)
+    return s
+
 
 def makeService(config):
     """
     Set up the otter-api service.
     """
+    if config['workers'] > 1 and config['worker'] is None:
+        return _makeDispatcherService(config)
     s = MultiService()
     if config['realtime']:
         from twisted.internet import reactor as clock
     else:
         clock = Clock()
+    if config['id-seed'] is not None:
+        allocator.seed(config['id-seed'])
     core = MimicCore.fromPlugins(clock)
-    root = MimicRoot(core, clock)
-    site = Site(root.app.resource())
+    core.sessions.limit_sessions(config['max-sessions'])
+    core.sessions.retention = timedelta(seconds=config['session-retention'])
+    if config['worker'] is not None:
+        core.sessions.id_filter = (
+            lambda generated: workers.shard_for(
+                generated, config['workers']) == config['worker'])
+    if config['state-file'] is not None and exists(config['state-file']):
+        snapshot.load(core, config['state-file'])
+    if config['journal'] is not None and exists(config['journal']):
+        journal.replay(core, config['journal'])
+        if config['state-file'] is not None:
+            snapshot.save(core, config['state-file'])
+            open(config['journal'], 'wb').close()
+    sweeper = TimerService(config['session-sweep-interval'],
+                           core.sessions.sweep_expired)
+    sweeper.clock = clock
+    sweeper.setServiceParent(s)
+    root = MimicRoot(core, clock, config['state-file'])
+    resource = root.app.resource()
+    if config['journal'] is not None:
+        changes = journal.Journal(core, config['journal'],
+                                  config['journal-interval'])
+        changes.setServiceParent(s)
+        resource = changes.wrap(resource)
+    site = Site(resource)
     site.displayTracebacks = False
+    if config['worker'] is not None:
+        site.requestFactory = workers.ForwardedRequest
     service(config['listen'], site).setServiceParent(s)
     return s
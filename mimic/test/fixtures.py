@@ -12,7 +12,7 @@ class TenantAuthentication(object):
     Provides some functionality to help log into mimic identity with a
     particular username and password
     """
-    def __init__(self, test_case, root, username, password):
+    def __init__(self, test_case, root, username, password, tenant_id=None):
         """
         Authenticate a particular user against the mimic root.
 
@@ -21,17 +21,18 @@ class TenantAuthentication(object):
 
         :param username: the username to authenticate as
         :param password: the password with which to use to authenticate
+        :param tenant_id: the tenant to authenticate for, if any
         """
+        auth = {
+            "passwordCredentials": {
+                "username": username,
+                "password": password,
+            },
+        }
+        if tenant_id is not None:
+            auth["tenantId"] = tenant_id
         _, self.service_catalog_json = test_case.successResultOf(json_request(
-            test_case, root, "POST", "/identity/v2.0/tokens",
-            {
-                "auth": {
-                    "passwordCredentials": {
-                        "username": username,
-                        "password": password,
-                    },
-                }
-            }
+            test_case, root, "POST", "/identity/v2.0/tokens", {"auth": auth}
         ))
 
     def nth_endpoint_public(self, n):
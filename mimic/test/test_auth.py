@@ -8,7 +8,9 @@ from mimic.canned_responses.auth import (
     HARD_CODED_USER_NAME, HARD_CODED_ROLES,
     get_endpoints
 )
+from mimic.rest.nova_api import NovaApi
 from mimic.test.dummy import ExampleAPI
+from mimic.test.fixtures import APIMockHelper
 from mimic.test.helpers import request, json_request
 from mimic.catalog import Entry, Endpoint
 
@@ -506,6 +508,27 @@ class GetEndpointsForTokenTests(SynchronousTestCase):
             urls[0].startswith('http://mybase/'),
             '{0} does not start with "http://mybase"'.format(urls[0]))
 
+    def test_endpoint_ids_stable(self):
+        """
+        The endpoints of a tenant have the same IDs each time they are
+        listed, and the same URLs as in its service catalog.
+        """
+        core = MimicCore(Clock(), [NovaApi()])
+        root = MimicRoot(core).app.resource()
+        (response, catalog) = authenticate_with_username_password(self, core)
+        token = catalog["access"]["token"]["id"]
+        uri = "/identity/v2.0/tokens/{0}/endpoints".format(token)
+        (response, first) = self.successResultOf(json_request(
+            self, root, "GET", uri))
+        (response, second) = self.successResultOf(json_request(
+            self, root, "GET", uri))
+        self.assertEqual(first, second)
+        self.assertEqual(
+            [endpoint["publicURL"] for endpoint in first["endpoints"]],
+            [endpoint["publicURL"]
+             for entry in catalog["access"]["serviceCatalog"]
+             for endpoint in entry["endpoints"]])
+
     def test_api_service_endpoints_are_not_duplicated(self):
         """
         The service catalog should not duplicate endpoints for an entry/endpoints
@@ -783,6 +806,109 @@ class GetEndpointsForTokenTests(SynchronousTestCase):
         self.assertEqual(json_body['access']['token']['id'], '123456a')
         self.assertTrue(json_body['access']['token']['tenant']['id'])
 
+    def test_validate_token_cached(self):
+        """
+        Validating a token which already has a session responds the same
+        each time, with that session's details, whether or not the tenant is
+        given, without creating any sessions.
+        """
+        core = MimicCore(Clock(), [ExampleAPI()])
+        root = MimicRoot(core).app.resource()
+        (response, catalog) = authenticate_with_username_password(
+            self, core, tenant_id="111111")
+        token = catalog["access"]["token"]["id"]
+        bodies = []
+        for uri in ["/identity/v2.0/tokens/{0}",
+                    "/identity/v2.0/tokens/{0}?belongsTo=111111",
+                    "/identity/v2.0/tokens/{0}"]:
+            (response, body) = self.successResultOf(json_request(
+                self, root, "GET", uri.format(token)))
+            bodies.append(body)
+        self.assertEqual(bodies[0]["access"]["token"]["tenant"]["id"],
+                         "111111")
+        self.assertEqual(bodies[0]["access"]["user"],
+                         catalog["access"]["user"])
+        self.assertEqual(bodies, [bodies[0]] * 3)
+        self.assertEqual(len(core.sessions.all_sessions()), 1)
+
+    def test_validate_expired_token(self):
+        """
+        A token expires a day after it is issued, according to mimic's clock:
+        the expiry time in its responses is then, and afterwards validating it
+        or listing its endpoints responds 404, authenticating with it responds
+        401, and authenticating with the same credentials issues a new token.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [ExampleAPI()])
+        root = MimicRoot(core, clock).app.resource()
+        (response, catalog) = authenticate_with_username_password(
+            self, core, tenant_id="111111")
+        token = catalog["access"]["token"]["id"]
+        self.assertEqual(catalog["access"]["token"]["expires"],
+                         "1970-01-02T00:00:00.999-05:00")
+        (response, body) = self.successResultOf(json_request(
+            self, root, "GET", "/identity/v2.0/tokens/" + token))
+        self.assertEqual(body["access"]["token"]["expires"],
+                         "1970-01-02T00:00:00.999-05:00")
+
+        self.successResultOf(json_request(
+            self, root, "POST", "/mimic/v1.1/tick", {"amount": 86400}))
+        for uri in ["/identity/v2.0/tokens/{0}?belongsTo=111111",
+                    "/identity/v2.0/tokens/{0}/endpoints"]:
+            (response, body) = self.successResultOf(json_request(
+                self, root, "GET", uri.format(token)))
+            self.assertEqual(response.code, 404)
+            self.assertEqual(body["itemNotFound"]["code"], 404)
+        (response, body) = authenticate_with_token(
+            self, core, tenant_id="111111", token_id=token)
+        self.assertEqual(response.code, 401)
+        (response, body) = authenticate_with_username_password(
+            self, core, tenant_id="111111")
+        self.assertEqual(response.code, 200)
+        self.assertNotEqual(body["access"]["token"]["id"], token)
+        self.assertEqual(body["access"]["token"]["expires"],
+                         "1970-01-03T00:00:00.999-05:00")
+
+    def test_reauthenticate_after_expiry(self):
+        """
+        Authenticating again with only a username and password, after the
+        token has expired, issues a new token for the same tenant.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [ExampleAPI()])
+        (response, body) = authenticate_with_username_password(self, core)
+        token = body["access"]["token"]["id"]
+        tenant_id = body["access"]["token"]["tenant"]["id"]
+        clock.advance(86400)
+        (response, body) = authenticate_with_username_password(self, core)
+        self.assertEqual(response.code, 200)
+        self.assertNotEqual(body["access"]["token"]["id"], token)
+        self.assertEqual(body["access"]["token"]["tenant"]["id"], tenant_id)
+
+    def test_server_kept_after_expiry(self):
+        """
+        A tenant's servers are kept after its token expires, and are still
+        there when its user authenticates again.
+        """
+        helper = APIMockHelper(self, [NovaApi(["ORD", "MIMIC"])])
+        (response, body) = self.successResultOf(json_request(
+            self, helper.root, "POST", helper.uri + "/servers",
+            {"server": {"name": "kept", "imageRef": "image",
+                        "flavorRef": "flavor"}}))
+        server_uri = helper.uri + "/servers/" + body["server"]["id"]
+        helper.clock.advance(86400 + 1)
+        (response, body) = self.successResultOf(json_request(
+            self, helper.root, "GET", server_uri))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(body["server"]["name"], "kept")
+        (response, body) = authenticate_with_username_password(
+            self, helper.core, username="test1", password="test1password")
+        self.assertEqual(body["access"]["token"]["tenant"]["id"],
+                         helper.uri.rsplit("/", 1)[-1])
+        (response, body) = self.successResultOf(json_request(
+            self, helper.root, "GET", server_uri))
+        self.assertEqual(response.code, 200)
+
     def test_response_for_validate_token_then_authenticate(self):
         """
         Test to verify :func: `validate_token` and then authenticate
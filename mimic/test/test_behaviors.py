@@ -0,0 +1,211 @@
+"""
+Tests for :mod:`mimic.model.behaviors`.
+"""
+
+from twisted.trial.unittest import SynchronousTestCase
+
+from mimic.model.behaviors import (
+    BehaviorRegistry, Criterion, EventDescription, regexp_predicate,
+    regexp_prefix
+)
+
+
+class RegexpPrefixTests(SynchronousTestCase):
+    """
+    Tests for :obj:`regexp_prefix`.
+    """
+
+    def test_plain_characters(self):
+        """
+        The prefix is the plain characters at the start of the expression,
+        after any ``^``.
+        """
+        self.assertEqual(regexp_prefix("failing_server"), "failing_server")
+        self.assertEqual(regexp_prefix("^web-.*"), "web-")
+        self.assertEqual(regexp_prefix("db[0-9]+$"), "db")
+        self.assertEqual(regexp_prefix(".*web"), "")
+
+    def test_quantified(self):
+        """
+        A character which may be left out by the quantifier after it is not
+        part of the prefix.
+        """
+        self.assertEqual(regexp_prefix("webs?-1"), "web")
+        self.assertEqual(regexp_prefix("ab*"), "a")
+        self.assertEqual(regexp_prefix("a{0,2}b"), "")
+
+    def test_unsure(self):
+        """
+        Expressions with alternatives or inline flags have no prefix.
+        """
+        self.assertEqual(regexp_prefix("web|db"), "")
+        self.assertEqual(regexp_prefix("web(?i)"), "")
+
+
+event = EventDescription()
+
+
+@event.declare_criterion("name")
+def name_criterion(value):
+    """
+    A criterion which matches a regular expression against ``"name"``.
+    """
+    return Criterion(name="name", predicate=regexp_predicate(value),
+                     prefix=(None, regexp_prefix(value)))
+
+
+@event.declare_criterion("other")
+def other_criterion(value):
+    """
+    A criterion which matches a regular expression against ``"other"``, and
+    records each evaluation.
+    """
+    match = regexp_predicate(value)
+
+    def predicate(attribute):
+        evaluated.append(value)
+        return match(attribute)
+    return Criterion(name="other", predicate=predicate)
+
+
+@event.declare_behavior_creator("named")
+def named_behavior(parameters):
+    """
+    A behavior which is just its name.
+    """
+    return parameters
+
+
+event.declare_default_behavior("default")
+
+evaluated = []
+
+
+class BehaviorRegistryTests(SynchronousTestCase):
+    """
+    Tests for :obj:`BehaviorRegistry`.
+    """
+
+    def setUp(self):
+        """
+        Create an empty registry.
+        """
+        self.registry = BehaviorRegistry(event=event)
+        del evaluated[:]
+
+    def register(self, parameters, *criteria):
+        """
+        Register a behavior with the given criteria.
+        """
+        self.registry.register_from_json({
+            "name": "named", "parameters": parameters,
+            "criteria": list(criteria)})
+
+    def test_first_match_wins(self):
+        """
+        The earliest registered behavior which matches is the one found,
+        whether or not it is indexed by a prefix.
+        """
+        self.register("web", {"name": "web"})
+        self.register("anything", {"name": ".*"})
+        self.register("web-1", {"name": "web-1"})
+        self.assertEqual([self.registry.behavior_for_attributes({"name": name})
+                          for name in ["web-1", "db", "we"]],
+                         ["web", "anything", "anything"])
+
+    def test_no_match(self):
+        """
+        If no behavior matches, the event's default is found.
+        """
+        self.register("web", {"name": "web"})
+        self.assertEqual(self.registry.behavior_for_attributes({"name": "db"}),
+                         "default")
+
+    def test_only_candidates_evaluated(self):
+        """
+        The criteria of behaviors whose prefix does not match the attributes
+        are not evaluated.
+        """
+        for n in range(100):
+            self.register(n, {"name": "server-{0}$".format(n)},
+                          {"other": str(n)})
+        self.register("unindexed", {"other": "x"})
+        self.assertEqual(self.registry.behavior_for_attributes(
+            {"name": "server-42", "other": "42"}), 42)
+        self.assertEqual(evaluated, ["42"])
+        del evaluated[:]
+        self.assertEqual(self.registry.behavior_for_attributes(
+            {"name": "db", "other": "x"}), "unindexed")
+        self.assertEqual(evaluated, ["x"])
+
+    def test_uses(self):
+        """
+        A behavior registered with a number of ``uses`` is removed once it
+        has been found that many times, letting later behaviors match.
+        """
+        self.register("once", {"name": "web"})
+        self.registry.register_from_json({
+            "name": "named", "parameters": "twice", "uses": 2,
+            "criteria": [{"name": "web"}]})
+        self.registry.register_from_json({
+            "name": "named", "parameters": "first", "uses": 1,
+            "criteria": [{"name": "w"}]})
+        found = [self.registry.behavior_for_attributes({"name": "web"})
+                 for _ in range(3)]
+        self.assertEqual(found, ["once"] * 3)
+        self.registry.remove(self.registry.registered_json()[0]["id"])
+        found = [self.registry.behavior_for_attributes({"name": "web"})
+                 for _ in range(4)]
+        self.assertEqual(found, ["twice", "twice", "first", "default"])
+        self.assertEqual(self.registry.registered_json(), [])
+        self.assertEqual(self.registry._index, {})
+
+    def test_ttl(self):
+        """
+        A behavior registered with a ``ttl`` is removed that many seconds
+        after it was registered.
+        """
+        self.registry.register_from_json({
+            "name": "named", "parameters": "brief", "ttl": 5,
+            "criteria": [{"name": "web"}]}, now=10)
+        self.assertEqual(
+            self.registry.behavior_for_attributes({"name": "web"}, now=14),
+            "brief")
+        self.assertEqual(
+            [payload["expires"] for payload in
+             self.registry.registered_json(now=14)], [15])
+        self.assertEqual(
+            self.registry.behavior_for_attributes({"name": "web"}, now=15),
+            "default")
+        self.assertEqual(self.registry.registered_json(now=15), [])
+
+    def test_register_again(self):
+        """
+        The JSON of registered behaviors registers the same behaviors, with
+        the same IDs, uses left and expiry time, again; a behavior registered
+        with the ID of another replaces it.
+        """
+        self.registry.register_from_json({
+            "name": "named", "parameters": "limited", "ttl": 5, "uses": 3,
+            "criteria": [{"name": "web"}]}, now=10)
+        self.registry.behavior_for_attributes({"name": "web"}, now=10)
+        [payload] = self.registry.registered_json(now=10)
+        self.assertEqual((payload["uses"], payload["expires"]), (2, 15))
+        again = BehaviorRegistry(event=event)
+        again.register_from_json(payload, now=11)
+        self.assertEqual(again.registered_json(now=11), [payload])
+        again.register_from_json(dict(payload, uses=1), now=11)
+        self.assertEqual([p["uses"] for p in again.registered_json(now=11)],
+                         [1])
+
+    def test_invalid_limits(self):
+        """
+        ``uses`` and ``ttl`` must be positive numbers.
+        """
+        for limits in [{"uses": 0}, {"uses": 1.5}, {"ttl": -1},
+                       {"ttl": "5"}]:
+            payload = {"name": "named", "parameters": None, "criteria": []}
+            payload.update(limits)
+            self.assertRaises(ValueError,
+                              self.registry.register_from_json, payload)
+        self.assertEqual(self.registry.registered_json(), [])
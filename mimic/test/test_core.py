@@ -3,7 +3,8 @@ from __future__ import unicode_literals
 from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
-from mimic.core import MimicCore
+from mimic.core import MimicCore, TenantCatalog
+from mimic.test.dummy import ExampleAPI
 from mimic.plugins import (nova_plugin, loadbalancer_plugin, swift_plugin,
                            queue_plugin, maas_plugin, rackconnect_v3_plugin)
 
@@ -38,3 +39,119 @@ class CoreBuildingTests(SynchronousTestCase):
             len(plugin_apis),
             len(list(core.entries_for_tenant('any_tenant', {},
                                              'http://mimic'))))
+
+
+class ServiceResourceCacheTests(SynchronousTestCase):
+    """
+    Tests for the per-region resource cache used by
+    :func:`MimicCore.service_with_region`.
+    """
+    def setUp(self):
+        """
+        Create a :class:`MimicCore` with a single example API and remember its
+        service ID.
+        """
+        self.api = ExampleAPI()
+        self.core = MimicCore(Clock(), [self.api], resource_cache_size=2)
+        self.service_id = list(self.core._uuid_to_api.keys())[0]
+
+    def test_same_resource_for_same_key(self):
+        """
+        Requesting the resource for the same service, region and base URI
+        twice returns the cached resource rather than building a new one.
+        """
+        first = self.core.service_with_region("ORD", self.service_id,
+                                              "http://mimic/")
+        del self.api.store['uri_prefix']
+        second = self.core.service_with_region("ORD", self.service_id,
+                                               "http://mimic/")
+        self.assertIs(first, second)
+        self.assertEqual(self.api.store, {})
+        self.assertEqual((self.core.resource_cache.hits,
+                          self.core.resource_cache.misses), (1, 1))
+
+    def test_different_base_uri(self):
+        """
+        Different base URIs get different resources, since the resources
+        generate absolute URLs from them.
+        """
+        first = self.core.service_with_region("ORD", self.service_id,
+                                              "http://mimic/")
+        second = self.core.service_with_region("ORD", self.service_id,
+                                               "http://other/")
+        self.assertIsNot(first, second)
+        self.assertEqual(
+            "http://other/mimicking/{0}/ORD/".format(self.service_id),
+            self.api.store['uri_prefix'])
+
+    def test_bounded(self):
+        """
+        The cache never holds more than its maximum number of resources.
+        """
+        for host in ["a", "b", "c", "d"]:
+            self.core.service_with_region("ORD", self.service_id,
+                                          "http://{0}/".format(host))
+        self.assertEqual(len(self.core.resource_cache), 2)
+        self.assertEqual(self.core.resource_cache.evictions, 2)
+
+    def test_unknown_service_not_cached(self):
+        """
+        Looking up an unknown service ID returns ``None`` and caches nothing.
+        """
+        self.assertIs(
+            self.core.service_with_region("ORD", "nope", "http://mimic/"),
+            None)
+        self.assertEqual(len(self.core.resource_cache), 0)
+
+
+class TenantCatalogTests(SynchronousTestCase):
+    """
+    Tests for :obj:`TenantCatalog` and the catalogs of sessions.
+    """
+
+    def setUp(self):
+        """
+        Create a :class:`MimicCore` with the nova plugin, whose endpoints get
+        random IDs.
+        """
+        self.core = MimicCore(Clock(), [nova_plugin.nova],
+                              catalog_cache_size=2)
+
+    def endpoint_ids(self, tenant_id):
+        """
+        The IDs of the endpoints in the catalog of the tenant's session.
+        """
+        session = self.core.sessions.session_for_tenant_id(tenant_id)
+        return [endpoint.endpoint_id
+                for entry in session.catalog.entries
+                for endpoint in entry.endpoints]
+
+    def test_built_with_session(self):
+        """
+        A tenant's catalog is built once, when its session is created, so its
+        endpoints keep their IDs even once its serialized catalog has been
+        evicted by those of other tenants.
+        """
+        session = self.core.sessions.session_for_tenant_id("1234")
+        self.assertIsInstance(session.catalog, TenantCatalog)
+        ids = self.endpoint_ids("1234")
+        session.catalog.serialized("http://mimic/")
+        for tenant_id in ["a", "b"]:
+            self.core.sessions.session_for_tenant_id(
+                tenant_id).catalog.serialized("http://mimic/")
+        self.assertEqual(self.core.catalog_cache.evictions, 1)
+        self.assertEqual(self.endpoint_ids("1234"), ids)
+
+    def test_base_uris(self):
+        """
+        The catalog's URI prefixes and JSON are rendered for each base URI,
+        and the JSON is cached.
+        """
+        catalog = self.core.catalog_for_tenant("1234")
+        [prefix] = catalog.prefix_map("http://mimic/").values()
+        self.assertTrue(prefix.startswith("http://mimic/mimicking/NovaApi-"))
+        self.assertIn('"publicURL": "http://other/mimicking/NovaApi-',
+                      catalog.serialized("http://other/"))
+        self.assertIs(catalog.serialized("http://other/"),
+                      catalog.serialized("http://other/"))
+        self.assertEqual(len(self.core.catalog_cache), 1)
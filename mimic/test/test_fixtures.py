@@ -0,0 +1,225 @@
+"""
+Tests for :mod:`mimic.fixtures` and the fixtures API.
+"""
+
+import json
+from base64 import b64encode
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from mimic import fixtures
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.rest.loadbalancer_api import LoadBalancerApi
+from mimic.rest.maas_api import MaasApi
+from mimic.rest.nova_api import NovaApi
+from mimic.rest.rackconnect_v3_api import RackConnectV3
+from mimic.rest.swift_api import SwiftMock
+from mimic.test.fixtures import TenantAuthentication
+from mimic.test.helpers import json_request, request, request_with_content
+
+
+def document(*records):
+    """
+    A fixtures document of the given records.
+    """
+    return b"".join(json.dumps(record).encode("utf-8") + b"\n"
+                    for record in records)
+
+
+class FixturesTests(SynchronousTestCase):
+    """
+    Tests for loading fixtures.
+    """
+
+    def setUp(self):
+        """
+        Create a mimic with every API mock which loads fixtures.
+        """
+        self.clock = Clock()
+        self.core = MimicCore(self.clock, [
+            NovaApi(), LoadBalancerApi(), MaasApi(), SwiftMock(),
+            RackConnectV3()])
+        self.root = MimicRoot(self.core, self.clock).app.resource()
+
+    def load(self, body):
+        """
+        Load a fixtures document with the fixtures API.
+
+        :return: the response and its JSON body.
+        """
+        return self.successResultOf(request_with_content(
+            self, self.root, "POST", "/mimic/v1.1/fixtures", body))
+
+    def test_load_everything(self):
+        """
+        Objects of every kind can be loaded, and are then visible through
+        the REST APIs of the tenant they belong to.
+        """
+        (response, body) = self.load(document(
+            {"kind": "tenant", "tenant_id": "1234", "username": "user"},
+            {"kind": "server", "tenant_id": "1234", "id": "s1",
+             "status": "BUILD",
+             "server": {"name": "web", "imageRef": "i", "flavorRef": "f"}},
+            {"kind": "loadbalancer", "tenant_id": "1234", "id": 17,
+             "loadBalancer": {"name": "lb", "protocol": "HTTP"}},
+            {"kind": "node", "tenant_id": "1234", "loadbalancer_id": 17,
+             "nodes": [{"address": "10.0.0.1", "port": 80,
+                        "condition": "ENABLED"}]},
+            {"kind": "entity", "tenant_id": "1234", "id": "en1",
+             "entity": {"label": "an entity"}},
+            {"kind": "check", "tenant_id": "1234", "id": "ch1",
+             "entity_id": "en1", "check": {"label": "a check",
+                                           "type": "remote.ping"}},
+            {"kind": "alarm", "tenant_id": "1234", "id": "al1",
+             "entity_id": "en1", "alarm": {"check_id": "ch1",
+                                           "notification_plan_id": "np"}},
+            {"kind": "object", "tenant_id": "1234", "container": "c",
+             "name": "text", "content_type": "text/plain", "data": "hello"},
+            {"kind": "object", "tenant_id": "1234", "container": "c",
+             "name": "binary",
+             "data_base64": b64encode(b"\x00\xff").decode("ascii")},
+            {"kind": "pool", "tenant_id": "1234", "id": "p1",
+             "pool": {"name": "fixtured", "port": 443}}))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(body)["loaded"], {
+            "tenant": 1, "server": 1, "loadbalancer": 1, "node": 1,
+            "entity": 1, "check": 1, "alarm": 1, "object": 2, "pool": 1})
+
+        auth = TenantAuthentication(self, self.root, "user", "password")
+        self.assertEqual(auth.service_catalog_json['access']['token']
+                         ['tenant']['id'], "1234")
+
+        def get(service, path):
+            (response, body) = self.successResultOf(json_request(
+                self, self.root, "GET",
+                auth.get_service_endpoint(service) + path))
+            return body
+
+        self.assertEqual(
+            get("cloudServersOpenStack", "/servers/s1")["server"]["status"],
+            "BUILD")
+        lb = get("cloudLoadBalancers", "/loadbalancers/17")["loadBalancer"]
+        self.assertEqual([node["address"] for node in lb["nodes"]],
+                         ["10.0.0.1"])
+        self.assertEqual(
+            [check["id"] for check in
+             get("cloudMonitoring", "/entities/en1/checks")["values"]],
+            ["ch1"])
+        self.assertEqual(
+            [(alarm["id"], alarm["check_id"]) for alarm in
+             get("cloudMonitoring", "/entities/en1/alarms")["values"]],
+            [("al1", "ch1")])
+        self.assertEqual(
+            [pool["name"] for pool in
+             get("rackconnect", "/load_balancer_pools")],
+            ["fixtured"])
+        swift = auth.get_service_endpoint("cloudFiles")
+        for name, data in [("text", b"hello"), ("binary", b"\x00\xff")]:
+            (response, content) = self.successResultOf(request_with_content(
+                self, self.root, "GET", swift + "/c/" + name))
+            self.assertEqual(content, data)
+
+    def test_invalid_record(self):
+        """
+        Loading stops at a record which cannot be loaded, with a 400 which
+        says which line it was on, and the records before it stay loaded.
+        """
+        (response, body) = self.load(
+            document({"kind": "tenant", "tenant_id": "1234"}) + b"\n" +
+            document({"kind": "check", "tenant_id": "1234",
+                      "entity_id": "nope", "check": {}},
+                     {"kind": "tenant", "tenant_id": "5678"}))
+        self.assertEqual(response.code, 400)
+        self.assertEqual(json.loads(body), {
+            "message": "Line 3: no entity nope",
+            "loaded": {"tenant": 1}})
+        self.assertEqual([session.tenant_id for session
+                          in self.core.sessions.all_sessions()], ["1234"])
+        for line in [b"not json", b'{"kind": "spaceship", "tenant_id": 1}',
+                     b'{"kind": "server"}', b"[]",
+                     document({"kind": "loadbalancer", "tenant_id": "1234",
+                               "loadBalancer": {
+                                   "name": "lb", "protocol": "HTTP",
+                                   "metadata": [{"key": "lb_building",
+                                                 "value": "soon"}]}})]:
+            response = self.successResultOf(request(
+                self, self.root, "POST", "/mimic/v1.1/fixtures", line))
+            self.assertEqual(response.code, 400)
+
+    def test_duplicates(self):
+        """
+        A server or load balancer with the ID of an existing one, or a node
+        with the address and port of another node on its load balancer, is
+        rejected with a 400, and the existing objects are left as they were.
+        """
+        self.load(document(
+            {"kind": "tenant", "tenant_id": "1234", "username": "user"},
+            {"kind": "server", "tenant_id": "1234", "id": "s1",
+             "server": {"name": "web", "imageRef": "i", "flavorRef": "f"}},
+            {"kind": "loadbalancer", "tenant_id": "1234", "id": 17,
+             "loadBalancer": {"name": "lb", "protocol": "HTTP"}},
+            {"kind": "node", "tenant_id": "1234", "loadbalancer_id": 17,
+             "nodes": [{"address": "10.0.0.1", "port": 80,
+                        "condition": "ENABLED"}]}))
+        node = {"address": "10.0.0.2", "port": 80, "condition": "ENABLED"}
+        for record in [
+                {"kind": "server", "tenant_id": "1234", "id": "s1",
+                 "server": {"name": "other", "imageRef": "i",
+                            "flavorRef": "f"}},
+                {"kind": "loadbalancer", "tenant_id": "1234", "id": 17,
+                 "loadBalancer": {"name": "other", "protocol": "HTTP"}},
+                {"kind": "node", "tenant_id": "1234", "loadbalancer_id": 17,
+                 "nodes": [dict(node, address="10.0.0.1")]},
+                {"kind": "node", "tenant_id": "1234", "loadbalancer_id": 17,
+                 "nodes": [node, node]}]:
+            (response, body) = self.load(document(record))
+            self.assertEqual(response.code, 400)
+            self.assertEqual(json.loads(body)["loaded"], {})
+
+        auth = TenantAuthentication(self, self.root, "user", "password")
+
+        def get(service, path):
+            (response, body) = self.successResultOf(json_request(
+                self, self.root, "GET",
+                auth.get_service_endpoint(service) + path))
+            return body
+
+        self.assertEqual(
+            [server["name"] for server in
+             get("cloudServersOpenStack", "/servers/detail")["servers"]],
+            ["web"])
+        lb = get("cloudLoadBalancers", "/loadbalancers/17")["loadBalancer"]
+        self.assertEqual(lb["name"], "lb")
+        self.assertEqual([node["address"] for node in lb["nodes"]],
+                         ["10.0.0.1"])
+
+    def test_chunks(self):
+        """
+        Records are loaded a chunk at a time, in separate iterations of the
+        reactor.
+        """
+        reactor = Clock()
+        d = fixtures.load(
+            self.core,
+            document(*[{"kind": "tenant", "tenant_id": str(n)}
+                       for n in range(5)]).splitlines(),
+            chunk_size=2, reactor=reactor)
+        self.assertNoResult(d)
+        self.assertEqual(len(self.core.sessions.all_sessions()), 2)
+        self.assertEqual(len(reactor.getDelayedCalls()), 1)
+        reactor.advance(0)
+        self.assertEqual(self.successResultOf(d), {"tenant": 5})
+
+    def test_other_workers_tenants(self):
+        """
+        A worker of a multi-process mimic skips the records of tenants which
+        belong to other workers.
+        """
+        self.core.sessions.id_filter = lambda tenant_id: tenant_id != "5678"
+        d = fixtures.load(self.core, [
+            json.dumps({"kind": "tenant", "tenant_id": tenant_id})
+            for tenant_id in ["1234", "5678"]])
+        self.assertEqual(self.successResultOf(d),
+                         {"tenant": 1, "skipped": 1})
@@ -0,0 +1,218 @@
+"""
+Tests for :mod:`mimic.journal`.
+"""
+
+import json
+
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.task import Clock
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import SynchronousTestCase
+
+from mimic.core import MimicCore
+from mimic.journal import Journal, replay
+from mimic.resource import MimicRoot
+from mimic.rest.nova_api import NovaApi
+from mimic.test.fixtures import TenantAuthentication
+from mimic.test.helpers import json_request
+from mimic.util.ids import allocator
+
+
+class JournalTests(SynchronousTestCase):
+    """
+    Tests for :obj:`Journal` and :obj:`replay`.
+    """
+
+    def setUp(self):
+        """
+        Create a mimic with a journal written every second.
+        """
+        self.path = self.mktemp()
+        self.flush_clock = Clock()
+        self.core = MimicCore(Clock(), [NovaApi()])
+        self.journal = Journal(self.core, self.path, 1.0, self.flush_clock,
+                               maybeDeferred)
+        self.root = self.journal.wrap(MimicRoot(self.core).app.resource())
+        self.journal.startService()
+        self.addCleanup(self.stop)
+        self.auth = TenantAuthentication(self, self.root, "user", "password")
+        self.nova = self.auth.get_service_endpoint("cloudServersOpenStack")
+
+    def stop(self):
+        """
+        Stop the journal, if it is running.
+        """
+        if self.journal.running:
+            self.journal.stopService()
+
+    def create_server(self, name):
+        """
+        Create a server, and return its ID.
+        """
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", self.nova + "/servers",
+            {"server": {"name": name, "imageRef": "image",
+                        "flavorRef": "flavor"}}))
+        self.assertEqual(response.code, 202)
+        return body["server"]["id"]
+
+    def records(self):
+        """
+        The records in the journal file.
+        """
+        return [json.loads(line)
+                for line in FilePath(self.path).getContent().splitlines()]
+
+    def test_batched(self):
+        """
+        The sessions changed by requests are written once per interval, each
+        once however many times it was changed.
+        """
+        self.assertEqual(self.records(), [])
+        self.create_server("one")
+        self.create_server("two")
+        self.flush_clock.advance(1)
+        [record] = self.records()
+        [session] = record["sessions"]
+        self.assertEqual(session["username"], "user")
+        self.flush_clock.advance(1)
+        self.assertEqual(len(self.records()), 1)
+
+    def test_only_changed_apis(self):
+        """
+        Only the data of the API a request is routed to is written, and none
+        for identity requests; replaying keeps the data of the other APIs.
+        """
+        server = self.create_server("one")
+        self.flush_clock.advance(1)
+        TenantAuthentication(self, self.root, "user", "password")
+        self.flush_clock.advance(1)
+        first, second = self.records()
+        self.assertEqual(list(first["sessions"][0]["apis"]), ["NovaApi"])
+        self.assertEqual(second["sessions"][0]["apis"], {})
+        self.journal.stopService()
+        core = MimicCore(Clock(), [NovaApi()])
+        replay(core, self.path)
+        [session] = core.sessions.all_sessions()
+        [(api, data)] = session.all_api_data()
+        self.assertEqual(
+            [s.server_id for s in data.collection_for_region("ORD").servers],
+            [server])
+
+    def test_forgotten(self):
+        """
+        Sessions which are forgotten are recorded as such, so that replaying
+        the journal does not bring them back.
+        """
+        self.create_server("one")
+        self.flush_clock.advance(1)
+        sessions = self.core.sessions
+        sessions.clock.advance(86400 + sessions.retention.total_seconds())
+        sessions.sweep_expired()
+        self.flush_clock.advance(1)
+        self.assertEqual(self.records()[-1]["forgotten"], ["user"])
+        self.journal.stopService()
+        core = MimicCore(Clock(), [NovaApi()])
+        replay(core, self.path)
+        self.assertEqual(core.sessions.all_sessions(), [])
+
+    def test_written_in_thread(self):
+        """
+        Records are written by the callable given to the journal, one write
+        at a time, and stopping the journal waits for them to be written.
+        """
+        writes = []
+
+        def in_thread(f, *args):
+            writes.append((f, args))
+            return Deferred()
+
+        journal = Journal(self.core, self.mktemp(), 1.0, self.flush_clock,
+                          in_thread)
+        journal.startService()
+        self.root = journal.wrap(MimicRoot(self.core).app.resource())
+        self.create_server("one")
+        journal.flush()
+        self.create_server("two")
+        journal.flush()
+        self.assertEqual(len(writes), 1)
+        stopped = journal.stopService()
+        self.assertNoResult(stopped)
+        f, args = writes.pop()
+        f(*args)
+        journal._writing.callback(None)
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(journal.records, 1)
+        self.assertNoResult(stopped)
+        f, args = writes.pop()
+        f(*args)
+        journal._writing.callback(None)
+        self.successResultOf(stopped)
+        self.assertEqual(journal.records, 2)
+
+    def test_reads_not_journaled(self):
+        """
+        ``GET`` requests do not cause anything to be written.
+        """
+        self.flush_clock.advance(1)
+        records = len(self.records())
+        self.successResultOf(json_request(
+            self, self.root, "GET", self.nova + "/servers"))
+        self.flush_clock.advance(1)
+        self.assertEqual(len(self.records()), records)
+
+    def test_replay(self):
+        """
+        Replaying the journal into a new mimic restores the sessions as they
+        were last written, and the clock, and stopping the journal writes any
+        outstanding changes.
+        """
+        first = self.create_server("one")
+        self.flush_clock.advance(1)
+        self.core.sessions.clock.advance(50)
+        second = self.create_server("two")
+        self.journal.stopService()
+        core = MimicCore(Clock(), [NovaApi()])
+        self.assertEqual(replay(core, self.path), 2)
+        self.assertEqual(core.sessions.clock.seconds(), 50)
+        root = MimicRoot(core).app.resource()
+        auth = TenantAuthentication(self, root, "user", "password")
+        (response, body) = self.successResultOf(json_request(
+            self, root, "GET",
+            auth.get_service_endpoint("cloudServersOpenStack") + "/servers"))
+        self.assertEqual([s["id"] for s in body["servers"]], [first, second])
+
+    def test_replay_skips_ids(self):
+        """
+        A mimic with the same ID seed which replays the journal does not
+        allocate the IDs of the objects in it again.
+        """
+        allocator.seed(1)
+        self.addCleanup(allocator.seed)
+        first = self.create_server("one")
+        self.journal.stopService()
+        allocator.seed(1)
+        core = MimicCore(Clock(), [NovaApi()])
+        replay(core, self.path)
+        root = MimicRoot(core).app.resource()
+        auth = TenantAuthentication(self, root, "user", "password")
+        servers = auth.get_service_endpoint("cloudServersOpenStack") + "/servers"
+        (response, body) = self.successResultOf(json_request(
+            self, root, "POST", servers,
+            {"server": {"name": "two", "imageRef": "image",
+                        "flavorRef": "flavor"}}))
+        self.assertNotEqual(body["server"]["id"], first)
+        (response, body) = self.successResultOf(json_request(
+            self, root, "GET", servers))
+        self.assertEqual([s["name"] for s in body["servers"]], ["one", "two"])
+
+    def test_replay_partial_record(self):
+        """
+        A final record which was only partly written is ignored.
+        """
+        self.create_server("one")
+        self.journal.stopService()
+        with open(self.path, "ab") as f:
+            f.write(b'{"now": 0, "sess')
+        core = MimicCore(Clock(), [NovaApi()])
+        self.assertEqual(replay(core, self.path), 1)
@@ -5,8 +5,12 @@ Unit tests for the
 import json
 import treq
 
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
-from mimic.canned_responses.loadbalancer import load_balancer_example
+from mimic.canned_responses.loadbalancer import (
+    Region_Tenant_CLBs, add_load_balancer, add_node, del_load_balancer,
+    delete_node, get_load_balancers, get_nodes, list_load_balancers,
+    list_nodes, load_balancer_example)
 from mimic.test.fixtures import APIMockHelper, TenantAuthentication
 from mimic.rest.loadbalancer_api import LoadBalancerApi
 from mimic.test.helpers import request_with_content, request
@@ -552,6 +556,19 @@ class LoadbalancerAPINegativeTests(SynchronousTestCase):
         create_lb_response = self.successResultOf(create_lb)
         return create_lb_response
 
+    def test_forgotten_session_cancels_transitions(self):
+        """
+        When the session of a tenant whose load balancer is building is
+        forgotten, the load balancer's pending status change is cancelled.
+        """
+        response = self._create_loadbalancer_for_given_metadata(
+            [{"key": "lb_building", "value": 30}])
+        self.assertEqual(response.code, 202)
+        self.assertEqual(len(self.helper.clock.getDelayedCalls()), 1)
+        sessions = self.helper.core.sessions
+        sessions.remove_session(sessions.all_sessions()[0].username)
+        self.assertEqual(self.helper.clock.getDelayedCalls(), [])
+
     def _add_node_to_lb(self, lb_id):
         """
         Adds a node to the load balancer and returns the response object
@@ -721,3 +738,224 @@ class LoadbalancerAPINegativeTests(SynchronousTestCase):
             self, self.root, "GET", self.uri + '/loadbalancers/' + str(lb["id"])
             + '/nodes')
         self.assertEqual(self.successResultOf(list_nodes).code, 404)
+
+
+class LoadBalancerStatusTransitionTests(SynchronousTestCase):
+    """
+    Tests for the scheduled status changes of load balancers in a
+    :obj:`Region_Tenant_CLBs`.
+    """
+
+    def setUp(self):
+        """
+        Create an empty store with its own clock.
+        """
+        self.clock = Clock()
+        self.store = Region_Tenant_CLBs(self.clock)
+
+    def _add_lb(self, lb_id, metadata):
+        """
+        Add a load balancer with the given metadata to the store.
+        """
+        add_load_balancer("1234", self.store,
+                          {"name": "lb", "protocol": "HTTP",
+                           "metadata": metadata},
+                          lb_id, self.clock.seconds())
+
+    def _status(self, lb_id):
+        """
+        The status of the load balancer, looked up directly in the store.
+        """
+        return self.store.lbs[lb_id].status
+
+    def test_build_completes_without_reads(self):
+        """
+        A building load balancer becomes ACTIVE when its build time has
+        elapsed, whether or not anyone has looked at it.
+        """
+        self._add_lb(1, [{"key": "lb_building", "value": 5}])
+        self.assertEqual(self._status(1), "BUILD")
+        self.clock.advance(4)
+        self.assertEqual(self._status(1), "BUILD")
+        self.clock.advance(1)
+        self.assertEqual(self._status(1), "ACTIVE")
+        self.assertEqual(self.store.transitions, {})
+
+    def test_fractional_delay(self):
+        """
+        A status change can be given a fractional number of seconds, and
+        an empty value, or one of 0, means the default of 10 seconds.
+        """
+        self._add_lb(1, [{"key": "lb_building", "value": "0.5"}])
+        self._add_lb(2, [{"key": "lb_building", "value": ""}])
+        self._add_lb(3, [{"key": "lb_building", "value": 0}])
+        self._add_lb(4, [{"key": "lb_building", "value": "0"}])
+        self.clock.advance(0.5)
+        self.assertEqual(self._status(1), "ACTIVE")
+        self.clock.advance(9)
+        self.assertEqual([self._status(n) for n in [2, 3, 4]],
+                         ["BUILD"] * 3)
+        self.clock.advance(0.5)
+        self.assertEqual([self._status(n) for n in [2, 3, 4]],
+                         ["ACTIVE"] * 3)
+
+    def test_invalid_delay(self):
+        """
+        Creating a load balancer whose metadata asks for a status to last
+        for something other than a non-negative number of seconds fails with
+        a 400, and creates nothing.
+        """
+        for n, value in enumerate(["soon", "-1", "nan", [], {}]):
+            for key in ["lb_building", "lb_pending_update",
+                        "lb_pending_delete"]:
+                body, code = add_load_balancer(
+                    "1234", self.store,
+                    {"name": "lb", "protocol": "HTTP",
+                     "metadata": [{"key": key, "value": value}]},
+                    n, self.clock.seconds())
+                self.assertEqual(code, 400)
+                self.assertIn(key, body["message"])
+        self.assertEqual(self.store.lbs, {})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_reads_do_not_postpone_transitions(self):
+        """
+        Reading a load balancer in PENDING-DELETE status does not delay it
+        from becoming DELETED, and the DELETED load balancer is removed an
+        hour later.
+        """
+        self._add_lb(1, [{"key": "lb_pending_delete", "value": 2}])
+        self.assertEqual(del_load_balancer(self.store, 1), (b'', 202))
+        self.clock.advance(1)
+        self.assertEqual(
+            get_load_balancers(self.store, 1)[0]["loadBalancer"]["status"],
+            "PENDING-DELETE")
+        self.clock.advance(1)
+        self.assertEqual(self._status(1), "DELETED")
+        self.clock.advance(3600)
+        self.assertNotIn(1, self.store.lbs)
+        self.assertEqual(list(self.store.lbs_for_tenant("1234")), [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_pending_update_reverts(self):
+        """
+        Changing a load balancer with ``lb_pending_update`` metadata puts it
+        into PENDING-UPDATE status for that many seconds.
+        """
+        self._add_lb(1, [{"key": "lb_pending_update", "value": 3}])
+        add_node(self.store, [{"address": "127.0.0.1", "port": 80,
+                               "condition": "ENABLED"}], 1)
+        self.assertEqual(self._status(1), "PENDING-UPDATE")
+        self.clock.advance(3)
+        self.assertEqual(self._status(1), "ACTIVE")
+
+    def test_delete_cancels_transition(self):
+        """
+        Deleting a load balancer cancels its scheduled status change.
+        """
+        self._add_lb(1, [{"key": "lb_pending_update", "value": 3}])
+        add_node(self.store, [{"address": "127.0.0.1", "port": 80,
+                               "condition": "ENABLED"}], 1)
+        self.assertEqual(del_load_balancer(self.store, 1), (b'', 202))
+        self.assertNotIn(1, self.store.lbs)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class LoadBalancerStoreTests(SynchronousTestCase):
+    """
+    Tests for the load balancer records kept in a :obj:`Region_Tenant_CLBs`.
+    """
+
+    def setUp(self):
+        """
+        Create an empty store with its own clock.
+        """
+        self.clock = Clock()
+        self.store = Region_Tenant_CLBs(self.clock)
+
+    def _add_lb(self, tenant_id, lb_id):
+        """
+        Add a load balancer for the given tenant to the store.
+        """
+        add_load_balancer(tenant_id, self.store,
+                          {"name": "lb-{0}".format(lb_id), "protocol": "HTTP"},
+                          lb_id, self.clock.seconds())
+
+    def test_list_per_tenant_in_creation_order(self):
+        """
+        Listing load balancers only lists the tenant's own, oldest first.
+        """
+        self._add_lb("a", 30)
+        self._add_lb("b", 20)
+        self._add_lb("a", 10)
+        self.assertEqual(
+            [lb["id"] for lb in list_load_balancers("a", self.store)[0]
+             ["loadBalancers"]],
+            [30, 10])
+        del_load_balancer(self.store, 30)
+        self.assertEqual(
+            [lb["id"] for lb in list_load_balancers("a", self.store)[0]
+             ["loadBalancers"]],
+            [10])
+        self.assertEqual(list_load_balancers("c", self.store),
+                         ({"loadBalancers": []}, 200))
+
+    def test_replacing_lb_with_same_id(self):
+        """
+        A new load balancer with the ID of an existing one replaces it,
+        including in the per-tenant index.
+        """
+        self._add_lb("a", 1)
+        self._add_lb("b", 1)
+        self.assertEqual(list_load_balancers("a", self.store)[0],
+                         {"loadBalancers": []})
+        self.assertEqual(len(list_load_balancers("b", self.store)[0]
+                             ["loadBalancers"]), 1)
+
+    def test_node_count(self):
+        """
+        The listed node count includes nodes added to a load balancer which
+        already had nodes.
+        """
+        self._add_lb("a", 1)
+        for port in (80, 81):
+            add_node(self.store, [{"address": "10.0.0.1", "port": port,
+                                   "condition": "ENABLED"}], 1)
+        [lb] = list_load_balancers("a", self.store)[0]["loadBalancers"]
+        self.assertEqual(lb["nodeCount"], 2)
+        body, code = get_load_balancers(self.store, 1)
+        self.assertEqual(sorted(node["port"]
+                                for node in body["loadBalancer"]["nodes"]),
+                         [80, 81])
+        self.assertNotIn("tenant_id", body["loadBalancer"])
+        self.assertNotIn("nodeCount", body["loadBalancer"])
+
+    def test_nodes_indexed_by_address_and_id(self):
+        """
+        Nodes can be found by ID, duplicates are detected by address and
+        port, and a deleted node's address and port can be used again.
+        """
+        self._add_lb("a", 1)
+        body, code = add_node(
+            self.store, [{"address": "10.0.0.{0}".format(n), "port": 80,
+                          "condition": "ENABLED"} for n in range(50)], 1)
+        self.assertEqual(code, 200)
+        ids = [node["id"] for node in body["nodes"]]
+        self.assertEqual(len(set(ids)), 50)
+        self.assertEqual(get_nodes(self.store, 1, ids[7])[0]["node"]
+                         ["address"], "10.0.0.7")
+        self.assertEqual(
+            add_node(self.store, [{"address": "10.0.0.7", "port": 80,
+                                   "condition": "ENABLED"}], 1)[1],
+            413)
+        self.assertEqual(delete_node(self.store, 1, ids[7]), (None, 202))
+        self.assertEqual(get_nodes(self.store, 1, ids[7])[1], 404)
+        self.assertEqual(delete_node(self.store, 1, ids[7])[1], 404)
+        self.assertEqual(
+            add_node(self.store, [{"address": "10.0.0.7", "port": 80,
+                                   "condition": "ENABLED"}], 1)[1],
+            200)
+        self.assertEqual(
+            [node["address"] for node in
+             list_nodes(self.store, 1)[0]["nodes"]][-2:],
+            ["10.0.0.49", "10.0.0.7"])
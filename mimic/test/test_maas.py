@@ -1,7 +1,11 @@
 import json
 import treq
 from twisted.trial.unittest import SynchronousTestCase
-from mimic.rest.maas_api import MaasApi
+from random import Random
+
+from mimic.rest.maas_api import (
+    MaasApi, M_Cache, createDatapointColumns, createMultiplotFromMetric,
+    encodeMultiplot)
 from mimic.test.helpers import request
 from mimic.test.fixtures import APIMockHelper
 
@@ -432,6 +436,40 @@ class MaasAPITests(SynchronousTestCase):
         data = self.get_responsebody(resp)
         self.assertEquals(500, len(data['metrics'][0]['data']))
 
+    def multiplot(self, metrics, qstring):
+        """
+        Request datapoints for the given metrics, returning the JSON body.
+        """
+        req = request(self, self.root, "POST",
+                      self.uri + '/__experiments/multiplot' + qstring,
+                      json.dumps({'metrics': metrics}))
+        resp = self.successResultOf(req)
+        self.assertEquals(resp.code, 200)
+        return self.get_responsebody(resp)
+
+    def test_multiplot_seeded(self):
+        """
+        Requests with the same seed get the same datapoints, and metrics of
+        unknown checks are left out.
+        """
+        ecan = self.get_ecan_object_ids()
+        metrics = [{'entity_id': ecan['entity_id'], 'check_id': ecan['check_id'],
+                    'metric': 'mzdfw.available'},
+                   {'entity_id': ecan['entity_id'], 'check_id': 'chNothing',
+                    'metric': 'mzdfw.available'}]
+        qstring = '?from=1000&points=10&to=2000&seed=42'
+        first = self.multiplot(metrics, qstring)
+        self.assertEquals(len(first['metrics']), 1)
+        self.assertEquals(first, self.multiplot(metrics, qstring))
+        [metric] = first['metrics']
+        self.assertEquals(metric['unit'], 'percent')
+        self.assertEquals([d['timestamp'] for d in metric['data']],
+                          list(range(1000, 2000, 100)))
+        self.assertTrue(all(1 <= d['average'] <= 99 for d in metric['data']))
+        other = self.multiplot(metrics, '?from=1000&points=10&to=2000&seed=43')
+        self.assertNotEquals([d['average'] for d in metric['data']],
+                             [d['average'] for d in other['metrics'][0]['data']])
+
     def test_get_all_notification_plans(self):
         """
         get all notification plans
@@ -671,6 +709,33 @@ class MaasAPITests(SynchronousTestCase):
         data = self.get_responsebody(resp)
         self.assertEquals(data['values'][0]['id'], ecan['alarm_id'])
 
+    def test_alarms_by_np_pagination(self):
+        """
+        The alarms using a notification plan are paginated by ``limit`` and
+        ``marker``, where the marker is the ID of the first alarm on the page.
+        """
+        alarm_ids = [self.alarm_id] + [
+            self.getXobjectIDfromResponse(
+                self.createAlarm(label, self.entity_id, self.check_id))
+            for label in ('second', 'third')]
+        np_id = 'npTechnicalContactsEmail'
+        req = request(self, self.root, "GET",
+                      self.uri + '/views/alarmsByNp/' + np_id + '?limit=2', '')
+        data = self.get_responsebody(self.successResultOf(req))
+        self.assertEquals([a['id'] for a in data['values']], alarm_ids[:2])
+        self.assertEquals(data['metadata']['next_marker'], alarm_ids[2])
+        req = request(self, self.root, "GET",
+                      self.uri + '/views/alarmsByNp/' + np_id + '?marker=' + alarm_ids[2], '')
+        data = self.get_responsebody(self.successResultOf(req))
+        self.assertEquals([a['id'] for a in data['values']], alarm_ids[2:])
+        self.assertEquals(data['metadata']['limit'], 100)
+        req = request(self, self.root, "GET", self.uri + '/views/alarmCountsPerNp', '')
+        data = self.get_responsebody(self.successResultOf(req))
+        self.assertEquals(data['values'][0]['alarm_count'], 3)
+        req = request(self, self.root, "GET",
+                      self.uri + '/views/alarmCountsPerNp?marker=npNothing', '')
+        self.assertEquals(self.successResultOf(req).code, 400)
+
     def test_delete_np_in_use(self):
         """
         Cant delete a notificationPlan that's being pointed to by alarms
@@ -693,6 +758,67 @@ class MaasAPITests(SynchronousTestCase):
         self.assertTrue(ecan['alarm_id'] in data['message'])
         self.assertTrue(ecan['alarm_id'] in data['details'])
 
+    def get_overview(self, query=''):
+        """
+        Get the overview with the given query string, and return the response
+        and its JSON body.
+        """
+        req = request(self, self.root, "GET", self.uri + '/views/overview' + query, '')
+        resp = self.successResultOf(req)
+        return resp, self.get_responsebody(resp)
+
+    def test_overview_pagination(self):
+        """
+        The overview is paginated by ``limit`` and ``marker``, where the marker
+        is the ID of the first entity on the page.
+        """
+        second = self.getXobjectIDfromResponse(self.createEntity('second'))
+        third = self.getXobjectIDfromResponse(self.createEntity('third'))
+        resp, data = self.get_overview('?limit=2')
+        self.assertEquals(resp.code, 200)
+        self.assertEquals([v['entity']['id'] for v in data['values']],
+                          [self.entity_id, second])
+        self.assertEquals(data['metadata']['count'], 2)
+        self.assertEquals(data['metadata']['next_marker'], third)
+        self.assertTrue(data['metadata']['next_href'].endswith(
+            '/views/overview?marker=' + third + '&limit=2'))
+        resp, data = self.get_overview('?limit=2&marker=' + third)
+        self.assertEquals([v['entity']['id'] for v in data['values']], [third])
+        self.assertEquals(data['metadata']['next_marker'], None)
+        self.assertEquals(data['metadata']['next_href'], None)
+
+    def test_overview_bad_pagination(self):
+        """
+        An unknown marker, or a limit which is not between 1 and 1000, results
+        in a 400.
+        """
+        for query in ['?marker=enNothing', '?limit=0', '?limit=1001',
+                      '?limit=lots']:
+            resp, data = self.get_overview(query)
+            self.assertEquals(resp.code, 400)
+            self.assertEquals(data['type'], 'badRequest')
+
+    def test_overview_follows_changes(self):
+        """
+        The overview reflects checks and alarms created and deleted since it
+        was last fetched.
+        """
+        resp, data = self.get_overview()
+        self.assertEquals(len(data['values'][0]['checks']), 1)
+        new_check_id = self.getXobjectIDfromResponse(
+            self.createCheck('another', self.entity_id))
+        resp, data = self.get_overview()
+        self.assertEquals([c['id'] for c in data['values'][0]['checks']],
+                          [self.check_id, new_check_id])
+        self.assertNotIn('entity_id', data['values'][0]['checks'][1])
+        req = request(self, self.root, "DELETE",
+                      self.uri + '/entities/' + self.entity_id + '/checks/' + self.check_id)
+        self.assertEquals(self.successResultOf(req).code, 204)
+        resp, data = self.get_overview()
+        self.assertEquals([c['id'] for c in data['values'][0]['checks']],
+                          [new_check_id])
+        self.assertEquals(data['values'][0]['alarms'], [])
+
     def test_reset_session(self):
         """
         Reset session, remove all objects
@@ -712,3 +838,190 @@ class MaasAPITests(SynchronousTestCase):
         self.assertEquals(resp.code, 200)
         data = self.get_responsebody(resp)
         self.assertEquals(data['metadata']['count'], 0)
+
+
+class MCacheTests(SynchronousTestCase):
+
+    """
+    Tests for the indexes kept by :obj:`M_Cache`.
+    """
+
+    def setUp(self):
+        """
+        Create a cache with two entities, each with two checks and an alarm
+        on each check.
+        """
+        self.cache = M_Cache()
+        for entity_id in ('en1', 'en2'):
+            self.cache.add_entity({'id': entity_id})
+            for n in range(2):
+                check_id = 'ch{0}{1}'.format(entity_id, n)
+                self.cache.add_check({'id': check_id, 'entity_id': entity_id})
+                self.cache.add_alarm({'id': 'al{0}{1}'.format(entity_id, n),
+                                      'entity_id': entity_id,
+                                      'check_id': check_id})
+
+    def ids(self, objects):
+        """
+        The IDs of the given objects.
+        """
+        return [obj['id'] for obj in objects]
+
+    def test_children_by_entity(self):
+        """
+        Checks and alarms can be looked up by ID, and listed by entity in the
+        order they were added.
+        """
+        self.assertEqual(self.cache.checks.get('chen21')['entity_id'], 'en2')
+        self.assertEqual(self.ids(self.cache.checks_for_entity('en1')),
+                         ['chen10', 'chen11'])
+        self.assertEqual(self.ids(self.cache.alarms_for_entity('en2')),
+                         ['alen20', 'alen21'])
+        self.assertEqual(self.cache.checks_for_entity('en3'), [])
+
+    def test_replace_moves_to_end(self):
+        """
+        Adding a check with an existing ID replaces it, as the newest check.
+        """
+        self.cache.add_check({'id': 'chen10', 'entity_id': 'en1',
+                              'label': 'new'})
+        self.assertEqual(self.ids(self.cache.checks_for_entity('en1')),
+                         ['chen11', 'chen10'])
+        self.assertEqual(self.cache.checks.get('chen10')['label'], 'new')
+        self.assertEqual(len(self.cache.checks), 4)
+
+    def test_remove_entity_cascades(self):
+        """
+        Removing an entity removes all of its checks and alarms, and only
+        those.
+        """
+        self.cache.remove_entity('en1')
+        self.assertEqual(self.ids(self.cache.entities), ['en2'])
+        self.assertEqual(self.ids(self.cache.checks), ['chen20', 'chen21'])
+        self.assertEqual(self.ids(self.cache.alarms), ['alen20', 'alen21'])
+        self.assertEqual(self.cache.alarms_for_entity('en1'), [])
+
+    def test_remove_check(self):
+        """
+        Removing a check removes it from its entity's checks.
+        """
+        self.assertEqual(self.cache.remove_check('chen20')['id'], 'chen20')
+        self.assertEqual(self.cache.remove_check('chen20'), None)
+        self.assertEqual(self.ids(self.cache.checks_for_entity('en2')),
+                         ['chen21'])
+
+    def test_alarms_by_plan(self):
+        """
+        Alarms are indexed by notification plan, and move between plans when
+        they are replaced or removed.
+        """
+        self.cache.add_alarm({'id': 'alen10', 'entity_id': 'en1',
+                              'check_id': 'chen10', 'notification_plan_id': 'np1'})
+        self.cache.add_alarm({'id': 'alen21', 'entity_id': 'en2',
+                              'check_id': 'chen21', 'notification_plan_id': 'np1'})
+        self.assertEqual(self.ids(self.cache.alarms_for_plan('np1')),
+                         ['alen10', 'alen21'])
+        self.assertEqual(self.ids(self.cache.alarms_for_plan(None)),
+                         ['alen11', 'alen20'])
+        self.cache.remove_entity('en2')
+        self.assertEqual(self.ids(self.cache.alarms_for_plan('np1')), ['alen10'])
+        self.cache.remove_alarm('alen10')
+        self.assertEqual(len(self.cache.alarms_for_plan('np1')), 0)
+
+    def test_entity_overview_kept_until_changed(self):
+        """
+        An entity's overview is reused until one of its checks or alarms
+        changes, and is unaffected by changes to other entities.
+        """
+        overview = self.cache.entity_overview('en1')
+        self.assertIs(self.cache.entity_overview('en1'), overview)
+        self.assertEqual(self.ids(overview['checks']), ['chen10', 'chen11'])
+        self.cache.remove_alarm('alen20')
+        self.assertIs(self.cache.entity_overview('en1'), overview)
+        self.cache.remove_check('chen11')
+        self.assertEqual(self.ids(self.cache.entity_overview('en1')['checks']),
+                         ['chen10'])
+
+    def test_entity_metric_list_kept_until_checks_change(self):
+        """
+        An entity's metric list is reused until one of its checks changes,
+        and is unaffected by changes to its alarms or to other entities.
+        """
+        for n in range(2):
+            self.cache.add_check({'id': 'chen1{0}'.format(n), 'entity_id': 'en1',
+                                  'label': 'ping', 'type': 'remote.ping',
+                                  'monitoring_zones_poll': [u'mzord']})
+        self.cache.entities.get('en1')['label'] = 'one'
+        metric_list = self.cache.entity_metric_list('en1')
+        self.assertEqual(self.ids(metric_list['checks']), ['chen10', 'chen11'])
+        self.assertEqual([m['name'] for m in metric_list['checks'][0]['metrics']],
+                         ['mzord.available', 'mzord.average'])
+        self.cache.remove_alarm('alen10')
+        self.cache.remove_check('chen20')
+        self.assertIs(self.cache.entity_metric_list('en1'), metric_list)
+        self.cache.remove_check('chen11')
+        self.assertEqual(self.ids(self.cache.entity_metric_list('en1')['checks']),
+                         ['chen10'])
+
+
+class MultiplotDatapointTests(SynchronousTestCase):
+
+    """
+    Tests for the generation and encoding of multiplot datapoints.
+    """
+
+    def test_columns(self):
+        """
+        :obj:`createDatapointColumns` makes evenly spaced timestamps and
+        averages between 1 and 99, which only depend on the random generator.
+        """
+        timestamps, averages = createDatapointColumns(0, 1000, 4, Random(1))
+        self.assertEqual(list(timestamps), [0, 250, 500, 750])
+        self.assertEqual(len(averages), 4)
+        self.assertTrue(all(1 <= a <= 99 for a in averages))
+        self.assertEqual(list(averages),
+                         list(createDatapointColumns(0, 1000, 4, Random(1))[1]))
+
+    def test_column_in_one_draw(self):
+        """
+        :obj:`createDatapointColumns` draws all of the averages from the
+        random generator at once.
+        """
+        rng = Random(1)
+        createDatapointColumns(0, 1000, 1000, rng)
+        expected = Random(1)
+        expected.getrandbits(1000 * 8)
+        self.assertEqual(rng.getstate(), expected.getstate())
+
+    def test_more_points_than_time(self):
+        """
+        When there are more points than units of time, they all have the
+        starting timestamp, as before.
+        """
+        timestamps, averages = createDatapointColumns(10, 12, 5, Random(1))
+        self.assertEqual(list(timestamps), [10] * 5)
+
+    def test_seed_pinned(self):
+        """
+        :obj:`createMultiplotFromMetric` with a seed gives the same
+        datapoints on every version of Python, whatever its hash seed.
+        """
+        metric = {'entity_id': 'en1', 'check_id': 'ch1',
+                  'metric': 'mzdfw.available'}
+        multiplot, (timestamps, averages) = createMultiplotFromMetric(
+            metric, {'from': ['1000'], 'to': ['2000'], 'points': ['5']},
+            {'entity_id': 'en1', 'type': 'remote.ping'}, seed='42')
+        self.assertEqual(list(averages), [89, 13, 82, 51, 98])
+
+    def test_encode(self):
+        """
+        :obj:`encodeMultiplot` encodes a multiplot with its datapoints.
+        """
+        columns = createDatapointColumns(1412902262560, 1412902264560, 2,
+                                         Random(1))
+        decoded = json.loads(encodeMultiplot({'metric': 'm'}, columns))
+        self.assertEqual(decoded['metric'], 'm')
+        self.assertEqual(decoded['data'], [
+            {'numPoints': 4, 'timestamp': 1412902262560 + 1000 * n,
+             'average': columns[1][n]}
+            for n in range(2)])
@@ -2,11 +2,16 @@
 import json
 import treq
 
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from mimic.test.helpers import json_request, request, validate_link_json
 from mimic.rest.nova_api import NovaApi, NovaControlApi
+from mimic.util.streaming import JSONProducer
+from mimic.model.nova_objects import (
+    RegionalServerCollection, Server, create_building_behavior)
 from mimic.test.fixtures import APIMockHelper, TenantAuthentication
+from mimic.test.test_util import StreamingRequest
 
 
 class NovaAPITests(SynchronousTestCase):
@@ -301,6 +306,33 @@ class NovaAPITests(SynchronousTestCase):
         delete_server_response = self.successResultOf(delete_server)
         self.assertEqual(delete_server_response.code, 404)
 
+    def test_delete_server_keeps_list_order(self):
+        """
+        Deleting a server from the middle of the collection removes only that
+        server: the deleted server is no longer found, and the remaining
+        servers are still listed in the order they were created.
+        """
+        server_ids = [self.server_id]
+        for name in ["second", "third"]:
+            create_response, body = self.successResultOf(json_request(
+                self, self.root, "POST", self.uri + '/servers',
+                {"server": {"name": name, "imageRef": "test-image",
+                            "flavorRef": "test-flavor"}}))
+            server_ids.append(body['server']['id'])
+
+        delete_server = request(
+            self, self.root, "DELETE", self.uri + '/servers/' + server_ids[1])
+        self.assertEqual(self.successResultOf(delete_server).code, 204)
+
+        get_server = request(
+            self, self.root, "GET", self.uri + '/servers/' + server_ids[1])
+        self.assertEqual(self.successResultOf(get_server).code, 404)
+
+        response, body = self.successResultOf(json_request(
+            self, self.root, "GET", self.uri + '/servers'))
+        self.assertEqual([server['id'] for server in body['servers']],
+                         [server_ids[0], server_ids[2]])
+
     def test_get_server_image(self):
         """
         Test to verify :func:`get_image` on ``GET /v2.0/<tenant_id>/images/<image_id>``
@@ -677,3 +709,370 @@ class NovaAPINegativeTests(SynchronousTestCase):
         self.assertEquals(failing_create_response_body['message'],
                           "Sample failure message")
         self.assertEquals(failing_create_response_body['code'], 503)
+
+    def test_bounded_and_expiring_behaviors(self):
+        """
+        A behavior registered with a number of ``uses`` applies to that many
+        server creations, and one registered with a ``ttl`` applies for that
+        many seconds; behaviors can be listed, and deleted by the ID
+        returned when registering them.
+        """
+        behaviors = self.nova_control_endpoint + "/behaviors/creation/"
+
+        def register(**extra):
+            criterion = {"name": "fail",
+                         "parameters": {"message": "failed", "code": 500},
+                         "criteria": [{"server_name": "failing"}]}
+            criterion.update(extra)
+            (response, body) = self.successResultOf(json_request(
+                self, self.root, "POST", behaviors, criterion))
+            self.assertEqual(response.code, 201)
+            return body["id"]
+
+        def codes(count):
+            return [self.create_server(name="failing").code
+                    for _ in range(count)]
+
+        register(uses=2)
+        self.assertEqual(codes(3), [500, 500, 202])
+
+        register(ttl=10)
+        self.helper.clock.advance(9)
+        self.assertEqual(codes(1), [500])
+        self.helper.clock.advance(1)
+        self.assertEqual(codes(1), [202])
+
+        first = register(uses=5)
+        second = register(ttl=20)
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", behaviors))
+        self.assertEqual(
+            [(b["id"], b.get("uses"), b.get("expires"))
+             for b in body["behaviors"]],
+            [(first, 5, None), (second, None, 30)])
+
+        response = self.successResultOf(request(
+            self, self.root, "DELETE", behaviors + first))
+        self.assertEqual(response.code, 204)
+        response = self.successResultOf(request(
+            self, self.root, "DELETE", behaviors + first))
+        self.assertEqual(response.code, 404)
+        self.assertEqual(codes(1), [500])
+        self.successResultOf(request(
+            self, self.root, "DELETE", behaviors + second))
+        self.assertEqual(codes(1), [202])
+
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", behaviors,
+            {"name": "fail", "parameters": {}, "criteria": [], "uses": 0}))
+        self.assertEqual(response.code, 400)
+
+
+class NovaServerListPaginationAndFilterTests(SynchronousTestCase):
+
+    """
+    Tests for the ``limit``, ``marker``, ``status``, ``image``, ``flavor`` and
+    ``changes-since`` arguments to the list servers requests.
+    """
+
+    def setUp(self):
+        """
+        Create a :obj:`MimicCore` with :obj:`NovaApi` as the only plugin, and
+        create four servers with differing images, flavors and statuses, one
+        second apart.
+        """
+        self.helper = APIMockHelper(self, [NovaApi(["ORD", "MIMIC"])])
+        self.root = self.helper.root
+        self.uri = self.helper.uri
+        self.server_ids = [
+            self.create_server("one", "image-a", "flavor-a"),
+            self.create_server("two", "image-b", "flavor-a",
+                               {"server_building": "10"}),
+            self.create_server("three", "image-a", "flavor-b",
+                               {"server_error": "1"}),
+            self.create_server("four", "image-a", "flavor-a"),
+        ]
+
+    def create_server(self, name, image, flavor, metadata=None):
+        """
+        Create a server, advance the clock by a second, and return the new
+        server's ID.
+        """
+        response, body = self.successResultOf(json_request(
+            self, self.root, "POST", self.uri + '/servers',
+            {"server": {"name": name, "imageRef": image, "flavorRef": flavor,
+                        "metadata": metadata or {}}}))
+        self.assertEqual(response.code, 202)
+        self.helper.clock.advance(1)
+        return body['server']['id']
+
+    def list_ids(self, query, detail=False):
+        """
+        List servers with the given query string, returning the list of IDs
+        and the full JSON body.
+        """
+        response, body = self.successResultOf(json_request(
+            self, self.root, "GET", "{0}/servers{1}?{2}".format(
+                self.uri, "/detail" if detail else "", query)))
+        self.assertEqual(response.code, 200)
+        return [server['id'] for server in body['servers']], body
+
+    def test_list_streamed_in_chunks(self):
+        """
+        The list of servers is written in several chunks when it is larger
+        than :obj:`JSONProducer.chunk_size`, and still parses as one body.
+        """
+        self.patch(JSONProducer, "chunk_size", 64)
+        ids, body = self.list_ids("", detail=True)
+        self.assertEqual(ids, self.server_ids)
+        ids, body = self.list_ids("limit=3")
+        self.assertEqual(ids, self.server_ids[:3])
+        self.assertEqual(len(body['servers_links']), 1)
+
+    def test_list_is_a_snapshot(self):
+        """
+        The servers listed are those there were when the list was requested,
+        even if servers are created and deleted while it is being streamed.
+        """
+        self.patch(JSONProducer, "chunk_size", 64)
+        api = self.helper.core.apis()[0]
+        tenant_id = self.uri.rsplit("/", 1)[-1]
+        collection = (api._get_session(self.helper.core.sessions, tenant_id)
+                      .collection_for_region("ORD"))
+        req = StreamingRequest(pause_after_write=True)
+        d = collection.request_list(req, False, lambda path: path)
+        self.assertNoResult(d)
+        self.create_server("five", "image-a", "flavor-a")
+        for server_id in self.server_ids[1:3]:
+            self.successResultOf(request(
+                self, self.root, "DELETE",
+                self.uri + "/servers/" + server_id))
+        while req.producer is not None:
+            req.producer.resumeProducing()
+        self.successResultOf(d)
+        body = json.loads(b"".join(req.written).decode("utf-8"))
+        self.assertEqual([server["id"] for server in body["servers"]],
+                         self.server_ids)
+
+    def test_limit_and_next_link(self):
+        """
+        A ``limit`` returns at most that many servers, in creation order, with
+        a ``next`` link to the following page which carries the filters along.
+        """
+        ids, body = self.list_ids("limit=2&image=image-a", detail=True)
+        self.assertEqual(ids, [self.server_ids[0], self.server_ids[2]])
+        [link] = body['servers_links']
+        self.assertEqual(link['rel'], 'next')
+        self.assertIn("/servers/detail?", link['href'])
+        self.assertIn("marker=" + self.server_ids[2], link['href'])
+        self.assertIn("image=image-a", link['href'])
+
+        next_ids, next_body = self.list_ids(link['href'].split("?", 1)[1],
+                                            detail=True)
+        self.assertEqual(next_ids, [self.server_ids[3]])
+        self.assertNotIn('servers_links', next_body)
+
+    def test_marker_without_filters(self):
+        """
+        A ``marker`` lists only the servers created after the marked one.
+        """
+        ids, body = self.list_ids("marker=" + self.server_ids[1])
+        self.assertEqual(ids, self.server_ids[2:])
+        self.assertNotIn('servers_links', body)
+
+    def test_marker_not_found(self):
+        """
+        A ``marker`` which is not the ID of a server results in a 400.
+        """
+        response, body = self.successResultOf(json_request(
+            self, self.root, "GET", self.uri + '/servers?marker=nope'))
+        self.assertEqual(response.code, 400)
+        self.assertEqual(body['badRequest']['message'],
+                         "marker [nope] not found")
+
+    def test_invalid_limit(self):
+        """
+        A ``limit`` which is not a positive integer results in a 400.
+        """
+        for limit in ["abc", "-1", "0"]:
+            response, body = self.successResultOf(json_request(
+                self, self.root, "GET", self.uri + '/servers?limit=' + limit))
+            self.assertEqual(response.code, 400)
+            self.assertEqual(body['badRequest']['message'],
+                             "limit param must be a positive integer")
+
+    def test_filter_by_image_and_flavor(self):
+        """
+        The ``image`` and ``flavor`` filters can be combined.
+        """
+        ids, _ = self.list_ids("image=image-a&flavor=flavor-a")
+        self.assertEqual(ids, [self.server_ids[0], self.server_ids[3]])
+        ids, _ = self.list_ids("flavor=flavor-b")
+        self.assertEqual(ids, [self.server_ids[2]])
+        ids, _ = self.list_ids("image=no-such-image")
+        self.assertEqual(ids, [])
+
+    def test_filter_by_status_follows_build(self):
+        """
+        The ``status`` filter reflects status changes, including a building
+        server becoming active once its build time has elapsed.
+        """
+        self.assertEqual(self.list_ids("status=BUILD")[0],
+                         [self.server_ids[1]])
+        self.assertEqual(self.list_ids("status=ERROR")[0],
+                         [self.server_ids[2]])
+        self.helper.clock.advance(10)
+        self.assertEqual(self.list_ids("status=BUILD")[0], [])
+        self.assertEqual(
+            self.list_ids("status=ACTIVE")[0],
+            [self.server_ids[0], self.server_ids[1], self.server_ids[3]])
+
+    def test_changes_since(self):
+        """
+        ``changes-since`` lists only the servers updated at or after the given
+        time, in creation order; a build finishing counts as an update.
+        """
+        ids, _ = self.list_ids("changes-since=1970-01-01T00:00:02Z")
+        self.assertEqual(ids, self.server_ids[2:])
+        self.helper.clock.advance(10)
+        ids, _ = self.list_ids("changes-since=1970-01-01T00:00:10Z")
+        self.assertEqual(ids, [self.server_ids[1]])
+
+    def test_invalid_changes_since(self):
+        """
+        A ``changes-since`` which is not a timestamp results in a 400.
+        """
+        response, body = self.successResultOf(json_request(
+            self, self.root, "GET", self.uri + '/servers?changes-since=now'))
+        self.assertEqual(response.code, 400)
+
+    def test_deleted_servers_leave_indexes(self):
+        """
+        Deleted servers no longer appear in filtered lists.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "DELETE", self.uri + '/servers/' +
+            self.server_ids[0]))
+        self.assertEqual(response.code, 204)
+        ids, _ = self.list_ids("image=image-a&status=ACTIVE")
+        self.assertEqual(ids, [self.server_ids[3]])
+
+
+class ServerJSONMemoizationTests(SynchronousTestCase):
+
+    """
+    Tests for the memoized JSON representations of :obj:`Server`.
+    """
+
+    def setUp(self):
+        """
+        Create a server in a collection with its own clock.
+        """
+        self.clock = Clock()
+        self.collection = RegionalServerCollection(
+            tenant_id="1234", region_name="ORD", clock=self.clock)
+        self.server = Server.from_creation_request_json(
+            self.collection,
+            {"server": {"name": "memo", "imageRef": "image",
+                        "flavorRef": "flavor"}})
+
+    def absolutize_url(self, suffix):
+        """
+        Make a URL absolute against an example base.
+        """
+        return "http://mimic/" + suffix
+
+    def test_unchanged_server_reuses_json(self):
+        """
+        Rendering an unchanged server again returns the memoized objects.
+        """
+        detail = self.server.detail_json(self.absolutize_url)
+        brief = self.server.brief_json(self.absolutize_url)
+        self.assertIs(self.server.detail_json(self.absolutize_url), detail)
+        self.assertIs(self.server.brief_json(self.absolutize_url), brief)
+        self.assertEqual(brief['links'][0]['href'],
+                         "http://mimic/v2/1234/servers/" +
+                         self.server.server_id)
+
+    def test_each_url_generator_gets_its_own_json(self):
+        """
+        Representations contain absolute URLs, so a different URL generator
+        gets a different representation.
+        """
+        detail = self.server.detail_json(self.absolutize_url)
+        other = self.server.detail_json(lambda suffix: "http://other/" + suffix)
+        self.assertIsNot(detail, other)
+        self.assertTrue(other['links'][0]['href'].startswith("http://other/"))
+
+    def test_status_change_discards_json(self):
+        """
+        Changing the status discards memoized JSON, so the new status and
+        update time are rendered.
+        """
+        detail = self.server.detail_json(self.absolutize_url)
+        self.clock.advance(5)
+        self.server.update_status(u"ERROR")
+        new_detail = self.server.detail_json(self.absolutize_url)
+        self.assertIsNot(new_detail, detail)
+        self.assertEqual(new_detail['status'], u"ERROR")
+        self.assertEqual(new_detail['updated'], "1970-01-01T00:00:05.000000Z")
+
+    def test_build_completion_discards_json(self):
+        """
+        When the ``build`` behavior's timer fires, the server is rendered as
+        ``ACTIVE``.
+        """
+        building = Server.from_creation_request_json(
+            self.collection,
+            {"server": {"name": "building", "imageRef": "image",
+                        "flavorRef": "flavor"}})
+        building.update_status(u"BUILD")
+        self.assertEqual(
+            building.detail_json(self.absolutize_url)['status'], u"BUILD")
+        self.clock.callLater(3, building.update_status, u"ACTIVE")
+        self.clock.advance(3)
+        self.assertEqual(
+            building.detail_json(self.absolutize_url)['status'], u"ACTIVE")
+
+    def test_build_behavior_schedules_status_change(self):
+        """
+        The ``build`` behavior leaves the server in ``BUILD`` until its
+        duration has elapsed.
+        """
+        behavior = create_building_behavior({"duration": 2})
+
+        class FakeRequest(object):
+            def setResponseCode(self, code):
+                self.code = code
+
+        response = json.loads(behavior(
+            self.collection, FakeRequest(),
+            {"server": {"name": "built", "imageRef": "image",
+                        "flavorRef": "flavor"}},
+            self.absolutize_url))
+        server = self.collection.server_by_id(response['server']['id'])
+        self.assertEqual(
+            server.detail_json(self.absolutize_url)['status'], u"BUILD")
+        self.clock.advance(2)
+        self.assertEqual(
+            server.detail_json(self.absolutize_url)['status'], u"ACTIVE")
+
+    def test_metadata_change_discards_json(self):
+        """
+        Changing a metadata item discards memoized JSON.
+        """
+        self.server.detail_json(self.absolutize_url)
+        self.server.set_metadata_item("key", "value")
+        self.assertEqual(
+            self.server.detail_json(self.absolutize_url)['metadata'],
+            {"key": "value"})
+
+    def test_bounded(self):
+        """
+        No more than :obj:`Server.max_json_cache_entries` representations are
+        kept for a server.
+        """
+        for n in range(Server.max_json_cache_entries * 2):
+            self.server.brief_json(lambda suffix: suffix)
+        self.assertTrue(len(self.server._json_cache) <=
+                        Server.max_json_cache_entries)
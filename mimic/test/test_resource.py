@@ -175,6 +175,25 @@ class RootAndPresetTests(SynchronousTestCase):
         self.assertEqual(json_content, expected)
         self.assertEqual(do.done, True)
 
+    def test_stats(self):
+        """
+        ``/mimic/v1.1/stats`` (handled by :func:`MimicRoot.get_stats`) reports
+        the number of sessions kept and forgotten.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [])
+        core.sessions.session_for_token("a_token")
+        clock.advance(86400 + core.sessions.retention.total_seconds())
+        core.sessions.sweep_expired()
+        core.sessions.session_for_token("another_token")
+        root = MimicRoot(core, clock).app.resource()
+        (response, json_content) = self.successResultOf(json_request(
+            self, root, "GET", "/mimic/v1.1/stats"))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json_content["sessions"]["sessions"], 1)
+        self.assertEqual(json_content["sessions"]["expired"], 1)
+        self.assertEqual(json_content["resource_cache"]["size"], 0)
+
     def test_fastly(self):
         """
         The /fastly pointing to the fastly endpoint
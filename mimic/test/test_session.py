@@ -1,6 +1,6 @@
 
 import six
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 
 from twisted.trial.unittest import SynchronousTestCase
@@ -8,6 +8,7 @@ from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.task import Clock
 
 from mimic.session import NonMatchingTenantError, SessionStore
+from mimic.util.ids import IDAllocator
 
 
 class SessionCreationTests(SynchronousTestCase):
@@ -242,3 +243,262 @@ class SessionCreationTests(SynchronousTestCase):
         ]
         for i, session in enumerate(sessions):
             self.assertEqual("tenant{0}".format(i + 1), session.tenant_id)
+
+    def test_id_filter(self):
+        """
+        The usernames, tokens and tenant IDs generated for new sessions are
+        only those accepted by the store's ``id_filter``.
+        """
+        sessions = SessionStore(Clock())
+        sessions.id_filter = lambda generated: generated[-1] in "02468"
+        for _ in range(10):
+            session = sessions.session_for_token(None)
+            for generated in [session.username, session.token,
+                              session.tenant_id]:
+                self.assertIn(generated[-1], "02468")
+
+    def test_generated_ids_seeded(self):
+        """
+        The IDs generated for sessions are drawn from the store's ID
+        allocator, so stores whose allocators have the same seed generate the
+        same IDs.
+        """
+        def session_ids():
+            sessions = SessionStore(Clock(), ids=IDAllocator(1))
+            return [(s.username, s.token, s.tenant_id) for s in
+                    [sessions.session_for_token(None) for _ in range(3)]]
+        self.assertEqual(session_ids(), session_ids())
+        self.assertEqual(len(set(session_ids())), 3)
+
+    def test_used_session_for_token(self):
+        """
+        :func:`SessionStore.used_session_for_token` finds the session of a
+        token which belongs to the given tenant, if any, making it the most
+        recently used, and never creates one.
+        """
+        sessions = SessionStore(Clock())
+        first = sessions.session_for_token("first", "1234")
+        sessions.session_for_token("second")
+        self.assertIs(sessions.used_session_for_token("first"), first)
+        self.assertIs(sessions.used_session_for_token("first", "1234"),
+                      first)
+        self.assertIs(sessions.all_sessions()[-1], first)
+        self.assertIs(sessions.used_session_for_token("first", "5678"), None)
+        self.assertIs(sessions.used_session_for_token("third"), None)
+        self.assertEqual(len(sessions.all_sessions()), 2)
+
+    def test_cached_response(self):
+        """
+        :func:`Session.cached_response` renders a response once, until the
+        session's expiry time changes.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        session = sessions.session_for_username_password("user", "pass")
+        rendered = []
+
+        def render():
+            rendered.append(session.expires)
+            return len(rendered)
+        self.assertEqual(session.cached_response("key", render), 1)
+        self.assertEqual(session.cached_response("key", render), 1)
+        self.assertEqual(session.cached_response("other", render), 2)
+        sessions.session_for_impersonation("user", 60)
+        self.assertEqual(session.cached_response("key", render), 3)
+        self.assertEqual(rendered[-1], session.expires)
+
+
+class SessionExpiryTests(SynchronousTestCase):
+    """
+    Tests for forgetting sessions in :class:`SessionStore`.
+    """
+
+    def test_sweep_expired(self):
+        """
+        :func:`SessionStore.sweep_expired` forgets the sessions whose tokens
+        expired, according to the clock, at least ``retention`` ago, and all
+        the keys that refer to them, so that the same credentials get a new
+        session.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock, retention=timedelta(seconds=60))
+        old = sessions.session_for_username_password("old", "password", "111")
+        old.data_for_api("not_an_api", list)
+        clock.advance(3600)
+        new = sessions.session_for_token("new_token")
+        clock.advance(86400 - 3600)
+        self.assertEqual(sessions.sweep_expired(), 0)
+        clock.advance(60)
+        self.assertEqual(sessions.sweep_expired(), 1)
+        self.assertIdentical(sessions.session_for_token("new_token"), new)
+        self.assertNotIdentical(sessions.session_for_tenant_id("111"), old)
+        self.assertNotIdentical(
+            sessions.session_for_username_password("old", "password"), old)
+        self.assertEqual(sessions.stats()["expired"], 1)
+        self.assertEqual(sessions.stats()["api_objects_released"], 1)
+
+    def test_sweep_impersonation(self):
+        """
+        An impersonation session expires when the impersonation does, and its
+        impersonated token is forgotten with it.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock, retention=timedelta(0))
+        a = sessions.session_for_impersonation("pretender", 10,
+                                               impersonated_token="imp")
+        clock.advance(10)
+        sessions.sweep_expired()
+        self.assertEqual(sessions.stats()["tokens"], 0)
+        self.assertNotIdentical(sessions.session_for_token("imp"), a)
+
+    def test_sweep_only_expired(self):
+        """
+        :func:`SessionStore.sweep_expired` skips the expiry times which an
+        impersonation has since replaced, and leaves the sessions which have
+        not yet expired.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock, retention=timedelta(0))
+        extended = sessions.session_for_username_password("extended", "p")
+        for n in range(5):
+            clock.advance(1)
+            sessions.session_for_token("token{0}".format(n))
+        sessions.session_for_impersonation("extended", 86400 + 10,
+                                           impersonated_token="imp")
+        clock.advance(86400 - 3)
+        self.assertEqual(sessions.sweep_expired(), 2)
+        self.assertEqual(sessions.stats()["sessions"], 4)
+        self.assertIdentical(sessions.existing_session_for_token("imp"),
+                             extended)
+        clock.advance(100)
+        self.assertEqual(sessions.sweep_expired(), 4)
+        self.assertEqual(sessions._expiries, [])
+
+    def test_expiry_heap_bounded(self):
+        """
+        Replacing a session's expiry time, or forgetting the session, makes
+        its entry in the heap of expiry times stale, and stale entries are
+        compacted away before they outnumber the sessions.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock, max_sessions=2)
+        for n in range(100):
+            sessions.session_for_impersonation("user", 60 + n)
+            sessions.session_for_token("token{0}".format(n))
+            self.assertTrue(len(sessions._expiries) <= 2 * 2 + 1)
+
+    def test_expired_at_lookup(self):
+        """
+        A session's tokens expire according to the clock, even before it is
+        swept: looking the session up by them fails, and they are known to
+        have expired.  The session is kept, along with its data; when its
+        user authenticates again, it is issued a new token, and the old
+        tokens stay expired until they are used for a new session.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        old = sessions.session_for_username_password("old", "password", "111")
+        old_token = old.token
+        data = old.data_for_api("not_an_api", list)
+        sessions.session_for_impersonation("old", 20,
+                                           impersonated_token="imp")
+        clock.advance(10)
+        self.assertFalse(sessions.token_expired(old_token))
+        clock.advance(10)
+        self.assertIdentical(sessions.used_session_for_token(old_token), None)
+        self.assertTrue(sessions.token_expired(old_token))
+        self.assertTrue(sessions.token_expired("imp"))
+        self.assertFalse(sessions.token_expired("never_seen"))
+        self.assertIdentical(sessions.session_for_tenant_id("111"), old)
+        self.assertEqual(sessions.stats()["expired"], 0)
+
+        new = sessions.session_for_username_password("old", "password")
+        self.assertIdentical(new, old)
+        self.assertNotEqual(new.token, old_token)
+        self.assertEqual(new.tenant_id, "111")
+        self.assertIs(new.data_for_api("not_an_api", list), data)
+        self.assertEqual(new.expires, datetime.utcfromtimestamp(20 + 86400))
+        self.assertIdentical(sessions.used_session_for_token(new.token), new)
+        self.assertTrue(sessions.token_expired(old_token))
+        self.assertTrue(sessions.token_expired("imp"))
+
+        self.assertNotIdentical(sessions.session_for_token(old_token), new)
+        self.assertFalse(sessions.token_expired(old_token))
+        self.assertEqual(sessions.sweep_expired(), 0)
+
+    def test_renew_generated_tenant(self):
+        """
+        A user who authenticated without a tenant, and authenticates again
+        without one after their token expires, gets a new token for the same
+        tenant.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        old = sessions.session_for_username_password("user", "password")
+        tenant_id, token = old.tenant_id, old.token
+        clock.advance(86400)
+        new = sessions.session_for_api_key("user", "api_key")
+        self.assertIdentical(new, old)
+        self.assertEqual(new.tenant_id, tenant_id)
+        self.assertNotEqual(new.token, token)
+        self.assertIdentical(sessions.session_for_tenant_id(tenant_id), new)
+
+    def test_add_session_replaces_renewed(self):
+        """
+        :func:`SessionStore.add_session` replaces the session with the same
+        username, such as the same session restored from before it was
+        issued a new token.
+        """
+        sessions = SessionStore(Clock())
+        sessions.add_session(u"user", u"old_token", u"111",
+                             datetime.utcfromtimestamp(0))
+        new = sessions.add_session(u"user", u"new_token", u"111",
+                                   datetime.utcfromtimestamp(86400))
+        self.assertEqual(sessions.all_sessions(), [new])
+        self.assertIdentical(sessions.session_for_tenant_id(u"111"), new)
+
+    def test_remove_session(self):
+        """
+        :func:`SessionStore.remove_session` forgets the session of a user,
+        and the observers added with :func:`SessionStore.observe_forget` are
+        told about it.
+        """
+        sessions = SessionStore(Clock())
+        forgotten = []
+        sessions.observe_forget(forgotten.append)
+        session = sessions.session_for_api_key(u"user", u"api_key")
+        self.assertIdentical(
+            sessions.existing_session_for_username(u"user"), session)
+        sessions.remove_session(u"user")
+        sessions.remove_session(u"nobody")
+        self.assertEqual(sessions.all_sessions(), [])
+        self.assertIdentical(
+            sessions.existing_session_for_username(u"user"), None)
+        self.assertEqual(forgotten, [session])
+
+    def test_max_sessions(self):
+        """
+        With ``max_sessions``, creating a session beyond that number forgets
+        the least recently used session.
+        """
+        sessions = SessionStore(Clock(), max_sessions=2)
+        a = sessions.session_for_token("a")
+        b = sessions.session_for_token("b")
+        sessions.session_for_token("a")
+        sessions.session_for_token("c")
+        self.assertIdentical(sessions.session_for_token("a"), a)
+        self.assertNotIdentical(sessions.session_for_token("b"), b)
+        stats = sessions.stats()
+        self.assertEqual((stats["sessions"], stats["evicted"]), (2, 2))
+
+    def test_limit_sessions(self):
+        """
+        :func:`SessionStore.limit_sessions` evicts the sessions that are
+        already beyond the new limit.
+        """
+        sessions = SessionStore(Clock())
+        for token in "abc":
+            sessions.session_for_token(token)
+        sessions.limit_sessions(1)
+        self.assertEqual(sessions.stats()["sessions"], 1)
+        self.assertEqual(sessions.stats()["evicted"], 2)
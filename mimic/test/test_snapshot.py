@@ -0,0 +1,344 @@
+"""
+Tests for :mod:`mimic.snapshot` and the snapshot and restore APIs.
+"""
+
+import json
+
+from twisted.internet.task import Clock
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import SynchronousTestCase
+
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.rest.loadbalancer_api import LoadBalancerApi
+from mimic.rest.maas_api import MaasApi
+from mimic.rest.nova_api import NovaApi
+from mimic.rest.queue_api import QueueApi
+from mimic.rest.rackconnect_v3_api import RackConnectV3
+from mimic.rest.swift_api import SwiftMock
+from mimic.snapshot import BlobStore, SnapshotError, restore, snapshot
+from mimic.test.fixtures import TenantAuthentication
+from mimic.test.helpers import json_request, request, request_with_content
+from mimic.util.ids import IDAllocator
+
+
+def make_mimic(clock, state_file=None):
+    """
+    Create a :obj:`MimicCore` with every API mock whose data can be
+    snapshotted, and the root resource for it.
+    """
+    core = MimicCore(clock, [NovaApi(), LoadBalancerApi(), MaasApi(),
+                             SwiftMock(), RackConnectV3(), QueueApi()])
+    return core, MimicRoot(core, clock, state_file).app.resource()
+
+
+class BlobStoreTests(SynchronousTestCase):
+    """
+    Tests for :obj:`BlobStore`.
+    """
+
+    def test_inline_and_out_of_line(self):
+        """
+        Small payloads are stored inline, and large ones in the directory, by
+        their SHA-1.
+        """
+        directory = FilePath(self.mktemp())
+        blobs = BlobStore(directory)
+        small = blobs.put(b"small")
+        large = blobs.put(b"x" * 5000)
+        self.assertEqual(small, {"inline": "c21hbGw="})
+        self.assertEqual(directory.listdir(), [large["sha1"]])
+        self.assertEqual(blobs.get(small), b"small")
+        self.assertEqual(blobs.get(large), b"x" * 5000)
+
+    def test_missing(self):
+        """
+        Retrieving an out-of-line payload which is not there raises
+        :obj:`SnapshotError`.
+        """
+        blobs = BlobStore(FilePath(self.mktemp()))
+        self.assertRaises(SnapshotError, blobs.get, {"sha1": "0" * 40})
+        self.assertRaises(SnapshotError, BlobStore().get, {"sha1": "0" * 40})
+
+
+class SnapshotTests(SynchronousTestCase):
+    """
+    Tests for taking and restoring snapshots of all of mimic's state.
+    """
+
+    def populate(self):
+        """
+        Create a server, a building load balancer with a node, a monitoring
+        entity, a container with a large and a small object, a queue and the
+        default RackConnect pool, all for one tenant.
+
+        :return: a ``dict`` of the IDs of the objects created.
+        """
+        auth = TenantAuthentication(self, self.root, "snap", "password")
+        ids = {"tenant_id": auth.service_catalog_json
+               ['access']['token']['tenant']['id']}
+        nova = auth.get_service_endpoint("cloudServersOpenStack")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", nova + "/servers",
+            {"server": {"name": "snapped", "imageRef": "image",
+                        "flavorRef": "flavor"}}))
+        self.assertEqual(response.code, 202)
+        ids["server"] = body["server"]["id"]
+        lbs = auth.get_service_endpoint("cloudLoadBalancers")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", lbs + "/loadbalancers",
+            {"loadBalancer": {
+                "name": "snapped", "protocol": "HTTP",
+                "nodes": [{"address": "10.0.0.1", "port": 80,
+                           "condition": "ENABLED"}],
+                "metadata": [{"key": "lb_building", "value": 30}]}}))
+        self.assertEqual(response.code, 202)
+        ids["lb"] = body["loadBalancer"]["id"]
+        maas = auth.get_service_endpoint("cloudMonitoring")
+        response = self.successResultOf(request(
+            self, self.root, "POST", maas + "/entities",
+            json.dumps({"label": "snapped"})))
+        self.assertEqual(response.code, 201)
+        ids["entity"] = response.headers.getRawHeaders("x-object-id")[0]
+        swift = auth.get_service_endpoint("cloudFiles")
+        self.successResultOf(request(self, self.root, "PUT",
+                                     swift + "/snapped"))
+        for name, data in [("small", b"small"), ("large", b"x" * 5000)]:
+            response = self.successResultOf(request(
+                self, self.root, "PUT", swift + "/snapped/" + name, data,
+                headers={"content-type": ["text/plain"]}))
+            self.assertEqual(response.code, 201)
+        queues = auth.get_service_endpoint("cloudQueues")
+        response = self.successResultOf(request(
+            self, self.root, "PUT", queues + "/queues/snapped"))
+        self.assertEqual(response.code, 201)
+        rcv3 = auth.get_service_endpoint("rackconnect")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", rcv3 + "/load_balancer_pools"))
+        ids["pool"] = body[0]["id"]
+        return ids
+
+    def setUp(self):
+        """
+        Populate a mimic whose clock has been running for a while.
+        """
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.state_file = self.mktemp()
+        self.core, self.root = make_mimic(self.clock, self.state_file)
+        self.ids = self.populate()
+
+    def save(self):
+        """
+        Save a snapshot with the snapshot API.
+        """
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", "/mimic/v1.1/snapshot",
+            {"path": self.state_file}))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(body["sessions"],
+                         len(self.core.sessions.all_sessions()))
+
+    def restore(self):
+        """
+        Restore the snapshot with the restore API into a new mimic whose
+        ``--state-file`` is the snapshot, and authenticate with it as the same
+        user.
+
+        :return: a 2-tuple of the new mimic's clock and the authentication.
+        """
+        clock = Clock()
+        self.core, self.root = make_mimic(clock, self.state_file)
+        response = self.successResultOf(request(
+            self, self.root, "POST", "/mimic/v1.1/restore"))
+        self.assertEqual(response.code, 200)
+        return clock, TenantAuthentication(self, self.root, "snap", "password")
+
+    def test_round_trip(self):
+        """
+        Everything created before a snapshot is saved can be retrieved after
+        it is restored into a new mimic, even by different service URLs.
+        """
+        self.save()
+        self.assertEqual(
+            len(FilePath(self.state_file + ".blobs").listdir()), 1)
+        clock, auth = self.restore()
+        self.assertEqual(clock.seconds(), 1000)
+        self.assertEqual(auth.service_catalog_json['access']['token']
+                         ['tenant']['id'], self.ids["tenant_id"])
+
+        nova = auth.get_service_endpoint("cloudServersOpenStack")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", nova + "/servers/" + self.ids["server"]))
+        self.assertEqual(body["server"]["name"], "snapped")
+
+        lbs = auth.get_service_endpoint("cloudLoadBalancers")
+        lb_uri = lbs + "/loadbalancers/" + str(self.ids["lb"])
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", lb_uri))
+        self.assertEqual(body["loadBalancer"]["status"], "BUILD")
+        self.assertEqual(body["loadBalancer"]["nodes"][0]["address"],
+                         "10.0.0.1")
+        clock.advance(30)
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", lb_uri))
+        self.assertEqual(body["loadBalancer"]["status"], "ACTIVE")
+
+        maas = auth.get_service_endpoint("cloudMonitoring")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", maas + "/entities"))
+        self.assertEqual([e["id"] for e in body["values"]],
+                         [self.ids["entity"]])
+
+        swift = auth.get_service_endpoint("cloudFiles")
+        for name, data in [("small", b"small"), ("large", b"x" * 5000)]:
+            (response, content) = self.successResultOf(request_with_content(
+                self, self.root, "GET", swift + "/snapped/" + name))
+            self.assertEqual(content, data)
+
+        queues = auth.get_service_endpoint("cloudQueues")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", queues + "/queues"))
+        self.assertEqual([q["name"] for q in body["queues"]], ["snapped"])
+
+        rcv3 = auth.get_service_endpoint("rackconnect")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", rcv3 + "/load_balancer_pools"))
+        self.assertEqual([pool["id"] for pool in body], [self.ids["pool"]])
+
+    def test_restore_replaces(self):
+        """
+        Restoring a snapshot forgets all the sessions created since.
+        """
+        self.save()
+        saved = [s.token for s in self.core.sessions.all_sessions()]
+        TenantAuthentication(self, self.root, "another", "password")
+        response = self.successResultOf(request(
+            self, self.root, "POST", "/mimic/v1.1/restore",
+            json.dumps({"path": self.state_file})))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            [s.token for s in self.core.sessions.all_sessions()], saved)
+
+    def test_restore_clears_caches(self):
+        """
+        Restoring a snapshot forgets the cached service catalogs and service
+        resources.
+        """
+        self.save()
+        self.assertNotEqual(self.core.catalog_cache.stats()["size"], 0)
+        self.assertNotEqual(self.core.resource_cache.stats()["size"], 0)
+        response = self.successResultOf(request(
+            self, self.root, "POST", "/mimic/v1.1/restore"))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.core.catalog_cache.stats()["size"], 0)
+        self.assertEqual(self.core.resource_cache.stats()["size"], 0)
+
+    def test_failed_restore_keeps_state(self):
+        """
+        If a snapshot has a session which cannot be restored, restoring it
+        fails with a 400 and leaves mimic's sessions and clock as they were.
+        """
+        self.save()
+        saved = json.loads(FilePath(self.state_file).getContent())
+        saved["now"] = 5000
+        tokens = [s.token for s in self.core.sessions.all_sessions()]
+        blob = FilePath(self.state_file + ".blobs").children()[0]
+
+        def malformed_session():
+            FilePath(self.state_file).setContent(json.dumps(
+                dict(saved, sessions=saved["sessions"] + [{}])))
+
+        def missing_blob():
+            FilePath(self.state_file).setContent(json.dumps(saved))
+            blob.remove()
+
+        for corrupt in [malformed_session, missing_blob]:
+            corrupt()
+            response = self.successResultOf(request(
+                self, self.root, "POST", "/mimic/v1.1/restore"))
+            self.assertEqual(response.code, 400)
+            self.assertEqual(
+                [s.token for s in self.core.sessions.all_sessions()], tokens)
+            self.assertEqual(self.clock.seconds(), 1000)
+
+    def test_save_error(self):
+        """
+        The snapshot API fails with a 400 if the snapshot cannot be written.
+        """
+        not_a_directory = FilePath(self.state_file).sibling("file")
+        not_a_directory.setContent(b"")
+        path = not_a_directory.child("snapshot")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", "/mimic/v1.1/snapshot",
+            {"path": path.path}))
+        self.assertEqual(response.code, 400)
+        self.assertIn("Could not save", body["message"])
+
+    def test_ids_skipped(self):
+        """
+        A mimic whose IDs have the same seed as the one a snapshot was taken
+        of does not, once the snapshot is restored, generate the IDs that one
+        had already generated.
+        """
+        self.core.sessions.ids = IDAllocator(1)
+        generated = [self.core.sessions.generate_id("token")
+                     for _ in range(3)]
+        dumped = snapshot(self.core, BlobStore())
+        core, root = make_mimic(Clock())
+        core.sessions.ids = IDAllocator(1)
+        restore(core, json.loads(json.dumps(dumped)), BlobStore())
+        self.assertNotIn(core.sessions.generate_id("token"), generated)
+
+    def test_no_state_file(self):
+        """
+        Without a ``--state-file``, the snapshot and restore APIs fail with a
+        400, with or without a path in the request.
+        """
+        core, root = make_mimic(Clock())
+        for uri in ["/mimic/v1.1/snapshot", "/mimic/v1.1/restore"]:
+            for body in [b"", json.dumps({"path": self.state_file})]:
+                response = self.successResultOf(request(
+                    self, root, "POST", uri, body))
+                self.assertEqual(response.code, 400)
+
+    def test_path_in_state_directory(self):
+        """
+        The snapshot and restore APIs accept a path in the directory of the
+        ``--state-file``.
+        """
+        other = FilePath(self.state_file).sibling("other").path
+        for uri in ["/mimic/v1.1/snapshot", "/mimic/v1.1/restore"]:
+            response = self.successResultOf(request(
+                self, self.root, "POST", uri, json.dumps({"path": other})))
+            self.assertEqual(response.code, 200)
+
+    def test_bad_request(self):
+        """
+        The snapshot and restore APIs fail with a 400 if the request body is
+        not a JSON object, or its path is not in the directory of the
+        ``--state-file``.
+        """
+        outside = FilePath(self.state_file).parent().sibling("outside").path
+        for uri in ["/mimic/v1.1/snapshot", "/mimic/v1.1/restore"]:
+            for body in [b"not json", b"[]", json.dumps({"path": 1}),
+                         json.dumps({"path": outside}),
+                         json.dumps({"path": "/etc/passwd"})]:
+                response = self.successResultOf(request(
+                    self, self.root, "POST", uri, body))
+                self.assertEqual(response.code, 400)
+        self.assertFalse(FilePath(outside).exists())
+
+    def test_unsupported_version(self):
+        """
+        A snapshot of a different version cannot be restored.
+        """
+        dumped = snapshot(self.core, BlobStore())
+        dumped["version"] = 0
+        self.assertRaises(SnapshotError, restore, self.core, dumped,
+                          BlobStore())
+        FilePath(self.state_file).setContent(json.dumps(dumped))
+        response = self.successResultOf(request(
+            self, self.root, "POST", "/mimic/v1.1/restore",
+            json.dumps({"path": self.state_file})))
+        self.assertEqual(response.code, 400)
@@ -2,6 +2,7 @@
 Tests for L{mimic.tap}
 """
 
+import json
 import sys
 import types
 
@@ -12,17 +13,22 @@ from twisted import plugins
 from twisted.internet.interfaces import (
     IStreamServerEndpointStringParser, IStreamServerEndpoint
 )
-from twisted.internet.defer import succeed
+from twisted.internet.defer import maybeDeferred, succeed
 
 from twisted.plugin import IPlugin
 from twisted.python.filepath import FilePath
+from twisted.python.usage import UsageError
 
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.plugins.mimic import mimicService
 from twisted.application.service import IServiceMaker
 
+from mimic import journal, snapshot
 from mimic.core import MimicCore
+from mimic.test.helpers import request
 from mimic.tap import Options, makeService
+from mimic.util.ids import allocator
+from mimic.workers import Dispatcher, ForwardedRequest, Workers, shard_for
 
 
 @implementer(IStreamServerEndpoint)
@@ -115,6 +121,186 @@ class TapTests(SynchronousTestCase):
         factory = endpoints.factories[0]
         self.assertEqual(factory.displayTracebacks, False)
 
+    def keep_cores(self):
+        """
+        Patch :obj:`mimic.tap` to keep each :obj:`MimicCore` it makes.
+
+        :return: a list to which the cores are appended.
+        """
+        made = []
+
+        class KeepCore(MimicCore):
+            @classmethod
+            def fromPlugins(cls, clock):
+                made.append(super(KeepCore, cls).fromPlugins(clock))
+                return made[-1]
+        from mimic import tap
+        self.patch(tap, "MimicCore", KeepCore)
+        return made
+
+    def test_session_options(self):
+        """
+        The C{--max-sessions} option limits the sessions kept by the service's
+        session store, and sessions whose tokens expired more than
+        C{--session-retention} seconds ago are swept every
+        C{--session-sweep-interval} seconds of mimic time.
+        """
+        o = Options()
+        o.parseOptions(["--listen", "fake:", "--max-sessions", "5",
+                        "--session-sweep-interval", "30",
+                        "--session-retention", "3600"])
+        addFakePluginObject(self, plugins, FakeEndpointParser())
+        made = self.keep_cores()
+        service = makeService(o)
+        service.startService()
+        self.addCleanup(service.stopService)
+        sessions = made[0].sessions
+        self.assertEqual(sessions.max_sessions, 5)
+        sessions.session_for_token("a_token")
+        sessions.clock.advance(86390 + 3600)
+        self.assertEqual(sessions.stats()["sessions"], 1)
+        sessions.clock.advance(30)
+        self.assertEqual(sessions.stats()["sessions"], 0)
+
+    def test_state_file(self):
+        """
+        The C{--state-file} option restores the given snapshot, if it exists,
+        when the service is made.
+        """
+        state_file = self.mktemp()
+        for expected_sessions in [0, 1]:
+            o = Options()
+            o.parseOptions(["--state-file", state_file])
+            made = self.keep_cores()
+            makeService(o)
+            sessions = made[0].sessions
+            self.assertEqual(len(sessions.all_sessions()), expected_sessions)
+            sessions.session_for_token("a_token")
+            snapshot.save(made[0], state_file)
+
+    def test_journal(self):
+        """
+        The C{--journal} option replays the given journal, if it exists, and
+        appends to it; with C{--state-file}, the journal is compacted into the
+        state file first.
+        """
+        state_file = self.mktemp()
+        journal_file = self.mktemp()
+        addFakePluginObject(self, plugins, FakeEndpointParser())
+        self.patch(journal, "deferToThread", maybeDeferred)
+        for expected_sessions in [0, 1, 2]:
+            o = Options()
+            o.parseOptions(["--listen", "fake:", "--state-file", state_file,
+                            "--journal", journal_file])
+            made = self.keep_cores()
+            service = makeService(o)
+            sessions = made[0].sessions
+            self.assertEqual(len(sessions.all_sessions()), expected_sessions)
+            if expected_sessions:
+                self.assertEqual(FilePath(journal_file).getContent(), b"")
+            [site] = [child.factory for child in service
+                      if hasattr(child, "factory")]
+            service.startService()
+            self.successResultOf(request(
+                self, site.resource, "POST", "/identity/v2.0/tokens",
+                json.dumps({"auth": {"passwordCredentials": {
+                    "username": "user{0}".format(expected_sessions),
+                    "password": "password"}}})))
+            self.successResultOf(service.stopService())
+
+    def test_bad_session_options(self):
+        """
+        The session options must be positive (or, for the retention, not
+        negative).
+        """
+        for args in [["--max-sessions", "0"],
+                     ["--session-sweep-interval", "0"],
+                     ["--session-retention", "-1"]]:
+            self.assertRaises(UsageError, Options().parseOptions, args)
+
+    def test_workers(self):
+        """
+        The C{--workers} option runs that many worker processes, each with
+        its own state file and journal, behind a dispatcher.
+        """
+        o = Options()
+        o.parseOptions(["--listen", "fake:", "--workers", "2",
+                        "--state-file", "state", "--journal", "journal"])
+        thisFakeParser = FakeEndpointParser()
+        addFakePluginObject(self, plugins, thisFakeParser)
+        service = makeService(o)
+        [pool] = [child for child in service if isinstance(child, Workers)]
+        self.addCleanup(pool._remove_directory, None)
+        self.assertEqual(sorted(pool.monitor.processes), ["worker-0",
+                                                          "worker-1"])
+        arguments = pool.monitor.processes["worker-1"][0]
+        self.assertEqual(
+            arguments[arguments.index("mimic") + 1:][:6],
+            ["--listen", "unix:" + pool._directory + "/worker-1.sock",
+             "--workers", "2", "--worker", "1"])
+        self.assertEqual(arguments[-4:], ["--state-file", "state.worker1",
+                                          "--journal", "journal.worker1"])
+        service.startService()
+        self.addCleanup(service.stopService)
+        [factory] = thisFakeParser.endpoints[0].factories
+        self.assertIsInstance(factory.resource, Dispatcher)
+
+    def test_worker(self):
+        """
+        The C{--worker} option makes a worker of a multi-process mimic, which
+        generates only the tenant IDs and tokens routed to it, and which
+        serves requests forwarded by the dispatcher.
+        """
+        o = Options()
+        o.parseOptions(["--listen", "fake:", "--workers", "3",
+                        "--worker", "2"])
+        addFakePluginObject(self, plugins, FakeEndpointParser())
+        made = self.keep_cores()
+        service = makeService(o)
+        [site] = [child.factory for child in service
+                  if hasattr(child, "factory")]
+        self.assertIs(site.requestFactory, ForwardedRequest)
+        session = made[0].sessions.session_for_token(None)
+        self.assertEqual(shard_for(session.token, 3), 2)
+        self.assertEqual(shard_for(session.tenant_id, 3), 2)
+
+    def test_id_seed(self):
+        """
+        The C{--id-seed} option makes mimic generate the same IDs from run to
+        run, and gives each worker of a multi-process mimic its own seed.
+        """
+        addFakePluginObject(self, plugins, FakeEndpointParser())
+        self.addCleanup(allocator.seed)
+        made = self.keep_cores()
+        tokens = []
+        for _ in range(2):
+            o = Options()
+            o.parseOptions(["--listen", "fake:", "--id-seed", "42"])
+            makeService(o)
+            tokens.append(made[-1].sessions.session_for_token(None).token)
+        self.assertEqual(tokens[0], tokens[1])
+
+        o = Options()
+        o.parseOptions(["--listen", "fake:", "--workers", "2",
+                        "--id-seed", "42"])
+        service = makeService(o)
+        [pool] = [child for child in service if isinstance(child, Workers)]
+        self.addCleanup(pool._remove_directory, None)
+        arguments = pool.monitor.processes["worker-1"][0]
+        self.assertEqual(
+            arguments[arguments.index("--id-seed"):][:2],
+            ["--id-seed", "42:1"])
+
+    def test_bad_worker_options(self):
+        """
+        There must be at least one worker, and a worker's index must be less
+        than the number of workers.
+        """
+        for args in [["--workers", "0"],
+                     ["--workers", "2", "--worker", "2"],
+                     ["--worker", "-1"]]:
+            self.assertRaises(UsageError, Options().parseOptions, args)
+
     def test_realtime(self):
         """
         The C{--realtime} option specifies that the global reactor ought to be
@@ -1,10 +1,23 @@
 """
 Unit tests for :mod:`mimic.util`
 """
+import json
+from uuid import RFC_4122, UUID
+
+from twisted.internet.defer import CancelledError
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.web.resource import Resource
 
+from mimic.canned_responses.auth import (
+    impersonator_user_role, impersonator_user_role_template
+)
+from mimic.canned_responses.maas_json_home import json_home, json_home_template
 from mimic.util import helper
+from mimic.util.cache import LRUCache
+from mimic.util.ids import IDAllocator
+from mimic.util.json_template import JSONTemplate, insert_member, slot
+from mimic.util.ordered import OrderedIndex, SortedIndex
+from mimic.util.streaming import iter_json, JSONProducer, stream_json
 from mimic.test.helpers import request
 
 
@@ -68,6 +81,21 @@ class HelperTests(SynchronousTestCase):
             self.assertEqual(match[1],
                              helper.seconds_to_timestamp(0, match[0]))
 
+    def test_timestamp_to_seconds(self):
+        """
+        :func:`helper.timestamp_to_seconds` parses ISO8601 Zulu timestamps
+        with or without fractional seconds, and is the inverse of
+        :func:`helper.seconds_to_timestamp`.
+        """
+        self.assertEqual(
+            helper.timestamp_to_seconds(helper.seconds_to_timestamp(1.5)),
+            1.5)
+        self.assertEqual(
+            helper.timestamp_to_seconds("1970-01-02T00:00:00Z"), 86400)
+        self.assertEqual(
+            helper.timestamp_to_seconds("1970-01-01T00:01:00"), 60)
+        self.assertRaises(ValueError, helper.timestamp_to_seconds, "now")
+
 
 class TestHelperTests(SynchronousTestCase):
     """
@@ -121,3 +149,475 @@ class TestRandomString(SynchronousTestCase):
             a_string = helper.random_string(1024, selectable=desired_chars)
             for char in a_string:
                 self.assertTrue(char in desired_chars)
+
+
+class LRUCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`mimic.util.cache.LRUCache`.
+    """
+
+    def test_get_counts_hits_and_misses(self):
+        """
+        Looking up a key that is present counts as a hit, and one that is
+        absent counts as a miss and returns the default.
+        """
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b", "default"), "default")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        """
+        When the cache is full, storing a new key evicts whichever key was
+        used least recently, and reports it to the ``on_evict`` callback.
+        """
+        evicted = []
+        cache = LRUCache(2, on_evict=lambda k, v: evicted.append((k, v)))
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.keys(), ["a", "c"])
+        self.assertEqual(evicted, [("b", 2)])
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_get_or_create(self):
+        """
+        :obj:`LRUCache.get_or_create` only calls the factory when the key is
+        not already cached.
+        """
+        calls = []
+
+        def factory():
+            calls.append(None)
+            return len(calls)
+
+        cache = LRUCache(2)
+        self.assertEqual(cache.get_or_create("a", factory), 1)
+        self.assertEqual(cache.get_or_create("a", factory), 1)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats(), {"size": 1, "max_size": 2, "hits": 1,
+                                         "misses": 1, "evictions": 0})
+
+    def test_pop_and_clear(self):
+        """
+        Popping or clearing entries removes them without counting evictions.
+        """
+        cache = LRUCache(3)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertEqual(cache.pop("a", "gone"), "gone")
+        self.assertNotIn("a", cache)
+        cache.clear()
+        self.assertEqual(cache.keys(), [])
+        self.assertEqual(cache.evictions, 0)
+
+    def test_invalid_size(self):
+        """
+        A cache must be able to hold at least one entry.
+        """
+        self.assertRaises(ValueError, LRUCache, 0)
+
+
+class OrderedIndexTests(SynchronousTestCase):
+    """
+    Tests for :class:`mimic.util.ordered.OrderedIndex`.
+    """
+
+    def setUp(self):
+        """
+        Create an index with a few values in it.
+        """
+        self.index = OrderedIndex()
+        for key in ["a", "b", "c", "d"]:
+            self.index.add(key, key.upper())
+
+    def test_iterates_in_insertion_order(self):
+        """
+        Iterating yields the values in the order they were added, and
+        replacing a value keeps its position.
+        """
+        self.index.add("b", "B2")
+        self.assertEqual(list(self.index), ["A", "B2", "C", "D"])
+        self.assertEqual(self.index.keys(), ["a", "b", "c", "d"])
+
+    def test_lookup(self):
+        """
+        Values can be looked up by key.
+        """
+        self.assertEqual(self.index["c"], "C")
+        self.assertEqual(self.index.get("z", "default"), "default")
+        self.assertIn("a", self.index)
+        self.assertRaises(KeyError, lambda: self.index["z"])
+
+    def test_pop_keeps_order(self):
+        """
+        Removing a value from the middle leaves the others in order.
+        """
+        self.assertEqual(self.index.pop("b"), "B")
+        self.assertEqual(self.index.pop("b"), None)
+        self.assertEqual(list(self.index), ["A", "C", "D"])
+        self.assertEqual(len(self.index), 3)
+
+    def test_pop_while_iterating(self):
+        """
+        The value most recently yielded may be removed during iteration.
+        """
+        for value in self.index:
+            self.index.pop(value.lower())
+        self.assertEqual(len(self.index), 0)
+
+    def test_reversed(self):
+        """
+        Iterating in reverse yields the newest value first.
+        """
+        self.assertEqual(list(reversed(self.index)), ["D", "C", "B", "A"])
+
+    def test_values_after(self):
+        """
+        Iteration can start just after any key.
+        """
+        self.assertEqual(list(self.index.values_after("b")), ["C", "D"])
+        self.assertEqual(list(self.index.values_after("d")), [])
+        self.assertRaises(KeyError, self.index.values_after, "z")
+
+    def test_values_from(self):
+        """
+        Iteration can start at any key.
+        """
+        self.assertEqual(list(self.index.values_from("b")), ["B", "C", "D"])
+        self.assertEqual(list(self.index.values_from("d")), ["D"])
+        self.assertRaises(KeyError, self.index.values_from, "z")
+
+    def test_move_to_end_and_clear(self):
+        """
+        A value can be moved to the newest end, and the index can be emptied.
+        """
+        self.index.move_to_end("a")
+        self.assertEqual(self.index.first_key(), "b")
+        self.assertEqual(list(self.index), ["B", "C", "D", "A"])
+        self.index.clear()
+        self.assertEqual(list(self.index), [])
+        self.assertEqual(self.index.first_key(), None)
+
+
+class SortedIndexTests(SynchronousTestCase):
+    """
+    Tests for :class:`mimic.util.ordered.SortedIndex`.
+    """
+
+    def test_keys_in_position_order(self):
+        """
+        The keys for a value are yielded in position order regardless of the
+        order they were added in, optionally starting after a position.
+        """
+        index = SortedIndex()
+        index.add("red", 3, "c")
+        index.add("red", 1, "a")
+        index.add("blue", 2, "b")
+        index.add("red", 5, "e")
+        self.assertEqual(list(index.keys_after("red")), ["a", "c", "e"])
+        self.assertEqual(list(index.keys_after("red", 1)), ["c", "e"])
+        self.assertEqual(list(index.keys_after("red", 2)), ["c", "e"])
+        self.assertEqual(list(index.keys_after("green")), [])
+        self.assertEqual((index.count("red"), index.count("green")), (3, 0))
+
+    def test_remove(self):
+        """
+        Removed keys are no longer yielded, and values without keys are
+        forgotten.
+        """
+        index = SortedIndex()
+        index.add("red", 1, "a")
+        index.add("red", 2, "b")
+        index.add("blue", 3, "c")
+        index.remove("red", 1, "a")
+        index.remove("blue", 3, "c")
+        self.assertEqual(list(index.keys_after("red")), ["b"])
+        self.assertEqual(index.count("blue"), 0)
+
+    def test_remove_missing(self):
+        """
+        Removing an entry which the index does not have raises
+        :obj:`KeyError`, and leaves the other entries alone.
+        """
+        index = SortedIndex()
+        index.add("red", 1, "a")
+        index.add("red", 3, "c")
+        for value, position, key in [("red", 1, "x"), ("red", 2, "b"),
+                                     ("red", 4, "d"), ("blue", 1, "a")]:
+            self.assertRaises(KeyError, index.remove, value, position, key)
+        index.remove("red", 1, "a")
+        self.assertRaises(KeyError, index.remove, "red", 1, "a")
+        self.assertEqual(list(index.keys_after("red")), ["c"])
+
+
+class StreamingRequest(object):
+    """
+    Just enough of a request to consume the output of a
+    :obj:`JSONProducer`, optionally pausing it after every write the way a
+    transport with a full buffer would.
+    """
+
+    def __init__(self, pause_after_write=False):
+        """
+        Create a request to which nothing has been written.
+        """
+        self.written = []
+        self.producer = None
+        self.pause_after_write = pause_after_write
+
+    def registerProducer(self, producer, streaming):
+        """
+        Remember the (push) producer.
+        """
+        assert streaming
+        self.producer = producer
+
+    def unregisterProducer(self):
+        """
+        Forget the producer.
+        """
+        self.producer = None
+
+    def write(self, data):
+        """
+        Record some written bytes.
+        """
+        assert isinstance(data, bytes)
+        self.written.append(data)
+        if self.pause_after_write:
+            self.producer.pauseProducing()
+
+
+class StreamingJSONTests(SynchronousTestCase):
+    """
+    Tests for :mod:`mimic.util.streaming`.
+    """
+
+    value = {"metadata": {"count": 3, "marker": None},
+             "values": [{"id": "a"}, {"id": u"\u00e9"}, {"id": "c"}],
+             "empty": [],
+             "name": "things"}
+
+    def test_iter_json(self):
+        """
+        The pieces generated by :obj:`iter_json` are the JSON encoding of the
+        value, with iterables (including generators) encoded as arrays.
+        """
+        self.assertEqual(json.loads("".join(iter_json(self.value))),
+                         self.value)
+        self.assertEqual(
+            json.loads("".join(iter_json(
+                {"values": (n * 2 for n in range(3))}))),
+            {"values": [0, 2, 4]})
+
+    def test_iter_json_is_lazy(self):
+        """
+        :obj:`iter_json` only consumes a generator as it generates pieces.
+        """
+        consumed = []
+
+        def values():
+            for n in range(3):
+                consumed.append(n)
+                yield n
+
+        pieces = iter_json(values())
+        self.assertEqual([next(pieces), next(pieces)], ["[", "0"])
+        self.assertEqual(consumed, [0])
+
+    def test_stream_json(self):
+        """
+        :obj:`stream_json` writes the whole value to an unpaused request,
+        unregisters and fires its :obj:`Deferred`.
+        """
+        req = StreamingRequest()
+        d = stream_json(req, self.value)
+        self.assertEqual(self.successResultOf(d), None)
+        self.assertEqual(json.loads(b"".join(req.written).decode("utf-8")),
+                         self.value)
+        self.assertIdentical(req.producer, None)
+
+    def test_chunks(self):
+        """
+        :obj:`JSONProducer` writes roughly :obj:`JSONProducer.chunk_size`
+        bytes at a time.
+        """
+        req = StreamingRequest()
+        producer = JSONProducer(req, {"values": ["x" * 10] * 100})
+        producer.chunk_size = 100
+        self.successResultOf(producer.start())
+        self.assertTrue(len(req.written) > 10)
+        self.assertTrue(all(len(chunk) < 120 for chunk in req.written))
+        self.assertEqual(json.loads(b"".join(req.written)),
+                         {"values": ["x" * 10] * 100})
+
+    def test_pause_and_resume(self):
+        """
+        Nothing more is written while the producer is paused, and writing
+        continues when it is resumed.
+        """
+        req = StreamingRequest(pause_after_write=True)
+        producer = JSONProducer(req, {"values": ["x" * 10] * 100})
+        producer.chunk_size = 100
+        d = producer.start()
+        self.assertEqual(len(req.written), 1)
+        self.assertNoResult(d)
+        producer.resumeProducing()
+        self.assertEqual(len(req.written), 2)
+        req.pause_after_write = False
+        producer.resumeProducing()
+        self.successResultOf(d)
+        self.assertEqual(json.loads(b"".join(req.written)),
+                         {"values": ["x" * 10] * 100})
+
+    def test_stop(self):
+        """
+        Once stopped, the producer writes nothing more and unregisters, and
+        its :obj:`Deferred` is left for the caller to cancel.
+        """
+        req = StreamingRequest(pause_after_write=True)
+        producer = JSONProducer(req, {"values": ["x" * 10] * 100})
+        producer.chunk_size = 100
+        d = producer.start()
+        producer.stopProducing()
+        producer.resumeProducing()
+        self.assertEqual(len(req.written), 1)
+        self.assertIdentical(req.producer, None)
+        self.assertNoResult(d)
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+
+    def test_cancel_stops(self):
+        """
+        Cancelling the :obj:`Deferred` returned by :obj:`JSONProducer.start`
+        stops the producer.
+        """
+        req = StreamingRequest(pause_after_write=True)
+        producer = JSONProducer(req, {"values": ["x" * 10] * 100})
+        producer.chunk_size = 100
+        d = producer.start()
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        producer.resumeProducing()
+        self.assertEqual(len(req.written), 1)
+        self.assertIdentical(req.producer, None)
+
+
+class JSONTemplateTests(SynchronousTestCase):
+    """
+    Tests for :mod:`mimic.util.json_template`.
+    """
+
+    def test_render(self):
+        """
+        :obj:`JSONTemplate.render` fills in each slot, whether it is a whole
+        string or part of one, even of a key, escaping the values.
+        """
+        template = JSONTemplate({
+            "image": {"id": slot("id"), "links": ["/images/" + slot("id")]},
+            slot("url") + "/images": True})
+        rendered = template.render(id=u'a"\u00e9', url="http://mimic")
+        self.assertEqual(json.loads(rendered), {
+            "image": {"id": u'a"\u00e9', "links": [u'/images/a"\u00e9']},
+            "http://mimic/images": True})
+        self.assertRaises(KeyError, template.render, id="a")
+
+    def test_canned_responses(self):
+        """
+        The templates of canned responses render the same documents as the
+        functions which build them.
+        """
+        self.assertEqual(
+            json.loads(json_home_template.render(url="http://mimic/v1.0")),
+            json.loads(json.dumps(json_home("http://mimic/v1.0"))))
+        self.assertEqual(
+            json.loads(impersonator_user_role_template.render(id="1",
+                                                              name="me")),
+            impersonator_user_role("1", "me"))
+
+    def test_insert_member(self):
+        """
+        :obj:`insert_member` adds a member with a serialized value to a
+        serialized object.
+        """
+        self.assertEqual(
+            json.loads(insert_member('{"a": 1}', "b", '[2, 3]')),
+            {"a": 1, "b": [2, 3]})
+
+
+class IDAllocatorTests(SynchronousTestCase):
+    """
+    Tests for :obj:`IDAllocator`.
+    """
+
+    def test_no_collisions(self):
+        """
+        Every number of a namespace's range is allocated once before the
+        range is used up.
+        """
+        ids = IDAllocator()
+        numbers = [ids.number("n", 10) for _ in range(1024)]
+        self.assertEqual(sorted(numbers), list(range(1024)))
+        self.assertRaises(OverflowError, ids.number, "n", 10)
+
+    def test_seed(self):
+        """
+        Allocators with the same seed allocate the same IDs, and allocators
+        with different seeds, or namespaces of one allocator, different ones.
+        """
+        def allocate(ids, namespace):
+            return [ids.number(namespace, 31), ids.hex(namespace + "h", 8),
+                    ids.uuid(namespace + "u")]
+        self.assertEqual(allocate(IDAllocator(1), "a"),
+                         allocate(IDAllocator(1), "a"))
+        self.assertNotEqual(allocate(IDAllocator(1), "a"),
+                            allocate(IDAllocator(2), "a"))
+        self.assertNotEqual(allocate(IDAllocator(1), "a"),
+                            allocate(IDAllocator(1), "b"))
+        ids = IDAllocator(1)
+        first = allocate(ids, "a")
+        ids.seed(1)
+        self.assertEqual(allocate(ids, "a"), first)
+
+    def test_seed_pinned(self):
+        """
+        A text seed gives the same IDs on every version of Python, whatever
+        its hash seed, as ``--id-seed`` does.
+        """
+        ids = IDAllocator("abc")
+        self.assertEqual(ids.uuid("x"), "927e77d6-47db-46ca-9b90-4a39173d94a6")
+        self.assertEqual(ids.hex("y", 8), "9eb25e29")
+        self.assertEqual(ids.number("z", 32), 3141626185)
+        self.assertEqual(IDAllocator(u"1:0").uuid("nova_server"),
+                         "8b379a68-af94-4ad6-bde3-63bc2ad7ec6e")
+
+    def test_formats(self):
+        """
+        Hexadecimal IDs have the given number of digits, and UUIDs are
+        version 4 UUIDs.
+        """
+        ids = IDAllocator()
+        for _ in range(100):
+            self.assertEqual(len(ids.hex("h", 6)), 6)
+            int(ids.hex("h", 6), 16)
+            uuid = UUID(ids.uuid("u"))
+            self.assertEqual((uuid.version, uuid.variant),
+                             (4, RFC_4122))
+
+    def test_skip(self):
+        """
+        An allocator skips the IDs in the state of another with the same
+        seed.
+        """
+        ids = IDAllocator(1)
+        for _ in range(3):
+            ids.uuid("u")
+        again = IDAllocator(1)
+        again.skip(ids.state())
+        again.skip({"u": 1})
+        self.assertEqual(again.uuid("u"), ids.uuid("u"))
@@ -0,0 +1,313 @@
+"""
+Tests for :mod:`mimic.workers`.
+"""
+
+import json
+from io import BytesIO
+
+from zope.interface import implementer
+
+from twisted.internet.defer import fail
+from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.client import ResponseDone
+from twisted.web.http_headers import Headers
+from twisted.web.iweb import IAgent
+from twisted.web.server import Site
+
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.rest.nova_api import NovaApi
+from mimic.test.fixtures import TenantAuthentication
+from mimic.test.helpers import json_request, request, request_with_content
+from mimic.workers import (
+    Dispatcher, ForwardedRequest, routing_key, shard_for, worker_file
+)
+
+
+class FakeRequest(object):
+    """
+    Just enough of a request to find its :obj:`routing_key`.
+    """
+
+    def __init__(self, path, body=b"", args=None, token=None):
+        """
+        A request for ``path``.
+        """
+        self.path = path
+        self.content = BytesIO(body)
+        self.args = args or {}
+        self.token = token
+
+    def getHeader(self, name):
+        """
+        Only the ``X-Auth-Token`` header is ever set.
+        """
+        if name == b"x-auth-token":
+            return self.token
+
+
+class RoutingKeyTests(SynchronousTestCase):
+    """
+    Tests for :obj:`routing_key` and :obj:`shard_for`.
+    """
+
+    def test_service_requests(self):
+        """
+        Requests to a service are routed by the tenant in their path.
+        """
+        self.assertEqual(routing_key(FakeRequest(
+            b"/mimicking/NovaApi-abc/ORD/v2/1234/servers", token=b"t")),
+            b"1234")
+
+    def test_token_requests(self):
+        """
+        Requests to validate a token are routed by the tenant it should
+        belong to, if there is one, and otherwise by the token.
+        """
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v2.0/tokens/abc")), b"abc")
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v2.0/tokens/abc/endpoints")), b"abc")
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v2.0/tokens/abc", args={b"belongsTo": [b"1234"]})),
+            b"1234")
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v1.1/mosso/1234")), b"1234")
+
+    def test_authentication(self):
+        """
+        Requests for a token are routed by the tenant in them, if there is
+        one, and otherwise by the username or token, and the request's body
+        can still be read.
+        """
+        def auth(**fields):
+            request = FakeRequest(b"/identity/v2.0/tokens",
+                                  json.dumps({"auth": fields}).encode("utf-8"))
+            key = routing_key(request)
+            self.assertEqual(json.loads(request.content.read()),
+                             {"auth": fields})
+            return key
+        password = {"username": "user", "password": "p"}
+        self.assertEqual(auth(passwordCredentials=password), "user")
+        self.assertEqual(auth(passwordCredentials=password,
+                              tenantName="1234"), "1234")
+        self.assertEqual(auth(**{"RAX-KSKEY:apiKeyCredentials":
+                                 {"username": "user", "apiKey": "k"}}),
+                         "user")
+        self.assertEqual(auth(token={"id": "abc"}), "abc")
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v2.0/tokens", b"not json")), None)
+
+    def test_impersonation(self):
+        """
+        Requests to impersonate a user are routed by the user.
+        """
+        self.assertEqual(routing_key(FakeRequest(
+            b"/identity/v2.0/RAX-AUTH/impersonation-tokens",
+            json.dumps({"RAX-AUTH:impersonation": {
+                "user": {"username": "user"},
+                "expire-in-seconds": 30}}).encode("utf-8"),
+            token=b"t")), "user")
+
+    def test_other_requests(self):
+        """
+        Other requests are routed by their token, if they have one.
+        """
+        self.assertEqual(routing_key(FakeRequest(b"/fastly/", token=b"t")),
+                         b"t")
+        self.assertEqual(routing_key(FakeRequest(b"/fastly/")), None)
+
+    def test_shard_for(self):
+        """
+        Keys are spread across the workers, the same way whether they are
+        ``bytes`` or text.
+        """
+        shards = set(shard_for(str(n), 4) for n in range(100))
+        self.assertEqual(shards, set(range(4)))
+        self.assertEqual(shard_for(b"1234", 4), shard_for(u"1234", 4))
+
+
+class FakeResponse(object):
+    """
+    A response from a worker.
+    """
+
+    def __init__(self, code, body, headers=None):
+        """
+        A response with the given code, body and headers.
+        """
+        self.code = code
+        self.phrase = b"Phrase"
+        self.headers = Headers(headers or {})
+        self.length = len(body)
+        self.body = body
+
+    def deliverBody(self, protocol):
+        """
+        Deliver the whole body at once.
+        """
+        protocol.dataReceived(self.body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+@implementer(IAgent)
+class WorkersAgent(object):
+    """
+    An agent which sends requests to :obj:`MimicCore` workers in memory.
+    """
+
+    def __init__(self, test, count):
+        """
+        Create ``count`` workers, whose cores are :obj:`cores`, each with its
+        own state file in the current directory.
+        """
+        self.test = test
+        self.cores = [MimicCore(Clock(), [NovaApi()]) for _ in range(count)]
+        self.roots = [MimicRoot(core, core.sessions.clock,
+                                worker_file("state", index)).app.resource()
+                      for index, core in enumerate(self.cores)]
+        self.requests = []
+        self.refuse = False
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        """
+        Render a request with the worker named by the host of the URI.
+        """
+        if self.refuse:
+            return fail(ConnectionRefusedError())
+        host, path = uri[len(b"http://"):].split(b"/", 1)
+        index = int(host.split(b"-")[1])
+        consumer = StringTransport()
+        if bodyProducer is not None:
+            bodyProducer.startProducing(consumer)
+            self.test.assertEqual(len(consumer.value()), bodyProducer.length)
+        body = consumer.value()
+        self.requests.append((index, method, b"/" + path, headers, body))
+        d = request_with_content(self.test, self.roots[index], method,
+                                 b"/" + path, body)
+        return d.addCallback(lambda result: FakeResponse(
+            result[0].code, result[1],
+            dict(result[0].headers.getAllRawHeaders())))
+
+
+class DispatcherTests(SynchronousTestCase):
+    """
+    Tests for :obj:`Dispatcher`.
+    """
+
+    def setUp(self):
+        """
+        Create a dispatcher of three workers.
+        """
+        self.agent = WorkersAgent(self, 3)
+        self.root = Dispatcher(self.agent, 3)
+
+    def test_tenant_on_one_worker(self):
+        """
+        All of a tenant's requests are sent to the worker which owns it.
+        """
+        auth = TenantAuthentication(self, self.root, "user", "password",
+                                    tenant_id="1234")
+        nova = auth.get_service_endpoint("cloudServersOpenStack")
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "GET", nova + "/servers"))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(body, {"servers": []})
+        owner = shard_for(b"1234", 3)
+        self.assertEqual(set(index for (index, _, _, _, _)
+                             in self.agent.requests),
+                         set([owner]))
+        self.assertEqual(
+            [len(core.sessions.all_sessions()) for core in self.agent.cores],
+            [1 if index == owner else 0 for index in range(3)])
+
+    def test_forwarded_headers(self):
+        """
+        Workers are told the port the request was received on, and are sent
+        its headers.
+        """
+        self.successResultOf(request(
+            self, self.root, "GET", "/mimicking/NovaApi-abc/ORD/v2/1/servers",
+            headers={b"x-auth-token": [b"a_token"]}))
+        [(_, method, path, headers, body)] = self.agent.requests
+        self.assertEqual((method, path, body),
+                         (b"GET", b"/mimicking/NovaApi-abc/ORD/v2/1/servers",
+                          b""))
+        self.assertEqual(headers.getRawHeaders(b"x-forwarded-port"),
+                         [b"80"])
+        self.assertEqual(headers.getRawHeaders(b"x-auth-token"),
+                         [b"a_token"])
+
+    def test_broadcast(self):
+        """
+        Requests to mimic's control APIs are sent to every worker; if they
+        all respond the same, that is the response.
+        """
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", "/mimic/v1.1/tick", {"amount": 3}))
+        self.assertEqual(body["advanced"], 3)
+        self.assertEqual([core.sessions.clock.seconds()
+                          for core in self.agent.cores], [3, 3, 3])
+
+    def test_broadcast_different_responses(self):
+        """
+        If the workers respond to a control API differently, their responses
+        are combined, and paths in the request are replaced with a file for
+        each worker.
+        """
+        TenantAuthentication(self, self.root, "user", "password",
+                             tenant_id="1234")
+        del self.agent.requests[:]
+        (response, body) = self.successResultOf(json_request(
+            self, self.root, "POST", "/mimic/v1.1/snapshot",
+            {"path": "a_file"}))
+        self.assertEqual(response.code, 200)
+        self.assertEqual([worker["path"] for worker in body["workers"]],
+                         [worker_file("a_file", n) for n in range(3)])
+        self.assertEqual(
+            [json.loads(sent)["path"]
+             for (_, _, _, _, sent) in self.agent.requests],
+            [worker_file("a_file", n) for n in range(3)])
+
+    def test_bad_gateway(self):
+        """
+        If a worker cannot be reached, the response is a 502.
+        """
+        self.agent.refuse = True
+        (response, content) = self.successResultOf(request_with_content(
+            self, self.root, "GET", "/identity/v2.0/tokens/abc"))
+        self.assertEqual(response.code, 502)
+        self.assertEqual(len(self.flushLoggedErrors(ConnectionRefusedError)),
+                         1)
+
+
+class ForwardedRequestTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ForwardedRequest`.
+    """
+
+    def test_service_catalog(self):
+        """
+        The service catalog of a worker points at the port and scheme on
+        which the dispatcher received the request for it.
+        """
+        site = Site(MimicRoot(MimicCore(Clock(), [NovaApi()])).app.resource())
+        site.requestFactory = ForwardedRequest
+        channel = site.buildProtocol(None)
+        transport = StringTransport()
+        channel.makeConnection(transport)
+        body = json.dumps({"auth": {"passwordCredentials": {
+            "username": "user", "password": "password"}}}).encode("utf-8")
+        channel.dataReceived(
+            b"POST /identity/v2.0/tokens HTTP/1.1\r\n"
+            b"Host: example.com\r\n"
+            b"X-Forwarded-Port: 8443\r\n"
+            b"X-Forwarded-Proto: https\r\n"
+            b"Content-Length: " + str(len(body)).encode("ascii") +
+            b"\r\n\r\n" + body)
+        self.assertIn(b'"https://example.com:8443/mimicking/NovaApi-',
+                      transport.value())
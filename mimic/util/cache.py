@@ -0,0 +1,128 @@
+# -*- test-case-name: mimic.test.test_util -*-
+"""
+Bounded caches for objects that are expensive to rebuild on every request.
+"""
+
+from mimic.util.ordered import OrderedIndex
+
+
+class LRUCache(object):
+    """
+    A mapping which holds at most ``max_size`` entries, evicting the least
+    recently used entry when a new one would exceed that bound.
+
+    Entries are kept in an :obj:`OrderedIndex` ordered from least to most
+    recently used, so lookups, insertions and evictions are all O(1).
+
+    :ivar int max_size: The maximum number of entries kept in the cache.
+    :ivar int hits: The number of lookups which found an entry.
+    :ivar int misses: The number of lookups which did not find an entry.
+    :ivar int evictions: The number of entries dropped to make room for
+        newer ones.
+    """
+
+    def __init__(self, max_size, on_evict=None):
+        """
+        Create an empty cache.
+
+        :param int max_size: The maximum number of entries to keep; must be
+            at least 1.
+        :param callable on_evict: If specified, a 2-argument callable invoked
+            with the key and value of every entry evicted to make room for a
+            newer one.  It is not invoked for entries removed with
+            :obj:`LRUCache.pop` or :obj:`LRUCache.clear`.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._on_evict = on_evict
+        self._entries = OrderedIndex()
+
+    def __len__(self):
+        """
+        The number of entries in the cache.
+        """
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        Whether the key is in the cache; does not count as a use of the entry.
+        """
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Look up a value, marking it as the most recently used.
+
+        :return: the value for ``key``, or ``default`` if there is none.
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key, value):
+        """
+        Store a value as the most recently used entry, evicting the least
+        recently used entry if the cache is full.
+        """
+        if key in self._entries:
+            self._entries.add(key, value)
+            self._entries.move_to_end(key)
+            return
+        if len(self._entries) >= self.max_size:
+            oldest_key = self._entries.first_key()
+            oldest_value = self._entries.pop(oldest_key)
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(oldest_key, oldest_value)
+        self._entries.add(key, value)
+
+    def get_or_create(self, key, factory):
+        """
+        Look up a value, creating and storing it by calling ``factory`` with no
+        arguments if it is not already cached.
+        """
+        if key in self._entries:
+            return self.get(key)
+        self.misses += 1
+        value = factory()
+        self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        """
+        Remove an entry without counting it as an eviction.
+
+        :return: the removed value, or ``default`` if there was none.
+        """
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        """
+        Remove all entries.  The hit, miss and eviction counters are kept.
+        """
+        self._entries.clear()
+
+    def keys(self):
+        """
+        All the keys in the cache, least recently used first.
+        """
+        return self._entries.keys()
+
+    def stats(self):
+        """
+        A JSON-serializable summary of the cache's size and counters.
+        """
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -7,7 +7,8 @@ Helper methods
 """
 import os
 import string
-from datetime import datetime, timedelta
+from calendar import timegm
+from datetime import datetime
 from random import choice, randint
 
 from six import text_type
@@ -58,6 +59,23 @@ def seconds_to_timestamp(seconds, format=fmt):
     return datetime.utcfromtimestamp(seconds).strftime(format)
 
 
+def timestamp_to_seconds(timestamp):
+    """
+    Return seconds since the epoch given an ISO8601 Zulu timestamp, with or
+    without fractional seconds, such as the ones produced by
+    :func:`seconds_to_timestamp`.
+
+    :raise: :obj:`ValueError` if the timestamp is not in a recognized format.
+    """
+    for format in (fmt, '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            parsed = datetime.strptime(timestamp, format)
+        except ValueError:
+            continue
+        return timegm(parsed.utctimetuple()) + parsed.microsecond / 1e6
+    raise ValueError("Unrecognized timestamp: {0}".format(timestamp))
+
+
 def not_found_response(resource='servers'):
     """
     Return a 404 response body for Nova, depending on the resource.  Expects
@@ -99,30 +117,3 @@ def bad_request(message, response_code=400):
     provided.
     """
     return {"badRequest": invalid_resource(message, response_code)}
-
-
-def set_resource_status(updated_time, time_delta, status='ACTIVE',
-                        current_timestamp=None):
-    """
-    Given the updated_time and time delta, if the updated_time + time_delta is
-    greater than the current time in UTC, returns the given status; otherwise
-    return None.
-
-    :param str updated_time: The time that the server was last updated by a
-        client.
-    :param int time_delta: The delta, in seconds, from ``updated_time``.
-    :param str status: The status to return if the time_delta has expired (i.e.
-        the wall clock has advanced more than ``time_delta`` past
-        ``updated_time``).
-    :param float current_timestamp: The current time, in seconds from the POSIX
-        epoch.
-
-    :return: ``status`` or ``None``.
-    """
-    current_datetime = datetime.utcfromtimestamp(current_timestamp)
-    last_updated_datetime = datetime.strptime(updated_time, fmt)
-    expiration_interval = timedelta(seconds=int(time_delta))
-    expiration_datetime = last_updated_datetime + expiration_interval
-
-    if current_datetime >= expiration_datetime:
-        return status
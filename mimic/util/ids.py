@@ -0,0 +1,149 @@
+# -*- test-case-name: mimic.test.test_util -*-
+"""
+IDs for the objects mimic's plugins create, which never collide and can be
+made the same from run to run.
+
+Each kind of ID (each *namespace*, such as ``"nova_server"``) has a counter,
+and the ``n``-th ID of a namespace is ``n`` put through a permutation of the
+IDs' range, chosen by the allocator's seed and the namespace.  So IDs look
+as random as the real APIs' do, but no two IDs of a namespace are the same
+until the range is used up, and an allocator with a given seed allocates the
+same IDs in the same order every time.  An allocator which is not given a
+seed chooses one at random, so that IDs differ from run to run as before.
+"""
+
+from hashlib import sha1
+from random import Random
+from uuid import UUID
+
+from six import text_type
+
+_ROUNDS = 3
+
+
+class IDAllocator(object):
+    """
+    Allocates IDs from a counter for each namespace.
+
+    The IDs of a namespace must all be allocated with the same method and
+    range.
+    """
+
+    def __init__(self, seed=None):
+        """
+        Create an allocator.
+
+        :param seed: A seed, as for :obj:`seed`.
+        """
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Start every namespace again, with a new seed.
+
+        The seed is hashed as UTF-8 text with SHA-1, rather than given to
+        :obj:`random.Random`, which seeds differently from strings on each
+        version of Python (and, on Python 2, by their ``hash()``), so that a
+        seed gives the same IDs everywhere.
+
+        :param seed: Text (or anything else, by its text), or ``None`` for a
+            random seed.
+        """
+        if seed is None:
+            value = Random().getrandbits(128)
+        else:
+            value = int(sha1(text_type(seed).encode("utf-8")).hexdigest()[:32],
+                        16)
+        self._seed = "{0:032x}".format(value)
+        self._counters = {}
+        self._permutations = {}
+
+    def state(self):
+        """
+        The number of IDs allocated in each namespace, so that they can be
+        skipped (with :obj:`skip`) by an allocator with the same seed.
+
+        :return: a JSON-serializable ``dict``.
+        """
+        return dict(self._counters)
+
+    def skip(self, state):
+        """
+        Skip the IDs allocated by an allocator with the same seed, so as not
+        to allocate them again.
+
+        :param dict state: the :obj:`state` of that allocator.
+        """
+        for namespace, allocated in state.items():
+            if allocated > self._counters.get(namespace, 0):
+                self._counters[namespace] = allocated
+
+    def number(self, namespace, bits):
+        """
+        Allocate a number.
+
+        :param str namespace: The kind of ID.
+        :param int bits: The size, in bits, of the range of the IDs: they are
+            from 0 to ``2 ** bits - 1``.
+
+        :return: an ``int``.
+        :raises OverflowError: if every number of the range is allocated.
+        """
+        allocated = self._counters.get(namespace, 0)
+        if allocated >> bits:
+            raise OverflowError("all {0}-bit IDs of {1} are allocated"
+                                .format(bits, namespace))
+        self._counters[namespace] = allocated + 1
+        permutation = self._permutations.get(namespace)
+        if permutation is None:
+            permutation = self._permutations[namespace] = (
+                self._permutation(namespace, bits))
+        mask, shift, rounds = permutation
+        value = allocated
+        for key, multiplier in rounds:
+            value = ((value ^ key) * multiplier) & mask
+            value ^= value >> shift
+        return int(value)
+
+    def hex(self, namespace, digits):
+        """
+        Allocate a string of hexadecimal digits.
+
+        :param str namespace: The kind of ID.
+        :param int digits: The number of digits.
+
+        :return: a ``str``.
+        """
+        return "{0:0{1}x}".format(self.number(namespace, digits * 4), digits)
+
+    def uuid(self, namespace):
+        """
+        Allocate a version 4 UUID.
+
+        :param str namespace: The kind of ID.
+
+        :return: the UUID as text.
+        """
+        value = self.number(namespace, 122)
+        return text_type(UUID(int=(
+            (value >> 74 << 80) | (4 << 76) | ((value >> 62 & 0xfff) << 64) |
+            (2 << 62) | (value & ((1 << 62) - 1)))))
+
+    def _permutation(self, namespace, bits):
+        """
+        The permutation of a namespace's range of IDs.
+
+        :return: the mask of the range, the shift of the right-shift-and-xor
+            which follows each round, and the ``(key, odd multiplier)`` of
+            each round.
+        """
+        rng = Random(int(sha1((self._seed + namespace).encode("utf-8"))
+                         .hexdigest(), 16))
+        return ((1 << bits) - 1, bits // 2 + 1,
+                [(rng.getrandbits(bits), rng.getrandbits(bits) | 1)
+                 for _ in range(_ROUNDS)])
+
+
+#: The allocator from which mimic's plugins draw the IDs of the objects they
+#: create.
+allocator = IDAllocator()
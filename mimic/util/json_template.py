@@ -0,0 +1,69 @@
+# -*- test-case-name: mimic.test.test_util -*-
+"""
+Canned JSON responses which are serialized once, rather than for every
+response, with slots for the few strings, such as IDs and URLs, which differ
+between responses.
+"""
+
+import re
+from json import dumps
+
+# Slots are marked with NUL characters, which json.dumps escapes as \u0000,
+# and which no canned response otherwise contains.
+_SLOT = re.compile(r"\\u0000(\w+)\\u0000")
+
+
+def slot(name):
+    """
+    A placeholder for the string named ``name``, to put in the document of a
+    :obj:`JSONTemplate`, either as a string or as part of one.
+    """
+    return u"\x00" + name + u"\x00"
+
+
+class JSONTemplate(object):
+    """
+    The JSON text of a document, with slots to fill in.
+
+    Use like so::
+
+        template = JSONTemplate({"image": {"id": slot("image_id"),
+                                           "href": "/images/" +
+                                                   slot("image_id")}})
+        template.render(image_id=u"abc")
+    """
+
+    def __init__(self, document):
+        """
+        Serialize ``document``, whose strings may contain slots (see
+        :obj:`slot`).
+        """
+        self._parts = _SLOT.split(dumps(document))
+
+    def render(self, **values):
+        """
+        The JSON text of the document, with each slot filled in with the
+        string of the same name in ``values``.
+
+        :raises KeyError: if there is no value for one of the slots.
+        """
+        escaped = dict([(name, dumps(value)[1:-1])
+                        for name, value in values.items()])
+        parts = self._parts[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = escaped[parts[index]]
+        return "".join(parts)
+
+
+def insert_member(serialized_object, name, serialized_value):
+    """
+    Insert a member into the JSON text of a non-empty object.
+
+    :param str serialized_object: the JSON text of the object.
+    :param name: the name of the member.
+    :param str serialized_value: the JSON text of the member's value.
+
+    :return: the JSON text of the object with the member.
+    """
+    return ("{" + dumps(name) + ": " + serialized_value + ", " +
+            serialized_object[1:])
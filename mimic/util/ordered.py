@@ -0,0 +1,244 @@
+# -*- test-case-name: mimic.test.test_util -*-
+"""
+Ordered collections whose members are addressable by key, for serving
+lookups and marker-based pagination without scanning.
+"""
+
+from bisect import bisect_left, insort
+
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class OrderedIndex(object):
+    """
+    A collection of values, kept in insertion order, which can be looked up,
+    removed or moved by key in constant time.
+
+    This is a dictionary of links in a circular doubly-linked list (rather
+    than an ``OrderedDict``, which is not available on Python 2.6).  Unlike a
+    list plus a dictionary, removing an item does not require finding and
+    shifting its position in the list, and iteration can start from any key,
+    which makes marker-based pagination O(page size).
+
+    Iterating over an :obj:`OrderedIndex` yields its values, oldest first.
+    """
+
+    def __init__(self):
+        """
+        Create an empty index.
+        """
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        """
+        The number of values in the index.
+        """
+        return len(self._links)
+
+    def __contains__(self, key):
+        """
+        Whether there is a value with the given key.
+        """
+        return key in self._links
+
+    def __getitem__(self, key):
+        """
+        Get the value with the given key, raising :obj:`KeyError` if there is
+        none.
+        """
+        return self._links[key][_VALUE]
+
+    def __iter__(self):
+        """
+        Iterate over the values, oldest first.
+        """
+        return self._values_from(self._root[_NEXT])
+
+    def __reversed__(self):
+        """
+        Iterate over the values, newest first.
+        """
+        root = self._root
+        link = root[_PREV]
+        while link is not root:
+            previous_link = link[_PREV]
+            yield link[_VALUE]
+            link = previous_link
+
+    def _values_from(self, link):
+        """
+        Generate the values from the given link to the newest one.
+        """
+        root = self._root
+        while link is not root:
+            # Grab the next link first so that the current value may be
+            # removed while iterating.
+            next_link = link[_NEXT]
+            yield link[_VALUE]
+            link = next_link
+
+    def _unlink(self, link):
+        """
+        Remove a link from the list.
+        """
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def _append(self, link):
+        """
+        Add a link at the newest end of the list.
+        """
+        last = self._root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = self._root
+        last[_NEXT] = link
+        self._root[_PREV] = link
+
+    def get(self, key, default=None):
+        """
+        Get the value with the given key, or ``default`` if there is none.
+        """
+        link = self._links.get(key)
+        if link is None:
+            return default
+        return link[_VALUE]
+
+    def add(self, key, value):
+        """
+        Add a value as the newest one.  If a value with this key is already
+        present it is replaced, keeping its place in the order.
+        """
+        link = self._links.get(key)
+        if link is not None:
+            link[_VALUE] = value
+            return
+        link = [None, None, key, value]
+        self._append(link)
+        self._links[key] = link
+
+    def move_to_end(self, key):
+        """
+        Make the value with the given key the newest one.
+        """
+        link = self._links[key]
+        self._unlink(link)
+        self._append(link)
+
+    def pop(self, key, default=None):
+        """
+        Remove the value with the given key.
+
+        :return: the removed value, or ``default`` if there was none.
+        """
+        link = self._links.pop(key, None)
+        if link is None:
+            return default
+        self._unlink(link)
+        return link[_VALUE]
+
+    def first_key(self):
+        """
+        The key of the oldest value, or ``None`` if the index is empty.
+        """
+        return self._root[_NEXT][_KEY]
+
+    def clear(self):
+        """
+        Remove all values.
+        """
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def keys(self):
+        """
+        A list of all the keys, oldest first.
+        """
+        result = []
+        link = self._root[_NEXT]
+        while link is not self._root:
+            result.append(link[_KEY])
+            link = link[_NEXT]
+        return result
+
+    def values_from(self, key):
+        """
+        Iterate over the value with the given key and the values newer than
+        it, oldest first.
+
+        :raise: :obj:`KeyError` if there is no value with the given key.
+        """
+        return self._values_from(self._links[key])
+
+    def values_after(self, key):
+        """
+        Iterate over the values newer than the one with the given key, oldest
+        first.  This costs nothing for the values that are skipped.
+
+        :raise: :obj:`KeyError` if there is no value with the given key.
+        """
+        return self._values_from(self._links[key][_NEXT])
+
+
+class SortedIndex(object):
+    """
+    A secondary index, mapping each value of some attribute to the keys of the
+    objects which have that value.
+
+    The keys for each value are kept sorted by an integer position (such as
+    creation order) that is unique to each object, so that iteration can
+    resume after any position without visiting the entries before it.
+    """
+
+    def __init__(self):
+        """
+        Create an empty index.
+        """
+        self._entries = {
+            # mapping of attribute value to sorted list of (position, key)
+        }
+
+    def add(self, value, position, key):
+        """
+        Record that the object at ``position`` with the given key has the
+        given value.
+        """
+        insort(self._entries.setdefault(value, []), (position, key))
+
+    def remove(self, value, position, key):
+        """
+        Forget that the object at ``position`` with the given key has the given
+        value.
+
+        :raise: :obj:`KeyError` if the index does not record that, rather than
+            forgetting some other object's entry.
+        """
+        entries = self._entries.get(value, [])
+        entry = (position, key)
+        index = bisect_left(entries, entry)
+        if index == len(entries) or entries[index] != entry:
+            raise KeyError((value, position, key))
+        del entries[index]
+        if not entries:
+            del self._entries[value]
+
+    def count(self, value):
+        """
+        The number of objects which have the given value.
+        """
+        return len(self._entries.get(value, ()))
+
+    def keys_after(self, value, position=None):
+        """
+        Iterate over the keys of the objects with the given value, in position
+        order, starting just after ``position`` (or from the start, if
+        ``position`` is ``None``).
+        """
+        entries = self._entries.get(value, [])
+        start = 0
+        if position is not None:
+            start = bisect_left(entries, (position + 1,))
+        while start < len(entries):
+            yield entries[start][1]
+            start += 1
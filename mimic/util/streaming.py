@@ -0,0 +1,167 @@
+# -*- test-case-name: mimic.test.test_util -*-
+"""
+Write large JSON responses incrementally, rather than building the whole
+response body in memory before sending any of it.
+"""
+
+from json import dumps
+
+from six import text_type
+
+from zope.interface import implementer
+
+from twisted.internet.defer import Deferred
+from twisted.internet.interfaces import IPushProducer
+
+
+def iter_json(value):
+    """
+    Encode ``value`` as JSON, generating the encoded text in pieces.
+
+    Dictionaries are encoded one member at a time, with each member's value
+    encoded by this function in turn.  Lists, tuples and any other iterables
+    (such as generators) are encoded one element at a time, with each element
+    encoded by :obj:`json.dumps` in one piece; so an iterable of resources
+    is never encoded as a whole, and a generator of resources is never held
+    in memory as a whole.  Anything else is encoded by :obj:`json.dumps`.
+
+    :return: an iterator of ``str``.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        separator = ""
+        for key in value:
+            yield separator + dumps(key) + ": "
+            for piece in iter_json(value[key]):
+                yield piece
+            separator = ", "
+        yield "}"
+    elif (hasattr(value, "__iter__") and
+          not isinstance(value, (bytes, text_type))):
+        yield "["
+        separator = ""
+        for element in value:
+            yield separator + dumps(element)
+            separator = ", "
+        yield "]"
+    else:
+        yield dumps(value)
+
+
+@implementer(IPushProducer)
+class JSONProducer(object):
+    """
+    A push producer which writes a value encoded as JSON to a request, about
+    :obj:`chunk_size` bytes at a time, for as long as the request's transport
+    accepts data.
+
+    :ivar int chunk_size: The number of bytes to collect before each write.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, request, value):
+        """
+        :param request: The :obj:`twisted.web.server.Request` to write to.
+        :param value: The value to encode, as accepted by :obj:`iter_json`.
+        """
+        self._request = request
+        self._pieces = iter_json(value)
+        self._paused = False
+        self._producing = False
+        self._exhausted = False
+        self._stopped = False
+        self._finished = None
+
+    def start(self):
+        """
+        Register with the request and write as much of the response as the
+        transport will take.
+
+        :return: a :obj:`Deferred` which fires with ``None`` once the whole
+            response has been written.  Cancelling it stops the producer.
+        """
+        self._finished = Deferred(lambda _: self.stopProducing())
+        self._request.registerProducer(self, True)
+        self._produce()
+        return self._finished
+
+    def _produce(self):
+        """
+        Write chunks until the producer is paused or stopped, or there are no
+        more.
+        """
+        # A write may pause us (and, later, resume us) re-entrantly; the loop
+        # that is already running carries on when that happens.
+        if self._producing:
+            return
+        self._producing = True
+        try:
+            while not (self._paused or self._stopped or self._exhausted):
+                chunk = self._next_chunk()
+                if chunk:
+                    self._request.write(chunk)
+            if self._exhausted and not self._stopped:
+                self._stopped = True
+                self._request.unregisterProducer()
+                self._finished.callback(None)
+        finally:
+            self._producing = False
+
+    def _next_chunk(self):
+        """
+        Collect the next :obj:`chunk_size` bytes or so of encoded JSON.
+        """
+        buf = []
+        size = 0
+        for piece in self._pieces:
+            if isinstance(piece, text_type):
+                piece = piece.encode("utf-8")
+            buf.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                break
+        else:
+            self._exhausted = True
+        return b"".join(buf)
+
+    def pauseProducing(self):
+        """
+        Stop writing until :obj:`resumeProducing` is called.
+        """
+        self._paused = True
+
+    def resumeProducing(self):
+        """
+        Continue writing.
+        """
+        self._paused = False
+        self._produce()
+
+    def stopProducing(self):
+        """
+        Abandon the response; nothing more will be written.
+        """
+        if not self._stopped:
+            self._stopped = True
+            self._request.unregisterProducer()
+
+
+def stream_json(request, value):
+    """
+    Write ``value`` to ``request`` as JSON, a chunk at a time.  Return the
+    result of this from a ``klein`` route instead of the result of
+    :obj:`json.dumps`; ``klein`` finishes the request when it fires.
+
+    The value is encoded over several turns of the reactor, in which other
+    requests may change mimic's state; so its iterables should be snapshots
+    (such as a list of the objects to respond with, with a generator of their
+    JSON), not live views of mimic's collections or indexes.
+
+    :param request: The :obj:`twisted.web.server.Request` to write to.
+    :param value: The value to encode, as accepted by :obj:`iter_json`.
+
+    :return: a :obj:`Deferred` which fires with ``None`` once the whole value
+        has been written.
+    """
+    return JSONProducer(request, value).start()
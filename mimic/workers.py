@@ -0,0 +1,394 @@
+# -*- test-case-name: mimic.test.test_workers -*-
+
+"""
+Run mimic as several worker processes behind a dispatcher, so that it can use
+more than one CPU.
+
+The workers share nothing: each has its own sessions, and so its own tenants.
+The dispatcher listens on mimic's port, and forwards each request to the
+worker which owns the tenant (or token, or user) it is about, found by
+:obj:`routing_key`, so a tenant's requests always land on the same worker.
+Each worker only generates the tenant IDs and tokens it owns (see
+:obj:`mimic.session.SessionStore.id_filter`), so those it hands out are routed
+back to it.
+
+Requests to mimic's own control APIs (``/mimic/...``), such as advancing the
+clock, are sent to every worker.
+
+The workers listen on UNIX sockets in a private directory, rather than all
+listening on mimic's port with ``SO_REUSEPORT``, because the kernel would
+spread connections across them without regard to tenants.
+"""
+
+import json
+import os
+import shutil
+import sys
+from tempfile import mkdtemp
+from zlib import crc32
+
+from twisted.application.service import MultiService
+from twisted.internet.address import IPv4Address
+from twisted.internet.defer import gatherResults, succeed
+from twisted.internet.endpoints import UNIXClientEndpoint
+from twisted.python import log
+from twisted.runner.procmon import ProcessMonitor
+from twisted.web.client import Agent, HTTPConnectionPool, readBody
+from twisted.web.iweb import IAgentEndpointFactory, IBodyProducer
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Request
+from zope.interface import implementer
+
+# Headers which describe a connection rather than a request or response, and
+# so are not forwarded between the dispatcher and the workers.
+_HOP_BY_HOP = [b"connection", b"keep-alive", b"proxy-authenticate",
+               b"proxy-authorization", b"te", b"trailers",
+               b"transfer-encoding", b"upgrade", b"content-length"]
+
+# Response headers which the dispatcher sets itself.
+_NOT_FORWARDED = _HOP_BY_HOP + [b"date", b"server"]
+
+
+def shard_for(key, workers):
+    """
+    The index of the worker which owns a tenant ID, token or username.
+
+    :param key: The tenant ID, token or username, as ``bytes`` or ``unicode``.
+    :param int workers: The number of workers.
+    """
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return (crc32(key) & 0xffffffff) % workers
+
+
+def worker_file(path, index):
+    """
+    The name of the file which a worker uses in place of the given state or
+    journal file, so that the workers do not overwrite each other's.
+    """
+    return "{0}.worker{1}".format(path, index)
+
+
+def _json_body(request):
+    """
+    The JSON body of a request, or ``None`` if it does not have one; the body
+    can still be read afterwards.
+    """
+    content = request.content.read()
+    request.content.seek(0)
+    try:
+        body = json.loads(content.decode("utf-8"))
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        return body
+
+
+def _username_from_auth(auth):
+    """
+    The username in the ``"auth"`` of a request for a token, if it has one.
+    """
+    for credentials in ["passwordCredentials", "RAX-KSKEY:apiKeyCredentials"]:
+        if isinstance(auth.get(credentials), dict):
+            return auth[credentials].get("username")
+
+
+def routing_key(request):
+    """
+    The tenant ID, token or username that a request is about, by which it is
+    sent to a worker.
+
+    :return: the key, or ``None`` if there is nothing to route the request
+        by.
+    """
+    segments = request.path.split(b"/")
+    key = None
+    if segments[1:2] == [b"mimicking"] and len(segments) > 5:
+        # /mimicking/<service>/<region>/<version>/<tenant>/...
+        key = segments[5]
+    elif segments[1:2] == [b"identity"]:
+        identity = segments[2:]
+        if identity[:2] == [b"v2.0", b"tokens"] and len(identity) > 2:
+            key = (request.args.get(b"belongsTo", [None])[0] or
+                   identity[2])
+        elif identity == [b"v2.0", b"tokens"]:
+            auth = (_json_body(request) or {}).get("auth")
+            if isinstance(auth, dict):
+                key = (auth.get("tenantName") or auth.get("tenantId") or
+                       _username_from_auth(auth) or
+                       (auth.get("token") or {}).get("id"))
+        elif identity[:2] == [b"v1.1", b"mosso"] and len(identity) > 2:
+            key = identity[2]
+        elif identity == [b"v2.0", b"RAX-AUTH", b"impersonation-tokens"]:
+            impersonation = ((_json_body(request) or {})
+                             .get("RAX-AUTH:impersonation") or {})
+            key = (impersonation.get("user") or {}).get("username")
+    if not key:
+        key = request.getHeader(b"x-auth-token")
+    return key or None
+
+
+def _is_broadcast(request):
+    """
+    Whether a request should be sent to every worker.
+    """
+    return request.path.split(b"/")[1:2] == [b"mimic"]
+
+
+@implementer(IBodyProducer)
+class _BytesProducer(object):
+    """
+    A body producer of some bytes which are already in memory.
+    """
+
+    def __init__(self, body):
+        """
+        Produce ``body``.
+        """
+        self.body = body
+        self.length = len(body)
+
+    def startProducing(self, consumer):
+        """
+        Write the whole body at once.
+        """
+        consumer.write(self.body)
+        return succeed(None)
+
+    def pauseProducing(self):  # pragma:nocover
+        """
+        The body has already been written.
+        """
+
+    def stopProducing(self):  # pragma:nocover
+        """
+        The body has already been written.
+        """
+
+
+def _body_for_worker(body, index):
+    """
+    The body of a request sent to every worker, as sent to the given worker:
+    a ``"path"`` (as for the snapshot and restore APIs) is replaced with the
+    worker's own file, by :obj:`worker_file`.
+    """
+    try:
+        parsed = json.loads(body.decode("utf-8"))
+    except ValueError:
+        return body
+    if isinstance(parsed, dict) and "path" in parsed:
+        parsed["path"] = worker_file(parsed["path"], index)
+        return json.dumps(parsed).encode("utf-8")
+    return body
+
+
+def _combine(results):
+    """
+    Combine the responses of every worker to one request into one.
+
+    :param results: a list of 2-tuples of response and body, one for each
+        worker, in order.
+    :return: the first response, and either its body, if all the workers
+        responded with the same body, or a JSON body of the form
+        ``{"workers": [<each worker's body>]}``.
+    """
+    response, body = results[0]
+    if all(other == body for (_, other) in results):
+        return response, body
+    bodies = []
+    for _, other in results:
+        try:
+            bodies.append(json.loads(other.decode("utf-8")))
+        except ValueError:
+            bodies.append(other.decode("utf-8", "replace"))
+    return response, json.dumps({"workers": bodies}).encode("utf-8")
+
+
+class Dispatcher(Resource):
+    """
+    The root resource of the dispatcher: it renders each request by
+    forwarding it to the worker which owns it, or to every worker.
+    """
+
+    isLeaf = True
+
+    def __init__(self, agent, workers):
+        """
+        :param agent: An :obj:`twisted.web.iweb.IAgent` which connects to
+            worker ``n`` for URIs whose host is ``worker-<n>``.
+        :param int workers: The number of workers.
+        """
+        Resource.__init__(self)
+        self._agent = agent
+        self._workers = workers
+
+    def render(self, request):
+        """
+        Forward the request, and respond with the worker's response.
+        """
+        if _is_broadcast(request):
+            body = request.content.read()
+            d = gatherResults(
+                [self._forward(request, index, _body_for_worker(body, index))
+                 for index in range(self._workers)], consumeErrors=True)
+            d.addCallback(_combine)
+        else:
+            key = routing_key(request)
+            index = 0 if key is None else shard_for(key, self._workers)
+            d = self._forward(request, index, request.content.read())
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+        d.addCallbacks(self._respond, self._bad_gateway,
+                       callbackArgs=(request, finished),
+                       errbackArgs=(request, finished))
+        return NOT_DONE_YET
+
+    def _forward(self, request, index, body):
+        """
+        Send a request to a worker.
+
+        :return: a :obj:`Deferred` firing with a 2-tuple of the worker's
+            response and its body.
+        """
+        headers = request.requestHeaders.copy()
+        for name in _HOP_BY_HOP:
+            headers.removeHeader(name)
+        headers.setRawHeaders(b"x-forwarded-port",
+                              [str(request.getHost().port).encode("ascii")])
+        headers.setRawHeaders(
+            b"x-forwarded-proto",
+            [b"https" if request.isSecure() else b"http"])
+        d = self._agent.request(
+            request.method,
+            "http://worker-{0}".format(index).encode("ascii") + request.uri,
+            headers, _BytesProducer(body) if body else None)
+        d.addCallback(lambda response: readBody(response).addCallback(
+            lambda content: (response, content)))
+        return d
+
+    def _respond(self, result, request, finished):
+        """
+        Respond to a request with a worker's response.
+        """
+        if finished:
+            return
+        response, body = result
+        request.setResponseCode(response.code, response.phrase)
+        for name, values in response.headers.getAllRawHeaders():
+            if name.lower() not in _NOT_FORWARDED:
+                request.responseHeaders.setRawHeaders(name, values)
+        request.setHeader(b"content-length", str(len(body)).encode("ascii"))
+        request.write(body)
+        request.finish()
+
+    def _bad_gateway(self, failure, request, finished):
+        """
+        Respond to a request which could not be forwarded with a 502.
+        """
+        log.err(failure, "Could not forward a request to a mimic worker")
+        if finished:
+            return
+        request.setResponseCode(502)
+        request.finish()
+
+
+class ForwardedRequest(Request):
+    """
+    A request received by a worker from the dispatcher, which knows the port
+    and scheme that the dispatcher received it on, so that the URLs it
+    generates (such as those in service catalogs) point at the dispatcher.
+    """
+
+    def getHost(self):
+        """
+        The address of the dispatcher, if the request was forwarded by it.
+        """
+        port = self.getHeader(b"x-forwarded-port")
+        if port is None:
+            return Request.getHost(self)
+        return IPv4Address("TCP", "127.0.0.1", int(port))
+
+    def isSecure(self):
+        """
+        Whether the dispatcher received the request over HTTPS.
+        """
+        scheme = self.getHeader(b"x-forwarded-proto")
+        if scheme is None:
+            return Request.isSecure(self)
+        return scheme == b"https"
+
+
+@implementer(IAgentEndpointFactory)
+class _WorkerEndpoints(object):
+    """
+    Endpoints which connect to the workers' sockets.
+    """
+
+    def __init__(self, reactor, sockets):
+        """
+        :param sockets: the names of the workers' sockets, in order.
+        """
+        self._reactor = reactor
+        self._sockets = sockets
+
+    def endpointForURI(self, uri):
+        """
+        An endpoint for a URI whose host is ``worker-<n>``.
+        """
+        index = int(uri.host.split(b"-")[1])
+        return UNIXClientEndpoint(self._reactor, self._sockets[index])
+
+
+class Workers(MultiService):
+    """
+    A service which runs the worker processes, restarting any which exit,
+    and an agent with which to send them requests.
+
+    :ivar monitor: The :obj:`ProcessMonitor` which runs the workers.
+    :ivar agent: An :obj:`twisted.web.iweb.IAgent` for :obj:`Dispatcher`.
+    """
+
+    def __init__(self, count, arguments, reactor=None):
+        """
+        :param int count: The number of workers.
+        :param arguments: A callable which, given the index of a worker and
+            the endpoint string on which it should listen, returns the
+            arguments to the ``twistd`` which runs it.
+        :param reactor: The reactor with which to run the workers and connect
+            to them; by default, the global reactor.
+        """
+        MultiService.__init__(self)
+        if reactor is None:
+            from twisted.internet import reactor
+        self._directory = mkdtemp(prefix="mimic-workers-")
+        sockets = [os.path.join(self._directory, "worker-{0}.sock"
+                                .format(index))
+                   for index in range(count)]
+        self.monitor = ProcessMonitor(reactor)
+        for index, socket in enumerate(sockets):
+            self.monitor.addProcess(
+                "worker-{0}".format(index),
+                [sys.executable, "-c",
+                 "from twisted.scripts.twistd import run; run()"] +
+                arguments(index, "unix:" + socket),
+                env=os.environ)
+        self.monitor.setServiceParent(self)
+        pool = HTTPConnectionPool(reactor)
+        pool.maxPersistentPerHost = 10
+        self.agent = Agent.usingEndpointFactory(
+            reactor, _WorkerEndpoints(reactor, sockets), pool)
+
+    def stopService(self):
+        """
+        Stop the workers, and remove the directory of their sockets.
+        """
+        d = MultiService.stopService(self)
+        d.addBoth(self._remove_directory)
+        return d
+
+    def _remove_directory(self, result):
+        """
+        Remove the directory of the workers' sockets.
+        """
+        shutil.rmtree(self._directory, ignore_errors=True)
+        return result